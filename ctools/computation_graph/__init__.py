@@ -0,0 +1 @@
+from .base_computation_graph import BaseCompGraph
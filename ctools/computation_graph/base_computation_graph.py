@@ -0,0 +1,35 @@
+from abc import ABC, abstractmethod
+from typing import Any
+
+
+class BaseCompGraph(ABC):
+    r"""
+    Overview:
+        base class of the computation graph of a learner, which computes the losses of the processed data with
+        the agent, called in ``BaseLearner._train``
+    Interface:
+        forward, register_stats, __repr__
+    """
+
+    @abstractmethod
+    def forward(self, data: Any, agent: Any) -> dict:
+        r"""
+        Overview:
+            compute the losses of a batch
+        Arguments:
+            - data (:obj:`Any`): the collated batch
+            - agent (:obj:`BaseAgent`): the learner agent
+        Returns:
+            - log_vars (:obj:`dict`): the variables to log, including 'total_loss' to backward
+        """
+        raise NotImplementedError
+
+    def register_stats(self, record: Any, tb_logger: Any) -> None:
+        r"""
+        Overview:
+            register the variables of the returned dict of ``forward`` to record & tb_logger, none by default
+        """
+        pass
+
+    def __repr__(self) -> str:
+        return self.__class__.__name__
@@ -1,4 +1,4 @@
-from .collate_fn import diff_shape_collate, default_collate, default_decollate, timestep_collate
+from .collate_fn import diff_shape_collate, default_collate, default_decollate, host_decollate, timestep_collate
 from .replay_buffer import ReplayBuffer
 from .structure import PrioritizedBuffer
 from .dataloader import AsyncDataLoader
@@ -5,6 +5,8 @@ import torch
 import re
 from torch._six import container_abcs, string_classes, int_classes
 
+from ctools.torch_utils import to_host_split
+
 np_str_obj_array_pattern = re.compile(r'[SaUO]')
 
 default_collate_err_msg_format = (
@@ -188,3 +190,31 @@ def default_decollate(batch: Union[torch.Tensor, Sequence, Mapping], ignore: Lis
         return [{k: tmp[k][i] for k in tmp.keys()} for i in range(B)]
 
     raise TypeError("not support batch type: {}".format(type(batch)))
+
+
+def host_decollate(batch: Union[torch.Tensor, Sequence, Mapping], ignore: List[str] = ['prev_state']) -> List[Any]:
+    """
+    Overview:
+        Decollate the batch to host as ``default_decollate``, with one device to host copy for each dtype laid out
+        by env(``to_host_split``): the tensors of each env are views of a chunk of its own, instead of a clone of
+        each piece, so the decollated data of one env pickles just its own elements.
+    Arguments:
+        - batch (:obj:`Union[torch.Tensor, Sequence, Mapping]`): can reference the Returns of ``default_collate``
+        - ignore(:obj:`List[str]`): a list of names to be ignored, only function if input ``batch`` is a dict. \
+            If key is in this list, its value is a list of the value of each env, and is not copied.
+    Returns:
+        - ret (:obj:`List[Any]`): a list with B elements, in the same format as ``default_decollate``.
+    """
+    envs = to_host_split(batch, ignore_keys=ignore, keepdim_1d=True)
+    return [_decollate_format(e, i, ignore) for i, e in enumerate(envs)]
+
+
+def _decollate_format(item: Any, i: int, ignore: List[str]) -> Any:
+    # sequences as tuples and the ignored values indexed by env, the same as default_decollate
+    if isinstance(item, torch.Tensor):
+        return item
+    elif isinstance(item, Sequence) and not isinstance(item, str):
+        return tuple(_decollate_format(e, i, ignore) for e in item)
+    elif isinstance(item, Mapping):
+        return {k: v[i] if k in ignore else _decollate_format(v, i, ignore) for k, v in item.items()}
+    return item
@@ -0,0 +1,247 @@
+"""
+Long-polling metadata channel between the learner dataloader and the coordinator
+
+    ``coordinator/ask_for_metadata`` answers at once, so a learner waiting for data keeps sending new requests. With
+    ``coordinator/stream_metadata`` the learner sends its credit, the number of batches it has room for, on a
+    keep-alive session, and the coordinator holds the request until at least one batch is ready or ``wait`` seconds
+    pass, then answers at most ``credit`` batches. The coordinator never assigns trajectories to a learner that has
+    no room for them, and an idle learner sends one request per ``wait`` seconds.
+
+    request: {'learner_uid', 'batch_size', 'credit', 'wait'}
+    response: {'code': 0, 'info': [batch, ...]}, a batch is a list of metadata dicts, empty when timed out
+
+    A coordinator without ``stream_metadata``(404) is asked with ``ask_for_metadata`` instead, with a backoff on
+    empty results and errors. ``MetadataChannel`` is the coordinator side of the api, ``StubCoordinator`` serves it
+    over http on localhost for tests and benchmarks.
+"""
+import json
+import logging
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+STREAM_API = 'coordinator/stream_metadata'
+LEGACY_API = 'coordinator/ask_for_metadata'
+
+
+class MetadataStream(object):
+    r"""
+    Overview:
+        learner side of the metadata channel, one for each reading thread as the session is not thread safe
+    Interface:
+        __init__, fetch, close
+    """
+
+    def __init__(
+            self,
+            url_prefix: str,
+            learner_uid: int,
+            batch_size: int,
+            wait: float = 10.,
+            min_backoff: float = 0.05,
+            max_backoff: float = 2.
+    ) -> None:
+        r"""
+        Arguments:
+            - url_prefix (:obj:`str`): coordinator url prefix, e.g. 'http://127.0.0.1:8000/'
+            - learner_uid (:obj:`int`): the learner uid
+            - batch_size (:obj:`int`): trajectories in a batch
+            - wait (:obj:`float`): seconds the coordinator holds a request without data
+            - min_backoff (:obj:`float`): first sleep after an error or an empty result, doubled until max_backoff
+            - max_backoff (:obj:`float`): max sleep after errors or empty results
+        """
+        self._url_prefix = url_prefix
+        self._learner_uid = learner_uid
+        self._batch_size = batch_size
+        self._wait = wait
+        self._min_backoff = min_backoff
+        self._max_backoff = max_backoff
+        self._backoff = min_backoff
+        self._legacy = False
+        self._session = requests.Session()
+        self._session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self._logger = logging.getLogger('default_logger')
+
+    @property
+    def legacy(self) -> bool:
+        return self._legacy
+
+    def _sleep_backoff(self) -> None:
+        time.sleep(self._backoff)
+        self._backoff = min(self._backoff * 2, self._max_backoff)
+
+    def _post(self, api: str, d: dict, timeout: float) -> Optional[requests.Response]:
+        try:
+            return self._session.post(self._url_prefix + api, json=d, timeout=timeout)
+        except requests.RequestException:
+            self._logger.error("[error] api({}): {}".format(api, sys.exc_info()))
+            self._sleep_backoff()
+            return None
+
+    def fetch(self, credit: int) -> List[list]:
+        r"""
+        Overview:
+            get at most ``credit`` batches, blocks at most about ``wait`` seconds when the coordinator has no data
+        Arguments:
+            - credit (:obj:`int`): batches the caller has room for
+        Returns:
+            - batches (:obj:`List[list]`): list of batches, each one a list of metadata dicts, may be empty
+        """
+        assert credit >= 1, credit
+        if self._legacy:
+            return self._fetch_legacy()
+        d = {'learner_uid': self._learner_uid, 'batch_size': self._batch_size, 'credit': credit, 'wait': self._wait}
+        response = self._post(STREAM_API, d, timeout=self._wait + 10)
+        if response is None:
+            return []
+        if response.status_code == 404:
+            self._logger.info('coordinator has no {}, fall back to {}'.format(STREAM_API, LEGACY_API))
+            self._legacy = True
+            return self._fetch_legacy()
+        try:
+            result = response.json()
+        except ValueError:
+            result = None
+        if result is None or result['code'] != 0:
+            self._logger.error('[error] api({}): {}'.format(STREAM_API, response.text[:200]))
+            self._sleep_backoff()
+            return []
+        self._backoff = self._min_backoff
+        batches = result['info']
+        if len(batches) > credit:
+            self._logger.error('coordinator sent {} batches with credit {}'.format(len(batches), credit))
+        return batches
+
+    def _fetch_legacy(self) -> List[list]:
+        d = {'learner_uid': self._learner_uid, 'batch_size': self._batch_size}
+        response = self._post(LEGACY_API, d, timeout=self._wait + 10)
+        if response is None:
+            return []
+        try:
+            result = response.json()
+        except ValueError:
+            result = None
+        if result is not None and result['code'] == 0 and result['info'] is not None:
+            assert isinstance(result['info'], list)
+            self._backoff = self._min_backoff
+            return [result['info']]
+        self._sleep_backoff()
+        return []
+
+    def close(self) -> None:
+        self._session.close()
+
+
+class MetadataChannel(object):
+    r"""
+    Overview:
+        coordinator side of the metadata channel, holds the metadata of the trajectories ready for training and
+        answers the long-polling requests of learners
+    Interface:
+        __init__, put, get, __len__
+    """
+
+    def __init__(self) -> None:
+        self._pending = deque()
+        self._cond = threading.Condition()
+
+    def put(self, metadata: dict) -> None:
+        r"""
+        Overview:
+            add the metadata of a trajectory, wakes up a waiting learner when a batch is ready
+        """
+        with self._cond:
+            self._pending.append(metadata)
+            self._cond.notify_all()
+
+    def get(self, batch_size: int, credit: int = 1, wait: float = 0.) -> List[list]:
+        r"""
+        Overview:
+            get at most ``credit`` batches, waits at most ``wait`` seconds for the first one
+        Returns:
+            - batches (:obj:`List[list]`): list of batches, empty when timed out
+        """
+        deadline = time.time() + wait
+        with self._cond:
+            while len(self._pending) < batch_size:
+                remain = deadline - time.time()
+                if remain <= 0:
+                    return []
+                self._cond.wait(remain)
+            num = min(credit, len(self._pending) // batch_size)
+            return [[self._pending.popleft() for _ in range(batch_size)] for _ in range(num)]
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+
+class StubCoordinator(object):
+    r"""
+    Overview:
+        serve ``stream_metadata`` and ``ask_for_metadata`` of a ``MetadataChannel`` on localhost, the number of
+        requests of each api are counted
+    Interface:
+        __init__, start, close, url_prefix, channel, request_count
+    """
+
+    def __init__(self, channel: Optional[MetadataChannel] = None, stream: bool = True) -> None:
+        r"""
+        Arguments:
+            - channel (:obj:`MetadataChannel`): the channel to serve, a new one if None
+            - stream (:obj:`bool`): whether to serve ``stream_metadata``, or 404 as an old coordinator
+        """
+        self.channel = channel if channel is not None else MetadataChannel()
+        self.request_count = {STREAM_API: 0, LEGACY_API: 0}
+        self._stream = stream
+        coordinator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+
+            def do_POST(self):
+                d = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                api = self.path.lstrip('/')
+                if api == STREAM_API and coordinator._stream:
+                    coordinator.request_count[api] += 1
+                    info = coordinator.channel.get(d['batch_size'], d['credit'], d['wait'])
+                    self._reply(200, {'code': 0, 'info': info})
+                elif api == LEGACY_API:
+                    coordinator.request_count[api] += 1
+                    info = coordinator.channel.get(d['batch_size'])
+                    self._reply(200, {'code': 0, 'info': info[0] if info else None})
+                else:
+                    self._reply(404, {'code': 1, 'info': 'unknown api: {}'.format(api)})
+
+            def _reply(self, status, result):
+                data = json.dumps(result).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url_prefix(self) -> str:
+        return 'http://127.0.0.1:{}/'.format(self._server.server_address[1])
+
+    def start(self) -> 'StubCoordinator':
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
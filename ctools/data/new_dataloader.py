@@ -1,13 +1,9 @@
 import os
 import queue
-import sys
 import threading
 import time
-import traceback
-import logging
 from typing import Iterable, Callable, Optional, Any, Union
 
-import requests
 import torch
 import torch.multiprocessing as tm
 from ctools.torch_utils import to_device
@@ -16,54 +12,44 @@ from ctools.utils.file_helper import remove_file
 from ctools.utils.log_helper import TextLogger
 
 from .collate_fn import default_collate
+from .metadata_stream import MetadataStream
 
 
-def _read_data_loop(worker_queue, url_prefix, batch_size, learner_uid=0) -> None:
-    logger = logging.getLogger('default_logger')
-    api = 'coordinator/ask_for_metadata'
+def _read_data_loop(worker_queue, credits, url_prefix, batch_size, learner_uid=0, metadata_wait=10.) -> None:
+    # a credit is a free slot of worker_queue, the coordinator sends at most as many batches as the credits
+    stream = MetadataStream(url_prefix, learner_uid, batch_size, wait=metadata_wait)
     while True:
-        while worker_queue.full():  # make sure only last queue has cache data
-            time.sleep(0.1)
-        d = {'learner_uid': learner_uid, 'batch_size': batch_size}
-        while True:
-            t = time.time()
-            try:
-                result = requests.post(url_prefix + api, json=d).json()
-                if result is not None and result['code'] == 0:
-                    metadata = result['info']
-                    logger.info('ask for data cost time: {}'.format(time.time() - t))
-                    if metadata is not None:
-                        assert isinstance(metadata, list)
-                        data = [
-                            m['traj_id']
-                            for m in metadata
-                        ]
-                        break
-            except Exception as e:
-                logger.error(''.join(traceback.format_tb(e.__traceback__)))
-                logger.error("[error] api({}): {}".format(api, sys.exc_info()))
-                time.sleep(0.05)
-        worker_queue.put(data)
+        credits.acquire()
+        credit = 1
+        while credits.acquire(blocking=False):
+            credit += 1
+        batches = stream.fetch(credit)[:credit]
+        for metadata in batches:
+            worker_queue.put([m['traj_id'] for m in metadata])
+        for _ in range(credit - len(batches)):
+            credits.release()
 
 
 def _worker_loop(data_queue, collate_fn, path_traj, url_prefix, learner_uid, batch_size,num_workers,cur_batch,
-                 decompress_type='none', ) -> None:
+                 decompress_type='none', max_credit=3, metadata_wait=10.) -> None:
     logger = TextLogger(path='.log', name='data_loader_read_loop')
     torch.set_num_threads(4)
-    worker_queue = queue.Queue(maxsize=3)
+    worker_queue = queue.Queue()
+    credits = threading.Semaphore(max_credit)
     read_data_thread = threading.Thread(
-        target=_read_data_loop, args=(worker_queue, url_prefix, batch_size, learner_uid), daemon=True)
+        target=_read_data_loop,
+        args=(worker_queue, credits, url_prefix, batch_size, learner_uid, metadata_wait),
+        daemon=True
+    )
     read_data_thread.start()
     print('start read loop')
 
     decompressor = get_data_decompressor(decompress_type)
 
     while True:
-        if worker_queue.empty() or data_queue.full():
-            time.sleep(0.1)
-            continue
+        data = worker_queue.get()
+        credits.release()
         try:
-            data = worker_queue.get()
             load_t = time.time()
             for i in range(len(data)):
                 filename = data[i]
@@ -76,31 +62,125 @@ def _worker_loop(data_queue, collate_fn, path_traj, url_prefix, learner_uid, bat
             continue
         
         data = collate_fn(data)
-        while data_queue.full():
-            time.sleep(0.01)
         data_queue.put(data)
         with cur_batch.get_lock():
             cur_batch.value = (cur_batch.value + 1) % num_workers
 
 
-def _cuda_loop(cuda_queue, data_queue, device) -> None:
+class PinnedBuffer(object):
+    r"""
+    Overview:
+        Staging area for host to device copy. Each tensor of the nested data is copied into a (pinned) buffer
+        indexed by its path in the data, the buffer is reused across batches and only grows when a larger
+        tensor comes, so the pinned memory is allocated only a few times in the whole training.
     """
-            Overview:
-                Only when using cuda, would this be run as a thread through ``self.cuda_thread``.
-                Get data from ``self.async_train_queue``, change its device and put it into ``self.cuda_queue``
+
+    def __init__(self, pin_memory: bool = True) -> None:
+        self._pin_memory = pin_memory
+        self._cache = {}
+
+    def _get_buffer(self, key: tuple, item: torch.Tensor) -> torch.Tensor:
+        buf = self._cache.get(key)
+        if buf is None or buf.dtype != item.dtype or buf.numel() < item.numel():
+            buf = torch.empty(item.numel(), dtype=item.dtype, pin_memory=self._pin_memory)
+            self._cache[key] = buf
+        return buf[:item.numel()].view(item.shape)
+
+    def stage(self, item: Any, key: tuple = ()) -> Any:
+        if isinstance(item, torch.Tensor):
+            if item.is_cuda:
+                return item
+            buf = self._get_buffer(key, item)
+            buf.copy_(item)
+            return buf
+        elif isinstance(item, dict):
+            return {k: self.stage(v, key + (k, )) for k, v in item.items()}
+        elif isinstance(item, (list, tuple)) and not isinstance(item, str):
+            return [self.stage(v, key + (i, )) for i, v in enumerate(item)]
+        else:
+            return item
+
+
+class _DummyEvent(object):
+
+    def record(self, stream=None) -> None:
+        pass
+
+    def synchronize(self) -> None:
+        pass
+
+
+def _record_stream(item: Any, stream: Any) -> None:
+    if isinstance(item, torch.Tensor):
+        if item.is_cuda:
+            item.record_stream(stream)
+    elif isinstance(item, dict):
+        for v in item.values():
+            _record_stream(v, stream)
+    elif isinstance(item, (list, tuple)):
+        for v in item:
+            _record_stream(v, stream)
+
+
+class DevicePrefetcher(object):
+    r"""
+    Overview:
+        Move collated data to device in a background thread, at most ``prefetch_num`` batches are in flight.
+        With cuda, data is staged into reused pinned buffers and copied with ``non_blocking`` on a side stream,
+        the consumer stream waits on the copy event instead of the host, so the copy overlaps with training.
+        With cpu, the same pipeline runs without pinned memory, stream and event, which is used in test.
+    Interface:
+        __init__, start, get
     """
-    stream = torch.cuda.Stream(device=device)
-    with torch.cuda.stream(stream):
+
+    def __init__(self, data_queue: Any, device: Union[int, str, torch.device], prefetch_num: int = 2) -> None:
+        assert prefetch_num >= 1, prefetch_num
+        self._data_queue = data_queue
+        self._device = device
+        self._use_cuda = isinstance(device, int) or torch.device(device).type == 'cuda'
+        self._prefetch_num = prefetch_num
+        self._queue = queue.Queue(maxsize=prefetch_num)
+        # one staging buffer for each in flight batch, a buffer is reused only after its copy is done
+        self._buffers = [PinnedBuffer(pin_memory=True) for _ in range(prefetch_num)] if self._use_cuda else None
+        self._events = [_DummyEvent() for _ in range(prefetch_num)]
+        self._stream = torch.cuda.Stream(device=device) if self._use_cuda else None
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def start(self) -> 'DevicePrefetcher':
+        self._thread.start()
+        return self
+
+    def _transfer(self, data: Any, slot: int) -> Any:
+        if not self._use_cuda:
+            return to_device(data, self._device)
+        self._events[slot].synchronize()
+        data = self._buffers[slot].stage(data)
+        with torch.cuda.stream(self._stream):
+            data = to_device(data, self._device, non_blocking=True)
+            event = torch.cuda.Event()
+            event.record(self._stream)
+        self._events[slot] = event
+        return data
+
+    def _loop(self) -> None:
+        slot = 0
         while True:
-            
-            while data_queue.empty():
-                time.sleep(0.05)
-            data = data_queue.get()
-            while cuda_queue.full():
-                time.sleep(0.05)
-            t = time.time()
-            data = to_device(data, device)
-            cuda_queue.put(data)
+            data = self._data_queue.get()
+            data = self._transfer(data, slot)
+            self._queue.put((data, self._events[slot]))
+            slot = (slot + 1) % self._prefetch_num
+
+    def get(self) -> Any:
+        r"""
+        Overview:
+            Get the next batch on device, it is safe to be used in the current stream immediately
+        """
+        data, event = self._queue.get()
+        if self._use_cuda:
+            stream = torch.cuda.current_stream(self._device)
+            stream.wait_event(event)
+            _record_stream(data, stream)
+        return data
 
 
 class AsyncDataLoader(object):
@@ -118,6 +198,9 @@ class AsyncDataLoader(object):
             use_async_cuda=True,  # using aysnc cuda costs extra GPU memory
             max_reuse=0,
             decompress_type='none',
+            prefetch_num=2,  # batches in flight in async cuda, each one costs a batch of GPU and pinned memory
+            max_credit=3,  # batches a worker may ask the coordinator for ahead of loading them
+            metadata_wait=10.,  # seconds the coordinator holds a metadata request without data
     ) -> None:
         self.url_prefix = url_prefix
         self.path_traj = path_traj
@@ -131,6 +214,8 @@ class AsyncDataLoader(object):
         self.learner_uid = learner_uid
         self.cache_data = None
         self.decompress_type = decompress_type
+        self.max_credit = max_credit
+        self.metadata_wait = metadata_wait
 
         if collate_fn is None:
             self.collate_fn = default_collate
@@ -151,7 +236,7 @@ class AsyncDataLoader(object):
         self.cur_batch = mp_context_fork.Value('i', 0)
         if self.use_async:
             # self.queue_maxsize = self.num_workers
-            self.data_queue = tm.Queue(maxsize=self.num_workers * 2)
+            self.data_queue = mp_context_fork.Queue(maxsize=self.num_workers * 2)
 
             self.workers = [mp_context_fork.Process(target=_worker_loop,
                                                     args=(self.data_queue,
@@ -163,6 +248,8 @@ class AsyncDataLoader(object):
                                                           self.num_workers,
                                                           self.cur_batch,
                                                           self.decompress_type,
+                                                          self.max_credit,
+                                                          self.metadata_wait,
                                                           ),
                                                     daemon=True) for _ in
                             range(self.num_workers)]
@@ -170,13 +257,9 @@ class AsyncDataLoader(object):
                 w.start()
 
             # cuda thread
-            if self.use_async_cuda:
-                # the queue to store processed cuda data, user will get data from it if use cuda
-                self.cuda_queue = queue.Queue(maxsize=1)
-                self.cuda_thread = threading.Thread(target=_cuda_loop, args=(
-                    self.cuda_queue, self.data_queue, self.device,),
-                                                      daemon=True)
-                self.cuda_thread.start()
+            if self.use_cuda and self.use_async_cuda:
+                # user will get cuda data from the prefetcher
+                self.prefetcher = DevicePrefetcher(self.data_queue, self.device, prefetch_num).start()
             elif self.use_cuda:
                 self.stream = torch.cuda.Stream(device=self.device)
 
@@ -206,7 +289,7 @@ class AsyncDataLoader(object):
     def __next__(self) -> Any:
         """
         Overview:
-            Return next data in the iterator. If use cuda, get from ``self.cuda_queue``;
+            Return next data in the iterator. If use cuda, get from ``self.prefetcher``;
             Otherwise, get from ``self.async_train_queue``.
         Returns:
             - data (:obj:`torch.Tensor`): next data in the iterator
@@ -215,9 +298,8 @@ class AsyncDataLoader(object):
             if self.use_cuda:
                 if self.use_async_cuda:
                     if self.reuse_count == self.max_reuse:
-                        while self.cuda_queue.empty():
-                            time.sleep(0.01)
-                        self.cache_data = self.cuda_queue.get()
+                        self.cache_data = None  # release the last batch before the next one arrives
+                        self.cache_data = self.prefetcher.get()
                         self.reuse_count = 0
                     else:
                         self.reuse_count += 1
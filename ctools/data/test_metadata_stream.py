@@ -0,0 +1,90 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from ctools.data.metadata_stream import MetadataChannel, MetadataStream, StubCoordinator, STREAM_API, LEGACY_API
+from ctools.data.new_dataloader import _read_data_loop
+
+
+def put_trajs(channel, num, start=0):
+    for i in range(start, start + num):
+        channel.put({'traj_id': 'traj_{}'.format(i)})
+
+
+@pytest.mark.unittest
+class TestMetadataStream:
+
+    def test_channel(self):
+        channel = MetadataChannel()
+        put_trajs(channel, 5)
+        # credit limits the batches
+        batches = channel.get(batch_size=2, credit=1)
+        assert [[m['traj_id'] for m in b] for b in batches] == [['traj_0', 'traj_1']]
+        batches = channel.get(batch_size=2, credit=3)
+        assert len(batches) == 1 and len(channel) == 1
+        # timed out without a full batch
+        t = time.time()
+        assert channel.get(batch_size=2, credit=1, wait=0.2) == []
+        assert time.time() - t >= 0.2
+        # woken up by put
+        threading.Timer(0.1, put_trajs, args=(channel, 1, 5)).start()
+        t = time.time()
+        batches = channel.get(batch_size=2, credit=1, wait=5.)
+        assert time.time() - t < 2.
+        assert [m['traj_id'] for m in batches[0]] == ['traj_4', 'traj_5']
+
+    def test_long_poll(self):
+        coordinator = StubCoordinator().start()
+        stream = MetadataStream(coordinator.url_prefix, learner_uid=0, batch_size=2, wait=0.5)
+        try:
+            put_trajs(coordinator.channel, 6)
+            assert len(stream.fetch(credit=2)) == 2
+            assert len(stream.fetch(credit=2)) == 1
+            # an idle learner sends one request in each wait
+            t = time.time()
+            assert stream.fetch(credit=2) == []
+            assert time.time() - t >= 0.5
+            assert coordinator.request_count[STREAM_API] == 3
+            assert not stream.legacy
+        finally:
+            stream.close()
+            coordinator.close()
+
+    def test_legacy_fallback(self):
+        coordinator = StubCoordinator(stream=False).start()
+        stream = MetadataStream(coordinator.url_prefix, learner_uid=0, batch_size=2, min_backoff=0.01)
+        try:
+            put_trajs(coordinator.channel, 4)
+            assert len(stream.fetch(credit=2)) == 1
+            assert stream.legacy
+            assert len(stream.fetch(credit=2)) == 1
+            assert stream.fetch(credit=2) == []
+            assert coordinator.request_count[LEGACY_API] == 3
+        finally:
+            stream.close()
+            coordinator.close()
+
+    def test_read_data_loop_credit(self):
+        coordinator = StubCoordinator().start()
+        worker_queue = queue.Queue()
+        credits = threading.Semaphore(2)
+        thread = threading.Thread(
+            target=_read_data_loop,
+            args=(worker_queue, credits, coordinator.url_prefix, 2, 0, 0.2),
+            daemon=True
+        )
+        thread.start()
+        try:
+            put_trajs(coordinator.channel, 10)
+            time.sleep(0.5)
+            # no more batches than the credits
+            assert worker_queue.qsize() == 2
+            assert worker_queue.get() == ['traj_0', 'traj_1']
+            credits.release()
+            time.sleep(0.5)
+            assert worker_queue.qsize() == 2
+            assert len(coordinator.channel) == 4
+        finally:
+            coordinator.close()
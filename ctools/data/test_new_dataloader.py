@@ -0,0 +1,48 @@
+import queue
+
+import pytest
+import torch
+
+from ctools.data.new_dataloader import PinnedBuffer, DevicePrefetcher
+
+
+def get_data(n):
+    return {'obs': torch.randn(n, 4), 'action': [torch.randint(0, 5, (n, )), torch.randint(0, 5, (n, ))], 'step': n}
+
+
+@pytest.mark.unittest
+class TestDevicePrefetcher:
+
+    def test_pinned_buffer(self):
+        buffer = PinnedBuffer(pin_memory=False)
+        data = get_data(8)
+        staged = buffer.stage(data)
+        assert torch.equal(staged['obs'], data['obs'])
+        assert torch.equal(staged['action'][1], data['action'][1])
+        assert staged['step'] == 8
+        ptr = staged['obs'].data_ptr()
+        # smaller data reuses the buffer
+        data = get_data(4)
+        staged = buffer.stage(data)
+        assert staged['obs'].data_ptr() == ptr
+        assert staged['obs'].shape == (4, 4)
+        assert torch.equal(staged['obs'], data['obs'])
+        # larger data grows the buffer
+        data = get_data(16)
+        staged = buffer.stage(data)
+        assert torch.equal(staged['obs'], data['obs'])
+
+    @pytest.mark.parametrize('prefetch_num', [1, 3])
+    def test_prefetch(self, prefetch_num):
+        data_queue = queue.Queue(maxsize=4)
+        prefetcher = DevicePrefetcher(data_queue, 'cpu', prefetch_num).start()
+        data = [get_data(i + 1) for i in range(10)]
+        for d in data[:4]:
+            data_queue.put(d)
+        for i, d in enumerate(data):
+            if i + 4 < len(data):
+                data_queue.put(data[i + 4])
+            output = prefetcher.get()
+            assert output['step'] == d['step']
+            assert torch.equal(output['obs'], d['obs'])
+            assert torch.equal(output['action'][0], d['action'][0])
@@ -0,0 +1,86 @@
+#!/usr/bin/python
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmark sequential vs pipelined requests per step against a fake SC2."""
+
+import time
+
+from absl import app
+from absl import flags
+
+from ctools.pysc2.lib import fake_sc2_server
+from ctools.pysc2.lib import remote_controller
+
+from s2clientprotocol import raw_pb2 as sc_raw
+from s2clientprotocol import sc2api_pb2 as sc_pb
+
+
+flags.DEFINE_integer("count", 500, "How many steps to run.")
+flags.DEFINE_integer("step_mul", 8, "How many game steps per observation.")
+flags.DEFINE_float("latency_ms", 0.5, "One way latency of each message.")
+flags.DEFINE_float("process_ms", 0., "Processing time of each step request.")
+flags.DEFINE_integer("obs_kb", 64, "Size of each observation.")
+flags.DEFINE_integer("actions", 1, "Actions sent each step.")
+FLAGS = flags.FLAGS
+
+
+def _actions():
+  return [sc_pb.Action(action_raw=sc_raw.ActionRaw(
+      unit_command=sc_raw.ActionRawUnitCommand(ability_id=1, unit_tags=[1])))
+          for _ in range(FLAGS.actions)]
+
+
+def sequential(controller):
+  """The former per step requests: action, step, observation and game_info."""
+  acts = _actions()
+  if acts:
+    controller.actions(sc_pb.RequestAction(actions=acts))
+  controller.step(FLAGS.step_mul)
+  controller.observe()
+  controller.game_info()
+
+
+def sequential_cached(controller):
+  """Same as the former one, with game_info cached per episode."""
+  controller.acts(_actions())
+  controller.step(FLAGS.step_mul)
+  controller.observe()
+
+
+def pipelined(controller):
+  controller.act_step_observe(_actions(), count=FLAGS.step_mul)
+
+
+def main(unused_argv):
+  with fake_sc2_server.FakeSC2Server(
+      latency=FLAGS.latency_ms / 1000., process_time=FLAGS.process_ms / 1000.,
+      obs_bytes=FLAGS.obs_kb * 1024) as server:
+    controller = remote_controller.RemoteController(
+        "127.0.0.1", server.port, timeout_seconds=10)
+    controller.create_game(sc_pb.RequestCreateGame())
+    controller.join_game(sc_pb.RequestJoinGame())
+    print("latency: %.2fms, process: %.2fms, observation: %dKB" % (
+        FLAGS.latency_ms, FLAGS.process_ms, FLAGS.obs_kb))
+    for fn in [sequential, sequential_cached, pipelined]:
+      start = time.time()
+      for _ in range(FLAGS.count):
+        fn(controller)
+      elapsed = time.time() - start
+      print("%-20s %8.3f ms/step %8.1f steps/s" % (
+          fn.__name__, 1000 * elapsed / FLAGS.count, FLAGS.count / elapsed))
+    controller.quit()
+
+
+if __name__ == "__main__":
+  app.run(main)
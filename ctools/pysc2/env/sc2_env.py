@@ -28,8 +28,10 @@ from ctools.pysc2.lib import actions as actions_lib
 from ctools.pysc2.lib import features
 from ctools.pysc2.lib import metrics
 from ctools.pysc2.lib import portspicker
+from ctools.pysc2.lib import protocol
 from ctools.pysc2.lib import renderer_human
 from ctools.pysc2.lib import run_parallel
+from ctools.pysc2.lib import static_data
 from ctools.pysc2.lib import stopwatch
 
 from s2clientprotocol import common_pb2 as sc_common
@@ -37,6 +39,29 @@ from s2clientprotocol import sc2api_pb2 as sc_pb
 
 sw = stopwatch.sw
 
+# Static data(ResponseData and the StaticData tables built from it) only depends on the game build, so it is
+# shared by all the envs in the process and kept across episodes, keyed by build version.
+_static_data_cache = {}
+
+
+def get_static_data_cache(build_version, controller):
+    """Return the cached {'data_raw', 'static_data'} of the build, fetch it from the controller if missing."""
+    if build_version not in _static_data_cache:
+        data_raw = controller.data_raw()
+        _static_data_cache[build_version] = {
+            'data_raw': data_raw,
+            'static_data': static_data.StaticData(data_raw),
+        }
+    return _static_data_cache[build_version]
+
+
+def clear_static_data_cache(build_version=None):
+    """Drop the cached static data of one build, or of all the builds if build_version is None."""
+    if build_version is None:
+        _static_data_cache.clear()
+    else:
+        _static_data_cache.pop(build_version, None)
+
 possible_results = {
     sc_pb.Victory: 1,
     sc_pb.Defeat: -1,
@@ -141,7 +166,9 @@ class SC2Env(environment.Base):
                  random_seed=None,
                  disable_fog=False,
                  ensure_available_actions=True,
-                 version=None):
+                 version=None,
+                 pipeline_requests=False,
+                 process_pool=None):
         """Create a SC2 Env.
 
         You must pass a resolution that you want to play at. You can send either
@@ -194,6 +221,11 @@ class SC2Env(environment.Base):
           ensure_available_actions: Whether to throw an exception when an
               unavailable action is passed to step().
           version: The version of SC2 to use, defaults to the latest.
+          pipeline_requests: Whether to send the action, step and observation
+              requests of a step back to back in one round-trip per controller,
+              only used when not realtime and there is no delayed action.
+          process_pool: An optional `StarcraftProcessPool`, warm SC2 processes are
+              leased from it instead of launched, and given back on close.
 
         Raises:
           ValueError: if no map is specified.
@@ -257,10 +289,14 @@ class SC2Env(environment.Base):
         self._default_score_multiplier = score_multiplier
         self._default_episode_length = game_steps_per_episode
         self._version = version
+        self._pipeline_requests = pipeline_requests
+        self._process_pool = process_pool
+        self._leases = None
 
         self._run_config = run_configs.get(version=version)
         self._parallel = run_parallel.RunParallel()  # Needed for multiplayer.
         self._game_info = None
+        self._game_info_valid = False
 
         if agent_interface_format is None:
             raise ValueError("Please specify agent_interface_format.")
@@ -297,9 +333,7 @@ class SC2Env(environment.Base):
 
         if visualize:
             self._renderer_human = renderer_human.RendererHuman()
-            self._renderer_human.init(
-                self._controllers[0].game_info(),
-                self._controllers[0].data())
+            self._renderer_human.init(self._game_info[0], self.static_data())
         else:
             self._renderer_human = None
 
@@ -354,10 +388,15 @@ class SC2Env(environment.Base):
             self._ports = []
 
         # Actually launch the game processes.
-        self._sc2_procs = [
-            self._run_config.start(extra_ports=self._ports,
-                                   want_rgb=interface.HasField("render"))
-            for interface in self._interface_options]
+        if self._process_pool is not None:
+            self._leases = [self._process_pool.lease(1, want_rgb=interface.HasField("render"))
+                            for interface in self._interface_options]
+            self._sc2_procs = [lease.procs[0] for lease in self._leases]
+        else:
+            self._sc2_procs = [
+                self._run_config.start(extra_ports=self._ports,
+                                       want_rgb=interface.HasField("render"))
+                for interface in self._interface_options]
         self._controllers = [p.controller for p in self._sc2_procs]
 
         if self._battle_net_map:
@@ -440,6 +479,7 @@ class SC2Env(environment.Base):
                            for c, join in zip(self._controllers, join_reqs))
 
         self._game_info = self._parallel.run(c.game_info for c in self._controllers)
+        self._game_info_valid = True
         for g, interface in zip(self._game_info, self._interface_options):
             if g.options.render != interface.render:
                 logging.warning(
@@ -463,8 +503,24 @@ class SC2Env(environment.Base):
         """A list of ResponseGameInfo, one per agent."""
         return self._game_info
 
+    def invalidate_game_info(self):
+        """Fetch game_info again on the next observation instead of using the one cached for this episode."""
+        self._game_info_valid = False
+
+    def _episode_game_info(self):
+        """game_info doesn't change within a game, it is fetched once per episode unless invalidated."""
+        if not self._game_info_valid:
+            self._game_info = self._parallel.run(c.game_info for c in self._controllers)
+            self._game_info_valid = True
+        return self._game_info
+
+    def data_raw(self):
+        """ResponseData of the running build, cached across episodes."""
+        return get_static_data_cache(self._run_config.version.build_version, self._controllers[0])['data_raw']
+
     def static_data(self):
-        return self._controllers[0].data()
+        """StaticData of the running build, cached across episodes."""
+        return get_static_data_cache(self._run_config.version.build_version, self._controllers[0])['static_data']
 
     def observation_spec(self):
         """Look at Features for full specs."""
@@ -495,6 +551,7 @@ class SC2Env(environment.Base):
                 len(self._maps) == 1):
             # Need to support restart for fast-restart of mini-games.
             self._controllers[0].restart()
+            self.invalidate_game_info()
         else:
             if len(self._controllers) > 1:
                 self._parallel.run(c.leave for c in self._controllers)
@@ -551,6 +608,8 @@ class SC2Env(environment.Base):
 
         if not self._realtime:
             actions = self._apply_action_delays(actions)
+            if self._pipeline_requests and not any(self._delayed_actions):
+                return self._pipelined_step(actions, step_mul)
 
         funcs_with_args = []
         for c, f, o, a in zip(self._controllers, self._features, self._obs, actions):
@@ -562,6 +621,17 @@ class SC2Env(environment.Base):
 
         action_result = self._parallel.run(funcs_with_args)
         # assert len(action_result) == self._num_agents
+        results = self._action_results(action_result)
+
+        # TODO merge fix(sc_pb.RequestAction(actions=a))
+        # self._parallel.run((c.actions, sc_pb.RequestAction(actions=a))
+        #                   for c, a in zip(self._controllers, actions))
+
+        self._state = environment.StepType.MID
+        return self._step(step_mul), results
+
+    @staticmethod
+    def _action_results(action_result):
         results = []
         for item in action_result:
             if item is None:
@@ -572,13 +642,26 @@ class SC2Env(environment.Base):
                     results.append(1)
                 else:
                     results.append(sum([j == 1 for j in result]) >= 1)
+        return results
 
-        # TODO merge fix(sc_pb.RequestAction(actions=a))
-        # self._parallel.run((c.actions, sc_pb.RequestAction(actions=a))
-        #                   for c, a in zip(self._controllers, actions))
+    def _pipelined_step(self, actions, step_mul=None):
+        """Act, step and observe with one pipelined round-trip per controller."""
+        step_mul = step_mul or self._step_mul
+        if step_mul <= 0:
+            raise ValueError("step_mul should be positive, got {}".format(step_mul))
+        target_game_loop = self._episode_steps + step_mul
 
+        # Transform in the thread so it runs while waiting for other observations.
+        def parallel_act_step_observe(c, f, a):
+            action_result, obs = c.act_step_observe(a, count=step_mul, target_game_loop=target_game_loop)
+            return action_result, obs, f.transform_obs(obs)
+
+        with self._metrics.measure_step_time(step_mul):
+            action_result, obs, agent_obs = zip(*self._parallel.run(
+                (parallel_act_step_observe, c, f, a)
+                for c, f, a in zip(self._controllers, self._features, actions)))
         self._state = environment.StepType.MID
-        return self._step(step_mul), results
+        return self._observe(target_game_loop, observations=(obs, agent_obs)), self._action_results(action_result)
 
     def _step(self, step_mul=None):
         step_mul = step_mul or self._step_mul
@@ -658,17 +741,20 @@ class SC2Env(environment.Base):
                 if not self._controllers[0].status_ended:  # May already have ended.
                     self._parallel.run((c.step, step_mul) for c in self._controllers)
 
-    def _get_observations(self, target_game_loop):
+    def _get_observations(self, target_game_loop, observations=None):
         # Transform in the thread so it runs while waiting for other observations.
         def parallel_observe(c, f):
             obs = c.observe(target_game_loop=target_game_loop)
             agent_obs = f.transform_obs(obs)
             return obs, agent_obs
 
-        with self._metrics.measure_observation_time():
-            self._obs, self._agent_obs = zip(*self._parallel.run(
-                (parallel_observe, c, f)
-                for c, f in zip(self._controllers, self._features)))
+        if observations is not None:  # already observed in the pipelined step
+            self._obs, self._agent_obs = observations
+        else:
+            with self._metrics.measure_observation_time():
+                self._obs, self._agent_obs = zip(*self._parallel.run(
+                    (parallel_observe, c, f)
+                    for c, f in zip(self._controllers, self._features)))
 
         game_loop = self._agent_obs[0].game_loop[0]
         if (game_loop < target_game_loop and
@@ -699,8 +785,8 @@ class SC2Env(environment.Base):
                                 break
             self._last_obs_game_loop = game_loop
 
-    def _observe(self, target_game_loop):
-        self._get_observations(target_game_loop)
+    def _observe(self, target_game_loop, observations=None):
+        self._get_observations(target_game_loop, observations)
         game_info = [None for c in self._controllers]
 
         # TODO(tewalds): How should we handle more than 2 agents and the case where
@@ -718,7 +804,7 @@ class SC2Env(environment.Base):
                     if result.player_id == player_id:
                         outcome[i] = possible_results.get(result.result, 0)
         else:
-            game_info = self._parallel.run(c.game_info for c in self._controllers)
+            game_info = self._episode_game_info()
 
         if self._score_index >= 0:  # Game score, not win/loss reward.
             cur_score = [o["score_cumulative"][self._score_index]
@@ -790,7 +876,14 @@ class SC2Env(environment.Base):
     def state(self):
         return self._state
 
-    def close(self):
+    def close(self, discard=False):
+        """Close the env, pooled processes are given back unless `discard`.
+
+        Args:
+          discard: Whether to close the pooled processes instead of giving them
+              back, for the processes that just failed a game, which may still
+              answer the health check.
+        """
         logging.info("Environment Close")
         if hasattr(self, "_metrics") and self._metrics:
             self._metrics.close()
@@ -799,6 +892,21 @@ class SC2Env(environment.Base):
             self._renderer_human.close()
             self._renderer_human = None
 
+        if getattr(self, "_leases", None):
+            # Keep the processes for the next env, leave the multiplayer game so they can create a new one.
+            if len(self._controllers) > 1 and not discard:
+                for c in self._controllers:
+                    try:
+                        if c.status in (protocol.Status.in_game, protocol.Status.ended):
+                            c.leave()
+                    except Exception as e:  # pylint: disable=broad-except
+                        logging.warning("Failed to leave the game: %s", e)
+            for lease in self._leases:
+                lease.release(discard=discard)
+            self._leases = None
+            self._controllers = None
+            self._sc2_procs = None
+
         # Don't use parallel since it might be broken by an exception.
         if hasattr(self, "_controllers") and self._controllers:
             for c in self._controllers:
@@ -814,6 +922,7 @@ class SC2Env(environment.Base):
             self._ports = None
 
         self._game_info = None
+        self._game_info_valid = False
         logging.info(sw)
 
     @property
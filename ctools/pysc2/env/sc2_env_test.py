@@ -14,10 +14,16 @@
 # limitations under the License.
 """Test for sc2_env."""
 
+import types
+
 from absl.testing import absltest
 from absl.testing import parameterized
 
 from ctools.pysc2.env import sc2_env
+from ctools.pysc2.lib import run_parallel
+from ctools.pysc2.lib import static_data
+
+from s2clientprotocol import sc2api_pb2 as sc_pb
 
 
 class TestNameCroppingAndDeduplication(parameterized.TestCase):
@@ -49,5 +55,122 @@ class TestNameCroppingAndDeduplication(parameterized.TestCase):
     self.assertEqual(sc2_env.crop_and_deduplicate_names(names), expected_output)
 
 
+
+class _FakeController(object):
+  """Counts the data_raw and game_info requests."""
+
+  def __init__(self):
+    self.data_raw_count = 0
+    self.game_info_count = 0
+    self._map_path = None
+
+  def data_raw(self):
+    self.data_raw_count += 1
+    return sc_pb.ResponseData()
+
+  def game_info(self):
+    self.game_info_count += 1
+    return sc_pb.ResponseGameInfo(local_map_path=self._map_path)
+
+  def create_game(self, create):
+    self._map_path = create.local_map.map_path
+
+  def join_game(self, join):
+    pass
+
+
+class _FakeMap(object):
+  step_mul = 8
+  score_index = None
+  score_multiplier = None
+  game_steps_per_episode = 0
+  battle_net = None
+
+  def __init__(self, name):
+    self.name = name
+    self.path = name + ".SC2Map"
+
+  def data(self, run_config):
+    del run_config
+    return b""
+
+
+def _bare_env(build_version, map_name="A"):
+  # A SC2Env on a fake controller, with what _create_join needs.
+  env = object.__new__(sc2_env.SC2Env)
+  env._run_config = types.SimpleNamespace(
+      version=types.SimpleNamespace(build_version=build_version))
+  env._controllers = [_FakeController()]
+  env._parallel = run_parallel.RunParallel()
+  env._game_info = None
+  env._game_info_valid = False
+  env._maps = [_FakeMap(map_name)]
+  env._num_agents = 1
+  env._players = [sc2_env.Agent(sc2_env.Race.zerg)]
+  env._interface_options = [sc_pb.InterfaceOptions(raw=True)]
+  env._ports = []
+  env._battle_net_map = False
+  env._disable_fog = False
+  env._realtime = False
+  env._random_seed = None
+  env._default_step_mul = None
+  env._default_score_index = None
+  env._default_score_multiplier = None
+  env._default_episode_length = None
+  return env
+
+
+class StaticDataCacheTest(absltest.TestCase):
+
+  def setUp(self):
+    super(StaticDataCacheTest, self).setUp()
+    sc2_env.clear_static_data_cache()
+
+  def tearDown(self):
+    sc2_env.clear_static_data_cache()
+    super(StaticDataCacheTest, self).tearDown()
+
+  def test_game_info_per_episode(self):
+    env = _bare_env(1)
+    controller = env._controllers[0]
+    env._create_join(require_features=False)
+    self.assertEqual(controller.game_info_count, 1)
+    for _ in range(3):
+      self.assertEqual(env._episode_game_info()[0].local_map_path, "A.SC2Map")
+    self.assertEqual(controller.game_info_count, 1)
+    # A restarted game may differ, it is fetched again.
+    env.invalidate_game_info()
+    env._episode_game_info()
+    env._episode_game_info()
+    self.assertEqual(controller.game_info_count, 2)
+    # A new game on another map fetches its own.
+    env._maps = [_FakeMap("B")]
+    env._create_join(require_features=False)
+    self.assertEqual(controller.game_info_count, 3)
+    self.assertEqual(env._episode_game_info()[0].local_map_path, "B.SC2Map")
+    self.assertEqual(controller.game_info_count, 3)
+
+  def test_static_data_per_build(self):
+    env = _bare_env(1)
+    for _ in range(3):  # episodes
+      env._create_join(require_features=False)
+      env.data_raw()
+      self.assertIsInstance(env.static_data(), static_data.StaticData)
+    self.assertEqual(env._controllers[0].data_raw_count, 1)
+    # Shared by the envs of the same build in the process.
+    same_build = _bare_env(1)
+    self.assertIs(same_build.static_data(), env.static_data())
+    self.assertEqual(same_build._controllers[0].data_raw_count, 0)
+    other_build = _bare_env(2)
+    self.assertIsNot(other_build.static_data(), env.static_data())
+    self.assertEqual(other_build._controllers[0].data_raw_count, 1)
+    # Fetched again after the build is cleared, the others are kept.
+    sc2_env.clear_static_data_cache(1)
+    env.data_raw()
+    other_build.data_raw()
+    self.assertEqual(env._controllers[0].data_raw_count, 2)
+    self.assertEqual(other_build._controllers[0].data_raw_count, 1)
+
+
 if __name__ == "__main__":
   absltest.main()
@@ -24,6 +24,7 @@ import enum
 from ctools.pysc2 import maps
 from ctools.pysc2 import run_configs
 from ctools.pysc2.env import environment
+from ctools.pysc2.env.sc2_env import get_static_data_cache
 from ctools.pysc2.lib import actions as actions_lib
 from ctools.pysc2.lib import features
 from ctools.pysc2.lib import metrics
@@ -256,6 +257,7 @@ class SC2EVALEnv(environment.Base):
         self._run_config = run_configs.get(version=version)
         self._parallel = run_parallel.RunParallel()  # Needed for multiplayer.
         self._game_info = None
+        self._game_info_valid = False
 
         if agent_interface_format is None:
             raise ValueError("Please specify agent_interface_format.")
@@ -292,9 +294,7 @@ class SC2EVALEnv(environment.Base):
 
         if visualize:
             self._renderer_human = renderer_human.RendererHuman()
-            self._renderer_human.init(
-                self._controllers[0].game_info(),
-                self._controllers[0].data())
+            self._renderer_human.init(self._game_info[0], self.static_data())
         else:
             self._renderer_human = None
 
@@ -446,6 +446,7 @@ class SC2EVALEnv(environment.Base):
                            for c, join in zip(self._controllers, join_reqs))
 
         self._game_info = self._parallel.run(c.game_info for c in self._controllers)
+        self._game_info_valid = True
         for g, interface in zip(self._game_info, self._interface_options):
             if g.options.render != interface.render:
                 logging.warning(
@@ -469,8 +470,17 @@ class SC2EVALEnv(environment.Base):
         """A list of ResponseGameInfo, one per agent."""
         return self._game_info
 
+    def invalidate_game_info(self):
+        """Fetch game_info again on the next observation instead of using the one cached for this episode."""
+        self._game_info_valid = False
+
+    def data_raw(self):
+        """ResponseData of the running build, cached across episodes."""
+        return get_static_data_cache(self._run_config.version.build_version, self._controllers[0])['data_raw']
+
     def static_data(self):
-        return self._controllers[0].data()
+        """StaticData of the running build, cached across episodes."""
+        return get_static_data_cache(self._run_config.version.build_version, self._controllers[0])['static_data']
 
     def observation_spec(self):
         """Look at Features for full specs."""
@@ -501,6 +511,7 @@ class SC2EVALEnv(environment.Base):
                 len(self._maps) == 1):
             # Need to support restart for fast-restart of mini-games.
             self._controllers[0].restart()
+            self.invalidate_game_info()
         else:
             if len(self._controllers) > 1:
                 self._parallel.run(c.leave for c in self._controllers)
@@ -731,7 +742,11 @@ class SC2EVALEnv(environment.Base):
                     if result.player_id == player_id:
                         outcome[i] = possible_results.get(result.result, 0)
         else:
-            game_info = self._parallel.run(c.game_info for c in self._controllers)
+            # game_info doesn't change within a game, it is fetched once per episode unless invalidated
+            if not self._game_info_valid:
+                self._game_info = self._parallel.run(c.game_info for c in self._controllers)
+                self._game_info_valid = True
+            game_info = self._game_info
 
         if self._score_index >= 0:  # Game score, not win/loss reward.
             cur_score = [o["score_cumulative"][self._score_index]
@@ -827,6 +842,7 @@ class SC2EVALEnv(environment.Base):
             self._ports = None
 
         self._game_info = None
+        self._game_info_valid = False
         logging.info(sw)
 
     @property
@@ -0,0 +1,266 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A local stand-in for the SC2 websocket api, used to test and benchmark the protocol.
+
+It speaks the sc2api proto over a minimal websocket server(stdlib only), answers
+requests in order like SC2 does, and simulates the network latency of each
+message and the processing time of each request.
+"""
+
+import base64
+import hashlib
+import queue
+import socket
+import struct
+import threading
+import time
+
+from ctools.pysc2.lib import remote_controller
+
+from s2clientprotocol import error_pb2 as sc_error
+from s2clientprotocol import sc2api_pb2 as sc_pb
+
+_WS_MAGIC = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def _recv_exact(conn, n):
+  data = b""
+  while len(data) < n:
+    chunk = conn.recv(n - len(data))
+    if not chunk:
+      raise EOFError("Connection closed.")
+    data += chunk
+  return data
+
+
+def _recv_frame(conn):
+  """Read one websocket frame, return (fin, opcode, payload)."""
+  b0, b1 = struct.unpack("!BB", _recv_exact(conn, 2))
+  fin, opcode = b0 & 0x80, b0 & 0x0f
+  length = b1 & 0x7f
+  if length == 126:
+    length = struct.unpack("!H", _recv_exact(conn, 2))[0]
+  elif length == 127:
+    length = struct.unpack("!Q", _recv_exact(conn, 8))[0]
+  mask = _recv_exact(conn, 4) if b1 & 0x80 else None
+  payload = _recv_exact(conn, length)
+  if mask:
+    payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+  return fin, opcode, payload
+
+
+def _send_frame(conn, payload, opcode=0x2):
+  header = struct.pack("!B", 0x80 | opcode)
+  length = len(payload)
+  if length < 126:
+    header += struct.pack("!B", length)
+  elif length < 2**16:
+    header += struct.pack("!BH", 126, length)
+  else:
+    header += struct.pack("!BQ", 127, length)
+  conn.sendall(header + payload)
+
+
+def _handshake(conn):
+  request = b""
+  while b"\r\n\r\n" not in request:
+    chunk = conn.recv(4096)
+    if not chunk:
+      raise EOFError("Connection closed during handshake.")
+    request += chunk
+  headers = {}
+  for line in request.split(b"\r\n")[1:]:
+    if b":" in line:
+      k, v = line.split(b":", 1)
+      headers[k.strip().lower()] = v.strip()
+  accept = base64.b64encode(
+      hashlib.sha1(headers[b"sec-websocket-key"] + _WS_MAGIC).digest())
+  conn.sendall(b"HTTP/1.1 101 Switching Protocols\r\n"
+               b"Upgrade: websocket\r\nConnection: Upgrade\r\n"
+               b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+
+
+class FakeSC2Server(object):
+  """Serve the sc2api on localhost for a single connection at a time.
+
+  Args:
+    latency: one way network latency in seconds, applied to each response
+        without blocking the following requests.
+    process_time: seconds to process a step request, requests are processed
+        sequentially like SC2.
+    obs_bytes: size of the fake render data put into each observation.
+    error_requests: names of the requests answered with an error.
+  """
+
+  def __init__(self, latency=0., process_time=0., obs_bytes=0,
+               error_requests=()):
+    self.latency = latency
+    self.process_time = process_time
+    self.obs_bytes = obs_bytes
+    self.error_requests = set(error_requests)
+    self.game_loop = 0
+    self.status = sc_pb.launched
+    self.request_count = 0
+    self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    self._sock.bind(("127.0.0.1", 0))
+    self._sock.listen(1)
+    self.port = self._sock.getsockname()[1]
+    self._thread = threading.Thread(target=self._serve, daemon=True)
+    self._thread.start()
+
+  def close(self):
+    self._sock.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exception_type, exception_value, traceback):
+    self.close()
+
+  def _serve(self):
+    while True:
+      try:
+        conn, _ = self._sock.accept()
+      except OSError:
+        return
+      conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+      try:
+        _handshake(conn)
+        self._handle(conn)
+      except (EOFError, OSError):
+        pass
+      finally:
+        conn.close()
+
+  def _handle(self, conn):
+    """Read and answer requests in order, responses are sent by a writer."""
+    outbox = queue.Queue()
+    writer = threading.Thread(target=self._write_loop, args=(conn, outbox),
+                              daemon=True)
+    writer.start()
+    try:
+      message = b""
+      while True:
+        fin, opcode, payload = _recv_frame(conn)
+        if opcode == 0x8:  # close
+          return
+        elif opcode == 0x9:  # ping
+          outbox.put((0., payload, 0xA))
+          continue
+        message += payload
+        if not fin:
+          continue
+        request = sc_pb.Request.FromString(message)
+        message = b""
+        response = self._respond(request)
+        if response is None:  # quit
+          return
+        outbox.put((time.time() + self.latency, response.SerializeToString(),
+                    0x2))
+    finally:
+      outbox.put(None)
+      writer.join()
+
+  def _write_loop(self, conn, outbox):
+    while True:
+      item = outbox.get()
+      if item is None:
+        return
+      send_time, payload, opcode = item
+      delay = send_time - time.time()
+      if delay > 0:
+        time.sleep(delay)
+      try:
+        _send_frame(conn, payload, opcode)
+      except OSError:
+        return
+
+  def _respond(self, request):
+    """Build the Response of a Request, the same id is echoed."""
+    self.request_count += 1
+    name = request.WhichOneof("request")
+    if name == "quit":
+      return None
+    response = sc_pb.Response(id=request.id)
+    getattr(response, name).SetInParent()
+    if name in self.error_requests:
+      response.error.append("Fake error in %s." % name)
+    elif name == "create_game":
+      self.status = sc_pb.init_game
+    elif name == "join_game":
+      self.status = sc_pb.in_game
+      self.game_loop = 0
+      response.join_game.player_id = 1
+    elif name == "restart_game":
+      self.status = sc_pb.in_game
+      self.game_loop = 0
+    elif name == "leave_game":
+      self.status = sc_pb.launched
+    elif name == "step":
+      if self.process_time:
+        time.sleep(self.process_time)
+      self.game_loop += request.step.count
+      response.step.simulation_loop = self.game_loop
+    elif name == "action":
+      response.action.result.extend(
+          [sc_error.Success] * len(request.action.actions))
+    elif name == "observation":
+      response.observation.observation.game_loop = self.game_loop
+      if self.obs_bytes:
+        response.observation.observation.render_data.map.data = (
+            b"\0" * self.obs_bytes)
+    elif name == "game_info":
+      response.game_info.map_name = "FakeMap"
+    elif name == "ping":
+      response.ping.game_version = "fake"
+    response.status = self.status
+    return response
+
+
+class FakeStarcraftProcess(object):
+  """A mock of `sc_process.StarcraftProcess` backed by a FakeSC2Server.
+
+  It has the same `controller`, `running` and `close` interface, so it can be
+  used as the launcher of a process pool in tests.
+  """
+
+  def __init__(self, **server_kwargs):
+    self._server = FakeSC2Server(**server_kwargs)
+    self._running = True
+    self._controller = remote_controller.RemoteController(
+        "127.0.0.1", self._server.port, timeout_seconds=10)
+
+  @property
+  def controller(self):
+    return self._controller
+
+  @property
+  def server(self):
+    return self._server
+
+  @property
+  def running(self):
+    return self._running
+
+  def kill(self):
+    """Simulate a crash, the controller is left connected to nothing."""
+    self._running = False
+    self._server.close()
+
+  def close(self):
+    if self._controller:
+      self._controller.quit()
+      self._controller = None
+    self.kill()
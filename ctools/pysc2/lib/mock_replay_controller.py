@@ -0,0 +1,183 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Record the protos of a replay and play them back without SC2.
+
+A recording holds the ResponseReplayInfo of a replay, and for each recorded
+player the ResponseGameInfo and the ResponseObservations seen while stepping
+through the replay. The recording is serialized into bytes that take the place
+of the replay data, so code written against `RemoteController` can run offline
+with a `MockReplayController`.
+"""
+
+import copy
+import pickle
+
+from absl import logging
+from ctools.pysc2.lib import protocol
+
+from s2clientprotocol import sc2api_pb2 as sc_pb
+
+Status = protocol.Status
+
+_RECORDING_VERSION = 1
+
+
+def record_replay(controller, replay_data, player_ids=(1, 2), interface=None,
+                  step_mul=1, map_data=None, max_game_loops=0):
+  """Step through a replay and record the protos the controller responded.
+
+  Args:
+    controller: a `RemoteController` of a running SC2.
+    replay_data: the replay file content.
+    player_ids: the players to observe.
+    interface: a `sc_pb.InterfaceOptions`, raw only by default.
+    step_mul: game loops between two recorded observations.
+    map_data: the map file content, if it isn't available to SC2.
+    max_game_loops: stop recording after this many game loops, 0 means the
+        whole replay.
+
+  Returns:
+    The recording as bytes, pass them to `MockReplayController` in place of
+    the replay data.
+  """
+  if interface is None:
+    interface = sc_pb.InterfaceOptions(raw=True)
+  info = controller.replay_info(replay_data)
+  recording = {
+      "version": _RECORDING_VERSION,
+      "replay_info": info.SerializeToString(),
+      "players": {},
+  }
+  for player_id in player_ids:
+    controller.start_replay(sc_pb.RequestStartReplay(
+        replay_data=replay_data, map_data=map_data, options=interface,
+        observed_player_id=player_id))
+    game_info = controller.game_info()
+    observations = []
+    while True:
+      obs = controller.observe()
+      observations.append(obs.SerializeToString())
+      if obs.player_result or (
+          max_game_loops and obs.observation.game_loop >= max_game_loops):
+        break
+      controller.step(step_mul)
+    recording["players"][player_id] = {
+        "game_info": game_info.SerializeToString(),
+        "observations": observations,
+    }
+    logging.info("Recorded %s observations of player %s.",
+                 len(observations), player_id)
+  return pickle.dumps(recording)
+
+
+class MockReplayController(object):
+  """Play back a recording with the replay api of `RemoteController`.
+
+  The recording bytes are passed wherever the replay data would be. Stepping
+  more game loops than the recorded step_mul skips observations, but their
+  actions are merged into the next one, so no action is lost.
+  """
+
+  def __init__(self):
+    self._recording = None
+    self._game_info = None
+    self._observations = []
+    self._index = 0
+    self._game_loop = 0
+    self._pending_actions = []
+    self.status = Status.launched
+
+  def _load(self, replay_data):
+    recording = pickle.loads(replay_data)
+    if recording.get("version") != _RECORDING_VERSION:
+      raise ValueError("Unknown recording version: %s" %
+                       recording.get("version"))
+    self._recording = recording
+    return recording
+
+  def ping(self):
+    return sc_pb.ResponsePing(game_version="mock", base_build=0)
+
+  def replay_info(self, replay_data):
+    recording = self._load(replay_data)
+    return sc_pb.ResponseReplayInfo.FromString(recording["replay_info"])
+
+  def start_replay(self, req_start_replay):
+    recording = self._load(req_start_replay.replay_data)
+    player = recording["players"].get(req_start_replay.observed_player_id)
+    if player is None:
+      raise ValueError("Player %s isn't recorded." %
+                       req_start_replay.observed_player_id)
+    self._game_info = sc_pb.ResponseGameInfo.FromString(player["game_info"])
+    self._observations = player["observations"]
+    self._index = 0
+    self._game_loop = 0
+    self._pending_actions = []
+    self.status = Status.in_replay
+    return sc_pb.ResponseStartReplay()
+
+  def game_info(self):
+    return copy.deepcopy(self._game_info)
+
+  def observe(self, disable_fog=False, target_game_loop=0):
+    del disable_fog, target_game_loop
+    obs = sc_pb.ResponseObservation.FromString(
+        self._observations[self._index])
+    if self._pending_actions:
+      actions = self._pending_actions + list(obs.actions)
+      del obs.actions[:]
+      obs.actions.extend(actions)
+      self._pending_actions = []
+    self._game_loop = obs.observation.game_loop
+    if self._index == len(self._observations) - 1:
+      self.status = Status.ended
+    return obs
+
+  def step(self, count=1):
+    target = self._game_loop + count
+    last = len(self._observations) - 1
+    self._index = min(self._index + 1, last)
+    while self._index < last:
+      obs = sc_pb.ResponseObservation.FromString(
+          self._observations[self._index])
+      if obs.observation.game_loop >= target:
+        break
+      # Skipped observations give their actions to the next one.
+      self._pending_actions.extend(obs.actions)
+      self._index += 1
+    return sc_pb.ResponseStep(simulation_loop=target)
+
+  def quit(self):
+    self.status = Status.quit
+
+  def close(self):
+    pass
+
+
+class MockReplayProcess(object):
+  """Stands for `sc_process.StarcraftProcess` with a `MockReplayController`."""
+
+  def __init__(self, **unused_launch_kwargs):
+    self._controller = MockReplayController()
+
+  @property
+  def controller(self):
+    return self._controller
+
+  @property
+  def running(self):
+    return True
+
+  def close(self):
+    self._controller.quit()
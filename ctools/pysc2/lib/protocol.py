@@ -152,6 +152,81 @@ class StarcraftProtocol(object):
           "Error during %s: Got a response with a different id" % name)
     return getattr(res, name)
 
+  @sw.decorate
+  def send_reqs(self, requests):
+    """Pipelined mode: write pre-filled Requests back to back, then read.
+
+    SC2 handles the requests in order, so only one round-trip of latency is
+    paid for the whole batch. Responses are matched to the requests by id, and
+    in order for responses without an id.
+
+    Args:
+      requests: A list of Request, each with a unique id.
+
+    Returns:
+      A list of Response, one per request, in the order of the requests.
+    Raises:
+      ConnectionError: if the responses don't match the requests.
+      ProtocolError: the first error in the responses, raised after all the
+          responses are read so the socket is left in a consistent state.
+    """
+    for request in requests:
+      self.write(request)
+    by_id = {}
+    without_id = []
+    error = None
+    for _ in requests:
+      try:
+        response = self.read()
+      except ProtocolError as e:
+        error = error or e
+        continue
+      if response.HasField("id"):
+        by_id[response.id] = response
+      else:
+        without_id.append(response)
+    if error:
+      raise error
+    responses = []
+    for request in requests:
+      if request.id in by_id:
+        responses.append(by_id.pop(request.id))
+      elif without_id:
+        responses.append(without_id.pop(0))
+      else:
+        raise ConnectionError("Missing the response of request id %s" % request.id)
+    if by_id:
+      raise ConnectionError(
+          "Got responses with unknown ids: %s" % sorted(by_id.keys()))
+    return responses
+
+  def send_pipelined(self, *requests):
+    """Create and send several requests pipelined, and return the responses.
+
+    For example:
+      send_pipelined(dict(step=sc_pb.RequestStep(count=8)),
+                     dict(observation=sc_pb.RequestObservation()))
+      => [sc_pb.ResponseStep, sc_pb.ResponseObservation]
+
+    Args:
+      *requests: dicts with a single kwarg each, the same as `send`.
+
+    Returns:
+      The Responses corresponding to your requests.
+    """
+    names, reqs = [], []
+    for kwargs in requests:
+      assert len(kwargs) == 1, "Must make a single request per dict."
+      names.append(list(kwargs.keys())[0])
+      req = sc_pb.Request(**kwargs)
+      req.id = next(self._count)
+      reqs.append(req)
+    try:
+      res = self.send_reqs(reqs)
+    except ConnectionError as e:
+      raise ConnectionError("Error during %s: %s" % (", ".join(names), e))
+    return [getattr(r, name) for r, name in zip(res, names)]
+
   def _packet_str(self, packet):
     """Return a string form of this packet."""
     max_lines = FLAGS.sc2_verbose_protocol
@@ -0,0 +1,78 @@
+#!/usr/bin/python
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the pipelined protocol mode, against the fake SC2 server."""
+
+from absl.testing import absltest
+from ctools.pysc2.lib import fake_sc2_server
+from ctools.pysc2.lib import protocol
+from ctools.pysc2.lib import remote_controller
+
+from s2clientprotocol import raw_pb2 as sc_raw
+from s2clientprotocol import sc2api_pb2 as sc_pb
+
+
+def _action():
+  return sc_pb.Action(action_raw=sc_raw.ActionRaw(
+      unit_command=sc_raw.ActionRawUnitCommand(ability_id=1, unit_tags=[1])))
+
+
+class ProtocolTest(absltest.TestCase):
+
+  def setUp(self):
+    super(ProtocolTest, self).setUp()
+    self._server = fake_sc2_server.FakeSC2Server(latency=0.001)
+    self._controller = remote_controller.RemoteController(
+        "127.0.0.1", self._server.port, timeout_seconds=5)
+    self._controller.create_game(sc_pb.RequestCreateGame())
+    self._controller.join_game(sc_pb.RequestJoinGame())
+
+  def tearDown(self):
+    self._controller.quit()
+    self._server.close()
+    super(ProtocolTest, self).tearDown()
+
+  def test_send_pipelined(self):
+    client = self._controller._client
+    res = client.send_pipelined(dict(step=sc_pb.RequestStep(count=2)),
+                                dict(game_info=sc_pb.RequestGameInfo()),
+                                dict(observation=sc_pb.RequestObservation()))
+    self.assertEqual(res[0].simulation_loop, 2)
+    self.assertEqual(res[1].map_name, "FakeMap")
+    self.assertEqual(res[2].observation.game_loop, 2)
+
+  def test_act_step_observe(self):
+    action_result, obs = self._controller.act_step_observe(
+        [_action(), _action()], count=8)
+    self.assertLen(action_result.result, 2)
+    self.assertEqual(obs.observation.game_loop, 8)
+    action_result, obs = self._controller.act_step_observe([], count=4)
+    self.assertIsNone(action_result)
+    self.assertEqual(obs.observation.game_loop, 12)
+    self.assertEqual(self._controller.observe().observation.game_loop, 12)
+
+  def test_error_drains_responses(self):
+    self._server.error_requests.add("game_info")
+    with self.assertRaises(protocol.ProtocolError):
+      self._controller._client.send_pipelined(
+          dict(game_info=sc_pb.RequestGameInfo()),
+          dict(step=sc_pb.RequestStep(count=1)),
+          dict(observation=sc_pb.RequestObservation()))
+    self._server.error_requests.clear()
+    # The following responses were read, so the next request gets its own.
+    self.assertEqual(self._controller.observe().observation.game_loop, 1)
+
+
+if __name__ == "__main__":
+  absltest.main()
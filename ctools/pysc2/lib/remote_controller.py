@@ -243,7 +243,9 @@ class RemoteController(object):
         obs = self._client.send(observation=sc_pb.RequestObservation(
             game_loop=target_game_loop,
             disable_fog=disable_fog))
+        return self._process_observation(obs)
 
+    def _process_observation(self, obs):
         if obs.observation.game_loop == 2**32 - 1:
             logging.info("Received stub observation.")
 
@@ -271,6 +273,38 @@ class RemoteController(object):
 
         return obs
 
+    @valid_status(Status.in_game)
+    @sw.decorate
+    def act_step_observe(self, act_list, count=1, disable_fog=False, target_game_loop=0):
+        """Send actions, step and observe in one pipelined round-trip.
+
+        Returns:
+          (ResponseAction or None if there are no actions, ResponseObservation)
+        """
+        if FLAGS.sc2_log_actions and act_list:
+            sys.stderr.write(" Sending actions ".center(60, ">") + "\n")
+            for action in act_list:
+                sys.stderr.write(str(action))
+            sys.stderr.flush()
+        requests = []
+        if act_list:
+            requests.append(dict(action=sc_pb.RequestAction(actions=act_list)))
+        if count > 0:
+            requests.append(dict(step=sc_pb.RequestStep(count=count)))
+        requests.append(dict(observation=sc_pb.RequestObservation(
+            game_loop=target_game_loop, disable_fog=disable_fog)))
+        try:
+            responses = self._client.send_pipelined(*requests)
+        except protocol.ProtocolError as protocol_error:
+            if "Game has already ended" not in str(protocol_error):
+                raise
+            # same as `catch_game_end`, the game ended during the action or step, observe again to get the result
+            logging.warning(
+                "Received a 'Game has already ended' error from SC2 in act_step_observe, observe again.")
+            return None, self.observe(disable_fog=disable_fog, target_game_loop=target_game_loop)
+        action_result = responses[0] if act_list else None
+        return action_result, self._process_observation(responses[-1])
+
     def available_maps(self):
         return self._client.send(available_maps=sc_pb.RequestAvailableMaps())
 
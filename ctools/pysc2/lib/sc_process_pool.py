@@ -0,0 +1,190 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""A pool of warm SC2 processes, leased to envs and reused across games.
+
+Launching SC2 and connecting to it takes seconds, while a process that is
+already running can host the next game with just `create_game`/`join_game`
+(or `restart` for the same single player game). Envs lease processes instead
+of launching them, and give them back when they are closed.
+"""
+
+import collections
+import threading
+
+from absl import logging
+from ctools.pysc2.lib import protocol
+from ctools.pysc2.lib import remote_controller
+from ctools.pysc2.lib import stopwatch
+
+import websocket
+
+sw = stopwatch.sw
+
+_HEALTH_CHECK_ERRORS = (protocol.ConnectionError, protocol.ProtocolError,
+                        remote_controller.RequestError,
+                        websocket.WebSocketException, OSError)
+
+
+class ProcessLease(object):
+  """A group of processes held by one env until `release` is called."""
+
+  def __init__(self, pool, procs):
+    self._pool = pool
+    self.procs = procs
+
+  @property
+  def controllers(self):
+    return [p.controller for p in self.procs]
+
+  def release(self, discard=False):
+    """Give the processes back, `discard` closes them instead."""
+    if self.procs is not None:
+      self._pool.release(self, discard=discard)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exception_type, unused_exception_value, unused_traceback):
+    # Processes that failed in a game are not trusted anymore.
+    self.release(discard=exception_type is not None)
+
+
+class StarcraftProcessPool(object):
+  """Keep idle SC2 processes warm and lease them.
+
+  Args:
+    launcher: callable(**launch_kwargs) returning a process with `controller`,
+        `running` and `close()`, e.g.: `run_config.start` or a mock process.
+    max_idle: max number of idle processes kept, the others are closed.
+    max_uses: close a process after it is leased this many times, 0 means
+        no limit. SC2 leaks memory over long runs.
+  """
+
+  def __init__(self, launcher, max_idle=4, max_uses=0):
+    self._launcher = launcher
+    self._max_idle = max_idle
+    self._max_uses = max_uses
+    self._idle = collections.defaultdict(list)  # launch key -> [process]
+    self._uses = {}  # id(process) -> (launch key, lease count)
+    self._lock = threading.Lock()
+    self.stats = collections.Counter()
+
+  @staticmethod
+  def _key(launch_kwargs):
+    return tuple(sorted(launch_kwargs.items()))
+
+  def _healthy(self, proc):
+    """Health check a process by `ping`."""
+    try:
+      if proc.running is False:
+        return False
+      proc.controller.ping()
+      return True
+    except _HEALTH_CHECK_ERRORS as e:
+      logging.warning("SC2 process failed the health check: %s", e)
+      return False
+
+  def _close(self, proc):
+    with self._lock:
+      self._uses.pop(id(proc), None)
+      self.stats["closed"] += 1
+    try:
+      proc.close()
+    except Exception as e:  # pylint: disable=broad-except
+      logging.warning("Failed to close the SC2 process: %s", e)
+
+  @sw.decorate("pool_lease")
+  def lease(self, num=1, **launch_kwargs):
+    """Lease `num` healthy processes, launching new ones if needed.
+
+    Args:
+      num: number of processes.
+      **launch_kwargs: passed to the launcher, only processes launched with
+          the same kwargs are reused.
+
+    Returns:
+      A ProcessLease.
+    """
+    key = self._key(launch_kwargs)
+    procs = []
+    while len(procs) < num:
+      with self._lock:
+        proc = self._idle[key].pop() if self._idle[key] else None
+      if proc is None:
+        break
+      if self._healthy(proc):
+        with self._lock:
+          self.stats["reused"] += 1
+        procs.append(proc)
+      else:
+        self._close(proc)
+    try:
+      while len(procs) < num:
+        proc = self._launcher(**launch_kwargs)
+        with self._lock:
+          self.stats["launched"] += 1
+          self._uses[id(proc)] = (key, 0)
+        procs.append(proc)
+    except:
+      for proc in procs:
+        self._close(proc)
+      raise
+    with self._lock:
+      for proc in procs:
+        k, count = self._uses.get(id(proc), (key, 0))
+        self._uses[id(proc)] = (k, count + 1)
+    return ProcessLease(self, procs)
+
+  def release(self, lease, discard=False):
+    """Return the processes of a lease to the pool."""
+    procs, lease.procs = lease.procs, None
+    for proc in procs:
+      # Leases are released from the threads of several envs.
+      with self._lock:
+        key, count = self._uses.get(id(proc), (None, 0))
+        if (not discard and key is not None and
+            not (self._max_uses and count >= self._max_uses) and
+            len(self._idle[key]) < self._max_idle):
+          self._idle[key].append(proc)
+          proc = None
+      if proc is not None:
+        self._close(proc)
+
+  def prewarm(self, num, **launch_kwargs):
+    """Launch processes in advance so the first lease is warm as well."""
+    lease = self.lease(num, **launch_kwargs)
+    with self._lock:
+      for proc in lease.procs:  # not counted as a use
+        key, count = self._uses[id(proc)]
+        self._uses[id(proc)] = (key, count - 1)
+    lease.release()
+
+  @property
+  def num_idle(self):
+    with self._lock:
+      return sum(len(v) for v in self._idle.values())
+
+  def close(self):
+    with self._lock:
+      procs = [p for v in self._idle.values() for p in v]
+      self._idle.clear()
+    for proc in procs:
+      self._close(proc)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, unused_exception_type, unused_exc_value,
+               unused_traceback):
+    self.close()
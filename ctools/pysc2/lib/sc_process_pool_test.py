@@ -0,0 +1,140 @@
+#!/usr/bin/python
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS-IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for lib.sc_process_pool, with the fake SC2 process backend."""
+
+import threading
+
+from absl.testing import absltest
+from ctools.pysc2.env import sc2_env
+from ctools.pysc2.lib import fake_sc2_server
+from ctools.pysc2.lib import sc_process_pool
+
+from s2clientprotocol import sc2api_pb2 as sc_pb
+
+
+def _launcher(want_rgb=False):
+  del want_rgb
+  return fake_sc2_server.FakeStarcraftProcess()
+
+
+class StarcraftProcessPoolTest(absltest.TestCase):
+
+  def setUp(self):
+    super(StarcraftProcessPoolTest, self).setUp()
+    self._pool = sc_process_pool.StarcraftProcessPool(_launcher, max_idle=2)
+
+  def tearDown(self):
+    self._pool.close()
+    super(StarcraftProcessPoolTest, self).tearDown()
+
+  def test_reuse(self):
+    with self._pool.lease(2) as lease:
+      procs = list(lease.procs)
+      for c in lease.controllers:
+        c.create_game(sc_pb.RequestCreateGame())
+        c.join_game(sc_pb.RequestJoinGame())
+        c.step(8)
+    self.assertEqual(self._pool.num_idle, 2)
+    # A warm process can create the next game directly.
+    with self._pool.lease(2) as lease:
+      self.assertCountEqual([id(p) for p in lease.procs], [id(p) for p in procs])
+      lease.controllers[0].create_game(sc_pb.RequestCreateGame())
+    self.assertEqual(self._pool.stats["launched"], 2)
+    self.assertEqual(self._pool.stats["reused"], 2)
+
+  def test_launch_key(self):
+    self._pool.prewarm(1, want_rgb=False)
+    lease = self._pool.lease(1, want_rgb=True)
+    self.assertEqual(self._pool.stats["launched"], 2)
+    self.assertEqual(self._pool.num_idle, 1)
+    lease.release()
+
+  def test_health_check(self):
+    self._pool.prewarm(2)
+    lease = self._pool.lease(2)
+    crashed = lease.procs[0]
+    lease.release()
+    crashed.kill()
+    lease = self._pool.lease(2)
+    self.assertNotIn(crashed, lease.procs)
+    self.assertEqual(self._pool.stats["reused"], 3)
+    self.assertEqual(self._pool.stats["launched"], 3)
+    lease.release()
+
+  def test_discard_and_max_uses(self):
+    pool = sc_process_pool.StarcraftProcessPool(_launcher, max_uses=2)
+    with pool:
+      pool.lease(1).release(discard=True)
+      self.assertEqual(pool.num_idle, 0)
+      pool.lease(1).release()
+      pool.lease(1).release()
+      self.assertEqual(pool.num_idle, 0)  # used twice
+      self.assertEqual(pool.stats["closed"], 2)
+
+  def test_exception_discards(self):
+    with self.assertRaises(ValueError):
+      with self._pool.lease(1):
+        raise ValueError()
+    self.assertEqual(self._pool.num_idle, 0)
+
+  def test_concurrent_release(self):
+    # Envs lease and release from their own threads.
+    pool = sc_process_pool.StarcraftProcessPool(_launcher, max_idle=4, max_uses=3)
+
+    def run():
+      for _ in range(20):
+        pool.lease(1).release()
+
+    with pool:
+      threads = [threading.Thread(target=run) for _ in range(8)]
+      for t in threads:
+        t.start()
+      for t in threads:
+        t.join()
+      self.assertEqual(pool.stats["reused"] + pool.stats["launched"], 160)
+      self.assertEqual(pool.stats["launched"] - pool.stats["closed"],
+                       pool.num_idle)
+      self.assertEqual(len(pool._uses), pool.num_idle)
+
+  def _env_with_leases(self, num):
+    # A bare SC2Env holding leased processes, as after `_launch_game`.
+    env = object.__new__(sc2_env.SC2Env)
+    env._leases = [self._pool.lease(1) for _ in range(num)]
+    env._sc2_procs = [lease.procs[0] for lease in env._leases]
+    env._controllers = [p.controller for p in env._sc2_procs]
+    return env
+
+  def test_env_close(self):
+    env = self._env_with_leases(2)
+    env.close()
+    self.assertEqual(self._pool.num_idle, 2)
+    self.assertEqual(self._pool.stats["closed"], 0)
+
+  def test_env_failed_reset_discards(self):
+    # The processes of a failed reset still answer ping, they must not be reused.
+    env = self._env_with_leases(2)
+    procs = list(env._sc2_procs)
+    for p in procs:
+      self.assertTrue(self._pool._healthy(p))
+    env.close(discard=True)
+    self.assertEqual(self._pool.num_idle, 0)
+    self.assertEqual(self._pool.stats["closed"], 2)
+    lease = self._pool.lease(2)
+    self.assertFalse(set(map(id, lease.procs)) & set(map(id, procs)))
+    lease.release()
+
+
+if __name__ == "__main__":
+  absltest.main()
@@ -1,6 +1,7 @@
-from .checkpoint_helper import build_checkpoint_helper, CountVar, auto_checkpoint
-from .data_helper import to_device, to_tensor, to_dtype, same_shape, tensor_to_list, build_log_buffer,\
-    CudaFetcher, get_tensor_data
+from .checkpoint_helper import build_checkpoint_helper, CountVar, auto_checkpoint, CheckpointHelper, \
+    AsyncCheckpointHelper
+from .data_helper import to_device, to_host_flat, to_host_split, to_tensor, to_dtype, same_shape, tensor_to_list, \
+    build_log_buffer, CudaFetcher, get_tensor_data
 from .distribution import CategoricalPd, CategoricalPdPytorch
 from .loss import *
 from .metric import levenshtein_distance, hamming_distance
@@ -3,16 +3,22 @@ Copyright 2020 Sensetime X-lab. All Rights Reserved
 
 Main Function:
     1. checkpoint helper, used to help to save or load checkpoint by give args.
-    2. CountVar, to help counting number.
+    2. async checkpoint helper, snapshot the checkpoint and write it in a background thread.
+    3. CountVar, to help counting number.
 """
 import logging
+import os
+import queue
 import signal
 import sys
+import threading
+import time
 import traceback
 
 import torch
 
 from ctools.utils import read_file, save_file
+from ctools.utils.file_helper import mc, read_from_mc
 
 logger = logging.getLogger('default_logger')
 
@@ -28,6 +34,11 @@ def build_checkpoint_helper(cfg):
     Returns:
         - (:obj:`CheckpointHelper`): checkpoint_helper created by this function
     """
+    ckpt_cfg = cfg.get('learner', {}).get('checkpoint', {})
+    if ckpt_cfg.get('async_save', False):
+        return AsyncCheckpointHelper(
+            max_in_flight=ckpt_cfg.get('max_in_flight', 1), pin_memory=ckpt_cfg.get('pin_memory', True)
+        )
     return CheckpointHelper()
 
 
@@ -37,7 +48,7 @@ class CheckpointHelper(object):
         Concrete implementation of CheckpointHelper, to help to save or load checkpoint
 
     Interface:
-        __init__, save, load
+        __init__, save, load, wait
     """
 
     def __init__(self):
@@ -110,6 +121,22 @@ class CheckpointHelper(object):
             - prefix_op (:obj:`str`): should be ['remove', 'add'], process on state_dict
             - prefix (:obj:`str`): prefix to be processed on state_dict
         """
+        checkpoint = self._build_checkpoint(
+            model, optimizer, last_iter, last_epoch, last_frame, dataset, actor_info, prefix_op, prefix
+        )
+        save_file(path, checkpoint)
+        logger.info('save checkpoint in {}'.format(path))
+
+    def wait(self):
+        r"""
+        Overview:
+            wait until all the checkpoints are written, checkpoints are written in ``save`` here
+        """
+        pass
+
+    def _build_checkpoint(
+        self, model, optimizer, last_iter, last_epoch, last_frame, dataset, actor_info, prefix_op, prefix
+    ):
         checkpoint = {}
         model = model.state_dict()
         if prefix_op is not None:  # remove or add prefix to model.keys()
@@ -133,8 +160,7 @@ class CheckpointHelper(object):
             checkpoint['dataset'] = dataset.state_dict()
         if actor_info is not None:
             checkpoint['actor_info'] = actor_info.state_dict()
-        save_file(path, checkpoint)
-        logger.info('save checkpoint in {}'.format(path))
+        return checkpoint
 
     def _load_matched_model_state_dict(self, model, ckpt_state_dict, info_print):
         r"""
@@ -272,6 +298,157 @@ class CheckpointHelper(object):
             raise NotImplementedError
 
 
+class AsyncCheckpointHelper(CheckpointHelper):
+    r"""
+    Overview:
+        CheckpointHelper which doesn't block the training loop on writing. ``save`` only copies the tensors of the
+        checkpoint into CPU(pinned for cuda tensors) buffers, a background thread serializes and writes the snapshot
+        to a temp file, and renames it to the path, so a checkpoint file is always complete. At most
+        ``max_in_flight`` snapshots wait to be written, the next ``save`` blocks until one of them is written.
+        The buffers of the written snapshots are reused.
+
+    Interface:
+        __init__, save, load, wait, metrics
+    """
+
+    def __init__(self, max_in_flight=1, pin_memory=True):
+        r"""
+        Overview:
+            initialization method, start the writer thread
+
+        Arguments:
+            - max_in_flight (:obj:`int`): max number of snapshots waiting to be written
+            - pin_memory (:obj:`bool`): whether to copy cuda tensors into pinned buffers
+        """
+        super(AsyncCheckpointHelper, self).__init__()
+        assert max_in_flight >= 1, max_in_flight
+        self._pin_memory = pin_memory and torch.cuda.is_available()
+        self._slots = threading.Semaphore(max_in_flight)
+        self._free_buffers = queue.Queue()
+        for _ in range(max_in_flight):
+            self._free_buffers.put({})
+        self._jobs = queue.Queue()
+        self._metrics = {
+            'saved': 0,
+            'failed': 0,
+            'in_flight': 0,
+            'last_path': None,
+            'last_wait_time': 0.,
+            'last_snapshot_time': 0.,
+            'last_write_time': 0.,
+            'last_bytes': 0,
+        }
+        self._lock = threading.Lock()
+        self._writer = threading.Thread(target=self._write_loop, name='checkpoint_writer')
+        self._writer.daemon = True
+        self._writer.start()
+
+    def _snapshot(self, data, buffers, key=()):
+        if isinstance(data, dict):
+            return type(data)((k, self._snapshot(v, buffers, key + (k, ))) for k, v in data.items())
+        elif isinstance(data, (list, tuple)):
+            return type(data)(self._snapshot(v, buffers, key + (i, )) for i, v in enumerate(data))
+        elif isinstance(data, torch.Tensor):
+            buf = buffers.get(key)
+            if buf is None or buf.shape != data.shape or buf.dtype != data.dtype:
+                buf = torch.empty(data.shape, dtype=data.dtype, pin_memory=self._pin_memory and data.is_cuda)
+                buffers[key] = buf
+            buf.copy_(data.detach(), non_blocking=data.is_cuda and buf.is_pinned())
+            return buf
+        else:
+            return data
+
+    def save(
+        self,
+        path,
+        model,
+        optimizer=None,
+        last_iter=None,
+        last_epoch=None,
+        last_frame=None,
+        dataset=None,
+        actor_info=None,
+        prefix_op=None,
+        prefix=None
+    ):
+        r"""
+        Overview:
+            snapshot the checkpoint and return, it is written to path later, the arguments are the same as
+            ``CheckpointHelper.save``
+        """
+        t = time.time()
+        self._slots.acquire()
+        wait_time = time.time() - t
+        t = time.time()
+        checkpoint = self._build_checkpoint(
+            model, optimizer, last_iter, last_epoch, last_frame, dataset, actor_info, prefix_op, prefix
+        )
+        buffers = self._free_buffers.get()
+        checkpoint = self._snapshot(checkpoint, buffers)
+        event = None
+        if self._pin_memory:
+            event = torch.cuda.Event()
+            event.record()
+        with self._lock:
+            self._metrics['in_flight'] += 1
+            self._metrics['last_wait_time'] = wait_time
+            self._metrics['last_snapshot_time'] = time.time() - t
+        self._jobs.put((path, checkpoint, buffers, event))
+
+    def _write_loop(self):
+        while True:
+            path, checkpoint, buffers, event = self._jobs.get()
+            t = time.time()
+            ok = True
+            try:
+                if event is not None:
+                    event.synchronize()
+                if path.lower().startswith('s3'):
+                    save_file(path, checkpoint)
+                else:
+                    tmp_path = path + '.tmp'
+                    save_file(tmp_path, checkpoint, fs_type='normal')
+                    os.replace(tmp_path, path)
+                    if mc is not None:
+                        # the same flush as save_file on memcache, for the final path
+                        read_from_mc(path, flush=True)
+                logger.info('save checkpoint in {}'.format(path))
+            except Exception as e:
+                ok = False
+                logger.error('failed to save checkpoint in {}: {}'.format(path, repr(e)))
+            del checkpoint
+            with self._lock:
+                self._metrics['in_flight'] -= 1
+                if ok:
+                    self._metrics['saved'] += 1
+                    self._metrics['last_path'] = path
+                    self._metrics['last_write_time'] = time.time() - t
+                    if os.path.exists(path):
+                        self._metrics['last_bytes'] = os.path.getsize(path)
+                else:
+                    self._metrics['failed'] += 1
+            self._free_buffers.put(buffers)
+            self._slots.release()
+            self._jobs.task_done()
+
+    def wait(self):
+        r"""
+        Overview:
+            wait until all the snapshots are written, call it before exiting
+        """
+        self._jobs.join()
+
+    @property
+    def metrics(self):
+        r"""
+        Overview:
+            the write metrics, including the number of saved/failed/in flight checkpoints, the last written path, and
+            the time of the last save spent on waiting for a slot, snapshot and writing
+        """
+        with self._lock:
+            return dict(self._metrics)
+
+
 class CountVar(object):
     r"""
     Overview:
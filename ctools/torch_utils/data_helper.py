@@ -1,5 +1,5 @@
 import numbers
-from collections.abc import Sequence
+from collections.abc import Sequence, Mapping
 from typing import Iterable, Any
 import time
 from threading import Thread
@@ -9,7 +9,7 @@ import numpy as np
 import torch
 
 
-def to_device(item, device, ignore_keys=[]):
+def to_device(item, device, ignore_keys=[], non_blocking=False):
     r"""
     Overview:
         transfer data to certain device
@@ -22,6 +22,7 @@ def to_device(item, device, ignore_keys=[]):
         - item (:obj:`object`): the item to be transfered
         - device (:obj:`torch.divice`): the device wanted
         - ignore_keys (:obj:`list` of `item.keys()`): the keys to be ignored in transfer, defalut set to empty
+        - non_blocking (:obj:`bool`): whether to use asynchronous copy, only takes effect with pinned cpu tensors
 
     Returns:
         - item (:obj:`object`): the transfered item
@@ -29,19 +30,19 @@ def to_device(item, device, ignore_keys=[]):
     if isinstance(item, torch.nn.Module):
         return item.to(device)
     elif isinstance(item, torch.Tensor):
-        return item.to(device)
+        return item.to(device, non_blocking=non_blocking)
     elif isinstance(item, Sequence):
         if isinstance(item, str):
             return item
         else:
-            return [to_device(t, device) for t in item]
+            return [to_device(t, device, non_blocking=non_blocking) for t in item]
     elif isinstance(item, dict):
         new_item = {}
         for k in item.keys():
             if k in ignore_keys:
                 new_item[k] = item[k]
             else:
-                new_item[k] = to_device(item[k], device)
+                new_item[k] = to_device(item[k], device, non_blocking=non_blocking)
         return new_item
     elif isinstance(item, numbers.Integral) or isinstance(item, numbers.Real):
         return item
@@ -53,6 +54,135 @@ def to_device(item, device, ignore_keys=[]):
         raise TypeError("not support item type: {}".format(type(item)))
 
 
+def _map_tensors(item, fn, ignore_keys):
+    # the same traversal for collecting and replacing the tensors in to_host_flat and to_host_split
+    if isinstance(item, torch.Tensor):
+        return fn(item)
+    elif isinstance(item, Sequence) and not isinstance(item, str):
+        ret = [_map_tensors(t, fn, ignore_keys) for t in item]
+        if isinstance(item, tuple):
+            return type(item)(*ret) if hasattr(item, '_fields') else tuple(ret)
+        return ret
+    elif isinstance(item, Mapping):
+        return {k: v if k in ignore_keys else _map_tensors(v, fn, ignore_keys) for k, v in item.items()}
+    else:
+        return item
+
+
+def to_host_flat(item, ignore_keys=[], buffers=None, copy_cpu=False):
+    r"""
+    Overview:
+        transfer the tensors of a nested data to cpu with one copy for each dtype: the tensors of a dtype are
+        flattened into one buffer on their device, copied to host at once, and the returned tensors are views of the
+        host buffer, instead of a small copy for each tensor as ``to_device``
+
+    Arguments:
+        - item (:obj:`object`): the item to be transfered, the types supported by ``to_device``
+        - ignore_keys (:obj:`list` of `item.keys()`): the keys to be ignored in transfer
+        - buffers (:obj:`dict`): dtype -> host buffer, reused and grown in each call, pinned if cuda is available. \
+            The returned tensors are only valid until the next call with the same buffers, for the data consumed \
+            at once, e.g. the actions sent to the envs. Without it a new host buffer is used in each call, which \
+            lives as long as any returned tensor, so keeping one of them keeps the whole buffer, and pickling one \
+            of them writes the whole buffer, use ``to_host_split`` for the pieces of each env kept or sent
+        - copy_cpu (:obj:`bool`): whether to copy the cpu tensors into the host buffer too, so the returned tensors \
+            don't share memory with the input, otherwise the cpu tensors are returned as they are
+
+    Returns:
+        - item (:obj:`object`): the transfered item, sequences are returned as lists except tuples and namedtuples
+    """
+    tensors, seen = [], set()
+
+    def collect(t):
+        if (copy_cpu or t.device.type != 'cpu') and id(t) not in seen:
+            seen.add(id(t))
+            tensors.append(t)
+        return t
+
+    _map_tensors(item, collect, ignore_keys)
+    if len(tensors) == 0:
+        return item
+    groups = {}
+    for t in tensors:
+        groups.setdefault(t.dtype, []).append(t)
+    host = {}
+    for dtype, group in groups.items():
+        flat = torch.cat([t.reshape(-1) for t in group])
+        if buffers is None:
+            buf = flat.cpu() if flat.device.type != 'cpu' else flat
+        else:
+            buf = buffers.get(dtype)
+            if buf is None or buf.numel() < flat.numel():
+                buf = torch.empty(flat.numel(), dtype=dtype, pin_memory=torch.cuda.is_available())
+                buffers[dtype] = buf
+            buf = buf[:flat.numel()]
+            buf.copy_(flat)
+        offset = 0
+        for t in group:
+            host[id(t)] = buf[offset:offset + t.numel()].view(t.shape)
+            offset += t.numel()
+    return _map_tensors(item, lambda t: host.get(id(t), t), ignore_keys)
+
+
+def to_host_split(item, ignore_keys=[], copy_cpu=True, keepdim_1d=False):
+    r"""
+    Overview:
+        split the tensors of a nested batch by env(the first dim) and transfer them to host with one copy for each
+        dtype, like ``to_host_flat`` but the buffer is laid out env-major: the elements of each env are one
+        contiguous chunk, and each piece of the env is a view of its part of the chunk with a storage of just its
+        elements, so pickling the pieces of an env writes only their own elements, without a clone of each piece.
+        The pieces keep the host buffer of their dtype alive, which is freed when the pieces of all the envs are.
+
+    Arguments:
+        - item (:obj:`object`): the item to be split, the types supported by ``to_device``, all the tensors have the \
+            same first dim, the batch size
+        - ignore_keys (:obj:`list` of `item.keys()`): the keys to be ignored in transfer, their values are kept in \
+            the item of each env as they are
+        - copy_cpu (:obj:`bool`): whether to copy the cpu tensors into the chunks too, otherwise their pieces are \
+            views of the input
+        - keepdim_1d (:obj:`bool`): whether the pieces of the 1-dim tensors keep the dim with a shape (1, ), as \
+            ``default_decollate``, otherwise the piece is ``t[b]`` for all the tensors
+
+    Returns:
+        - item (:obj:`list`): the item of each env, sequences are returned as lists except tuples and namedtuples, \
+            mappings as dicts, and the tensors are detached
+    """
+    tensors, seen = [], set()
+
+    def collect(t):
+        if id(t) not in seen:
+            seen.add(id(t))
+            tensors.append(t)
+        return t
+
+    _map_tensors(item, collect, ignore_keys)
+    if len(tensors) == 0:
+        raise ValueError("no tensor to split in item")
+    batch_size = tensors[0].shape[0]
+    assert all([t.shape[0] == batch_size for t in tensors]), [t.shape for t in tensors]
+    groups = {}
+    for t in tensors:
+        if copy_cpu or t.device.type != 'cpu':
+            groups.setdefault(t.dtype, []).append(t)
+    pieces = {}
+    for dtype, group in groups.items():
+        flat = torch.cat([t.detach().reshape(batch_size, -1) for t in group], dim=1)
+        host = flat.cpu() if flat.device.type != 'cpu' else flat
+        # a tensor from a numpy view has a storage of just the viewed elements, pickled alone, while a torch view
+        # pickles its whole storage
+        chunks = host.numpy()
+        offset = 0
+        for t in group:
+            numel = t.numel() // batch_size
+            pieces[id(t)] = [torch.from_numpy(c[offset:offset + numel]).view(t.shape[1:]) for c in chunks]
+            offset += numel
+    for t in tensors:
+        if id(t) not in pieces:
+            pieces[id(t)] = [t[b] for b in range(batch_size)]
+        if keepdim_1d and len(t.shape) == 1:
+            pieces[id(t)] = [p.unsqueeze(0) for p in pieces[id(t)]]
+    return [_map_tensors(item, lambda t: pieces[id(t)][b], ignore_keys) for b in range(batch_size)]
+
+
 def to_dtype(item, dtype):
     r"""
     Overview:
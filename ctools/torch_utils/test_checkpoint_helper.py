@@ -0,0 +1,52 @@
+import os
+
+import pytest
+import torch
+
+from ctools.torch_utils import AsyncCheckpointHelper, CheckpointHelper, CountVar, checkpoint_helper
+
+
+@pytest.mark.unittest
+class TestAsyncCheckpointHelper:
+
+    def test_save(self, tmpdir):
+        model = torch.nn.Linear(16, 8)
+        optimizer = torch.optim.Adam(model.parameters())
+        model(torch.randn(4, 16)).sum().backward()
+        optimizer.step()
+        helper = AsyncCheckpointHelper(max_in_flight=2)
+        paths, weights = [], []
+        for i in range(4):
+            paths.append(os.path.join(str(tmpdir), 'iteration_{}.pth.tar'.format(i)))
+            weights.append(model.weight.detach().clone())
+            helper.save(paths[-1], model, optimizer=optimizer, last_iter=CountVar(i))
+            # the training goes on while writing, the snapshot is not changed
+            with torch.no_grad():
+                model.weight.add_(1.)
+        helper.wait()
+        metrics = helper.metrics
+        assert metrics['saved'] == 4 and metrics['in_flight'] == 0 and metrics['failed'] == 0
+        assert metrics['last_path'] == paths[-1] and metrics['last_bytes'] > 0
+        assert not [f for f in os.listdir(str(tmpdir)) if f.endswith('.tmp')]
+        for i, path in enumerate(paths):
+            new_model = torch.nn.Linear(16, 8)
+            last_iter = CountVar(0)
+            CheckpointHelper().load(path, new_model, optimizer=torch.optim.Adam(new_model.parameters()),
+                                    last_iter=last_iter)
+            assert torch.equal(new_model.weight, weights[i]) and last_iter.val == i
+
+    def test_save_mc(self, tmpdir, monkeypatch):
+        # on memcache the final path is flushed after the rename, the same as save_file
+        flushed = []
+
+        def read_from_mc(path, flush=False):
+            assert flush and os.path.exists(path) and not os.path.exists(path + '.tmp')
+            flushed.append(path)
+
+        monkeypatch.setattr(checkpoint_helper, 'mc', object())
+        monkeypatch.setattr(checkpoint_helper, 'read_from_mc', read_from_mc)
+        helper = AsyncCheckpointHelper()
+        path = os.path.join(str(tmpdir), 'iteration_0.pth.tar')
+        helper.save(path, torch.nn.Linear(4, 2))
+        helper.wait()
+        assert flushed == [path] and helper.metrics['saved'] == 1
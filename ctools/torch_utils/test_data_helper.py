@@ -0,0 +1,101 @@
+import pickle
+from collections import namedtuple
+
+import pytest
+import torch
+
+from ctools.data import default_decollate, host_decollate
+from ctools.torch_utils import to_host_flat, to_host_split
+
+Baseline = namedtuple('Baseline', ['winloss', 'build_order'])
+
+
+def get_data():
+    return {
+        'logit': torch.randn(3, 5),
+        'action': [torch.randint(0, 9, (3, )), torch.randint(0, 9, (3, 2))],
+        'mask': torch.rand(3, 4) > 0.5,
+        'baselines': Baseline(torch.randn(3), torch.randn(3)),
+        'prev_state': [torch.randn(1, 8)],
+        'step': 3,
+    }
+
+
+@pytest.mark.unittest
+class TestToHostFlat:
+
+    def test_copy(self):
+        data = get_data()
+        out = to_host_flat(data, ignore_keys=['prev_state'], copy_cpu=True)
+        assert out['step'] == 3
+        assert out['prev_state'] is data['prev_state']
+        assert isinstance(out['baselines'], Baseline)
+        assert torch.equal(out['logit'], data['logit'])
+        assert torch.equal(out['action'][1], data['action'][1])
+        assert torch.equal(out['mask'], data['mask'])
+        # one buffer for each dtype, not shared with the input
+        assert out['logit'].data_ptr() != data['logit'].data_ptr()
+        assert out['logit']._base is out['baselines'].winloss._base
+        assert out['action'][0]._base is out['action'][1]._base
+        data['logit'].zero_()
+        assert not torch.equal(out['logit'], data['logit'])
+
+    def test_no_copy(self):
+        data = get_data()
+        out = to_host_flat(data)
+        # cpu tensors are returned as they are
+        assert out['logit'] is data['logit']
+        assert out['baselines'].winloss is data['baselines'].winloss
+
+    def test_reuse_buffer(self):
+        buffers = {}
+        data = get_data()
+        out = to_host_flat(data, buffers=buffers, copy_cpu=True)
+        ptr = out['logit'].data_ptr()
+        assert torch.equal(out['logit'], data['logit'])
+        data = get_data()
+        out = to_host_flat(data, buffers=buffers, copy_cpu=True)
+        assert out['logit'].data_ptr() == ptr
+        assert torch.equal(out['logit'], data['logit'])
+        assert set(buffers.keys()) == {torch.float32, torch.int64, torch.bool}
+
+    def test_split(self):
+        data = get_data()
+        data['prev_state'] = [torch.randn(1, 8) for _ in range(3)]
+        envs = to_host_split(data, ignore_keys=['prev_state'])
+        assert len(envs) == 3
+        for b, env in enumerate(envs):
+            assert env['step'] == 3
+            assert env['prev_state'] is data['prev_state']
+            assert isinstance(env['baselines'], Baseline)
+            assert torch.equal(env['logit'], data['logit'][b])
+            assert torch.equal(env['action'][1], data['action'][1][b])
+            assert torch.equal(env['mask'], data['mask'][b])
+            # one chunk of each dtype for an env, 5 logits and 2 baselines, not shared with the input
+            assert env['logit'].data_ptr() != data['logit'][b].data_ptr()
+            assert env['baselines'].winloss.data_ptr() == env['logit'].data_ptr() + 5 * 4
+            assert envs[(b + 1) % 3]['logit'].data_ptr() == env['logit'].data_ptr() + 7 * 4 * (1 if b < 2 else -2)
+            # but each piece pickles only its own elements
+            assert env['logit'].storage().size() == 5
+            assert len(pickle.dumps(env['logit'])) == len(pickle.dumps(data['logit'][b].clone()))
+        assert envs[0]['baselines'].winloss.shape == ()
+        envs = to_host_split(data, ignore_keys=['prev_state'], keepdim_1d=True)
+        assert envs[0]['baselines'].winloss.shape == (1, )
+        assert envs[0]['logit'].shape == (5, )
+
+    def test_host_decollate(self):
+        data = get_data()
+        data['prev_state'] = [torch.randn(1, 8) for _ in range(3)]
+        data.pop('step')
+        ref = default_decollate(data)
+        output = host_decollate(data)
+        assert len(output) == len(ref) == 3
+        for o, r in zip(output, ref):
+            assert o.keys() == r.keys()
+            assert o['prev_state'] is r['prev_state']
+            assert isinstance(o['action'], tuple) and isinstance(o['baselines'], tuple)
+            for k in ['logit', 'mask']:
+                assert o[k].shape == r[k].shape and torch.equal(o[k], r[k])
+            for k in ['action', 'baselines']:
+                for p, q in zip(o[k], r[k]):
+                    assert p.shape == q.shape and torch.equal(p, q)
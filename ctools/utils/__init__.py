@@ -1,14 +1,16 @@
-from .compression_helper import get_data_compressor, get_data_decompressor
+from .compression_helper import get_data_compressor, get_data_decompressor, get_bytes_compressor
 from .fake_linklink import link, FakeLink
 from .config_helper import deep_merge_dicts, read_config
 from .design_helper import SingletonMetaclass
 from .dist_helper import get_rank, get_world_size, distributed_mode, DistModule, dist_init, dist_finalize, \
-    allreduce, get_group, broadcast
+    allreduce, get_group, broadcast, GradBucketer
 from .file_helper import read_file, save_file, remove_file
 from .import_helper import try_import_ceph, try_import_mc, try_import_link, import_module
+from .model_delta_helper import ModelPublisher, ModelSubscriber, MODEL_SUFFIX
 from .lock_helper import LockContext, LockContextType
 from .log_helper import build_logger, DistributionTimeImage, get_default_logger, pretty_print, build_logger_naive, \
-    AverageMeter, VariableRecord
+    AverageMeter, VariableRecord, ScalarMeterGroup
+from .profile_helper import get_profiler, Profiler, ProfileExporter, LatencyHistogram, StackSampler
 from .system_helper import get_ip, get_pid, get_task_uid, get_manager_node_ip, PropagatingThread, find_free_port
 from .time_helper import build_time_helper, EasyTimer
 from .default_helper import override, dicts_to_lists, lists_to_dicts, squeeze, default_get, error_wrapper, list_split
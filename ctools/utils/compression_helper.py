@@ -43,6 +43,27 @@ def get_data_compressor(name: str):
     return _COMPRESSORS_MAP[name]
 
 
+_BYTES_COMPRESSORS_MAP = {
+    'lz4': lz4.block.compress,
+    'zlib': zlib.compress,
+    'none': None,
+}
+
+
+def get_bytes_compressor(name: str) -> Optional[Callable]:
+    r"""
+    Overview:
+        get the compressor of pickled bytes according to the input name, ``get_bytes_compressor(name)(pickle.dumps(
+        data))`` is the same as ``get_data_compressor(name)(data)``, so the pickling and the compression can be done
+        in different processes
+    Arguments:
+        - name(:obj:`str`): the name of the compressor, support ['lz4', 'zlib', 'none']
+    Return:
+        - (:obj:`Callable`): the compress function of bytes, None for 'none' as the data is not pickled
+    """
+    return _BYTES_COMPRESSORS_MAP[name]
+
+
 def dummy_decompressor(data):
     return data
 
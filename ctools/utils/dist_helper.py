@@ -144,6 +144,126 @@ def simple_group_split(world_size, rank, num_groups):
     return groups[rank // group_size]
 
 
+class GradBucketer(object):
+    r"""
+    Overview:
+        Reduce the gradients in size bounded buckets instead of one collective per parameter. The parameters are put
+        into buckets in the reverse order of registration, which is about the order their gradients are ready in
+        backward. The gradients of a bucket are flattened into one contiguous buffer, reduced with one call, and
+        copied back into ``.grad``.
+    Interface:
+        __init__, register_hooks, mark_ready, sync
+    """
+
+    def __init__(self, named_params, bucket_size=25 * 1024 * 1024, reduce_fn=None, wait_fn=None):
+        r"""
+        Overview:
+            build the buckets
+        Arguments:
+            - named_params (:obj:`iterable`): (name, param) pairs, params without requires_grad are skipped
+            - bucket_size (:obj:`int`): max bytes of a bucket, a larger parameter gets a bucket of its own
+            - reduce_fn (:obj:`callable`): reduce_fn(name, buffer) reduces a bucket in place, \
+                e.g. the blocking allreduce or link.allreduce_async
+            - wait_fn (:obj:`callable`): wait for the async reduce_fn to finish, None for a blocking reduce_fn
+        """
+        self._reduce_fn = reduce_fn
+        self._wait_fn = wait_fn
+        params = [(name, p) for name, p in named_params if p.requires_grad]
+        self._buckets = []
+        bucket, size = [], 0
+        for name, p in reversed(params):
+            nbytes = p.numel() * p.element_size()
+            if len(bucket) > 0 and (size + nbytes > bucket_size or p.dtype != bucket[0][1].dtype
+                                    or p.device != bucket[0][1].device):
+                self._add_bucket(bucket)
+                bucket, size = [], 0
+            bucket.append((name, p))
+            size += nbytes
+        if len(bucket) > 0:
+            self._add_bucket(bucket)
+        self._param2bucket = {id(p): i for i, b in enumerate(self._buckets) for p in b['params']}
+        self._grad_accs = []
+        self._reset()
+
+    def _add_bucket(self, bucket):
+        params = [p for _, p in bucket]
+        numels = [p.numel() for p in params]
+        self._buckets.append(
+            {
+                'name': 'bucket{}.{}'.format(len(self._buckets), bucket[0][0]),
+                'params': params,
+                'numels': numels,
+                'buffer': torch.zeros(sum(numels), dtype=params[0].dtype, device=params[0].device),
+            }
+        )
+
+    def _reset(self):
+        self._pending = [len(b['params']) for b in self._buckets]
+        self._launched = [False for _ in self._buckets]
+
+    @property
+    def num_buckets(self):
+        return len(self._buckets)
+
+    def register_hooks(self):
+        r"""
+        Overview:
+            launch the reduce of a bucket in backward, as soon as all of its gradients are ready
+        """
+        for b in self._buckets:
+            for p in b['params']:
+                p_tmp = p.expand_as(p)
+                grad_acc = p_tmp.grad_fn.next_functions[0][0]
+                grad_acc.register_hook(self._make_hook(p))
+                self._grad_accs.append(grad_acc)
+
+    def _make_hook(self, p):
+
+        def hook(*ignore):
+            self.mark_ready(p)
+
+        return hook
+
+    def mark_ready(self, param):
+        r"""
+        Overview:
+            mark the gradient of a param ready, and launch the reduce of its bucket when the bucket is full
+        """
+        i = self._param2bucket[id(param)]
+        self._pending[i] -= 1
+        if self._pending[i] == 0:
+            self._launch(i)
+
+    def _launch(self, i):
+        b = self._buckets[i]
+        for p, v in zip(b['params'], b['buffer'].split(b['numels'])):
+            if p.grad is None:
+                v.zero_()
+            else:
+                v.copy_(p.grad.data.reshape(-1))
+        self._reduce_fn(b['name'], b['buffer'])
+        self._launched[i] = True
+
+    def sync(self):
+        r"""
+        Overview:
+            launch the buckets not launched yet(e.g. some params are not used in backward), wait for the reduce,
+            and copy the reduced buckets back into ``.grad``
+        """
+        for i in range(len(self._buckets)):
+            if not self._launched[i]:
+                self._launch(i)
+        if self._wait_fn is not None:
+            self._wait_fn()
+        for b in self._buckets:
+            for p, v in zip(b['params'], b['buffer'].split(b['numels'])):
+                if p.grad is None:
+                    p.grad = v.view_as(p).clone()
+                else:
+                    p.grad.data.copy_(v.view_as(p))
+        self._reset()
+
+
 class DistModule(torch.nn.Module):
     r"""
     Overview:
@@ -152,13 +272,14 @@ class DistModule(torch.nn.Module):
         __init__, sync_gradients, broadcast_params
     """
 
-    def __init__(self, module, sync=True):
+    def __init__(self, module, sync=True, bucket_size=25 * 1024 * 1024):
         r"""
         Overview:
             init method of the DistModule
         Arguments:
             - module (:obj:`nn.model`): the module to be wrapped
             - sync (:obj:`bool`): whether need syncronize
+            - bucket_size (:obj:`int`): max bytes of the gradients reduced in one collective
         """
         super(DistModule, self).__init__()
         self.module = module
@@ -166,9 +287,13 @@ class DistModule(torch.nn.Module):
         self.broadcast_params()
 
         self.sync = sync
-        if not sync:
-            self._grad_accs = []
-            self._register_hooks()
+        if sync:
+            self._bucketer = GradBucketer(self.named_parameters(), bucket_size, lambda name, data: allreduce(data))
+        else:
+            self._bucketer = GradBucketer(
+                self.named_parameters(), bucket_size, link.allreduce_async, wait_fn=link.synchronize
+            )
+            self._bucketer.register_hooks()
         self._create_grad()
 
     def _extend_module_attr(self):
@@ -178,32 +303,15 @@ class DistModule(torch.nn.Module):
         for attr in attributes:
             setattr(self, attr, getattr(self.module, attr))
 
-    def _register_hooks(self):
-        for i, (name, p) in enumerate(self.named_parameters()):
-            if p.requires_grad:
-                p_tmp = p.expand_as(p)
-                grad_acc = p_tmp.grad_fn.next_functions[0][0]
-                grad_acc.register_hook(self._make_hook(name, p, i))
-                self._grad_accs.append(grad_acc)
-
-    def _make_hook(self, name, p, i):
-
-        def hook(*ignore):
-            link.allreduce_async(name, p.grad.data)
-
-        return hook
-
     def sync_gradients(self):
         r"""
         Overview:
-            calculate the average gradients
+            calculate the average gradients, bucket by bucket
         """
-        if self.sync and link.get_world_size() > 1:
-            for name, param in self.named_parameters():
-                if param.requires_grad:
-                    allreduce(param.grad.data)
-        else:
+        if self.sync and link.get_world_size() <= 1:
             link.synchronize()
+            return
+        self._bucketer.sync()
 
     def broadcast_params(self):
         """
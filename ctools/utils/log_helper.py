@@ -314,6 +314,9 @@ class VariableRecord(object):
         """
         self.var_dict = {'scalar': {}}
         self.length = max(length, 10)  # at least average across 10 iteration
+        self._scalar_groups = {}  # length -> ScalarMeterGroup
+        self._name2group = {}  # name -> ScalarMeterGroup of the scalar meters
+        self._name2meter = {}  # name -> meter of the other meters
 
     def register_var(self, name, length=None, var_type='scalar'):
         r"""
@@ -326,19 +329,43 @@ class VariableRecord(object):
         """
         assert (var_type in ['scalar'])
         lens = self.length if length is None else length
-        self.var_dict[var_type][name] = AverageMeter(lens)
+        if lens not in self._scalar_groups:
+            self._scalar_groups[lens] = ScalarMeterGroup(lens)
+        group = self._scalar_groups[lens]
+        group.add(name)
+        self._name2group[name] = group
+        self._name2meter.pop(name, None)
+        self.var_dict[var_type][name] = group.meter(name)
 
     def update_var(self, info):
         r"""
         Overview:
-            update vars
+            update vars, the scalars of the same length are updated together
         Arguments:
             - info (:obj:`dict`): key is var type and value is the corresponding variable name
         """
         assert isinstance(info, dict)
+        groups = {}
         for k, v in info.items():
-            var_type = self._get_var_type(k)
-            self.var_dict[var_type][k].update(v)
+            group = self._name2group.get(k)
+            if group is not None:
+                if isinstance(v, list):
+                    # 1D-array values are kept by an AverageMeter
+                    meter = AverageMeter(group.length)
+                    del self._name2group[k]
+                    self._name2meter[k] = meter
+                    self.var_dict[self._get_var_type(k)][k] = meter
+                    meter.update(v)
+                    continue
+                if id(group) not in groups:
+                    groups[id(group)] = (group, {})
+                groups[id(group)][1][k] = v
+            elif k in self._name2meter:
+                self._name2meter[k].update(v)
+            else:
+                raise KeyError("invalid key({}) in variable record".format(k))
+        for group, values in groups.values():
+            group.update(values)
 
     def _get_var_type(self, k):
         for var_type, var_type_dict in self.var_dict.items():
@@ -451,9 +478,12 @@ class VariableRecord(object):
 class AverageMeter(object):
     r"""
     Overview:
-        Computes and stores the average and current value, scalar and 1D-array
+        Computes and stores the average and current value, scalar and 1D-array, the history is kept in a ring buffer
+        with a running sum, so an update costs O(1) instead of O(length)
     Interface:
         __init__, reset, update
+    Property:
+        history
     """
 
     def __init__(self, length=0):
@@ -472,10 +502,27 @@ class AverageMeter(object):
         Overview:
             reset AverageMeter class
         """
-        self.history = []
+        self._buffer = None  # allocated by the first value, [length, *value_shape]
+        self._sum = None
+        self._count = 0
+        self._index = 0
         self.val = 0.0
         self.avg = 0.0
 
+    @property
+    def history(self):
+        r"""
+        Overview:
+            the last values, from the oldest to the latest
+        """
+        if self._buffer is None:
+            return []
+        if self._count < self.length:
+            history = self._buffer[:self._count]
+        else:
+            history = np.concatenate([self._buffer[self._index:], self._buffer[:self._index]])
+        return [h.tolist() for h in history]
+
     def update(self, val):
         r"""
         Overview:
@@ -486,12 +533,117 @@ class AverageMeter(object):
         if isinstance(val, torch.Tensor):
             val = val.item()
         assert (isinstance(val, list) or isinstance(val, numbers.Integral) or isinstance(val, numbers.Real))
-        self.history.append(val)
-        if len(self.history) > self.length:
-            del self.history[0]
+        value = np.asarray(val, dtype=np.float64)
+        if self._buffer is None or self._buffer.shape[1:] != value.shape:
+            self._buffer = np.zeros((self.length, ) + value.shape, dtype=np.float64)
+            self._sum = np.zeros(value.shape, dtype=np.float64)
+            self._count, self._index = 0, 0
+        if self._count == self.length:
+            self._sum -= self._buffer[self._index]
+        else:
+            self._count += 1
+        self._buffer[self._index] = value
+        self._sum += value
+        self._index = (self._index + 1) % self.length
+        if self._index == 0:
+            # drop the float error accumulated in the running sum
+            self._sum = self._buffer[:self._count].sum(axis=0)
+        self.val = val
+        self.avg = self._sum / self._count
+
+
+class ScalarMeterGroup(object):
+    r"""
+    Overview:
+        The ring buffers of many scalar AverageMeter with the same length in one array, so the values of a dict are
+        updated with a few vectorized ops. Each meter is a column, ``meter(name)`` returns a view with val and avg.
+    Interface:
+        __init__, add, meter, update
+    """
+
+    def __init__(self, length):
+        r"""
+        Overview:
+            init ScalarMeterGroup class
+        Arguments:
+            - length (:obj:`int`) : the length of iters to average
+        """
+        assert (length > 0)
+        self.length = length
+        self._columns = {}
+        self._buffer = np.zeros((length, 0), dtype=np.float64)
+        self._sum = np.zeros(0, dtype=np.float64)
+        self._count = np.zeros(0, dtype=np.int64)
+        self._index = np.zeros(0, dtype=np.int64)
+        self._val = np.zeros(0, dtype=np.float64)
+        self._num_updates = 0
+
+    def add(self, name):
+        r"""
+        Overview:
+            add a meter, or reset it if it exists
+        """
+        if name in self._columns:
+            col = self._columns[name]
+            self._buffer[:, col] = 0
+            self._sum[col], self._count[col], self._index[col], self._val[col] = 0, 0, 0, 0
+            return
+        self._columns[name] = len(self._columns)
+        self._buffer = np.concatenate([self._buffer, np.zeros((self.length, 1))], axis=1)
+        self._sum = np.append(self._sum, 0.)
+        self._count = np.append(self._count, 0)
+        self._index = np.append(self._index, 0)
+        self._val = np.append(self._val, 0.)
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def meter(self, name):
+        return _ScalarMeterView(self, name)
+
+    def update(self, info):
+        r"""
+        Overview:
+            update the meters of the names in info
+        Arguments:
+            - info (:obj:`dict`): name -> scalar value, the names must be added
+        """
+        if len(info) == 0:
+            return
+        cols = np.array([self._columns[k] for k in info.keys()], dtype=np.int64)
+        values = np.array([v.item() if isinstance(v, torch.Tensor) else v for v in info.values()], dtype=np.float64)
+        index = self._index[cols]
+        full = self._count[cols] == self.length
+        self._sum[cols] += values - np.where(full, self._buffer[index, cols], 0.)
+        self._buffer[index, cols] = values
+        self._count[cols] += ~full
+        self._index[cols] = (index + 1) % self.length
+        self._val[cols] = values
+        self._num_updates += 1
+        if self._num_updates % self.length == 0:
+            # drop the float error accumulated in the running sums, the unused slots are zeros
+            self._sum = self._buffer.sum(axis=0)
+
+
+class _ScalarMeterView(object):
+
+    def __init__(self, group, name):
+        self._group = group
+        self._name = name
+        self._col = group._columns[name]
+        self.length = group.length
+
+    @property
+    def val(self):
+        return self._group._val[self._col]
+
+    @property
+    def avg(self):
+        count = self._group._count[self._col]
+        return self._group._sum[self._col] / count if count > 0 else 0.0
 
-        self.val = self.history[-1]
-        self.avg = np.mean(self.history, axis=0)
+    def update(self, val):
+        self._group.update({self._name: val})
 
 
 class DistributionTimeImage(object):
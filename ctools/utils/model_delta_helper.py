@@ -0,0 +1,260 @@
+"""
+Versioned model broadcast as a base plus compressed deltas
+
+    The publisher(learner) writes the full weights as a base file every ``rebase_freq`` versions, and each version as
+    a model file holding the diffs against the last base, in fp16 or int8(per tensor scale). The diffs are always
+    against the base, so the quantization error doesn't accumulate between versions. A subscriber(actor) reads the
+    model file with mmap, and only reads the base file again when the base changes. Both files are raw tensor bytes
+    behind a small pickled header, so no tensor is unpickled, and put them in ``/dev/shm`` for the actors of a node.
+
+    file layout: MAGIC | header length(uint64) | pickled header | tensor bytes, the header holds
+    {'version', 'base_version', 'extra', 'tensors': [(name, shape, dtype, encoding, offset, nbytes, scale)]}
+"""
+import mmap
+import os
+import pickle
+import struct
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import torch
+
+MODEL_SUFFIX = '.model'
+_MAGIC = b'DMDL'
+_ALIGN = 64
+_NP_DTYPE = {
+    'fp16': np.float16,
+    'int8': np.int8,
+}
+
+
+def _base_path(model_path: str, base_version: int) -> str:
+    return '{}.base.{}'.format(model_path[:-len(MODEL_SUFFIX)], base_version)
+
+
+def _write_file(path: str, header: dict, payloads: list) -> int:
+    head = pickle.dumps(header)
+    start = len(_MAGIC) + 8 + len(head)
+    pad = (-start) % _ALIGN
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_MAGIC + struct.pack('<Q', len(head) + pad) + head + b'\0' * pad)
+        for p in payloads:
+            f.write(p)
+    # readers either see the old file or the new one
+    os.replace(tmp_path, path)
+    return start + pad + sum([len(p) for p in payloads])
+
+
+def _read_file(path: str) -> Tuple[dict, Optional[mmap.mmap], int]:
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else None
+    if buf is None or buf[:len(_MAGIC)] != _MAGIC:
+        raise ValueError('not a model file: {}'.format(path))
+    head_len = struct.unpack('<Q', buf[len(_MAGIC):len(_MAGIC) + 8])[0]
+    start = len(_MAGIC) + 8
+    header = pickle.loads(buf[start:start + head_len])
+    return header, buf, start + head_len
+
+
+def _tensor_bytes(t: torch.Tensor) -> bytes:
+    return t.detach().cpu().contiguous().numpy().tobytes()
+
+
+def encode_delta(diff: torch.Tensor, dtype: str) -> Tuple[bytes, float]:
+    r"""
+    Overview:
+        encode the diff of a float tensor
+    Arguments:
+        - diff (:obj:`torch.Tensor`): the diff
+        - dtype (:obj:`str`): 'fp16' or 'int8'
+    Returns:
+        - data (:obj:`bytes`): the encoded diff
+        - scale (:obj:`float`): the int8 scale, 1 for fp16
+    """
+    if dtype == 'fp16':
+        return _tensor_bytes(diff.half()), 1.
+    elif dtype == 'int8':
+        scale = diff.abs().max().item() / 127.
+        return _tensor_bytes(torch.round(diff / scale).clamp_(-127, 127).to(torch.int8)), scale
+    else:
+        raise KeyError('invalid delta dtype: {}'.format(dtype))
+
+
+def decode_delta(data: memoryview, dtype: str, scale: float, shape: tuple) -> torch.Tensor:
+    diff = torch.from_numpy(np.frombuffer(data, dtype=_NP_DTYPE[dtype]).astype(np.float32))
+    if dtype == 'int8':
+        diff.mul_(scale)
+    return diff.view(shape)
+
+
+class ModelPublisher(object):
+    r"""
+    Overview:
+        publish the versions of a model as ``<name>.model`` in ``path``, see the module doc for the format
+    Interface:
+        __init__, publish
+    """
+
+    def __init__(self, path: str, name: str, delta_dtype: str = 'fp16', rebase_freq: int = 10) -> None:
+        r"""
+        Arguments:
+            - path (:obj:`str`): the dir to publish in, e.g. the shared ``path_agent`` or ``/dev/shm``
+            - name (:obj:`str`): the model name
+            - delta_dtype (:obj:`str`): 'fp16' or 'int8'
+            - rebase_freq (:obj:`int`): write a new base every this many versions
+        """
+        assert delta_dtype in _NP_DTYPE, delta_dtype
+        self._model_path = os.path.join(path, name + MODEL_SUFFIX)
+        self._delta_dtype = delta_dtype
+        self._rebase_freq = rebase_freq
+        self._version = 0
+        self._base = None
+        self._base_version = None
+        self._old_base_version = None
+
+    @property
+    def model_path(self) -> str:
+        return self._model_path
+
+    def _need_rebase(self, state_dict: Dict[str, torch.Tensor]) -> bool:
+        if self._base is None or self._version - self._base_version >= self._rebase_freq:
+            return True
+        if state_dict.keys() != self._base.keys():
+            return True
+        return any([v.shape != self._base[k].shape or v.dtype != self._base[k].dtype for k, v in state_dict.items()])
+
+    def _write_base(self, state_dict: Dict[str, torch.Tensor]) -> int:
+        tensors, payloads, offset = [], [], 0
+        for k, v in state_dict.items():
+            data = _tensor_bytes(v)
+            tensors.append((k, tuple(v.shape), v.dtype, 'raw', offset, len(data), 1.))
+            payloads.append(data)
+            offset += len(data)
+        header = {'version': self._version, 'base_version': self._version, 'extra': {}, 'tensors': tensors}
+        size = _write_file(_base_path(self._model_path, self._version), header, payloads)
+        # keep the last base for the readers of the last delta
+        if self._old_base_version is not None:
+            try:
+                os.remove(_base_path(self._model_path, self._old_base_version))
+            except FileNotFoundError:
+                pass
+        self._old_base_version = self._base_version
+        self._base = {k: v.detach().cpu().clone() for k, v in state_dict.items()}
+        self._base_version = self._version
+        return size
+
+    def publish(self, state_dict: Dict[str, torch.Tensor], extra: Optional[dict] = None) -> dict:
+        r"""
+        Overview:
+            publish a new version of the model
+        Arguments:
+            - state_dict (:obj:`Dict[str, torch.Tensor]`): the model state dict
+            - extra (:obj:`dict`): small info sent with the version, e.g. the iter
+        Returns:
+            - info (:obj:`dict`): version, base_version and the bytes written
+        """
+        self._version += 1
+        base_bytes = 0
+        if self._need_rebase(state_dict):
+            base_bytes = self._write_base(state_dict)
+        tensors, payloads, offset = [], [], 0
+        for k, v in state_dict.items():
+            v = v.detach().cpu()
+            base = self._base[k]
+            if torch.equal(v, base):
+                continue
+            if v.is_floating_point():
+                data, scale = encode_delta(v.float() - base.float(), self._delta_dtype)
+                encoding = self._delta_dtype
+            else:
+                data, scale, encoding = _tensor_bytes(v), 1., 'raw'
+            tensors.append((k, tuple(v.shape), v.dtype, encoding, offset, len(data), scale))
+            payloads.append(data)
+            offset += len(data)
+        header = {
+            'version': self._version,
+            'base_version': self._base_version,
+            'extra': extra or {},
+            'tensors': tensors
+        }
+        delta_bytes = _write_file(self._model_path, header, payloads)
+        return {
+            'version': self._version,
+            'base_version': self._base_version,
+            'base_bytes': base_bytes,
+            'delta_bytes': delta_bytes
+        }
+
+
+class ModelSubscriber(object):
+    r"""
+    Overview:
+        read the latest version published by a ``ModelPublisher``
+    Interface:
+        __init__, read
+    """
+
+    def __init__(self, model_path: str, max_retry: int = 5) -> None:
+        r"""
+        Arguments:
+            - model_path (:obj:`str`): path of the ``<name>.model`` file
+            - max_retry (:obj:`int`): retries when the base is replaced while reading
+        """
+        assert model_path.endswith(MODEL_SUFFIX), model_path
+        self._model_path = model_path
+        self._max_retry = max_retry
+        self._base = None
+        self._base_version = None
+        self._version = None
+        self._state_dict = None
+
+    @property
+    def version(self) -> Optional[int]:
+        return self._version
+
+    def _load_base(self, base_version: int) -> None:
+        header, buf, start = _read_file(_base_path(self._model_path, base_version))
+        base = {}
+        for name, shape, dtype, _, offset, nbytes, _ in header['tensors']:
+            data = torch.frombuffer(bytearray(buf[start + offset:start + offset + nbytes]), dtype=dtype)
+            base[name] = data.view(shape)
+        buf.close()
+        self._base, self._base_version = base, base_version
+
+    def read(self) -> dict:
+        r"""
+        Overview:
+            read the latest version, the same dict is returned until a new version is published
+        Returns:
+            - state_dict (:obj:`dict`): {'model': model state dict, 'version': int, **extra}
+        """
+        for i in range(self._max_retry):
+            header, buf, start = _read_file(self._model_path)
+            try:
+                if header['version'] == self._version:
+                    return self._state_dict
+                if header['base_version'] != self._base_version:
+                    try:
+                        self._load_base(header['base_version'])
+                    except FileNotFoundError:
+                        # rebased twice since the model file was read
+                        continue
+                model = dict(self._base)
+                view = memoryview(buf)
+                for name, shape, dtype, encoding, offset, nbytes, scale in header['tensors']:
+                    data = view[start + offset:start + offset + nbytes]
+                    if encoding == 'raw':
+                        model[name] = torch.frombuffer(bytearray(data), dtype=dtype).view(shape)
+                    else:
+                        diff = decode_delta(data, encoding, scale, shape)
+                        model[name] = (self._base[name].float() + diff).to(dtype)
+                    del data
+                view.release()
+            finally:
+                buf.close()
+            self._version = header['version']
+            self._state_dict = dict(header['extra'], model=model, version=header['version'])
+            return self._state_dict
+        raise RuntimeError('failed to read model: {}'.format(self._model_path))
@@ -0,0 +1,476 @@
+"""
+Copyright 2020 Sensetime X-lab. All Rights Reserved
+
+Main Function:
+    1. LatencyHistogram, a HDR-style log-linear histogram of latencies.
+    2. Profiler, named spans aggregated per process, can merge the pysc2 stopwatch.
+    3. ProfileExporter, export the profiler to json and tensorboard periodically.
+    4. StackSampler, sample the python stacks of the threads of this process, as folded stacks for flamegraph.
+
+Usage:
+    >>> profiler = get_profiler()
+    >>> with profiler.span('actor.infer'):
+    >>>     ...
+    The spans cost nothing until the profiler is enabled, by ``profiler.enable()`` or by setting the environment
+    variable DISTAR_PROFILE_DIR, then every process(including the env subprocesses) exports its profile to
+    ``$DISTAR_PROFILE_DIR/profile_<pid>.json`` every DISTAR_PROFILE_INTERVAL(default 60) seconds.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+# histogram precision: 2**5 sub buckets per power of 2, about 3% relative error
+_SUB_BITS = 5
+_SUB_BUCKETS = 1 << _SUB_BITS
+_UNIT = 1e-6  # record in microseconds
+_LINE_PATTERN = re.compile(r':\d+\)$')
+
+
+class LatencyHistogram(object):
+    r"""
+    Overview:
+        HDR-style histogram of latencies: exact buckets below 32us, then 32 linear sub buckets for each power of 2,
+        so a percentile is within about 3% of the real value whatever the scale. Only the used buckets are stored.
+    Interface:
+        __init__, record, merge, percentile, summary, state_dict, load_state_dict
+    """
+
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self) -> None:
+        self.counts = {}
+        self.count = 0
+        self.total = 0.
+        self.min = float('inf')
+        self.max = 0.
+
+    @staticmethod
+    def _index(value: float) -> int:
+        v = int(value / _UNIT)
+        if v < _SUB_BUCKETS:
+            return max(v, 0)
+        shift = v.bit_length() - _SUB_BITS - 1
+        return ((shift + 1) << _SUB_BITS) + (v >> shift) - _SUB_BUCKETS
+
+    @staticmethod
+    def _bounds(index: int) -> tuple:
+        if index < _SUB_BUCKETS:
+            return index * _UNIT, (index + 1) * _UNIT
+        shift = (index >> _SUB_BITS) - 1
+        top = (index & (_SUB_BUCKETS - 1)) + _SUB_BUCKETS
+        return (top << shift) * _UNIT, ((top + 1) << shift) * _UNIT
+
+    def record(self, value: float) -> None:
+        r"""
+        Overview:
+            record a latency in seconds
+        """
+        idx = self._index(value)
+        self.counts[idx] = self.counts.get(idx, 0) + 1
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        for idx, c in other.counts.items():
+            self.counts[idx] = self.counts.get(idx, 0) + c
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q: float) -> float:
+        r"""
+        Overview:
+            the q-th(0~100) percentile in seconds, the middle of its bucket
+        """
+        if self.count == 0:
+            return 0.
+        target = q / 100. * self.count
+        acc = 0
+        for idx in sorted(self.counts.keys()):
+            acc += self.counts[idx]
+            if acc >= target:
+                low, high = self._bounds(idx)
+                return min(max((low + high) / 2, self.min), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        if self.count == 0:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+        }
+
+    def state_dict(self) -> dict:
+        return {'counts': dict(self.counts), 'count': self.count, 'total': self.total, 'min': self.min, 'max': self.max}
+
+    def load_state_dict(self, state_dict: dict) -> None:
+        self.counts = dict(state_dict['counts'])
+        self.count = state_dict['count']
+        self.total = state_dict['total']
+        self.min = state_dict['min']
+        self.max = state_dict['max']
+
+
+class _Span(object):
+    __slots__ = ('_profiler', '_name', '_start')
+
+    def __init__(self, profiler: 'Profiler', name: str) -> None:
+        self._profiler = profiler
+        self._name = name
+
+    def __enter__(self) -> None:
+        self._start = time.perf_counter()
+
+    def __exit__(self, *args) -> None:
+        self._profiler.record(self._name, time.perf_counter() - self._start)
+
+
+class _FakeSpan(object):
+
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *args) -> None:
+        pass
+
+
+_FAKE_SPAN = _FakeSpan()
+
+
+class Profiler(object):
+    r"""
+    Overview:
+        per process aggregator of the named spans, thread safe
+    Interface:
+        __init__, enable, disable, span, record, add_stopwatch, set_tb_writer, summary, state_dict, merge, reset
+    Property:
+        enabled
+    """
+
+    def __init__(self, enabled: bool = False) -> None:
+        self._enabled = enabled
+        self.pid = os.getpid()
+        self.exporter = None
+        self._histograms = {}
+        self._stopwatches = []
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    def enable(self) -> None:
+        self._enabled = True
+
+    def disable(self) -> None:
+        self._enabled = False
+
+    def span(self, name: str) -> Any:
+        r"""
+        Overview:
+            a context to time a block as span ``name``, e.g. 'actor.infer'
+        """
+        if not self._enabled:
+            return _FAKE_SPAN
+        return _Span(self, name)
+
+    def record(self, name: str, value: float) -> None:
+        r"""
+        Overview:
+            record a latency(in seconds) of span ``name``
+        """
+        if not self._enabled:
+            return
+        with self._lock:
+            hist = self._histograms.get(name)
+            if hist is None:
+                hist = self._histograms[name] = LatencyHistogram()
+            hist.record(value)
+
+    def add_stopwatch(self, stopwatch: Any, prefix: str = 'sc2.') -> None:
+        r"""
+        Overview:
+            merge the stats of a pysc2 stopwatch into the summary, with names prefixed, the stopwatch only keeps
+            count/sum/min/max, so there is no percentile of them
+        """
+        if (stopwatch, prefix) not in self._stopwatches:
+            self._stopwatches.append((stopwatch, prefix))
+
+    def set_tb_writer(self, tb_writer: Any) -> None:
+        r"""
+        Overview:
+            add the exported summary to tensorboard too, no-op without exporter(DISTAR_PROFILE_DIR is not set)
+        Arguments:
+            - tb_writer (:obj:`SummaryWriter`): tensorboard writer, e.g. the ``logger`` of the learner tb_logger
+        """
+        if self.exporter is not None:
+            self.exporter.set_tb_writer(tb_writer)
+
+    def summary(self) -> dict:
+        r"""
+        Overview:
+            the summary(count, total, mean, min, max, p50, p90, p99, in seconds) of each span
+        """
+        with self._lock:
+            ret = {k: v.summary() for k, v in self._histograms.items()}
+        for stopwatch, prefix in self._stopwatches:
+            for name, stat in list(stopwatch.times.items()):
+                if stat.num == 0:
+                    continue
+                ret[prefix + name] = {
+                    'count': stat.num,
+                    'total': stat.sum,
+                    'mean': stat.avg,
+                    'min': stat.min,
+                    'max': stat.max,
+                    'dev': stat.dev,
+                }
+        return ret
+
+    def state_dict(self) -> dict:
+        with self._lock:
+            return {k: v.state_dict() for k, v in self._histograms.items()}
+
+    def merge(self, state_dict: dict) -> None:
+        r"""
+        Overview:
+            merge the ``state_dict`` of the profiler of another process
+        """
+        with self._lock:
+            for k, v in state_dict.items():
+                hist = LatencyHistogram()
+                hist.load_state_dict(v)
+                if k in self._histograms:
+                    self._histograms[k].merge(hist)
+                else:
+                    self._histograms[k] = hist
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms = {}
+        for stopwatch, _ in self._stopwatches:
+            stopwatch.clear()
+
+
+class ProfileExporter(object):
+    r"""
+    Overview:
+        export the summary of a profiler as json lines and tensorboard scalars(mean, p50 and p99 in ms of each span)
+    Interface:
+        __init__, set_tb_writer, export, start, close
+    """
+
+    def __init__(
+            self,
+            profiler: Profiler,
+            path: str,
+            name: Optional[str] = None,
+            tb_writer: Any = None,
+            interval: float = 60.,
+            reset: bool = False
+    ) -> None:
+        r"""
+        Arguments:
+            - profiler (:obj:`Profiler`): the profiler to export
+            - path (:obj:`str`): dir of the json file
+            - name (:obj:`str`): json file name, default 'profile_<pid>.json'
+            - tb_writer (:obj:`SummaryWriter`): tensorboard writer, None means no tensorboard
+            - interval (:obj:`float`): seconds between two exports of the thread
+            - reset (:obj:`bool`): whether to reset the profiler after export, i.e. export each interval alone
+        """
+        self._profiler = profiler
+        if not os.path.exists(path):
+            os.makedirs(path, exist_ok=True)
+        name = name or 'profile_{}.json'.format(os.getpid())
+        self._path = os.path.join(path, name)
+        self._tb_writer = tb_writer
+        self._interval = interval
+        self._reset = reset
+        self._step = 0
+        self._end_flag = False
+        self._thread = None
+
+    def set_tb_writer(self, tb_writer: Any) -> None:
+        self._tb_writer = tb_writer
+
+    def export(self, step: Optional[int] = None) -> dict:
+        r"""
+        Overview:
+            append the summary to the json file, and add it to tensorboard
+        """
+        step = self._step if step is None else step
+        self._step += 1
+        summary = self._profiler.summary()
+        if self._reset:
+            self._profiler.reset()
+        with open(self._path, 'a') as f:
+            f.write(json.dumps({'time': time.time(), 'pid': os.getpid(), 'step': step, 'spans': summary}) + '\n')
+        if self._tb_writer is not None:
+            for name, s in summary.items():
+                for k in ['mean', 'p50', 'p99']:
+                    if k in s:
+                        self._tb_writer.add_scalar('profile/{}/{}_ms'.format(name, k), s[k] * 1000, step)
+        return summary
+
+    def _loop(self) -> None:
+        while not self._end_flag:
+            for _ in range(int(self._interval * 10)):
+                if self._end_flag:
+                    break
+                time.sleep(0.1)
+            self.export()
+
+    def start(self) -> None:
+        r"""
+        Overview:
+            export in a daemon thread every interval seconds
+        """
+        self._thread = threading.Thread(target=self._loop, name='profile_exporter')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self) -> None:
+        self._end_flag = True
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class StackSampler(object):
+    r"""
+    Overview:
+        sample the python stacks of the other threads(e.g. the data loader threads) every interval in a daemon
+        thread, and count them as folded stacks: ``thread;func (file:line);...`` -> samples, the format of
+        flamegraph.pl and py-spy(raw), so the two can be summarized together by ``top_functions``
+    Interface:
+        __init__, start, stop, folded, dump, top_functions
+    """
+
+    def __init__(
+            self,
+            interval: float = 0.01,
+            thread_filter: Optional[Callable[[threading.Thread], bool]] = None,
+            max_depth: int = 128
+    ) -> None:
+        r"""
+        Arguments:
+            - interval (:obj:`float`): seconds between two samples
+            - thread_filter (:obj:`Callable`): which threads to sample, default all threads except the main one
+            - max_depth (:obj:`int`): frames kept from the top of each stack
+        """
+        self._interval = interval
+        self._thread_filter = thread_filter or (lambda t: t is not threading.main_thread())
+        self._max_depth = max_depth
+        self._counts = Counter()
+        self._end_flag = False
+        self._thread = None
+        self.num_samples = 0
+
+    def _sample(self) -> None:
+        threads = {t.ident: t for t in threading.enumerate() if t is not self._thread and self._thread_filter(t)}
+        for ident, frame in sys._current_frames().items():
+            if ident not in threads:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self._max_depth:
+                code = frame.f_code
+                stack.append('{} ({}:{})'.format(code.co_name, code.co_filename, frame.f_lineno))
+                frame = frame.f_back
+            stack.append(threads[ident].name)
+            self._counts[';'.join(reversed(stack))] += 1
+        self.num_samples += 1
+
+    def _loop(self) -> None:
+        while not self._end_flag:
+            self._sample()
+            time.sleep(self._interval)
+
+    def start(self) -> 'StackSampler':
+        self._end_flag = False
+        self._thread = threading.Thread(target=self._loop, name='stack_sampler')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._end_flag = True
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def folded(self) -> Dict[str, int]:
+        return dict(self._counts)
+
+    def dump(self, path: str) -> None:
+        r"""
+        Overview:
+            write the folded stacks, render them by ``flamegraph.pl <path> > flame.svg`` or speedscope
+        """
+        with open(path, 'w') as f:
+            for stack, count in self._counts.most_common():
+                f.write('{} {}\n'.format(stack, count))
+
+    @staticmethod
+    def top_functions(folded: Dict[str, int], n: int = 30, keyword: Optional[str] = None) -> List[tuple]:
+        r"""
+        Overview:
+            the functions in the most samples
+        Arguments:
+            - folded (:obj:`Dict[str, int]`): folded stacks
+            - n (:obj:`int`): number of the functions returned
+            - keyword (:obj:`str`): only the functions whose frame contains it, e.g. 'collate'
+        Returns:
+            - top (:obj:`List[tuple]`): (function, total samples, self samples), sorted by the total samples
+        """
+        total, self_ = Counter(), Counter()
+        for stack, count in folded.items():
+            # the root is the thread, and the lines of a function are counted together
+            frames = [_LINE_PATTERN.sub(')', f) for f in stack.split(';')[1:]]
+            if len(frames) == 0:
+                continue
+            for frame in set(frames):
+                total[frame] += count
+            self_[frames[-1]] += count
+        if keyword is not None:
+            total = Counter({k: v for k, v in total.items() if keyword in k})
+        return [(k, v, self_[k]) for k, v in total.most_common(n)]
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler() -> Profiler:
+    r"""
+    Overview:
+        the profiler of this process, enabled and exported by a thread if DISTAR_PROFILE_DIR is set
+    """
+    global _profiler
+    if _profiler is None or _profiler.pid != os.getpid():  # a forked process has its own profiler
+        with _profiler_lock:
+            if _profiler is None or _profiler.pid != os.getpid():
+                profile_dir = os.environ.get('DISTAR_PROFILE_DIR', '')
+                profiler = Profiler(enabled=profile_dir != '')
+                if profile_dir != '':
+                    interval = float(os.environ.get('DISTAR_PROFILE_INTERVAL', 60))
+                    profiler.exporter = ProfileExporter(profiler, profile_dir, interval=interval)
+                    profiler.exporter.start()
+                _profiler = profiler
+    return _profiler
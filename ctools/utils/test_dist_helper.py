@@ -0,0 +1,103 @@
+import os
+
+import pytest
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from ctools.utils import GradBucketer
+
+
+def build_model():
+    torch.manual_seed(0)
+    return torch.nn.Sequential(*[torch.nn.Linear(8, 8) for _ in range(6)])
+
+
+def backward(model, rank):
+    torch.manual_seed(rank + 1)
+    model(torch.randn(4, 8)).sum().backward()
+
+
+def grads(model):
+    return [p.grad.clone() for p in model.parameters()]
+
+
+def run_bucketer(rank, world_size, port, use_hooks, result_queue):
+    os.environ['MASTER_ADDR'] = '127.0.0.1'
+    os.environ['MASTER_PORT'] = str(port)
+    dist.init_process_group('gloo', rank=rank, world_size=world_size)
+    calls = []
+    works = []
+
+    def reduce_fn(name, data):
+        calls.append(name)
+        if use_hooks:
+            works.append((dist.all_reduce(data, async_op=True), data))
+        else:
+            dist.all_reduce(data)
+            data.div_(world_size)
+
+    def wait_fn():
+        for work, data in works:
+            work.wait()
+            data.div_(world_size)
+        works.clear()
+
+    model = build_model()
+    # 2 layers(8 * 8 + 8 floats each) per bucket
+    bucketer = GradBucketer(model.named_parameters(), 2 * 72 * 4, reduce_fn, wait_fn if use_hooks else None)
+    if use_hooks:
+        bucketer.register_hooks()
+    for _ in range(2):
+        model.zero_grad()
+        backward(model, rank)
+        if use_hooks:
+            assert len(calls) == 3  # launched in backward
+        bucketer.sync()
+        # numpy arrays are pickled by value, shared tensors may outlive the process
+        result_queue.put((rank, calls[:], [g.numpy() for g in grads(model)]))
+        calls.clear()
+    dist.destroy_process_group()
+
+
+@pytest.mark.unittest
+class TestGradBucketer:
+
+    @pytest.mark.parametrize('use_hooks', [False, True])
+    def test_gloo(self, use_hooks):
+        world_size = 2
+        expected = []
+        for rank in range(world_size):
+            model = build_model()
+            backward(model, rank)
+            expected.append(grads(model))
+        expected = [sum(g) / world_size for g in zip(*expected)]
+
+        ctx = mp.get_context('spawn')
+        result_queue = ctx.Queue()
+        port = 29500 + os.getpid() % 1000 + int(use_hooks)
+        procs = [
+            ctx.Process(target=run_bucketer, args=(rank, world_size, port, use_hooks, result_queue))
+            for rank in range(world_size)
+        ]
+        for p in procs:
+            p.start()
+        results = [result_queue.get(timeout=60) for _ in range(2 * world_size)]
+        for p in procs:
+            p.join()
+        for rank, calls, result in results:
+            # reverse order: the last layer is in the first bucket
+            assert calls == ['bucket0.5.bias', 'bucket1.3.bias', 'bucket2.1.bias']
+            assert all([torch.allclose(torch.from_numpy(g), e, atol=1e-6) for g, e in zip(result, expected)])
+
+    def test_buckets(self):
+        model = torch.nn.Sequential(torch.nn.Linear(8, 8), torch.nn.Linear(64, 64), torch.nn.Linear(8, 8))
+        model[0].bias.requires_grad_(False)
+        calls = []
+        bucketer = GradBucketer(model.named_parameters(), 1024, lambda name, data: calls.append(data.numel()))
+        assert bucketer.num_buckets == 3  # the large weight gets a bucket of its own
+        # the unused params are reduced as zeros
+        model[2](torch.randn(2, 8)).sum().backward()
+        bucketer.sync()
+        assert calls == [8 + 64 + 64, 64 * 64, 64]
+        assert torch.equal(model[1].weight.grad, torch.zeros(64, 64))
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+import torch
+
+from ctools.utils import AverageMeter, VariableRecord
+
+
+@pytest.mark.unittest
+class TestMeter:
+
+    def test_average_meter(self):
+        meter = AverageMeter(7)
+        values = np.random.randn(50, 3)
+        for i, v in enumerate(values):
+            meter.update(v.tolist())
+            assert np.allclose(meter.avg, values[max(0, i - 6):i + 1].mean(axis=0))
+        assert np.allclose(meter.history, values[-7:])
+
+    def test_variable_record(self):
+        record = VariableRecord(10)
+        for k in ['a', 'b', 'c']:
+            record.register_var(k)
+        record.register_var('d', length=3)
+        a, c = [], []
+        for i in range(25):
+            info = {'a': i * 0.1, 'b': torch.tensor(2.), 'd': i}
+            if i % 2:
+                info['c'] = i
+                c.append(i)
+            a.append(i * 0.1)
+            record.update_var(info)
+        scalar = record.var_dict['scalar']
+        assert np.isclose(scalar['a'].avg, np.mean(a[-10:])) and np.isclose(scalar['a'].val, 2.4)
+        assert scalar['b'].avg == 2. and scalar['c'].avg == np.mean(c[-10:]) and scalar['d'].avg == 23
+        with pytest.raises(KeyError):
+            record.update_var({'e': 1})
@@ -0,0 +1,56 @@
+import os
+
+import pytest
+import torch
+
+from ctools.utils import ModelPublisher, ModelSubscriber
+
+
+def fake_state_dict():
+    return {
+        'fc.weight': torch.randn(64, 32),
+        'fc.bias': torch.randn(64),
+        'bn.num_batches_tracked': torch.tensor(0),
+    }
+
+
+def step(state_dict, lr=1e-3):
+    state_dict = {k: v.clone() for k, v in state_dict.items()}
+    state_dict['fc.weight'] += torch.randn_like(state_dict['fc.weight']) * lr
+    state_dict['bn.num_batches_tracked'] += 1
+    return state_dict
+
+
+@pytest.mark.unittest
+class TestModelDelta:
+
+    @pytest.mark.parametrize('dtype, tol', [('fp16', 1e-5), ('int8', 1e-4)])
+    def test_publish(self, tmpdir, dtype, tol):
+        publisher = ModelPublisher(str(tmpdir), 'agent', delta_dtype=dtype, rebase_freq=3)
+        subscriber = ModelSubscriber(publisher.model_path)
+        state_dict = fake_state_dict()
+        for i in range(7):
+            info = publisher.publish(state_dict, {'iter': i})
+            assert info['base_version'] == i // 3 * 3 + 1
+            assert (info['base_bytes'] > 0) == (i % 3 == 0)
+            data = subscriber.read()
+            assert data['iter'] == i and data['version'] == i + 1
+            assert data is subscriber.read()  # no new version
+            for k, v in state_dict.items():
+                assert data['model'][k].dtype == v.dtype
+                assert (data['model'][k] - v).abs().max().item() <= tol
+            if i % 3 != 0:
+                # only the changed tensors are in the delta, in half of the size or less
+                assert info['delta_bytes'] < 64 * 32 * 2 + 1024
+            state_dict = step(state_dict)
+        # the bases older than the last two are removed
+        assert sorted([f for f in os.listdir(str(tmpdir)) if '.base.' in f]) == ['agent.base.4', 'agent.base.7']
+
+    def test_new_subscriber(self, tmpdir):
+        publisher = ModelPublisher(str(tmpdir), 'agent', rebase_freq=10)
+        state_dict = fake_state_dict()
+        for i in range(4):
+            publisher.publish(state_dict, {'iter': i})
+            state_dict = step(state_dict)
+        data = ModelSubscriber(publisher.model_path).read()
+        assert data['version'] == 4 and data['model']['bn.num_batches_tracked'].item() == 3
@@ -0,0 +1,72 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from ctools.pysc2.lib import stopwatch
+from ctools.utils import LatencyHistogram, Profiler, ProfileExporter
+
+
+@pytest.mark.unittest
+class TestProfiler:
+
+    def test_histogram(self):
+        values = np.random.lognormal(-6, 1.5, size=10000)
+        hist = LatencyHistogram()
+        for v in values:
+            hist.record(v)
+        for q in [50, 90, 99]:
+            # about 3% error of the bucket, and 1us of the unit
+            assert abs(hist.percentile(q) - np.percentile(values, q)) <= np.percentile(values, q) * 0.04 + 1e-6
+        other = LatencyHistogram()
+        other.load_state_dict(hist.state_dict())
+        hist.merge(other)
+        assert hist.count == 20000 and hist.max == values.max()
+
+    def test_profiler(self, tmpdir):
+        profiler = Profiler()
+        with profiler.span('a'):
+            pass
+        assert profiler.summary() == {}
+        profiler.enable()
+        for _ in range(3):
+            with profiler.span('a'):
+                pass
+        profiler.record('b', 0.5)
+        sw = stopwatch.StopWatch()
+        with sw('rpc'):
+            pass
+        profiler.add_stopwatch(sw)
+        summary = profiler.summary()
+        assert summary['a']['count'] == 3 and summary['b']['p50'] == 0.5 and summary['sc2.rpc']['count'] == 1
+
+        exporter = ProfileExporter(profiler, str(tmpdir), name='profile.json', reset=True)
+        exporter.export()
+        exporter.export()
+        with open(os.path.join(str(tmpdir), 'profile.json')) as f:
+            lines = [json.loads(line) for line in f]
+        assert lines[0]['spans']['a']['count'] == 3 and lines[1]['spans'] == {}
+
+    def test_tb_writer(self, tmpdir):
+
+        class FakeWriter(object):
+
+            def __init__(self):
+                self.scalars = {}
+
+            def add_scalar(self, name, value, step):
+                self.scalars[(name, step)] = value
+
+        profiler = Profiler(enabled=True)
+        for v in [0.001, 0.002, 0.1]:
+            profiler.record('a', v)
+        profiler.exporter = ProfileExporter(profiler, str(tmpdir))
+        writer = FakeWriter()
+        # the same way as the learner does with its tb_logger
+        profiler.set_tb_writer(writer)
+        summary = profiler.exporter.export(step=7)
+        assert set(writer.scalars.keys()) == {('profile/a/{}_ms'.format(k), 7) for k in ['mean', 'p50', 'p99']}
+        for k in ['mean', 'p50', 'p99']:
+            assert writer.scalars[('profile/a/{}_ms'.format(k), 7)] == summary['a'][k] * 1000
+        assert abs(writer.scalars[('profile/a/p99_ms', 7)] - 100) <= 100 * 0.04
@@ -5,7 +5,7 @@ from collections import namedtuple
 from typing import Any
 import uuid
 
-from ctools.utils import build_logger_naive, EasyTimer, get_task_uid, VariableRecord, import_module
+from ctools.utils import build_logger_naive, EasyTimer, get_task_uid, VariableRecord, import_module, get_profiler
 from .comm.actor_comm_helper import ActorCommHelper
 
 
@@ -30,6 +30,7 @@ class BaseActor(ABC):
 
     def _setup_timer(self):
         self._timer = EasyTimer()
+        self._profiler = get_profiler()
 
         def agent_wrapper(fn):
 
@@ -37,6 +38,7 @@ class BaseActor(ABC):
                 with self._timer:
                     ret = fn(*args, **kwargs)
                 self._variable_record.update_var({'agent_time': self._timer.value})
+                self._profiler.record('actor.infer', self._timer.value)
                 return ret
 
             return wrapper
@@ -46,6 +48,7 @@ class BaseActor(ABC):
             def wrapper(*args, **kwargs):
                 with self._timer:
                     ret = fn(*args, **kwargs)
+                self._profiler.record('actor.env_step', self._timer.value)
                 size = sys.getsizeof(ret) / (1024 * 1024)  # MB
                 self._variable_record.update_var(
                     {
@@ -0,0 +1,233 @@
+"""
+Batched messaging from actors to the coordinator
+
+    Trajectory metadata and results are put into a bounded queue and sent by a background thread as one POST of
+    ``manager/send_batch`` every ``flush_interval`` seconds or ``max_batch`` messages, with a msgpack body over a
+    keep-alive session. A full queue blocks ``put``, so a slow coordinator slows down the packing thread of the actor
+    instead of growing the memory. A POST failed with a connection error or a 5xx status is retried with exponential
+    backoff and full jitter, so thousands of actors don't retry in lockstep.
+
+    body: msgpack of {'actor_uid': str, 'items': [{'api': str, 'data': dict}, ...]}
+    response: json {'code': 0, ...}, the coordinator handles each item as a request of its api, and a batch also counts
+    as a heartbeat of the actor. A coordinator without ``manager/send_batch``(404) is sent each item with its api.
+"""
+import json
+import queue
+import random
+import sys
+import threading
+import time
+from typing import Any, Optional
+
+import msgpack
+import numpy as np
+import requests
+import torch
+from requests.adapters import HTTPAdapter
+
+BATCH_API = 'manager/send_batch'
+
+
+def _encode(obj: Any) -> Any:
+    # msgpack only knows the python builtin types
+    if isinstance(obj, (np.ndarray, np.generic)):
+        return obj.tolist()
+    if isinstance(obj, torch.Tensor):
+        return obj.tolist()
+    if isinstance(obj, (set, tuple)):
+        return list(obj)
+    raise TypeError("not support message value type: {}".format(type(obj)))
+
+
+def pack_item(api: str, data: dict) -> bytes:
+    return msgpack.packb({'api': api, 'data': data}, default=_encode, use_bin_type=True)
+
+
+def pack_batch(actor_uid: str, items: list) -> bytes:
+    # items are already packed by pack_item, the body is the same as packing the list of their dicts
+    packer = msgpack.Packer(use_bin_type=True)
+    header = [
+        packer.pack_map_header(2),
+        packer.pack('actor_uid'),
+        packer.pack(actor_uid),
+        packer.pack('items'),
+        packer.pack_array_header(len(items))
+    ]
+    return b''.join(header + items)
+
+
+def unpack_batch(body: bytes) -> dict:
+    return msgpack.unpackb(body, raw=False)
+
+
+class BatchSender(object):
+    r"""
+    Overview:
+        coalesce the messages of an actor into batched POSTs, see the module doc for the protocol
+    Interface:
+        __init__, start, put, flush, close, queue_depth, last_send_time, legacy
+    """
+
+    def __init__(
+            self,
+            url_prefix: str,
+            actor_uid: str,
+            logger: Any,
+            max_queue: int = 1024,
+            max_batch: int = 256,
+            flush_interval: float = 1.,
+            base_delay: float = 0.5,
+            max_delay: float = 30.,
+            timeout: float = 30.
+    ) -> None:
+        r"""
+        Arguments:
+            - url_prefix (:obj:`str`): coordinator url prefix, e.g. 'http://127.0.0.1:8000/'
+            - actor_uid (:obj:`str`): the actor uid
+            - logger (:obj:`Any`): the actor logger
+            - max_queue (:obj:`int`): queued messages, ``put`` blocks when full
+            - max_batch (:obj:`int`): max messages in a POST
+            - flush_interval (:obj:`float`): max seconds a message waits for its batch
+            - base_delay (:obj:`float`): first retry delay, doubled after each failure until ``max_delay``
+            - max_delay (:obj:`float`): max retry delay, the delay is sampled in [0, delay) as the jitter
+            - timeout (:obj:`float`): http timeout of a POST
+        """
+        self._url_prefix = url_prefix
+        self._actor_uid = actor_uid
+        self._logger = logger
+        self._max_batch = max_batch
+        self._flush_interval = flush_interval
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._timeout = timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._session = requests.Session()
+        self._session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self._legacy = False
+        self._last_send_time = 0.
+        self._end_flag = False
+        self._thread = threading.Thread(target=self._send_loop, daemon=True)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def last_send_time(self) -> float:
+        # time of the last batch sent with the batch api, never set after falling back to each api
+        return self._last_send_time
+
+    @property
+    def legacy(self) -> bool:
+        return self._legacy
+
+    def start(self) -> 'BatchSender':
+        self._thread.start()
+        return self
+
+    def put(self, api: str, data: dict, timeout: Optional[float] = None) -> None:
+        r"""
+        Overview:
+            queue a message of ``api``, blocks when the queue is full
+        Arguments:
+            - api (:obj:`str`): the api the coordinator handles the message with, e.g. 'manager/get_metadata'
+            - data (:obj:`dict`): the message
+            - timeout (:obj:`float`): raise ``queue.Full`` after waiting for this many seconds, wait forever if None
+        Note:
+            the message is packed here, so an unsupported value raises ``TypeError`` in the caller, not the sender
+        """
+        packed = pack_item(api, data)
+        self._queue.put({'api': api, 'data': data, 'packed': packed}, timeout=timeout)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        r"""
+        Overview:
+            wait until all the queued messages are sent, returns False when timed out
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remain = None if deadline is None else deadline - time.time()
+                if remain is not None and remain <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remain)
+        return True
+
+    def close(self, timeout: float = 10.) -> None:
+        self.flush(timeout)
+        self._end_flag = True
+        self._thread.join(timeout)
+        self._session.close()
+
+    def _collect(self) -> list:
+        try:
+            items = [self._queue.get(timeout=self._flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.time() + self._flush_interval
+        while len(items) < self._max_batch:
+            remain = deadline - time.time()
+            if remain <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remain))
+            except queue.Empty:
+                break
+        return items
+
+    def _post(self, api: str, body: bytes, content_type: str) -> bool:
+        # False only when it is worth a retry, the coordinator rejecting the message is logged as before
+        t = time.time()
+        try:
+            response = self._session.post(
+                self._url_prefix + api, data=body, headers={'Content-Type': content_type}, timeout=self._timeout
+            )
+        except requests.RequestException:
+            self._logger.error("[error] api({}): {}".format(api, sys.exc_info()))
+            return False
+        if response.status_code == 404 and api == BATCH_API:
+            self._logger.info('coordinator has no {}, send each message with its api'.format(BATCH_API))
+            self._legacy = True
+            return False
+        if response.status_code >= 500:
+            self._logger.error("[error] api({}): status {}".format(api, response.status_code))
+            return False
+        try:
+            result = response.json()
+        except ValueError:
+            result = None
+        if result is not None and result['code'] == 0:
+            self._logger.info("{} succeed sending, cost_time: {}".format(api, time.time() - t))
+        else:
+            self._logger.error("{} failed to send: {}, cost_time: {}".format(api, response.text[:200], time.time() - t))
+        return True
+
+    def _send(self, items: list) -> bool:
+        if not self._legacy:
+            if self._post(BATCH_API, pack_batch(self._actor_uid, [item['packed'] for item in items]), 'application/msgpack'):
+                return True
+            if not self._legacy:
+                return False
+        # the coordinator without batch api, items already sent are not sent again on retry
+        while items:
+            if not self._post(items[0]['api'], json.dumps(items[0]['data'], default=_encode), 'application/json'):
+                return False
+            items.pop(0)
+            self._queue.task_done()
+        return True
+
+    def _send_loop(self) -> None:
+        while not self._end_flag:
+            items = self._collect()
+            if not items:
+                continue
+            num = len(items)
+            delay = self._base_delay
+            while not self._send(items) and not self._end_flag:
+                # full jitter
+                time.sleep(random.uniform(0, delay))
+                delay = min(delay * 2, self._max_delay)
+            if not self._legacy:
+                self._last_send_time = time.time()
+                for _ in range(num):
+                    self._queue.task_done()
@@ -7,8 +7,9 @@ import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
-from ctools.utils import read_file, save_file
+from ctools.utils import read_file, save_file, ModelSubscriber, MODEL_SUFFIX
 from .base_comm_actor import BaseCommActor
+from .batch_sender import BatchSender
 
 
 class FlaskFileSystemActor(BaseCommActor):
@@ -24,6 +25,37 @@ class FlaskFileSystemActor(BaseCommActor):
         self._path_agent = cfg.path_agent
         self._path_traj = cfg.path_traj
         self._heartbeats_freq = cfg.heartbeats_freq
+        self._model_subscribers = {}
+        # metadata and results are sent in batches by a BatchSender, created when the actor uid is set
+        self._batch_send = cfg.get('batch_send', True)
+        self._batch_sender = None
+
+    # override
+    def init_service(self) -> None:
+        super().init_service()
+        if self._batch_send:
+            self._batch_sender = BatchSender(
+                self._url_prefix,
+                self._actor_uid,
+                self._logger,
+                max_queue=self._cfg.get('batch_max_queue', 1024),
+                max_batch=self._cfg.get('batch_max_size', 256),
+                flush_interval=self._cfg.get('batch_flush_interval', 1.),
+            ).start()
+
+    # override
+    def close_service(self) -> None:
+        super().close_service()
+        if self._batch_sender is not None:
+            self._batch_sender.close()
+            self._batch_sender = None
+
+    def _send_message(self, data: dict, api: str) -> None:
+        if self._batch_sender is not None:
+            # blocks when the coordinator falls behind, which also blocks the packing of trajectories
+            self._batch_sender.put(api, data)
+        else:
+            self._flask_send(data, api)
 
     # override
     def get_job(self) -> dict:
@@ -40,6 +72,14 @@ class FlaskFileSystemActor(BaseCommActor):
 
     def get_init_agent_info(self, model_name):
         path = os.path.join(self._path_agent, model_name)
+        return self._read_agent(path)
+
+    def _read_agent(self, path: str) -> dict:
+        # the delta published models are read with mmap, and only the changed tensors are decoded
+        if path.endswith(MODEL_SUFFIX):
+            if path not in self._model_subscribers:
+                self._model_subscribers[path] = ModelSubscriber(path)
+            return self._model_subscribers[path].read()
         return read_file(path)
 
     # override
@@ -50,7 +90,7 @@ class FlaskFileSystemActor(BaseCommActor):
             if result is not None and result['code'] == 0:
                 path = result['info']
                 path = os.path.join(self._path_agent, path)
-                return read_file(path), path
+                return self._read_agent(path), path
             else:
                 time.sleep(1)
 
@@ -64,14 +104,14 @@ class FlaskFileSystemActor(BaseCommActor):
         assert self._actor_uid == metadata['actor_uid']
         d = {'actor_uid': metadata['actor_uid'], 'job_id': metadata['job_id'], 'metadata': metadata}
         api = 'manager/get_metadata'
-        self._flask_send(d, api)
+        self._send_message(d, api)
 
     # override
     def send_result(self, result_info: dict) -> None:
         assert self._actor_uid == result_info['actor_uid']
         d = {'actor_uid': result_info['actor_uid'], 'job_id': result_info['job_id'], 'result': result_info}
         api = 'manager/send_result'
-        self._flask_send(d, api)
+        self._send_message(d, api)
 
     # override
     def register_actor(self) -> None:
@@ -87,7 +127,10 @@ class FlaskFileSystemActor(BaseCommActor):
     def _send_actor_heartbeats(self) -> None:
         while self._active_flag:
             d = {'actor_uid': self._actor_uid}
-            self._flask_send(d, 'manager/get_heartbeats')
+            # a batch counts as a heartbeat, the messages sent with each api after falling back don't
+            sender = self._batch_sender
+            if sender is None or sender.legacy or time.time() - sender.last_send_time >= self._heartbeats_freq:
+                self._flask_send(d, 'manager/get_heartbeats')
             for _ in range(self._heartbeats_freq):
                 if not self._active_flag:
                     break
@@ -0,0 +1,172 @@
+import json
+import logging
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import msgpack
+import numpy as np
+import pytest
+from easydict import EasyDict
+
+from ctools.worker.actor.comm.batch_sender import BatchSender, BATCH_API, pack_batch, pack_item, unpack_batch
+from ctools.worker.actor.comm.flask_fs_actor import FlaskFileSystemActor
+
+
+class FakeCoordinator(object):
+
+    def __init__(self, batch_api=True, fail_num=0):
+        self.requests = []
+        self.fail_num = fail_num
+        coordinator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                api = self.path.lstrip('/')
+                if api == BATCH_API and not batch_api:
+                    self._reply(404, {'code': 1})
+                elif coordinator.fail_num > 0:
+                    coordinator.fail_num -= 1
+                    self._reply(503, {'code': 1})
+                else:
+                    data = unpack_batch(body) if api == BATCH_API else json.loads(body)
+                    coordinator.requests.append((api, data))
+                    self._reply(200, {'code': 0})
+
+            def _reply(self, status, result):
+                data = json.dumps(result).encode()
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.port = self._server.server_address[1]
+        self.url_prefix = 'http://127.0.0.1:{}/'.format(self.port)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def get_sender(coordinator, **kwargs):
+    return BatchSender(
+        coordinator.url_prefix, 'actor_0', logging.getLogger('test_batch_sender'), base_delay=0.01, **kwargs
+    )
+
+
+@pytest.mark.unittest
+class TestBatchSender:
+
+    def test_batch(self):
+        coordinator = FakeCoordinator()
+        sender = get_sender(coordinator, flush_interval=0.2)
+        for i in range(10):
+            sender.put('manager/get_metadata', {'traj_id': i, 'priority': np.float32(1.)})
+        sender.put('manager/send_result', {'result': (1, 0)})
+        sender.start()
+        assert sender.flush(timeout=5.)
+        sender.close()
+        coordinator.close()
+        assert len(coordinator.requests) == 1
+        api, data = coordinator.requests[0]
+        assert api == BATCH_API and data['actor_uid'] == 'actor_0'
+        assert [item['api'] for item in data['items']] == ['manager/get_metadata'] * 10 + ['manager/send_result']
+        assert data['items'][3]['data'] == {'traj_id': 3, 'priority': 1.}
+        assert data['items'][-1]['data']['result'] == [1, 0]
+
+    def test_retry(self):
+        coordinator = FakeCoordinator(fail_num=3)
+        sender = get_sender(coordinator, flush_interval=0.05).start()
+        sender.put('manager/get_metadata', {'traj_id': 0})
+        assert sender.flush(timeout=5.)
+        sender.close()
+        coordinator.close()
+        assert len(coordinator.requests) == 1
+        assert sender.last_send_time > 0
+
+    def test_legacy(self):
+        coordinator = FakeCoordinator(batch_api=False)
+        sender = get_sender(coordinator, flush_interval=0.05)
+        sender.put('manager/get_metadata', {'traj_id': 0})
+        sender.put('manager/send_result', {'result': 1})
+        sender.start()
+        assert sender.flush(timeout=5.)
+        sender.close()
+        coordinator.close()
+        assert coordinator.requests == [('manager/get_metadata', {'traj_id': 0}), ('manager/send_result', {'result': 1})]
+        assert sender.legacy and sender.last_send_time == 0
+
+    def test_legacy_heartbeats(self):
+        # the messages sent with each api don't count as heartbeats, the actor keeps sending them
+        coordinator = FakeCoordinator(batch_api=False)
+        cfg = EasyDict(
+            {
+                'upstream_ip': '127.0.0.1',
+                'upstream_port': coordinator.port,
+                'path_agent': '.',
+                'path_traj': '.',
+                'heartbeats_freq': 1,
+                'batch_flush_interval': 0.05,
+            }
+        )
+        actor = FlaskFileSystemActor(cfg)
+        actor.logger = logging.getLogger('test_batch_sender')
+        actor.actor_uid = 'actor_0'
+        actor.init_service()
+        actor.start_heartbeats_thread()
+        try:
+            for i in range(25):
+                actor.send_traj_metadata({'actor_uid': 'actor_0', 'job_id': 0, 'traj_id': i})
+                time.sleep(0.1)
+        finally:
+            actor.close_service()
+            coordinator.close()
+        apis = [api for api, _ in coordinator.requests]
+        assert apis.count('manager/get_metadata') == 25
+        assert apis.count('manager/get_heartbeats') >= 2
+
+    def test_backpressure(self):
+        coordinator = FakeCoordinator()
+        sender = get_sender(coordinator, max_queue=2, flush_interval=0.05)
+        sender.put('manager/get_metadata', {'traj_id': 0})
+        sender.put('manager/get_metadata', {'traj_id': 1})
+        assert sender.queue_depth == 2
+        with pytest.raises(queue.Full):
+            sender.put('manager/get_metadata', {'traj_id': 2}, timeout=0.1)
+        sender.start()
+        sender.put('manager/get_metadata', {'traj_id': 2}, timeout=5.)
+        assert sender.flush(timeout=5.)
+        sender.close()
+        coordinator.close()
+        assert sum([len(data['items']) for _, data in coordinator.requests]) == 3
+
+    def test_unsupported_type(self):
+        items = [('manager/get_metadata', {'traj_id': 0, 'shape': (2, 3)}), ('manager/send_result', {'result': 1})]
+        body = pack_batch('actor_0', [pack_item(api, data) for api, data in items])
+        assert body == msgpack.packb(
+            {
+                'actor_uid': 'actor_0',
+                'items': [{
+                    'api': api,
+                    'data': data
+                } for api, data in items]
+            },
+            default=list,
+            use_bin_type=True
+        )
+        coordinator = FakeCoordinator()
+        sender = get_sender(coordinator, flush_interval=0.05).start()
+        with pytest.raises(TypeError):
+            sender.put('manager/get_metadata', {'traj_id': 0, 'model': object()})
+        assert sender.queue_depth == 0
+        sender.close(timeout=1.)
+        coordinator.close()
@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+import torch
+
+from ctools.utils import get_data_compressor, get_data_decompressor
+from ctools.worker.actor.traj_packer import TrajPacker
+
+
+def get_traj(n):
+    return [{'obs': torch.randn(4, 8), 'action': torch.randint(0, 5, (2, )), 'done': i == n - 1} for i in range(n)]
+
+
+@pytest.mark.unittest
+class TestTrajPacker:
+
+    @pytest.mark.parametrize('compressor, num_workers', [('lz4', 2), ('zlib', 0), ('none', 2)])
+    def test_pack(self, compressor, num_workers):
+        written = {}
+        lock = threading.Lock()
+
+        def write_fn(traj_id, data, metadata):
+            with lock:
+                written[traj_id] = (data, metadata)
+
+        packer = TrajPacker(compressor, write_fn, num_workers=num_workers, max_in_flight=2)
+        trajs = {'traj_{}'.format(i): get_traj(3) for i in range(5)}
+        for traj_id, traj in trajs.items():
+            packer.submit(traj_id, traj, {'traj_id': traj_id})
+        packer.close()
+        assert packer.stats() == {'compressing': 0, 'writing': 0, 'packed': 5, 'failed': 0}
+        decompressor = get_data_decompressor(compressor)
+        for traj_id, traj in trajs.items():
+            data, metadata = written[traj_id]
+            assert metadata['traj_id'] == traj_id
+            if compressor != 'none':
+                # the same as compressing in the actor
+                assert data == get_data_compressor(compressor)(traj)
+            data = decompressor(data)
+            assert torch.equal(data[1]['obs'], traj[1]['obs'])
+
+    def test_backpressure(self):
+        release = threading.Event()
+        written = []
+
+        def write_fn(traj_id, data, metadata):
+            release.wait()
+            written.append(traj_id)
+
+        packer = TrajPacker('lz4', write_fn, num_workers=0, max_in_flight=2)
+        packer.submit('traj_0', get_traj(2), {})
+        packer.submit('traj_1', get_traj(2), {})
+        thread = threading.Thread(target=packer.submit, args=('traj_2', get_traj(2), {}), daemon=True)
+        thread.start()
+        time.sleep(0.3)
+        # blocked by the in flight ones
+        assert thread.is_alive()
+        assert packer.stats()['writing'] == 2
+        release.set()
+        thread.join(timeout=5)
+        packer.close()
+        assert sorted(written) == ['traj_0', 'traj_1', 'traj_2']
+
+    def test_failed(self):
+
+        def write_fn(traj_id, data, metadata):
+            raise IOError('disk full')
+
+        packer = TrajPacker('lz4', write_fn, num_workers=0)
+        packer.submit('traj_0', get_traj(2), {})
+        packer.close()
+        assert packer.stats()['failed'] == 1
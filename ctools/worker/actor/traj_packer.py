@@ -0,0 +1,149 @@
+"""
+Trajectory packing stage of the actor
+
+    The packing thread of the actor pickles a trajectory and submits it, the compression(lz4/zlib of the pickled
+    bytes) runs in a small process pool, and the compressed trajectory is written and its metadata sent in a writer
+    thread pool, so the packing thread only holds the GIL for the pickling. At most ``max_in_flight`` trajectories
+    are compressed or written at the same time, ``submit`` blocks beyond that, which blocks the packing thread and
+    so fills the bounded trajectory queue of the actor.
+
+    The submitted trajectory is owned by the packer, the caller must not modify it afterwards.
+"""
+import pickle
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+import torch.multiprocessing as tm
+
+from ctools.utils import get_bytes_compressor, get_data_compressor, get_profiler
+
+
+def _compress_bytes(compressor: str, payload: bytes) -> bytes:
+    return get_bytes_compressor(compressor)(payload)
+
+
+class TrajPacker(object):
+    r"""
+    Overview:
+        compress trajectories in a process pool and write them in a thread pool, see the module doc
+    Interface:
+        __init__, submit, flush, close, stats
+    """
+
+    def __init__(
+            self,
+            compressor: str,
+            write_fn: Callable[[str, Any, dict], None],
+            num_workers: int = 2,
+            num_writers: int = 2,
+            max_in_flight: int = 8,
+            logger: Optional[Any] = None
+    ) -> None:
+        r"""
+        Arguments:
+            - compressor (:obj:`str`): the name of the compressor, support ['lz4', 'zlib', 'none']
+            - write_fn (:obj:`Callable`): called with (traj_id, compressed data, metadata) in a writer thread
+            - num_workers (:obj:`int`): compression processes, 0 to compress in the writer threads
+            - num_writers (:obj:`int`): writer threads
+            - max_in_flight (:obj:`int`): trajectories being compressed or written, ``submit`` blocks beyond that
+            - logger (:obj:`Any`): the actor logger
+        """
+        self._compressor = compressor
+        self._bytes_compressor = get_bytes_compressor(compressor)
+        self._write_fn = write_fn
+        self._logger = logger
+        self._profiler = get_profiler()
+        if num_workers > 0 and self._bytes_compressor is not None:
+            self._pool = ProcessPoolExecutor(max_workers=num_workers, mp_context=tm.get_context('spawn'))
+        else:
+            self._pool = None
+        self._writer = ThreadPoolExecutor(max_workers=num_writers)
+        self._max_in_flight = max_in_flight
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._compressing = 0
+        self._writing = 0
+        self._packed = 0
+        self._failed = 0
+
+    def submit(self, traj_id: str, data: Any, metadata: dict) -> None:
+        r"""
+        Overview:
+            pack a trajectory asynchronously, blocks when ``max_in_flight`` trajectories are being packed
+        Arguments:
+            - traj_id (:obj:`str`): the trajectory id
+            - data (:obj:`Any`): the trajectory, owned by the packer since now
+            - metadata (:obj:`dict`): the metadata sent after the trajectory is written
+        """
+        self._slots.acquire()
+        start = time.time()
+        with self._lock:
+            self._compressing += 1
+        if self._bytes_compressor is None:
+            future = Future()
+            future.set_result(data)
+        elif self._pool is not None:
+            with self._profiler.span('actor.pack.pickle'):
+                payload = pickle.dumps(data)
+            future = self._pool.submit(_compress_bytes, self._compressor, payload)
+        else:
+            future = self._writer.submit(get_data_compressor(self._compressor), data)
+        del data
+        future.add_done_callback(lambda f: self._on_compressed(traj_id, f, metadata, start))
+
+    def _on_compressed(self, traj_id: str, future: Future, metadata: dict, start: float) -> None:
+        with self._lock:
+            self._compressing -= 1
+            self._writing += 1
+        self._writer.submit(self._write, traj_id, future, metadata, start)
+
+    def _write(self, traj_id: str, future: Future, metadata: dict, start: float) -> None:
+        try:
+            data = future.result()
+            self._profiler.record('actor.pack', time.time() - start)
+            with self._profiler.span('actor.send'):
+                self._write_fn(traj_id, data, metadata)
+            ok = True
+        except Exception as e:
+            ok = False
+            if self._logger is not None:
+                self._logger.error('pack traj({}) failed: {}'.format(traj_id, repr(e)))
+        finally:
+            with self._lock:
+                self._writing -= 1
+                if ok:
+                    self._packed += 1
+                else:
+                    self._failed += 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        r"""
+        Overview:
+            the queue depth of each stage and the number of packed and failed trajectories
+        """
+        with self._lock:
+            return {
+                'compressing': self._compressing,
+                'writing': self._writing,
+                'packed': self._packed,
+                'failed': self._failed,
+            }
+
+    def flush(self) -> None:
+        r"""
+        Overview:
+            wait until all the submitted trajectories are written
+        """
+        for _ in range(self._max_in_flight):
+            self._slots.acquire()
+        for _ in range(self._max_in_flight):
+            self._slots.release()
+
+    def close(self) -> None:
+        self.flush()
+        if self._pool is not None:
+            self._pool.shutdown()
+        self._writer.shutdown()
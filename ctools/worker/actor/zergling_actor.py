@@ -10,12 +10,13 @@ from collections import deque
 
 import torch
 
-from ctools.data import default_collate, default_decollate
+from ctools.data import default_collate, host_decollate
 from ctools.torch_utils import to_device, tensor_to_list
 from ctools.utils import get_data_compressor, lists_to_dicts
 from ctools.worker.agent import BaseAgent
 from ctools.worker.actor import BaseActor
 from ctools.worker.actor.env_manager import SubprocessEnvManager, BaseEnvManager
+from ctools.worker.actor.traj_packer import TrajPacker
 
 
 class ZerglingActor(BaseActor):
@@ -32,12 +33,21 @@ class ZerglingActor(BaseActor):
     # override
     def _init(self) -> None:
         super()._init()
-        self._traj_queue = queue.Queue()
+        # bounded, so a stalled packer or coordinator blocks the env loop instead of piling up trajectories
+        self._traj_queue = queue.Queue(maxsize=self._cfg.actor.get('max_traj_queue', 32))
         self._result_queue = queue.Queue()
         self._update_agent_thread = Thread(target=self._update_agent, args=())
         self._update_agent_thread.daemon = True
         self._update_agent_thread.start()  # keep alive in the whole job
         self._model_deque = [deque(maxlen=1) for _ in range(2)]
+        self._packer = TrajPacker(
+            self._cfg.actor.compressor,
+            self._send_traj,
+            num_workers=self._cfg.actor.get('pack_num_workers', 2),
+            num_writers=self._cfg.actor.get('pack_num_writers', 2),
+            max_in_flight=self._cfg.actor.get('pack_max_in_flight', 8),
+            logger=self._logger
+        )
         self._pack_trajectory_thread = Thread(target=self._pack_trajectory, args=())
         self._pack_trajectory_thread.daemon = True
         self._pack_trajectory_thread.start()
@@ -49,6 +59,11 @@ class ZerglingActor(BaseActor):
     def _init_with_job(self, job: dict) -> None:
         super()._init_with_job(job)
         self._job = job
+        # the job sent with each trajectory, forward_kwargs of self._job is changed in each inference
+        self._job_info = copy.deepcopy(job)
+        self._variable_record.register_var('traj_queue_depth')
+        self._variable_record.register_var('pack_compressing')
+        self._variable_record.register_var('pack_writing')
         self._logger.info('ACTOR({}): init with job {} in {}'.format(self._actor_uid, self._job['job_id'], time.time()))
         self._start_time = time.time()
         self._step_count = 0
@@ -61,7 +76,7 @@ class ZerglingActor(BaseActor):
         self._agent_update_freq = self._cfg.actor.agent_update_freq
         self._job_result = {k: [] for k in range(self._env_num)}
         self._collate_fn = default_collate
-        self._decollate_fn = default_decollate
+        self._decollate_fn = host_decollate
         self._env_manager = self._setup_env_manager()
         self._agent = self._setup_agent()
         self._obs_pool = {k: None for k in range(self._env_num)}
@@ -88,9 +103,9 @@ class ZerglingActor(BaseActor):
 
     # override
     def _agent_inference(self, obs: Dict[int, Any]) -> Dict[int, Any]:
-        # save in obs_pool
+        # save in obs_pool, the obs of each step are new objects from the env manager and only read afterwards
         for k, v in obs.items():
-            self._obs_pool[k] = copy.deepcopy(v)
+            self._obs_pool[k] = v
 
         env_id = obs.keys()
         obs = self._collate_fn(list(obs.values()))
@@ -102,8 +117,8 @@ class ZerglingActor(BaseActor):
             data = self._agent.forward(obs, **forward_kwargs)
         else:
             data = [agent.forward(obs[i], **forward_kwargs) for i, agent in enumerate(self._agent)]
-        if self._cfg.actor.use_cuda:
-            data = to_device(data, 'cpu')
+        # one host copy for each dtype, the outputs of each env are views of a chunk of its own, as they are pickled
+        # in the trajectories
         data = self._decollate_fn(data)
         data = [lists_to_dicts(d) for d in data]
         data = {i: d for i, d in zip(env_id, data)}
@@ -111,9 +126,9 @@ class ZerglingActor(BaseActor):
 
     # override
     def _env_step(self, agent_output: Dict[int, Dict]) -> Dict[int, Any]:
-        # save in act_pool
+        # save in act_pool, the outputs are new in each inference
         for k, v in agent_output.items():
-            self._act_pool[k] = copy.deepcopy(v)
+            self._act_pool[k] = v
         action = {k: v['action'] for k, v in agent_output.items()}
         return self._env_manager.step(action)
 
@@ -127,13 +142,13 @@ class ZerglingActor(BaseActor):
                 # last data copy must be in front of obs_next
                 last = self._data_buffer[env_id][-1]
                 data = self._data_buffer[env_id][:-1]
-                self._last_data_buffer[env_id].clear()
-                self._last_data_buffer[env_id] = copy.deepcopy(data)
+                # the transitions are shared with the packed trajectory, neither modifies them
+                self._last_data_buffer[env_id] = data
                 if self._adder_kwargs['use_gae']:
                     gamma = self._adder_kwargs['gamma']
                     gae_lambda = self._adder_kwargs['gae_lambda']
                     data = self._adder.get_gae(data, last['value'], gamma, gae_lambda)
-                self._traj_queue.put({'data': data, 'env_id': env_id, 'agent_id': 0, 'job': copy.deepcopy(self._job)})
+                self._traj_queue.put({'data': data, 'env_id': env_id, 'agent_id': 0, 'job': self._job_info})
                 self._data_buffer[env_id].clear()
                 self._data_buffer[env_id].append(last)
             if t.done:
@@ -146,9 +161,17 @@ class ZerglingActor(BaseActor):
                     gamma = self._adder_kwargs['gamma']
                     gae_lambda = self._adder_kwargs['gae_lambda']
                     data = self._adder.get_gae(data, torch.zeros(1), gamma, gae_lambda)
-                self._traj_queue.put({'data': data, 'env_id': env_id, 'agent_id': 0, 'job': copy.deepcopy(self._job)})
-                self._last_data_buffer[env_id].clear()
+                self._traj_queue.put({'data': data, 'env_id': env_id, 'agent_id': 0, 'job': self._job_info})
+                self._last_data_buffer[env_id] = []
                 self._data_buffer[env_id].clear()
+        stats = self._packer.stats()
+        self._variable_record.update_var(
+            {
+                'traj_queue_depth': self._traj_queue.qsize(),
+                'pack_compressing': stats['compressing'],
+                'pack_writing': stats['writing']
+            }
+        )
 
     # ******************************** thread **************************************
 
@@ -168,6 +191,9 @@ class ZerglingActor(BaseActor):
                             if i in self._job['update_agent']:
                                 t = time.time()
                                 agent_update_info, path = self.get_agent_update_info(self._job['learner_uid'][i])
+                                # the delta published models return the same dict until a new version comes
+                                if len(self._model_deque[i]) and self._model_deque[i][-1] is agent_update_info:
+                                    continue
                                 self._model_deque[i].append(agent_update_info)
                                 #if len(self._job['agent']) == 1:
                                 #    self._agent.load_state_dict(agent_update_info)
@@ -207,25 +233,27 @@ class ZerglingActor(BaseActor):
                 'compressor': self._cfg.actor.compressor,
                 'job': job,
             }
-            # save data
-            data = self._compressor(data)
-            t = time.time()
-            self.send_traj_stepdata(traj_id, data)
-            self.send_traj_metadata(metadata)
-            self._logger.info('ACTOR({}): send traj({}) in {}, cost time:{}'.format(self._actor_uid, traj_id, time.time(), time.time() - t))
+            # compressed in the process pool and saved in the writer threads of the packer
+            self._packer.submit(traj_id, data, metadata)
 
         finished_traj_num = 0
         while not self._end_flag:
             try:
                 element = self._traj_queue.get(timeout=1)
             except queue.Empty:
-                time.sleep(1)
                 continue
             _pack(element)
             finished_traj_num += 1
             self._logger.info('ACTOR({}) finished {}'.format(self._actor_uid, finished_traj_num))
+        self._packer.close()
         self._logger.info('send traj thread exit!!!!!')
 
+    def _send_traj(self, traj_id: str, data: Any, metadata: dict) -> None:
+        t = time.time()
+        self.send_traj_stepdata(traj_id, data)
+        self.send_traj_metadata(metadata)
+        self._logger.info('ACTOR({}): send traj({}) in {}, cost time:{}'.format(self._actor_uid, traj_id, time.time(), time.time() - t))
+
     def _send_result_thread(self):
         while not self._end_flag:
             try:
@@ -190,6 +190,140 @@ class HiddenStateHelper(IAgentStatefulPlugin):
                 self._state[idx] = h[i]
 
 
+class TensorHiddenStateHelper(HiddenStateHelper):
+    """
+    Overview:
+        maintain the hidden state for LSTM-base model in contiguous tensors instead of a dict of per-sample states,
+        the states of a batch are gathered and scattered by index tensor, so no per-step stack/split is needed
+
+    Interfaces:
+        register
+
+    .. note::
+        1. the model must accept stacked prev_state [H, C] (H and C are of size [num_layers, batch_size, hidden_size])\
+            and return next_state in the same format
+        2. the state tensors are lazily allocated with the shape of the first next_state, reset states are zeros,\
+            which is the same as None state for LSTM
+    """
+
+    @classmethod
+    def register(
+            cls: type,
+            agent: Any,
+            state_num: int,
+            save_prev_state: bool = False,
+            device: Optional[str] = None
+    ) -> None:
+        r"""
+        Overview:
+            same as HiddenStateHelper, except that the state is stored in tensors
+
+        Arguments:
+            - agent(:obj:`Any`): the wrapped agent class, should contain forward methods
+            - state_num (:obj:`int`): the num of states to process
+            - save_prev_state (:obj:`bool`): whether to output the prev state in output['prev_state'],\
+                the output format is the same as HiddenStateHelper(list of per-sample state views)
+            - device (:obj:`str`): the device where the state tensors reside, default set to the next_state device
+        """
+        state_manager = cls(state_num, device=device)
+        agent._state_manager = state_manager
+
+        def forward_state_wrapper(forward_fn):
+
+            def wrapper(data, **kwargs):
+                state_id = kwargs.pop('state_id', None)
+                valid_id = kwargs.pop('valid_id', None)
+                data, state_info = agent._state_manager.before_forward(data, state_id)
+                output = forward_fn(data, **kwargs)
+                h = output.pop('next_state', None)
+                if h:
+                    agent._state_manager.after_forward(h, state_info, valid_id)
+                if save_prev_state:
+                    output['prev_state'] = agent._state_manager.split_state(data['prev_state'], len(state_info))
+                return output
+
+            return wrapper
+
+        def reset_state_wrapper(reset_fn):
+
+            def wrapper(*args, **kwargs):
+                state = kwargs.pop('state', None)
+                state_id = kwargs.pop('state_id', None)
+                agent._state_manager.reset(state, state_id)
+                return reset_fn(*args, **kwargs)
+
+            return wrapper
+
+        agent.forward = forward_state_wrapper(agent.forward)
+        agent.reset = reset_state_wrapper(agent.reset)
+
+    def __init__(self, state_num: int, device: Optional[str] = None) -> None:
+        self._state_num = state_num
+        self._device = device
+        self._state = None  # [H, C], each of size [num_layers, state_num, hidden_size]
+        self._all_id = torch.arange(state_num)
+
+    def _index(self, state_id: Optional[list]) -> torch.Tensor:
+        if state_id is None:
+            return self._all_id
+        return torch.as_tensor(list(state_id), dtype=torch.long)
+
+    def reset(self, state: Optional[list] = None, state_id: Optional[list] = None) -> None:
+        if state is not None and all([s is None for s in state]):
+            # a list of None is the init state, the same as HiddenStateHelper with the default init_fn
+            assert len(state) == len(self._index(state_id)), '{}/{}'.format(len(state), len(self._index(state_id)))
+            state = None
+        if self._state is None:
+            assert state is None, 'state tensors are not allocated, can only reset to init state'
+            return
+        index = self._index(state_id).to(self._state[0].device)
+        if state is None:
+            # masked reset, set the selected states to init(zero) state
+            mask = torch.zeros(self._state_num, dtype=torch.bool, device=index.device)
+            mask[index] = True
+            for t in self._state:
+                t.masked_fill_(mask.view(1, -1, 1), 0.)
+            return
+        assert len(state) == len(index), '{}/{}'.format(len(state), len(index))
+        for idx, s in zip(index.tolist(), state):
+            for t, v in zip(self._state, s if s is not None else [None, None]):
+                t[:, idx] = 0. if v is None else v.to(t.device).view(t.shape[0], t.shape[2])
+
+    def before_forward(self, data: dict, state_id: Optional[list]) -> Tuple[dict, torch.Tensor]:
+        index = self._index(state_id)
+        if self._state is None:
+            data['prev_state'] = None
+        else:
+            index = index.to(self._state[0].device)
+            data['prev_state'] = [t.index_select(1, index) for t in self._state]
+        return data, index
+
+    def after_forward(self, h: Any, index: torch.Tensor, valid_id: Optional[list]) -> None:
+        if not isinstance(h[0], torch.Tensor):
+            # per-sample next_state, returned by the model when prev_state is None(before the first allocation)
+            h = [torch.cat(t, dim=1) for t in zip(*h)]
+        H, C = h
+        assert H.shape[1] == len(index), '{}/{}'.format(H.shape[1], len(index))
+        if self._state is None:
+            device = H.device if self._device is None else self._device
+            self._state = [torch.zeros(t.shape[0], self._state_num, t.shape[2], dtype=t.dtype, device=device)
+                           for t in (H, C)]
+        device = self._state[0].device
+        index = index.to(device)
+        if valid_id is not None:
+            keep = torch.as_tensor([idx in valid_id for idx in index.tolist()], dtype=torch.bool, device=device)
+            index = index[keep]
+            H, C = H[:, keep.to(H.device)], C[:, keep.to(C.device)]
+        for t, v in zip(self._state, (H, C)):
+            t.index_copy_(1, index, v.detach().to(device))
+
+    def split_state(self, prev_state: Optional[list], batch_size: int) -> list:
+        if prev_state is None:
+            return [None for _ in range(batch_size)]
+        H, C = [get_tensor_data(t) for t in prev_state]
+        return [list(s) for s in zip(torch.chunk(H, batch_size, dim=1), torch.chunk(C, batch_size, dim=1))]
+
+
 def sample_action(logit=None, prob=None):
     if prob is None:
         prob = torch.softmax(logit, dim=-1)
@@ -506,6 +640,7 @@ class TeacherNetworkHelper(IAgentStatelessPlugin):
 plugin_name_map = {
     'grad': GradHelper,
     'hidden_state': HiddenStateHelper,
+    'tensor_hidden_state': TensorHiddenStateHelper,
     'argmax_sample': ArgmaxSampleHelper,
     'eps_greedy_sample': EpsGreedySampleHelper,
     'multinomial_sample': MultinomialSampleHelper,
@@ -0,0 +1,104 @@
+from collections import OrderedDict
+
+import pytest
+import torch
+import torch.nn as nn
+
+from ctools.torch_utils.network.rnn import LSTM
+from ctools.worker.agent import BaseAgent
+
+STATE_NUM, NUM_LAYERS, HIDDEN_SIZE = 4, 2, 8
+
+
+class LstmModel(nn.Module):
+
+    def __init__(self):
+        super(LstmModel, self).__init__()
+        self.lstm = LSTM(3, HIDDEN_SIZE, NUM_LAYERS, norm_type='LN')
+
+    def forward(self, data):
+        prev_state = data['prev_state']
+        stacked_state = isinstance(prev_state, list) and len(prev_state) == 2 and isinstance(prev_state[0], torch.Tensor)
+        output, next_state = self.lstm(data['x'], prev_state, list_next_state=not stacked_state)
+        return {'output': output, 'next_state': next_state}
+
+
+def get_agents():
+    model = LstmModel()
+    agents = {}
+    for name in ['hidden_state', 'tensor_hidden_state']:
+        plugin_cfg = OrderedDict({name: {'state_num': STATE_NUM, 'save_prev_state': True}})
+        agents[name] = BaseAgent(model, plugin_cfg)
+    return agents
+
+
+def forward(agents, state_id=None, valid_id=None):
+    batch_size = STATE_NUM if state_id is None else len(state_id)
+    x = torch.randn(1, batch_size, 3)
+    outputs = [a.forward({'x': x}, state_id=state_id, valid_id=valid_id) for a in agents.values()]
+    assert torch.allclose(outputs[0]['output'], outputs[1]['output'], atol=1e-6)
+    # the prev_state output has the same format as HiddenStateHelper
+    assert len(outputs[1]['prev_state']) == batch_size
+    for p, q in zip(*[o['prev_state'] for o in outputs]):
+        if p is None:
+            assert q is None or all([(t == 0).all() for t in q])
+        else:
+            assert all([torch.allclose(s, t, atol=1e-6) for s, t in zip(p, q)])
+    return outputs
+
+
+def assert_same_state(agents):
+    state = agents['tensor_hidden_state']._state_manager._state
+    for idx, s in agents['hidden_state']._state_manager._state.items():
+        for t, v in zip(state, s if s is not None else [None, None]):
+            if v is None:
+                assert (t[:, idx] == 0).all()
+            else:
+                assert torch.allclose(t[:, idx], v.view(NUM_LAYERS, HIDDEN_SIZE), atol=1e-6)
+
+
+@pytest.mark.unittest
+class TestTensorHiddenStateHelper:
+
+    def test_forward(self):
+        agents = get_agents()
+        forward(agents)
+        forward(agents)
+        assert_same_state(agents)
+        # a part of the envs, and only the valid ones keep the next state
+        forward(agents, state_id=[1, 3], valid_id=[3])
+        assert_same_state(agents)
+        forward(agents, state_id=[2, 0, 3])
+        assert_same_state(agents)
+
+    def test_reset(self):
+        agents = get_agents()
+        # reset before the first forward, the state tensors are not allocated yet
+        for a in agents.values():
+            a.reset()
+            a.reset(state=[None for _ in range(STATE_NUM)])
+            a.reset(state=[None], state_id=[1])
+        assert agents['tensor_hidden_state']._state_manager._state is None
+        forward(agents)
+        forward(agents)
+        for a in agents.values():
+            a.reset(state=[None for _ in range(STATE_NUM)])
+        assert_same_state(agents)
+        assert all([(t == 0).all() for t in agents['tensor_hidden_state']._state_manager._state])
+        forward(agents)
+
+    def test_partial_reset(self):
+        agents = get_agents()
+        forward(agents)
+        forward(agents)
+        for a in agents.values():
+            a.reset(state_id=[2])
+        assert_same_state(agents)
+        state = agents['tensor_hidden_state']._state_manager._state
+        assert (state[0][:, 2] == 0).all() and not (state[0][:, 1] == 0).all()
+        new_state = [torch.randn(NUM_LAYERS, 1, HIDDEN_SIZE) for _ in range(2)]
+        for a in agents.values():
+            a.reset(state=[new_state, None], state_id=[1, 3])
+        assert_same_state(agents)
+        forward(agents, state_id=[1, 2, 3])
+        assert_same_state(agents)
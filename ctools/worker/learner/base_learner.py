@@ -16,7 +16,7 @@ from ctools.data.new_dataloader import AsyncDataLoader
 from ctools.torch_utils import build_checkpoint_helper, CountVar, auto_checkpoint, build_log_buffer, to_device
 from ctools.utils import build_logger, dist_init, EasyTimer, dist_finalize, pretty_print, read_config, \
     get_task_uid, import_module, broadcast
-from ctools.utils import deep_merge_dicts
+from ctools.utils import deep_merge_dicts, get_profiler
 
 from .comm import LearnerCommHelper
 from .learner_hook import build_learner_hook_by_cfg, add_learner_hook, merge_hooks, LearnerHook
@@ -84,6 +84,9 @@ class BaseLearner(ABC):
         self._timer = EasyTimer()
         # logger
         self._logger, self._tb_logger, self._record = build_logger(self._cfg, rank=self._rank)
+        if self._tb_logger is not None:
+            # the span percentiles exported by the profiler are shown with the other learner scalars
+            get_profiler().set_tb_writer(self._tb_logger.logger)
         self._log_buffer = build_log_buffer()
         # checkpoint helper
         self._checkpointer_manager = build_checkpoint_helper(self._cfg)
@@ -135,6 +138,7 @@ class BaseLearner(ABC):
             Setup time_wrapper to get data_time and train_time
         """
         self._wrapper_timer = EasyTimer()
+        self._profiler = get_profiler()
         self._get_iter_data = self.time_wrapper(self._get_iter_data, 'data_time')
         self._train = self.time_wrapper(self._train, 'train_time')
 
@@ -151,6 +155,7 @@ class BaseLearner(ABC):
             with self._wrapper_timer:
                 ret = fn(*args, **kwargs)
             self._log_buffer[name] = self._wrapper_timer.value
+            self._profiler.record('learner.' + name, self._wrapper_timer.value)
             return ret
 
         return wrapper
@@ -168,6 +173,10 @@ class BaseLearner(ABC):
         #self._dataloader = AsyncDataLoader(
         #    self.get_data, cfg.batch_size, self._device, cfg.chunk_size, self._collate_fn, cfg.num_workers, max_reuse=cfg.max_reuse
         #)
+        collate_fn = self._collate_fn
+        if cfg.get('entity_bucket_num', 0) > 0:
+            # group the samples by entity num in the collate function(e.g.: as_learner_collate_fn)
+            collate_fn = partial(collate_fn, entity_bucket_num=cfg.entity_bucket_num)
         self._dataloader = AsyncDataLoader(
             data_source=self.get_data,
             batch_size=cfg.batch_size,
@@ -175,12 +184,15 @@ class BaseLearner(ABC):
             learner_uid=self._learner_uid,
             url_prefix='http://{}:{}/'.format(self._cfg.system.coordinator_ip, self._cfg.system.coordinator_port),
             path_traj=self._cfg.common.path_traj,
-            collate_fn=self._collate_fn,
+            collate_fn=collate_fn,
             num_workers=cfg.num_workers,
             use_async=cfg.get('use_async',True),
             use_async_cuda=cfg.get('use_async_cuda',True),
             max_reuse=cfg.max_reuse,
-            decompress_type=cfg.get('decompress_type','none')
+            decompress_type=cfg.get('decompress_type','none'),
+            prefetch_num=cfg.get('prefetch_num', 2),
+            max_credit=cfg.get('max_credit', 3),
+            metadata_wait=cfg.get('metadata_wait', 10.),
         )
 
 
@@ -309,6 +321,7 @@ class BaseLearner(ABC):
         Overview:
             Close the related resources, such as dist_finalize when use_distributed
         """
+        self._checkpointer_manager.wait()
         if self._use_distributed:
             dist_finalize()
 
@@ -390,6 +403,10 @@ class BaseLearner(ABC):
     def save_path(self) -> str:
         return self._save_path
 
+    @property
+    def dataloader(self) -> Any:
+        return self._dataloader
+
     @property
     def checkpoint_manager(self) -> Any:
         return self._checkpointer_manager
@@ -9,7 +9,8 @@ import requests
 from typing import List
 from functools import partial
 
-from ctools.utils import read_file, save_file, get_rank, get_world_size, get_data_decompressor, remove_file, broadcast
+from ctools.utils import read_file, save_file, get_rank, get_world_size, get_data_decompressor, remove_file, broadcast, \
+    ModelPublisher
 from .base_comm_learner import BaseCommLearner
 from ..learner_hook import LearnerHook
 
@@ -50,6 +51,12 @@ class FlaskFileSystemLearner(BaseCommLearner):
         self._learner_port = cfg.learner_port - self._rank
         self._restore = cfg.restore
         self._iter = 0
+        self._model_broadcast = cfg.get('model_broadcast', 'file')
+        assert self._model_broadcast in ['file', 'delta'], self._model_broadcast
+        self._model_broadcast_path = cfg.get('model_broadcast_path', '') or self._path_agent
+        self._delta_dtype = cfg.get('delta_dtype', 'fp16')
+        self._rebase_freq = cfg.get('rebase_freq', 10)
+        self._model_publisher = None
 
     # override
     def register_learner(self) -> None:  # todo: 1 learner -> many agent?
@@ -82,8 +89,11 @@ class FlaskFileSystemLearner(BaseCommLearner):
         Arguments:
             - state_dict (:obj:`dict`): state dict of the runtime agent
         """
-        new_path = self._agent_name + '_' + str(self._iter) + '_ckpt.pth'
         state_dict['model'] = {k: v for k, v in state_dict['model'].items() if 'value_networks' not in k}
+        if self._model_broadcast == 'delta':
+            self._send_agent_delta(state_dict)
+            return
+        new_path = self._agent_name + '_' + str(self._iter) + '_ckpt.pth'
         path = os.path.join(self._path_agent, new_path)
         save_file(path, state_dict)
         d = {'learner_uid': self._learner_uid, 'model_path': new_path}
@@ -98,6 +108,38 @@ class FlaskFileSystemLearner(BaseCommLearner):
             else:
                 time.sleep(1)
 
+    def _send_agent_delta(self, state_dict: dict) -> None:
+        """
+        Overview:
+            Publish the agent as a new version of ``<agent_name>.model``, the model path sent to coordinator doesn't
+            change between versions, actors read the latest version from it.
+        Arguments:
+            - state_dict (:obj:`dict`): state dict of the runtime agent
+        """
+        if self._model_publisher is None:
+            self._model_publisher = ModelPublisher(
+                self._model_broadcast_path, self._agent_name, self._delta_dtype, self._rebase_freq
+            )
+        extra = {k: v for k, v in state_dict.items() if k != 'model'}
+        info = self._model_publisher.publish(state_dict['model'], extra)
+        self._logger.info(
+            'publish model version {}(base {}) for actor update, base bytes: {}, delta bytes: {}'.format(
+                info['version'], info['base_version'], info['base_bytes'], info['delta_bytes']
+            )
+        )
+        new_path = self._model_publisher.model_path
+        if self._model_broadcast_path == self._path_agent:
+            new_path = os.path.basename(new_path)  # actors join it with their path_agent
+        else:
+            new_path = os.path.abspath(new_path)
+        d = {'learner_uid': self._learner_uid, 'model_path': new_path}
+        while self._active_flag:
+            result = self._flask_send(d, 'coordinator/model_path_update')
+            if result is not None and result['code'] == 0:
+                return
+            else:
+                time.sleep(1)
+
 
     @staticmethod
     def load_data_fn(path_traj, traj_id, decompressor):
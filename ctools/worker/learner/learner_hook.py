@@ -1,12 +1,17 @@
 import numbers
 import os
+import shutil
+import signal
+import subprocess
 from abc import ABC, abstractmethod
 from typing import Any, Dict
 
+import numpy as np
 import torch
 from easydict import EasyDict
 
-from ctools.utils import allreduce
+from ctools.torch_utils import AsyncCheckpointHelper
+from ctools.utils import allreduce, get_world_size, StackSampler
 
 
 class Hook(ABC):
@@ -183,6 +188,11 @@ class SaveCkptHook(LearnerHook):
         Arguments:
             - engine (:obj:`BaseLearner`): the BaseLearner which needs to save checkpoint
         """
+        if engine.rank == 0 and isinstance(engine.checkpoint_manager, AsyncCheckpointHelper):
+            # the checkpoint is written in background, only the written ones are sent to coordinator
+            last_path = engine.checkpoint_manager.metrics['last_path']
+            if last_path is not None:
+                engine.last_ckpt_path = last_path
         if engine.rank == 0 and engine.last_iter.val % self._freq == 0:
             dirname = os.path.join(engine.save_path, 'ckpt')
             if not os.path.exists(dirname):
@@ -197,8 +207,25 @@ class SaveCkptHook(LearnerHook):
                 optimizer=engine.optimizer,
                 last_iter=engine.last_iter,
             )
+            if isinstance(engine.checkpoint_manager, AsyncCheckpointHelper):
+                self._log_async_save(engine, path)
+            else:
+                engine.last_ckpt_path = path
+                engine.info('{} save ckpt in {}'.format(engine.name, path))
+
+    def _log_async_save(self, engine: 'BaseLearner', path: str) -> None:  # noqa
+        if self.position == 'after_run':  # wait for all the checkpoints before exit
+            engine.checkpoint_manager.wait()
             engine.last_ckpt_path = path
-            engine.info('{} save ckpt in {}'.format(engine.name, path))
+        metrics = engine.checkpoint_manager.metrics
+        engine.info(
+            '{} snapshot ckpt for {}, wait: {:.3f}s, snapshot: {:.3f}s, last write: {:.3f}s({} bytes), '
+            'in flight: {}, saved: {}, failed: {}'.format(
+                engine.name, path, metrics['last_wait_time'], metrics['last_snapshot_time'],
+                metrics['last_write_time'], metrics['last_bytes'], metrics['in_flight'], metrics['saved'],
+                metrics['failed']
+            )
+        )
 
 
 class LogShowHook(LearnerHook):
@@ -251,7 +278,9 @@ class LogShowHook(LearnerHook):
 class LogReduceHook(LearnerHook):
     """
     Overview:
-        Hook to reduce the distributed logs
+        Hook to reduce the distributed logs. All the numbers and tensors in the log buffer are flattened into one
+        tensor and reduced with one collective(two if some keys use max or min), the layout of the flattened tensor
+        is cached until the structure of the log buffer changes.
     Interfaces:
         __init__, __call__
     Property:
@@ -263,9 +292,104 @@ class LogReduceHook(LearnerHook):
         Overview:
             init LogReduceHook
         Arguments:
-            - ext_args (:obj:`EasyDict`): extended_args, use ext_args.freq to set log_reduce_freq
+            - ext_args (:obj:`EasyDict`): extended_args, use ext_args.reduce_op to set the reduce op of the top level \
+                keys, e.g. {'grad': 'max'}, support ['mean', 'sum', 'max', 'min'], the default op is 'mean'
         """
         super().__init__(*args, **kwargs)
+        self._reduce_op = dict(ext_args.get('reduce_op', {}))
+        for k, v in self._reduce_op.items():
+            assert v in ['mean', 'sum', 'max', 'min'], 'invalid reduce op of {}: {}'.format(k, v)
+        self._key = None
+        self._layout = None
+
+    def _build_layout(self, data, path=(), layout=None):
+        # layout: a list of (path, type, shape, dtype, op)
+        if layout is None:
+            layout = []
+        if isinstance(data, dict):
+            for k, v in data.items():
+                self._build_layout(v, path + (k, ), layout)
+        elif isinstance(data, list) or isinstance(data, tuple):
+            for i, v in enumerate(data):
+                self._build_layout(v, path + (i, ), layout)
+        elif isinstance(data, torch.Tensor):
+            layout.append((path, type(data), data.shape, data.dtype, self._reduce_op.get(path[0], 'mean')))
+        elif isinstance(data, numbers.Integral) or isinstance(data, numbers.Real):
+            layout.append((path, float, (), None, self._reduce_op.get(path[0], 'mean')))
+        else:
+            raise TypeError("invalid type in reduce: {}".format(type(data)))
+        return layout
+
+    @staticmethod
+    def _count(data):
+        if isinstance(data, dict):
+            return sum(LogReduceHook._count(v) for v in data.values())
+        elif isinstance(data, list) or isinstance(data, tuple):
+            return sum(LogReduceHook._count(v) for v in data)
+        return 1
+
+    def _get_layout(self, data, rebuild=False):
+        # the full layout is only rebuilt when the cheap key(top level keys and number of values) changes, or the
+        # values do not match the cached layout(checked in _gather)
+        key = (tuple(data.keys()), self._count(data))
+        if key != self._key or rebuild:
+            self._key = key
+            op_index = {'mean': 0, 'sum': 0, 'max': 1, 'min': 1}
+            self._layout = [[], []]  # entries reduced by sum and max
+            offsets = [0, 0]
+            for path, t, shape, dtype, op in self._build_layout(data):
+                numel = int(np.prod(shape)) if len(shape) > 0 else 1
+                i = op_index[op]
+                self._layout[i].append((path, t, shape, dtype, op, offsets[i], numel))
+                offsets[i] += numel
+        return self._layout
+
+    def _gather(self, data, layout):
+        # flatten the values by the layout, return None if they do not match it
+        try:
+            device = 'cpu'
+            for path, t, _, _, _, _, _ in layout[0] + layout[1]:
+                if t is not float:
+                    device = self._get(data, path).device
+                    break
+            buffers = []
+            for i in range(2):
+                values = []
+                for path, t, shape, dtype, op, _, _ in layout[i]:
+                    v = self._get(data, path)
+                    if t is float:
+                        if not isinstance(v, numbers.Real):
+                            return None
+                        v = torch.tensor([v], device=device)
+                    else:
+                        if not isinstance(v, torch.Tensor) or v.shape != shape or v.dtype != dtype:
+                            return None
+                        v = v.detach().reshape(-1).float().to(device)
+                    values.append(v.neg() if op == 'min' else v)
+                buffers.append(torch.cat(values) if len(values) > 0 else None)
+        except (KeyError, IndexError, TypeError):
+            return None
+        return device, buffers
+
+    @staticmethod
+    def _get(data, path):
+        for k in path:
+            data = data[k]
+        return data
+
+    @staticmethod
+    def _set(data, path, value):
+        for k in path[:-1]:
+            data = data[k]
+        data[path[-1]] = value
+
+    @staticmethod
+    def _copy_structure(data):
+        if isinstance(data, dict):
+            return {k: LogReduceHook._copy_structure(v) for k, v in data.items()}
+        elif isinstance(data, list) or isinstance(data, tuple):
+            return [LogReduceHook._copy_structure(v) for v in data]
+        return data
 
     def __call__(self, engine: 'BaseLearner') -> None:  # noqa
         """
@@ -275,33 +399,150 @@ class LogReduceHook(LearnerHook):
             - engine (:obj:`BaseLearner`): the BaseLearner
         """
         assert engine.use_distributed
+        data = engine.log_buffer
+        layout = self._get_layout(data)
+        gathered = self._gather(data, layout)
+        if gathered is None:
+            layout = self._get_layout(data, rebuild=True)
+            gathered = self._gather(data, layout)
+        device, buffers = gathered
+        world_size = get_world_size()
+        new_data = self._copy_structure(data)
+        for i, reduce_op in enumerate(['sum', 'max']):
+            buffer = buffers[i]
+            if buffer is None:
+                continue
+            allreduce(buffer, op=reduce_op)  # sum is divided by world size
+            buffer = buffer.cpu()
+            numbers_ = buffer.tolist()
+            for path, t, shape, dtype, op, offset, numel in layout[i]:
+                scale = {'mean': 1, 'sum': world_size, 'max': 1, 'min': -1}[op]
+                if t is float:
+                    self._set(new_data, path, numbers_[offset] * scale)
+                else:
+                    v = buffer[offset:offset + numel].view(shape) * scale
+                    self._set(new_data, path, v.to(device=device, dtype=dtype))
+        engine.log_buffer = new_data
+
+
+class ProfilerHook(LearnerHook):
+    """
+    Overview:
+        Hook to profile the learner every ``freq`` iterations for ``profile_iters`` iterations, with a torch.profiler
+        trace of the training and a python stack sampling of the data loader(its threads in this process, and its
+        worker processes by py-spy if it is installed). The artifacts are written in
+        ``save_path/profile/iter_<start iter>``:
+
+            - trace.json: chrome trace of the torch ops, open it in chrome://tracing or perfetto
+            - ops.txt: table of the top torch ops by self cpu time
+            - torch_stacks.txt: folded python stacks of the torch ops weighted by cpu time(for flamegraph)
+            - loader.folded, worker_<pid>.folded: folded stacks of the data loader threads and worker processes
+            - loader_top.txt: table of the top sampled functions of the data loader, and of the collate functions
+    Interfaces:
+        __init__, __call__
+    Property:
+        name, priority, position
+    """
 
-        def aggregate(data):
-            r"""
-            Overview:
-                aggregate the information from all ranks(usually use sync allreduce)
-            Arguments:
-                - data (:obj:`dict`): data needs to be reduced.\
-                    Could be dict, torch.Tensor, numbers.Integral or numbers.Real.
-            Returns:
-                - new_data (:obj:`dict`): data after reduce
-            """
-            if isinstance(data, dict):
-                new_data = {k: aggregate(v) for k, v in data.items()}
-            elif isinstance(data, list) or isinstance(data, tuple):
-                new_data = [aggregate(t) for t in data]
-            elif isinstance(data, torch.Tensor):
-                new_data = data.clone().detach()
-                allreduce(new_data)  # get data from other processes
-            elif isinstance(data, numbers.Integral) or isinstance(data, numbers.Real):
-                new_data = torch.scalar_tensor(data).reshape([1])
-                allreduce(new_data)
-                new_data = new_data.item()
-            else:
-                raise TypeError("invalid type in reduce: {}".format(type(data)))
-            return new_data
+    def __init__(self, *args, ext_args: EasyDict = EasyDict(), **kwargs) -> None:
+        """
+        Overview:
+            init ProfilerHook
+        Arguments:
+            - ext_args (:obj:`EasyDict`): extended_args, freq(profile every freq iterations), \
+                profile_iters(iterations in a profile), sample_interval(seconds between two stack samples), \
+                row_limit(rows of the tables), use_py_spy(sample the worker processes by py-spy)
+        """
+        super().__init__(*args, **kwargs)
+        self._freq = ext_args.get('freq', 1000)
+        self._profile_iters = ext_args.get('profile_iters', 1)
+        self._sample_interval = ext_args.get('sample_interval', 0.01)
+        self._row_limit = ext_args.get('row_limit', 30)
+        self._use_py_spy = ext_args.get('use_py_spy', True)
+        self._start_iter = None
 
-        engine.log_buffer = aggregate(engine.log_buffer)
+    def __call__(self, engine: 'BaseLearner') -> None:  # noqa
+        """
+        Overview:
+            Start a profile at interval iterations, and stop it ``profile_iters`` iterations later, only at rank 0
+        Arguments:
+            - engine (:obj:`BaseLearner`): the BaseLearner
+        """
+        if engine.rank != 0:
+            return
+        iters = engine.last_iter.val
+        if self._start_iter is not None:
+            if iters - self._start_iter >= self._profile_iters or self.position == 'after_run':
+                self._stop(engine)
+        elif iters > 0 and iters % self._freq == 0 and self.position != 'after_run':
+            self._start(engine, iters)
+
+    def _start(self, engine: 'BaseLearner', iters: int) -> None:  # noqa
+        self._start_iter = iters
+        self._dirname = os.path.join(engine.save_path, 'profile', 'iter_{}'.format(iters))
+        os.makedirs(self._dirname, exist_ok=True)
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self._prof = torch.profiler.profile(activities=activities, with_stack=True)
+        self._prof.start()
+        self._sampler = StackSampler(self._sample_interval).start()
+        self._py_spy = []
+        py_spy = shutil.which('py-spy') if self._use_py_spy else None
+        workers = getattr(getattr(engine, 'dataloader', None), 'workers', [])
+        for w in workers:
+            pid = getattr(w, 'pid', None)  # threads have no pid, they are sampled by the sampler
+            if pid is None or py_spy is None:
+                continue
+            path = os.path.join(self._dirname, 'worker_{}.folded'.format(pid))
+            cmd = [
+                py_spy, 'record', '--pid',
+                str(pid), '--rate',
+                str(int(1 / self._sample_interval)), '--format', 'raw', '--threads', '--nonblocking', '--output', path
+            ]
+            self._py_spy.append((subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL), path))
+        engine.info('{} start profiling at iter {}'.format(engine.name, iters))
+
+    def _stop(self, engine: 'BaseLearner') -> None:  # noqa
+        self._prof.stop()
+        self._sampler.stop()
+        folded = self._sampler.folded()
+        for p, path in self._py_spy:
+            p.send_signal(signal.SIGINT)  # py-spy writes the output on SIGINT
+            try:
+                p.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                p.kill()
+                continue
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    for line in f:
+                        stack, _, count = line.rstrip().rpartition(' ')
+                        if stack:
+                            folded[stack] = folded.get(stack, 0) + int(count)
+        dirname = self._dirname
+        self._prof.export_chrome_trace(os.path.join(dirname, 'trace.json'))
+        try:
+            self._prof.export_stacks(os.path.join(dirname, 'torch_stacks.txt'), 'self_cpu_time_total')
+        except Exception as e:
+            engine.info('{} failed to export the torch stacks: {}'.format(engine.name, repr(e)))
+        with open(os.path.join(dirname, 'ops.txt'), 'w') as f:
+            f.write(self._prof.key_averages().table(sort_by='self_cpu_time_total', row_limit=self._row_limit))
+        self._sampler.dump(os.path.join(dirname, 'loader.folded'))
+        samples = sum(folded.values())
+        with open(os.path.join(dirname, 'loader_top.txt'), 'w') as f:
+            for title, keyword in [('top functions', None), ('collate functions', 'collate')]:
+                f.write('=== {} of the data loader, {} samples ===\n'.format(title, samples))
+                f.write('{:>8} {:>8}  function\n'.format('total%', 'self%'))
+                for frame, total, self_ in StackSampler.top_functions(folded, self._row_limit, keyword):
+                    f.write('{:>8.2f} {:>8.2f}  {}\n'.format(100. * total / samples, 100. * self_ / samples, frame))
+                f.write('\n')
+        engine.info(
+            '{} profiled iter {}~{}, written in {}'.format(
+                engine.name, self._start_iter, engine.last_iter.val, dirname
+            )
+        )
+        self._prof, self._sampler, self._py_spy, self._start_iter = None, None, [], None
 
 
 hook_mapping = {
@@ -310,6 +551,7 @@ hook_mapping = {
     'save_ckpt': SaveCkptHook,
     'log_show': LogShowHook,
     'log_reduce': LogReduceHook,
+    'profiler': ProfilerHook,
 }
 
 
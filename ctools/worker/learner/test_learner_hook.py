@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+
+import pytest
+import torch
+from easydict import EasyDict
+
+from ctools.worker.learner import learner_hook
+from ctools.worker.learner.learner_hook import LogReduceHook, build_learner_hook_by_cfg
+
+
+class FakeEngine:
+    use_distributed = True
+
+    def __init__(self, log_buffer):
+        self.log_buffer = log_buffer
+
+
+@pytest.mark.unittest
+class TestLogReduceHook:
+
+    def test_reduce(self, monkeypatch):
+        calls = []
+
+        # 2 ranks, the other one logs 3 times of the values
+        def fake_allreduce(data, op='sum'):
+            calls.append(op)
+            if op == 'sum':
+                data.mul_(4).div_(2)
+            else:
+                data.copy_(torch.max(data, data * 3))
+
+        monkeypatch.setattr(learner_hook, 'allreduce', fake_allreduce)
+        monkeypatch.setattr(learner_hook, 'get_world_size', lambda: 2)
+        hook = LogReduceHook(
+            'log_reduce', 10, position='after_iter', ext_args=EasyDict({'reduce_op': {
+                'grad': 'max',
+                'loss': 'min',
+                'frames': 'sum'
+            }})
+        )
+
+        def log_buffer():
+            return {
+                'total_loss': 1.5,
+                'frames': 10,
+                'grad': 2.,
+                'loss': torch.tensor([1., -1.]),
+                'reward': {
+                    'winloss': [torch.tensor(0.5), 1]
+                },
+            }
+
+        layouts = []
+        for _ in range(2):
+            engine = FakeEngine(log_buffer())
+            hook(engine)
+            data = engine.log_buffer
+            assert data['total_loss'] == 3. and data['frames'] == 40 and data['grad'] == 6.
+            assert torch.equal(data['loss'], torch.tensor([1., -3.]))
+            assert torch.equal(data['reward']['winloss'][0], torch.tensor(1.)) and data['reward']['winloss'][1] == 2
+            assert calls == ['sum', 'max']
+            calls.clear()
+            layouts.append(hook._layout)
+        # the layout is cached with the same structure
+        assert layouts[0] is layouts[1]
+        layout = hook._layout
+        # the same keys and number of values, but a different shape
+        engine = FakeEngine(dict(log_buffer(), loss=torch.tensor([1., -1., 2.])))
+        hook(engine)
+        assert torch.equal(engine.log_buffer['loss'], torch.tensor([1., -3., 2.])) and hook._layout is not layout
+        calls.clear()
+        layout = hook._layout
+        # the layout changes with the log buffer
+        engine = FakeEngine({'total_loss': 1.})
+        hook(engine)
+        assert engine.log_buffer == {'total_loss': 2.} and hook._layout is not layout and calls == ['sum']
+
+
+def fake_collate_fn(n):
+    time.sleep(0.002)
+    return torch.stack([torch.randn(64, 64) for _ in range(n)])
+
+
+class FakeLoader:
+
+    def __init__(self):
+        self.workers = [threading.Thread(target=self._worker_loop, daemon=True, name='loader_worker')]
+        self._end_flag = False
+        for w in self.workers:
+            w.start()
+
+    def _worker_loop(self):
+        while not self._end_flag:
+            fake_collate_fn(4)
+
+
+class FakeLearner:
+    rank = 0
+    name = 'learner'
+
+    def __init__(self, save_path):
+        self.save_path = save_path
+        self.last_iter = EasyDict({'val': 0})
+        self.dataloader = FakeLoader()
+        self.infos = []
+
+    def info(self, s):
+        self.infos.append(s)
+
+
+@pytest.mark.unittest
+def test_profiler_hook(tmpdir):
+    cfg = EasyDict(
+        {
+            'profiler': {
+                'name': 'profiler',
+                'type': 'profiler',
+                'position': 'before_iter',
+                'ext_args': {
+                    'freq': 2,
+                    'profile_iters': 2,
+                    'use_py_spy': False
+                }
+            }
+        }
+    )
+    hook = build_learner_hook_by_cfg(cfg)['before_iter'][0]
+    engine = FakeLearner(str(tmpdir))
+    model = torch.nn.Linear(64, 64)
+    for i in range(5):
+        engine.last_iter.val = i
+        hook(engine)
+        model(torch.randn(8, 64)).sum().backward()
+        time.sleep(0.05)
+    engine.dataloader._end_flag = True
+    dirname = os.path.join(str(tmpdir), 'profile', 'iter_2')
+    for name in ['trace.json', 'ops.txt', 'loader.folded', 'loader_top.txt']:
+        assert os.path.exists(os.path.join(dirname, name)), name
+    # the profile of iter 2~4 is stopped at iter 4, and the next one doesn't start before iter 6
+    assert hook._start_iter is None
+    assert engine.infos[0] == 'learner start profiling at iter 2'
+    assert engine.infos[-1].startswith('learner profiled iter 2~4')
+    assert os.listdir(os.path.join(str(tmpdir), 'profile')) == ['iter_2']
+    with open(os.path.join(dirname, 'ops.txt')) as f:
+        assert 'aten::' in f.read()
+    with open(os.path.join(dirname, 'loader_top.txt')) as f:
+        top = f.read()
+    assert 'fake_collate_fn' in top.split('collate functions')[1]
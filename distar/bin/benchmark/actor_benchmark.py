@@ -0,0 +1,171 @@
+"""
+Throughput benchmark of the actor hot path on a CPU-only box, SC2 replaced by recorded observations
+
+    The ``RecordedObsEnv``s play back the observation protos of a recording(written by ``record_replay`` of
+    ``ctools.pysc2.lib.mock_replay_controller`` from a real game, or a synthetic one with the given entity number)
+    with a ``MockReplayController`` per player, and run them through ``Features.transform_obs``,
+    ``AlphaStarObsRunner.get`` and the raw action transform, in the subprocesses of ``SubprocessEnvManager``. The main
+    process collates the observations with ``as_eval_collate_fn``, runs the model on CPU and packs the trajectories
+    like the actor. The steps/s and the latency of each stage are reported for each env number and entity number.
+
+    python -m distar.bin.benchmark.actor_benchmark --env_nums 1 4 --entity_nums 50 300
+    python -m distar.bin.benchmark.actor_benchmark --save actor_baseline.json
+    python -m distar.bin.benchmark.actor_benchmark --baseline actor_baseline.json --tolerance 0.2  # regression gate
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import torch
+
+from ctools.utils import Profiler, get_data_compressor, lists_to_dicts
+from ctools.worker.actor import SubprocessEnvManager
+from distar.data.collate_fn import as_eval_collate_fn
+from distar.envs.other.alphastar_compress import compress_obs
+from distar.envs.recorded_env import RecordedObsEnv, fake_recording
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--env_nums', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--entity_nums', type=int, nargs='+', default=[50, 300])
+    parser.add_argument('--recording', type=str, default='', help='a recording of record_replay, replaces the '
+                        'synthetic ones of entity_nums')
+    parser.add_argument('--map_name', type=str, default='KairosJunction')
+    parser.add_argument('--steps', type=int, default=40, help='measured steps of each config')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--traj_len', type=int, default=8, help='steps of a packed trajectory')
+    parser.add_argument('--compressor', type=str, default='lz4')
+    parser.add_argument('--torch_threads', type=int, default=4)
+    parser.add_argument('--save', type=str, default='', help='save the result as json, e.g. as the baseline')
+    parser.add_argument('--baseline', type=str, default='', help='fail if slower than the saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown of steps/s to the baseline')
+    return parser.parse_args()
+
+
+def build_agents(env_num, agent_num=2):
+    from distar.model import AlphaStarActorCritic
+    from distar.worker.agent.alphastar_agent import create_as_actor_agent
+    model = AlphaStarActorCritic()
+    agents = []
+    for _ in range(agent_num):
+        agent = create_as_actor_agent(model, env_num)
+        agent.mode(False)
+        agent.reset()
+        agents.append(agent)
+    return agents
+
+
+def run_config(args, env_num, recording_path):
+    r"""
+    Overview:
+        run the actor loop of ``env_num`` envs, returns the steps/s and the summary of each stage
+    """
+    env_cfg = {'map_name': args.map_name, 'recording': recording_path}
+    env_manager = SubprocessEnvManager(
+        env_fn=RecordedObsEnv, env_cfg=[env_cfg for _ in range(env_num)], env_num=env_num, map_name=args.map_name
+    )
+    env_manager.launch()
+    agents = build_agents(env_num)
+    compressor = get_data_compressor(args.compressor)
+    profiler = Profiler(enabled=True)
+    traj_buffer = {i: [] for i in range(env_num)}
+    env_steps, start_time = 0, None
+    try:
+        for step in range(args.warmup + args.steps):
+            if step == args.warmup:
+                profiler.reset()
+                env_steps, start_time = 0, time.time()
+            obs = env_manager.next_obs
+            env_ids = list(obs.keys())
+            with profiler.span('actor.collate'):
+                data = as_eval_collate_fn(list(obs.values()))
+            with profiler.span('actor.forward'):
+                output = [agent.forward(d, state_id=env_ids, valid_id=env_ids) for agent, d in zip(agents, data)]
+            action = dict(zip(env_ids, zip(*lists_to_dicts(output)['action'])))
+            with profiler.span('actor.env_step'):
+                timestep = env_manager.step(action)
+            with profiler.span('actor.pack'):
+                for env_id, t in timestep.items():
+                    traj_buffer[env_id].append(
+                        {
+                            'obs': compress_obs(obs[env_id][0]),
+                            'action': action[env_id][0]['action'],
+                            'reward': t.reward[0],
+                            'done': t.done
+                        }
+                    )
+                    if len(traj_buffer[env_id]) == args.traj_len or t.done:
+                        compressor(traj_buffer[env_id])
+                        traj_buffer[env_id] = []
+            for env_id, t in timestep.items():
+                for k, v in t.info['timing'].items():
+                    profiler.record(k, v)
+                if t.done:
+                    for agent in agents:
+                        agent.reset(state_id=[env_id])
+            env_steps += len(timestep)
+        duration = time.time() - start_time
+    finally:
+        env_manager.close()
+    return {'steps_per_sec': env_steps / duration, 'env_steps': env_steps, 'stages': profiler.summary()}
+
+
+def print_result(key, result):
+    print('=== {}: {:.2f} steps/s({} env steps) ==='.format(key, result['steps_per_sec'], result['env_steps']))
+    print('{:<24}{:>8}{:>12}{:>12}{:>12}'.format('stage', 'count', 'mean(ms)', 'p50(ms)', 'p99(ms)'))
+    for name, s in sorted(result['stages'].items()):
+        print(
+            '{:<24}{:>8}{:>12.2f}{:>12.2f}{:>12.2f}'.format(
+                name, s['count'], s['mean'] * 1000, s['p50'] * 1000, s['p99'] * 1000
+            )
+        )
+
+
+def check_baseline(results, baseline, tolerance):
+    r"""
+    Overview:
+        compare the steps/s of the configs in both, returns the regressed configs
+    """
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        expected = baseline[key]['steps_per_sec']
+        if result['steps_per_sec'] < expected * (1 - tolerance):
+            regressions.append('{}: {:.2f} steps/s, baseline: {:.2f}'.format(key, result['steps_per_sec'], expected))
+    return regressions
+
+
+if __name__ == '__main__':
+    args = get_args()
+    torch.set_num_threads(args.torch_threads)
+    tmp_dir = tempfile.mkdtemp()
+    if args.recording:
+        recordings = {'recording': args.recording}
+    else:
+        recordings = {}
+        for entity_num in args.entity_nums:
+            path = os.path.join(tmp_dir, 'entity_{}.recording'.format(entity_num))
+            with open(path, 'wb') as f:
+                f.write(fake_recording(entity_num, map_name=args.map_name))
+            recordings['entity_{}'.format(entity_num)] = path
+    results = {}
+    for name, path in recordings.items():
+        for env_num in args.env_nums:
+            key = 'env_{}/{}'.format(env_num, name)
+            results[key] = run_config(args, env_num, path)
+            print_result(key, results[key])
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = check_baseline(results, json.load(f), args.tolerance)
+        if regressions:
+            print('actor throughput regression:\n' + '\n'.join(regressions))
+            sys.exit(1)
+        print('no actor throughput regression')
@@ -0,0 +1,55 @@
+"""
+Micro-benchmark of ``as_learner_collate_fn`` on synthetic compressed trajectories
+
+    python -m distar.bin.benchmark.collate_benchmark --batch_size 8 --traj_len 64
+"""
+import argparse
+import copy
+import time
+
+import numpy as np
+import torch
+
+from distar.data.collate_fn import as_learner_collate_fn, decompress_batch
+from distar.data.fake_data import fake_trajectory
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch_size', type=int, default=8)
+    parser.add_argument('--traj_len', type=int, default=64)
+    parser.add_argument('--min_entity_num', type=int, default=40)
+    parser.add_argument('--max_entity_num', type=int, default=500)
+    parser.add_argument('--decompress_threads', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--torch_threads', type=int, default=4, help='same as the loader worker')
+    return parser.parse_args()
+
+
+def benchmark(batch, repeat, decompress_threads):
+    decompress_time, collate_time = [], []
+    for _ in range(repeat):
+        data = copy.deepcopy(batch)
+        t = time.time()
+        data = decompress_batch(data, decompress_threads)
+        decompress_time.append(time.time() - t)
+        t = time.time()
+        as_learner_collate_fn(data)
+        collate_time.append(time.time() - t)
+    return np.mean(decompress_time), np.mean(collate_time)
+
+
+if __name__ == '__main__':
+    args = get_args()
+    torch.set_num_threads(args.torch_threads)
+    batch = [
+        fake_trajectory(args.traj_len, (args.min_entity_num, args.max_entity_num), compress=True)
+        for _ in range(args.batch_size)
+    ]
+    print('batch_size: {}, traj_len: {}, entity_num: [{}, {}]'.format(
+        args.batch_size, args.traj_len, args.min_entity_num, args.max_entity_num))
+    for threads in sorted({1, args.decompress_threads}):
+        decompress_time, collate_time = benchmark(batch, args.repeat, threads)
+        total = decompress_time + collate_time
+        print('decompress_threads: {}\tdecompress: {:.3f}s\tcollate: {:.3f}s\ttotal: {:.3f}s\t{:.1f} samples/s'.format(
+            threads, decompress_time, collate_time, total, args.batch_size * args.traj_len / total))
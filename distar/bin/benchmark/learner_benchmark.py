@@ -0,0 +1,260 @@
+"""
+Throughput benchmark of the learner hot path on a CPU-only box, with synthetic trajectories
+
+    A pool of synthetic trajectories(``fake_trajectory``, the same schema as the actor packs, compressed obs and
+    entity num sampled in [min_entity_num, max_entity_num]) is saved once. The links to the saved ones are fed to
+    a ``StubCoordinator``, which serves the metadata requests of the ``AsyncDataLoader`` workers, so the workers
+    load, remove and collate(``as_learner_collate_fn``) the files the same as in training. The main process runs
+    ``AlphaStarActorCritic.compute_action_value`` through the learner agent, ``AlphaStarCompGraph.forward`` and the
+    backward and optimizer step on CPU. samples/s(batch_size * traj_len per iteration), the data time(waiting for
+    the loader) vs the train time and the peak RSS of the learner and the loader workers are reported for each config.
+
+    The defaults are a quick check of the whole path, about 1-2 minutes even on a single CPU core. The full model is
+    trained at any size, so the time is dominated by the batch, the traj_len and the entity num: an iteration of batch
+    2, traj_len 8 and up to 500 entities takes about 15s and 4GB on a single core, so the configs closer to training
+    take tens of minutes and a lot of memory, run them on purpose.
+
+    python -m distar.bin.benchmark.learner_benchmark
+    python -m distar.bin.benchmark.learner_benchmark --batch_sizes 2 4 --traj_len 8 --num_workers 1 2 --iters 10
+    python -m distar.bin.benchmark.learner_benchmark --save learner_baseline.json
+    python -m distar.bin.benchmark.learner_benchmark --baseline learner_baseline.json --tolerance 0.2  # regression gate
+"""
+import argparse
+import itertools
+import json
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+
+import numpy as np
+import torch
+
+from ctools.data.metadata_stream import StubCoordinator
+from ctools.data.new_dataloader import AsyncDataLoader
+from distar.data.collate_fn import as_learner_collate_fn
+from distar.data.fake_data import fake_trajectory
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[1, 2])
+    parser.add_argument('--traj_len', type=int, default=4)
+    parser.add_argument('--num_workers', type=int, nargs='+', default=[1])
+    parser.add_argument('--min_entity_num', type=int, default=40)
+    parser.add_argument('--max_entity_num', type=int, default=200)
+    parser.add_argument('--traj_pool', type=int, default=8, help='distinct synthetic trajectories to sample from')
+    parser.add_argument('--iters', type=int, default=3, help='measured iterations of each config')
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--decompress_threads', type=int, default=4)
+    parser.add_argument('--entity_bucket_num', type=int, default=0, help='learner.data.entity_bucket_num')
+    parser.add_argument('--torch_threads', type=int, default=8)
+    parser.add_argument('--save', type=str, default='', help='save the result as json, e.g. as the baseline')
+    parser.add_argument('--baseline', type=str, default='', help='fail if slower than the saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown of samples/s to the baseline')
+    return parser.parse_args()
+
+
+class TrajFeeder(object):
+    r"""
+    Overview:
+        link the trajectories of the pool into ``path_traj`` as new files, as the loader worker removes each one after
+        loading, and put their metadata into the coordinator channel, keeping ``max_pending`` of them ready like actors
+    Interface:
+        __init__, start, close
+    """
+
+    def __init__(self, pool, path_traj, channel, max_pending):
+        self._pool = pool
+        self._path_traj = path_traj
+        self._channel = channel
+        self._max_pending = max_pending
+        self._count = itertools.count()
+        self._end_flag = False
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def _link_one(self):
+        idx = next(self._count)
+        src = self._pool[idx % len(self._pool)]
+        name = 'traj_{}'.format(idx)
+        dst = os.path.join(self._path_traj, name)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+        return name
+
+    def _loop(self):
+        while not self._end_flag:
+            if len(self._channel) < self._max_pending:
+                self._channel.put({'traj_id': self._link_one()})
+            else:
+                time.sleep(0.01)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._end_flag = True
+        self._thread.join()
+
+
+def save_traj_pool(args, path):
+    pool = []
+    for i in range(args.traj_pool):
+        traj = fake_trajectory(args.traj_len, (args.min_entity_num, args.max_entity_num), compress=True)
+        filepath = os.path.join(path, 'pool_{}'.format(i))
+        torch.save(traj, filepath)
+        pool.append(filepath)
+    return pool
+
+
+def peak_rss_mb(pid=None):
+    r"""
+    Overview:
+        peak resident set size in MB of this process, or of the process ``pid`` from /proc(linux only)
+    """
+    if pid is None:
+        # KB on linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    try:
+        with open('/proc/{}/status'.format(pid), 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def build_learner(batch_size, traj_len):
+    from distar.computation_graph.alphastar_computation_graph import AlphaStarCompGraph, default_config
+    from distar.model import AlphaStarActorCritic
+    from distar.worker.agent.alphastar_agent import create_as_learner_agent
+    model = AlphaStarActorCritic(default_config.model)
+    agent = create_as_learner_agent(model, batch_size)
+    agent.mode(train=True)
+    graph = AlphaStarCompGraph({'unroll_len': traj_len, 'batch_size': batch_size})
+    optimizer = torch.optim.Adam(model.parameters(), lr=1e-5)
+    return model, agent, graph, optimizer
+
+
+def run_config(args, batch_size, num_workers, pool, tmp_dir):
+    r"""
+    Overview:
+        run the learner loop with ``num_workers`` loader workers, returns samples/s, the data and train time
+        of each iteration and the peak RSS
+    """
+    # a new directory for each config, the links left by the last one are not loaded and would collide by name
+    path_traj = tempfile.mkdtemp(prefix='traj_', dir=tmp_dir)
+    coordinator = StubCoordinator().start()
+    feeder = TrajFeeder(pool, path_traj, coordinator.channel, batch_size * num_workers * 4).start()
+    collate_fn = partial(
+        as_learner_collate_fn, entity_bucket_num=args.entity_bucket_num, decompress_threads=args.decompress_threads
+    )
+    dataloader = AsyncDataLoader(
+        None,
+        batch_size,
+        'cpu',
+        learner_uid=0,
+        url_prefix=coordinator.url_prefix,
+        path_traj=path_traj,
+        collate_fn=collate_fn,
+        num_workers=num_workers,
+        use_async=True
+    )
+    model, agent, graph, optimizer = build_learner(batch_size, args.traj_len)
+    data_time, train_time = [], []
+    try:
+        for it in range(args.warmup + args.iters):
+            if it == args.warmup:
+                data_time, train_time = [], []
+            t = time.time()
+            data = next(dataloader)
+            data_time.append(time.time() - t)
+            t = time.time()
+            output = graph.forward(data, agent)
+            optimizer.zero_grad()
+            output['total_loss'].backward()
+            optimizer.step()
+            train_time.append(time.time() - t)
+        worker_rss = [peak_rss_mb(w.pid) for w in dataloader.workers]
+    finally:
+        for w in dataloader.workers:
+            w.terminate()
+        feeder.close()
+        coordinator.close()
+        shutil.rmtree(path_traj, ignore_errors=True)
+    total = sum(data_time) + sum(train_time)
+    return {
+        'samples_per_sec': batch_size * args.traj_len * args.iters / total,
+        'data_time': np.mean(data_time),
+        'train_time': np.mean(train_time),
+        'learner_rss_mb': peak_rss_mb(),
+        'worker_rss_mb': worker_rss,
+    }
+
+
+def print_result(key, result):
+    worker_rss = ', '.join(['{:.0f}'.format(r) if r is not None else '-' for r in result['worker_rss_mb']])
+    print(
+        '{}\t{:.2f} samples/s\tdata: {:.3f}s\ttrain: {:.3f}s\tpeak rss(MB) learner: {:.0f}, workers: [{}]'.format(
+            key, result['samples_per_sec'], result['data_time'], result['train_time'], result['learner_rss_mb'],
+            worker_rss
+        )
+    )
+
+
+def check_baseline(results, baseline, tolerance):
+    r"""
+    Overview:
+        compare the samples/s of the configs in both, returns the regressed configs
+    """
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        expected = baseline[key]['samples_per_sec']
+        if result['samples_per_sec'] < expected * (1 - tolerance):
+            regressions.append(
+                '{}: {:.2f} samples/s, baseline: {:.2f}'.format(key, result['samples_per_sec'], expected)
+            )
+    return regressions
+
+
+if __name__ == '__main__':
+    args = get_args()
+    torch.set_num_threads(args.torch_threads)
+    tmp_dir = tempfile.mkdtemp()
+    pool_dir = os.path.join(tmp_dir, 'pool')
+    os.makedirs(pool_dir)
+    pool = save_traj_pool(args, pool_dir)
+    print(
+        'traj_len: {}, entity_num: [{}, {}], traj_pool: {}'.format(
+            args.traj_len, args.min_entity_num, args.max_entity_num, args.traj_pool
+        )
+    )
+    results = {}
+    try:
+        for batch_size in args.batch_sizes:
+            for num_workers in args.num_workers:
+                key = 'batch_{}/workers_{}'.format(batch_size, num_workers)
+                results[key] = run_config(args, batch_size, num_workers, pool, tmp_dir)
+                print_result(key, results[key])
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = check_baseline(results, json.load(f), args.tolerance)
+        if regressions:
+            print('learner throughput regression:\n' + '\n'.join(regressions))
+            sys.exit(1)
+        print('no learner throughput regression')
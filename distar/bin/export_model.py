@@ -0,0 +1,49 @@
+import argparse
+import copy
+import os
+
+from ctools.utils import read_config, read_file
+from distar.data.collate_fn import as_eval_collate_fn
+from distar.data.fake_data import fake_obs
+from distar.model import AlphaStarActorCritic
+from distar.model.alphastar.export import export_inference_model, load_inference_model, strip_state_dict, \
+    check_inference_parity
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, required=True, help='training checkpoint path')
+    parser.add_argument('--output', type=str, default=None, help='inference artifact path')
+    parser.add_argument('--config', type=str, default=None, help='model config(yaml) used in training')
+    parser.add_argument('--no_fold', action="store_true", help='do not fold norms')
+    parser.add_argument('--quantize', action="store_true", help='dynamic int8 quantization, only for cpu actors')
+    parser.add_argument('--no_script', action="store_true", help='do not script the submodules with TorchScript')
+    parser.add_argument('--no_check', action="store_true", help='skip the parity check on fake observations')
+    parser.add_argument('--entity_num', type=int, default=100, help='entity num of the fake observation for check')
+    return parser.parse_args()
+
+
+def check_parity(checkpoint_path, artifact_path, model_cfg, entity_num):
+    eager_model = AlphaStarActorCritic(copy.deepcopy(model_cfg) if model_cfg is not None else {})
+    eager_model.load_state_dict(strip_state_dict(read_file(checkpoint_path)['model']), strict=False)
+    inference_model = load_inference_model(artifact_path)
+    inputs = as_eval_collate_fn([(fake_obs(entity_num), )])[0]
+    inputs['prev_state'] = [None]
+    return check_inference_parity(eager_model, inference_model, inputs)
+
+
+if __name__ == '__main__':
+    args = get_args()
+    output = args.output
+    if output is None:
+        output = os.path.splitext(args.model)[0] + '_inference.pth'
+    model_cfg = read_config(args.config).model if args.config is not None else None
+    export_inference_model(
+        args.model, output, model_cfg, fold=not args.no_fold, quant=args.quantize, script=not args.no_script
+    )
+    print('export inference model to {}'.format(output))
+    if not args.no_check:
+        result = check_parity(args.model, output, model_cfg, args.entity_num)
+        for k, v in result.items():
+            print('{}: max_prob_diff {:.6f} kl {:.6f} action_match {:.3f}'.format(
+                k, v['max_prob_diff'], v['kl'], v['action_match']))
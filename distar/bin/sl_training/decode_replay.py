@@ -1,2 +1,52 @@
+"""
+Decode SC2 replays into sharded trajectories for supervised learning
+
+    python -m distar.bin.sl_training.decode_replay --replays <replay dir or list file> --output <dir> --workers 8
+
+    Run it again with the same output dir to resume, the replays already decoded are skipped. With --mock the replays
+    are recordings of ``ctools.pysc2.lib.mock_replay_controller.record_replay`` and SC2 is not needed.
+"""
+import argparse
+import functools
+import logging
+import os
+
+from ctools.pysc2.lib.mock_replay_controller import MockReplayProcess
+from ctools.utils import read_config
+from distar.data.replay_decoder import decode_replays, launch_sc2
+
+
+def get_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--replays', type=str, required=True, help='replay dir, or a file listing replay paths')
+    parser.add_argument('--output', type=str, required=True, help='output dir of the shards')
+    parser.add_argument('--config', type=str, default=None, help='yaml config with a decoder section')
+    parser.add_argument('--workers', type=int, default=1, help='number of workers, each one runs a SC2')
+    parser.add_argument('--version', type=str, default=None, help='SC2 version, same as the replays')
+    parser.add_argument('--suffix', type=str, default='.SC2Replay')
+    parser.add_argument('--mock', action="store_true", help='decode recordings without SC2')
+    return parser.parse_args()
+
+
+def get_replay_paths(replays, suffix):
+    if os.path.isdir(replays):
+        paths = []
+        for root, _, files in os.walk(replays):
+            paths.extend([os.path.join(root, f) for f in files if f.endswith(suffix)])
+        return sorted(paths)
+    with open(replays, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
 if __name__ == '__main__':
-    raise NotImplementedError('We will support this script in the future!')
\ No newline at end of file
+    logging.basicConfig(format='%(process)d - %(asctime)s - %(levelname)s: %(message)s', level=logging.INFO)
+    args = get_args()
+    cfg = read_config(args.config).decoder if args.config is not None else None
+    launcher = MockReplayProcess if args.mock else functools.partial(launch_sc2, args.version)
+    replay_paths = get_replay_paths(args.replays, args.suffix)
+    # the replays in a dir are named by their path relative to it, so the same file names in sub dirs don't collide
+    replay_root = args.replays if os.path.isdir(args.replays) else None
+    metrics = decode_replays(
+        replay_paths, args.output, cfg, num_workers=args.workers, launcher=launcher, replay_root=replay_root
+    )
+    print(metrics)
@@ -1,3 +1 @@
 from .alphastar_computation_graph import AlphaStarCompGraph
-from .supervised_computation_graph import SupervisedStarCompGraph
-
@@ -13,9 +13,8 @@ import numpy as np
 
 from ctools.computation_graph import BaseCompGraph
 from ctools.worker.agent import BaseAgent
-from distar.computation_graph.as_rl_utils import td_lambda_loss
 from ctools.utils import lists_to_dicts, get_rank, deep_merge_dicts, read_config
-from distar.computation_graph.as_rl_utils import compute_neg_log_prob, vtrace_advantages, upgo_returns
+from distar.computation_graph.as_rl_utils import batched_returns
 from ctools.torch_utils import to_device
 
 default_config = read_config(osp.join(osp.dirname(__file__), "alphastar_computation_graph_default_config.yaml"))
@@ -68,59 +67,56 @@ class AlphaStarCompGraph(BaseCompGraph):
 
         # td_lambda and v_trace
         actor_critic_loss = 0.
+        # detached scalars for log show, they are synchronized with host once at the end of the step
         loss_show = {}
 
-        # compute negative log probability
-        target_neg_logp = {}
-        behaviour_neg_logp = {}
-        for k, v in actions.items():
-            if k == 'selected_units':
-                target_neg_logp[k] = compute_neg_log_prob(target_outputs[k], actions[k], mask['selected_units_mask'])
-                behaviour_neg_logp[k] = compute_neg_log_prob(behaviour_outputs[k], actions[k], mask['selected_units_mask'])
-            else:
-                target_neg_logp[k] = compute_neg_log_prob(target_outputs[k], actions[k])
-                behaviour_neg_logp[k] = compute_neg_log_prob(behaviour_outputs[k], actions[k])
-
-        for field, baseline in baselines.items():
-            reward = rewards[field]
-            # td_lambda_loss = self._td_lambda_loss(baseline, reward) * self.loss_weights.baseline[field]
-            td_lambda_loss = self._td_lambda_loss(baseline, reward, gamma=self.gammas.baseline[field])
-            loss_show[short[field] + '_td'] = td_lambda_loss.item()
-            td_lambda_loss *= self.loss_weights.baseline[field]
-            vtrace_loss, vtrace_loss_dict = self._vtrace_pg_loss(
-                baseline, reward, target_neg_logp, behaviour_neg_logp, mask['actions_mask'], gamma=self.gammas.pg[field]
-            )
+        # log_softmax of each head is computed once, all the per sample terms are derived from it
+        policy_terms = self._policy_terms(target_outputs, behaviour_outputs, teacher_outputs, actions, mask)
+        target_neg_logp, behaviour_neg_logp = policy_terms['target_neg_logp'], policy_terms['behaviour_neg_logp']
+
+        td_returns, vtrace_advantages, upgo_advantages = self._compute_returns(
+            baselines, rewards, target_neg_logp, behaviour_neg_logp
+        )
+        for i, (field, baseline) in enumerate(baselines.items()):
+            td_lambda_loss = self._td_lambda_loss(baseline, td_returns[i])
+            loss_show[short[field] + '_td'] = td_lambda_loss.detach()
+            td_lambda_loss = td_lambda_loss * self.loss_weights.baseline[field]
+            vtrace_loss, vtrace_loss_dict = self._vtrace_pg_loss(vtrace_advantages[i], target_neg_logp, mask['actions_mask'])
             for k, v in vtrace_loss_dict.items():
                 loss_show[short[field] + '_' + short[k]] = v
 
-            loss_show[short[field] + '_total'] = vtrace_loss.item()
-            vtrace_loss *= self.loss_weights.pg[field]
+            loss_show[short[field] + '_total'] = vtrace_loss.detach()
+            vtrace_loss = vtrace_loss * self.loss_weights.pg[field]
             actor_critic_loss += td_lambda_loss + vtrace_loss
         # upgo loss
         upgo_loss, upgo_loss_dict = self._upgo_loss(
-            baselines['winloss'], rewards['winloss'], target_neg_logp, behaviour_neg_logp, mask['actions_mask'],
+            upgo_advantages[list(baselines.keys()).index('winloss')], target_neg_logp, behaviour_neg_logp,
+            mask['actions_mask'],
         )
         for k, v in upgo_loss_dict.items():
             loss_show['upgo' + '_' + short[k]] = v
-        loss_show['upgo' + '_total'] = upgo_loss.item()
-        upgo_loss *= self.loss_weights.upgo['winloss']
+        loss_show['upgo' + '_total'] = upgo_loss.detach()
+        upgo_loss = upgo_loss * self.loss_weights.upgo['winloss']
         # human kl loss
-        kl_loss, action_type_kl_loss, filter_kl_loss, kl_loss_dict = self._human_kl_loss(target_outputs, teacher_outputs, game_seconds, mask)
+        kl_loss, action_type_kl_loss, filter_kl_loss, kl_loss_dict = self._human_kl_loss(policy_terms, game_seconds, mask)
         for k, v in kl_loss_dict.items():
             loss_show['kl' + '_' + short[k]] = v
-        loss_show['kl' + '_total'] = kl_loss.item()
-        loss_show['kl_reward'] = action_type_kl_loss.item()  # replace extra action type loss to kl_reward for log show
-        loss_show['kl_td'] = filter_kl_loss.item()  # replace extra action type loss to kl_td for log show
-        kl_loss *= self.loss_weights.kl
-        action_type_kl_loss *= self.loss_weights.action_type_kl
-        filter_kl_loss *= self.loss_weights.filter_kl
+        loss_show['kl' + '_total'] = kl_loss.detach()
+        loss_show['kl_reward'] = action_type_kl_loss.detach()  # replace extra action type loss to kl_reward for log show
+        loss_show['kl_td'] = filter_kl_loss.detach()  # replace extra action type loss to kl_td for log show
+        kl_loss = kl_loss * self.loss_weights.kl
+        action_type_kl_loss = action_type_kl_loss * self.loss_weights.action_type_kl
+        filter_kl_loss = filter_kl_loss * self.loss_weights.filter_kl
 
         # entropy loss
-        ent_loss, ent_loss_dict = self._entropy_loss(target_outputs, mask)
+        ent_loss, ent_loss_dict = self._entropy_loss(policy_terms, mask)
         for k, v in ent_loss_dict.items():
             loss_show['entropy' + '_' + short[k]] = v
-        loss_show['entropy' + '_total'] = ent_loss.item()
-        ent_loss *= self.loss_weights.entropy
+        loss_show['entropy' + '_total'] = ent_loss.detach()
+        ent_loss = ent_loss * self.loss_weights.entropy
+
+        # only one device to host copy for all the logged values
+        loss_show = dict(zip(loss_show.keys(), torch.stack([v.reshape(()) for v in loss_show.values()]).tolist()))
 
         total_loss = actor_critic_loss + kl_loss + action_type_kl_loss + ent_loss + upgo_loss + filter_kl_loss
         ret = {
@@ -150,130 +146,132 @@ class AlphaStarCompGraph(BaseCompGraph):
             outputs_dict['baselines'][k][-1] *= flag
         return self.rollout_outputs(*outputs_dict.values())
 
-    def _td_lambda_loss(self, baseline, reward, gamma=1.0):
+    def _compute_returns(self, baselines, rewards, target_neg_logp, behaviour_neg_logp):
+        """
+            returns of all the fields and heads in one batched pass, td: [F, T, B], vtrace: [F, K, T, B], upgo: [F, T, B]
         """
-            default: gamma=1.0, lamda=0.8
+        fields = list(baselines.keys())
+        with torch.no_grad():
+            values = torch.stack([baselines[f] for f in fields])
+            reward = torch.stack([rewards[f] for f in fields])
+            assert values.shape[1] == self.T + 1 and reward.shape[1] == self.T
+            # rho = target_prob / behaviour_prob
+            clipped_rhos = torch.stack([behaviour_neg_logp[k] - target_neg_logp[k] for k in self.action_keys])
+            clipped_rhos = torch.exp(clipped_rhos).clamp_(max=1).view(len(self.action_keys), *reward.shape[1:])
+            td_gammas = reward.new_tensor([self.gammas.baseline[f] for f in fields]).view(-1, 1, 1)
+            # v-trace is computed with gamma 1.0 and the pg gamma scaling the advantages, which is the same as the
+            # former call vtrace_advantages(clipped_rhos, clipped_rhos, reward, baseline, gamma, lambda_=0.8)
+            pg_gammas = reward.new_ones(1, 1, 1, 1)
+            clipped_pg_rhos = reward.new_tensor([self.gammas.pg[f] for f in fields]).view(-1, 1, 1, 1)
+            return batched_returns(reward, values, clipped_rhos, td_gammas, pg_gammas, clipped_pg_rhos)
+
+    def _td_lambda_loss(self, baseline, returns):
+        """
+            returns: td lambda returns computed in _compute_returns, lambda=0.8
         """
         assert (isinstance(baseline, torch.Tensor) and baseline.shape[0] == self.T + 1)
-        assert (isinstance(reward, torch.Tensor) and reward.shape[0] == self.T)
-        return td_lambda_loss(baseline, reward, gamma=gamma)
+        assert (isinstance(returns, torch.Tensor) and returns.shape[0] == self.T)
+        # discard the value at T as it should be considered in the next slice
+        return 0.5 * torch.pow(returns - baseline[:-1], 2).mean()
 
-    def _vtrace_pg_loss(self, baseline, reward, target_neg_logp, behaviour_neg_logp, mask, gamma=1.0):
+    def _vtrace_pg_loss(self, advantages, target_neg_logp, mask):
         """
             seperated vtrace loss
         """
         loss = 0.
         loss_dict = {}
-        for k in self.action_keys:
-            with torch.no_grad():
-                # rho = target_prob / behaviour_prob
-                clipped_rhos = torch.exp((behaviour_neg_logp[k] - target_neg_logp[k])).clamp_(max=1)
-                clipped_rhos = clipped_rhos.view(baseline.shape[0] - 1, baseline.shape[1])  # t - 1, b
-                advantages = vtrace_advantages(clipped_rhos, clipped_rhos, reward, baseline, gamma, lambda_=0.8)
-                advantages = advantages.view(-1)
-
-            head_loss = advantages * target_neg_logp[k] * mask[k]
+        for i, k in enumerate(self.action_keys):
+            head_loss = advantages[i].view(-1) * target_neg_logp[k] * mask[k]
             head_loss = head_loss.mean()
-            loss_dict[k] = head_loss.item()
+            loss_dict[k] = head_loss.detach()
             loss += head_loss
         return loss, loss_dict
 
-    def _upgo_loss(self, baseline, reward, target_neg_logp, behaviour_neg_logp, mask):
+    def _upgo_loss(self, advantages, target_neg_logp, behaviour_neg_logp, mask):
         loss = 0.
         loss_dict = {}
+        advantages = advantages.view(-1)
         for k in self.action_keys:
             with torch.no_grad():
                 # rho = target_prob / behaviour_prob
                 clipped_rhos = torch.exp((behaviour_neg_logp[k] - target_neg_logp[k])).clamp_(max=1)
-                advantages = upgo_returns(reward, baseline) - baseline[:-1]
-                advantages = advantages.view(-1)
 
             head_loss = clipped_rhos * advantages * target_neg_logp[k] * mask[k]
             head_loss = head_loss.mean()
-            loss_dict[k] = head_loss.item()
+            loss_dict[k] = head_loss.detach()
             loss += head_loss
         return loss, loss_dict
 
-    def _human_kl_loss(self, target_outputs, teacher_outputs, game_seconds, mask):
-        loss_dict = {}
-
-        def kl(stu, tea, mask, k, flag=None):
-            tea = F.log_softmax(tea, dim=-1)
-            stu = F.log_softmax(stu, dim=-1)
-            tea_probs = torch.exp(tea)
+    def _policy_terms(self, target_outputs, behaviour_outputs, teacher_outputs, actions, mask):
+        """
+            log_softmax of target, behaviour and teacher outputs is computed once for each head, negative log prob,
+            kl to teacher and normalized entropy of each sample are all derived from it
+        """
+        terms = {'target_neg_logp': {}, 'behaviour_neg_logp': {}, 'kl': {}, 'entropy': {}}
+        for k in self.action_keys:
+            target_logp = F.log_softmax(target_outputs[k], dim=-1)
+            with torch.no_grad():
+                behaviour_logp = F.log_softmax(behaviour_outputs[k], dim=-1)
+                teacher_logp = F.log_softmax(teacher_outputs[k], dim=-1)
+                teacher_probs = torch.exp(teacher_logp)
+            action = actions[k].unsqueeze(dim=-1)
+            target_neg_logp = -target_logp.gather(-1, action).squeeze(dim=-1)
+            behaviour_neg_logp = -behaviour_logp.gather(-1, action).squeeze(dim=-1)
+            kl = (teacher_probs * (teacher_logp - target_logp)).sum(dim=-1)
+            ent = -(torch.exp(target_logp) * target_logp).sum(dim=-1)
 
-            kl = tea_probs * (tea - stu)
             if k == 'selected_units':
-                kl *= mask['selected_units_mask'].unsqueeze(dim=2)
-                kl = kl.sum(dim=1)
-                kl = kl.sum(dim=-1)
+                # multiply the probabilities of each selection, mask out invalid selections
+                su_mask = mask['selected_units_mask']
+                target_neg_logp = (target_neg_logp * su_mask).sum(dim=1)
+                behaviour_neg_logp = (behaviour_neg_logp * su_mask).sum(dim=1)
+                kl = (kl * su_mask).sum(dim=1)
+                ent = (ent * su_mask).sum(dim=1)
+                ent = ent / torch.log(mask['selected_units_logits_mask'].sum(dim=-1).float())  # normalize
             elif k == 'target_units':
-                kl = kl.sum(dim=-1)
+                ent = ent / torch.log(mask['target_units_logits_mask'].sum(dim=-1).float())  # normalize
             else:
-                kl = kl.sum(dim=-1)
-
-            if flag is not None:
-                kl *= flag
-            kl = kl * mask['actions_mask'][k]
-            kl = kl.mean()
-            return kl
+                ent = ent / np.log(target_logp.shape[-1])
+            if k == 'action_type':
+                terms['teacher_action_type_probs'] = teacher_probs
 
-        def filter_kl(stu, tea, mask, k, build_fac, train_fac):
-            tea = F.log_softmax(tea, dim=-1)
-            stu = F.log_softmax(stu, dim=-1)
-            tea_probs = torch.exp(tea)
-            factor_filter = tea_probs[:, filter_index].max(dim=-1).values
-            factor_train = tea_probs[:, train_index].max(dim=-1).values
-            factor_mask = factor_filter > factor_train
-            factor = factor_mask * factor_filter * build_fac + ~factor_mask * factor_train * train_fac
-
-            kl = tea_probs * (tea - stu)
-            kl = kl.sum(dim=-1)
-
-            kl = kl * mask['actions_mask'][k] * factor
-            kl = kl.mean()
-            return kl
+            terms['target_neg_logp'][k] = target_neg_logp
+            terms['behaviour_neg_logp'][k] = behaviour_neg_logp
+            terms['kl'][k] = kl
+            terms['entropy'][k] = ent
+        return terms
 
+    def _human_kl_loss(self, policy_terms, game_seconds, mask):
+        loss_dict = {}
+        kl = policy_terms['kl']
+        actions_mask = mask['actions_mask']
 
         kl_loss = torch.zeros(1).to(dtype=torch.float32, device=self.device)
         for k in self.action_keys:
-            tmp_loss = kl(target_outputs[k], teacher_outputs[k], mask, k)
-            loss_dict[k] = tmp_loss.item()
+            tmp_loss = (kl[k] * actions_mask[k]).mean()
+            loss_dict[k] = tmp_loss.detach()
             kl_loss += tmp_loss
 
         flag = game_seconds < self.action_type_kl_seconds
-        action_type_kl_loss = kl(
-            target_outputs['action_type'], teacher_outputs['action_type'], mask, 'action_type', flag
-        )
+        action_type_kl_loss = (kl['action_type'] * flag * actions_mask['action_type']).mean()
 
-        filter_kl_loss = filter_kl(
-            target_outputs['action_type'], teacher_outputs['action_type'], mask, 'action_type',
-            self.loss_weights.filter_kl_build, self.loss_weights.filter_kl_train
-        )
+        tea_probs = policy_terms['teacher_action_type_probs']
+        factor_filter = tea_probs[:, filter_index].max(dim=-1).values
+        factor_train = tea_probs[:, train_index].max(dim=-1).values
+        factor_mask = factor_filter > factor_train
+        factor = factor_mask * factor_filter * self.loss_weights.filter_kl_build + \
+            ~factor_mask * factor_train * self.loss_weights.filter_kl_train
+        filter_kl_loss = (kl['action_type'] * actions_mask['action_type'] * factor).mean()
 
         return kl_loss, action_type_kl_loss, filter_kl_loss, loss_dict
 
-    def _entropy_loss(self, target_outputs, mask):
+    def _entropy_loss(self, policy_terms, mask):
         loss = torch.zeros(1).to(dtype=torch.float, device=self.device)
         loss_dict = {}
         for k in self.action_keys:
-            policy = target_outputs[k]
-            log_policy = F.log_softmax(policy, dim=-1)
-            policy = torch.exp(log_policy)
-            ent = -policy * log_policy
-
-            if k == 'selected_units':
-                ent *= mask['selected_units_mask'].unsqueeze(dim=2)
-                ent = ent.sum(dim=1)
-                ent = ent.sum(dim=-1) / torch.log(mask['selected_units_logits_mask'].sum(dim=-1).float())  # normalize
-            elif k == 'target_units':
-                ent = ent.sum(dim=-1) / torch.log(mask['target_units_logits_mask'].sum(dim=-1).float())  # normalize
-            else:
-                ent = ent.sum(dim=-1) / torch.log(torch.FloatTensor([ent.shape[-1]]).to(ent.device))
-
-            ent = ent * mask['actions_mask'][k]
+            ent = policy_terms['entropy'][k] * mask['actions_mask'][k]
             tmp_loss = ent.mean()
-            loss_dict[k] = tmp_loss.item()
+            loss_dict[k] = tmp_loss.detach()
             loss += tmp_loss
         return - loss, loss_dict
 
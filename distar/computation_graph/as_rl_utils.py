@@ -1,6 +1,7 @@
 """Library for RL returns and losses evaluation"""
 
 from functools import reduce
+from typing import Optional, Tuple
 
 import torch
 import torch.nn.functional as F
@@ -179,3 +180,102 @@ def vtrace_advantages(clipped_rhos, clipped_cs, rewards, bootstrap_values, clipp
         clipped_pg_rhos = clipped_rhos
     advantages = clipped_pg_rhos * (rewards + gammas * vtrace_val[1:] - bootstrap_values[:-1])
     return advantages
+
+
+@torch.jit.script
+def reverse_linear_scan(offsets: torch.Tensor, coeffs: torch.Tensor, init: torch.Tensor) -> torch.Tensor:
+    r"""
+    Overview:
+        Solve the backward recursion shared by lambda returns and v-trace along the time dim(dim 1)
+        ```
+        result[:, T-1] = offsets[:, T-1] + coeffs[:, T-1] * init
+        result[:, t] = offsets[:, t] + coeffs[:, t] * result[:, t+1]
+        ```
+    Arguments:
+        - offsets (:obj:`torch.Tensor`): of size [N, T_traj, batchsize]
+        - coeffs (:obj:`torch.Tensor`): of size [N, T_traj, batchsize]
+        - init (:obj:`torch.Tensor`): the value after the last step, of size [N, batchsize]
+    Returns:
+        - result (:obj:`torch.Tensor`): of size [N, T_traj, batchsize]
+    """
+    result = []
+    cur = init
+    for t in range(offsets.shape[1] - 1, -1, -1):
+        cur = offsets[:, t] + coeffs[:, t] * cur
+        result.append(cur)
+    result.reverse()
+    return torch.stack(result, dim=1)
+
+
+@torch.jit.script
+def _lambda_return_terms(rewards: torch.Tensor, gammas: torch.Tensor, bootstrap_values: torch.Tensor,
+                         lambdas: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+    # multistep_forward_view written as result[t] = offsets[t] + coeffs[t] * result[t+1]
+    coeffs = gammas * lambdas
+    coeffs[:, -1] = 0.  # forced cutoff at the last one
+    offsets = rewards + (gammas - coeffs) * bootstrap_values[:, 1:]
+    return offsets, coeffs
+
+
+@torch.jit.script
+def batched_returns(
+        rewards: torch.Tensor,
+        bootstrap_values: torch.Tensor,
+        clipped_rhos: torch.Tensor,
+        td_gammas: torch.Tensor,
+        pg_gammas: torch.Tensor,
+        clipped_pg_rhos: Optional[torch.Tensor] = None,
+        td_lambda: float = 0.8,
+        vtrace_lambda: float = 0.8
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    r"""
+    Overview:
+        Compute TD($\lambda$) returns, V-trace advantages and UPGO advantages of all the reward fields and all the
+        action heads in one scan, the results are the same as calling ``generalized_lambda_returns``,
+        ``vtrace_advantages`` and ``upgo_returns`` for each field and head
+    Arguments:
+        - rewards (:obj:`torch.Tensor`): the returns of F fields from time step 0 to T-1, of size [F, T_traj, batchsize]
+        - bootstrap_values (:obj:`torch.Tensor`): estimation of the state value of F fields at step 0 to T,
+          of size [F, T_traj+1, batchsize]
+        - clipped_rhos (:obj:`torch.Tensor`): clipped importance sampling weights of K action heads,
+          also used as c in V-trace, of size [K, T_traj, batchsize]
+        - td_gammas (:obj:`torch.Tensor`): discount factor of TD($\lambda$), broadcastable to [F, T_traj, batchsize]
+        - pg_gammas (:obj:`torch.Tensor`): discount factor of V-trace, broadcastable to [F, K, T_traj, batchsize]
+        - clipped_pg_rhos (:obj:`torch.Tensor`): importance sampling weights of the policy gradient,
+          broadcastable to [F, K, T_traj, batchsize], ``clipped_rhos`` is used if it is None
+    Returns:
+        - td_returns (:obj:`torch.Tensor`): TD($\lambda$) returns, of size [F, T_traj, batchsize]
+        - vtrace_adv (:obj:`torch.Tensor`): V-trace advantages, of size [F, K, T_traj, batchsize]
+        - upgo_adv (:obj:`torch.Tensor`): UPGO returns minus baseline, of size [F, T_traj, batchsize]
+    """
+    F_, T, B = rewards.shape
+    K = clipped_rhos.shape[0]
+    values_t, values_tp1 = bootstrap_values[:, :-1], bootstrap_values[:, 1:]
+
+    # TD(lambda)
+    td_gammas = td_gammas.expand_as(rewards)
+    td_offsets, td_coeffs = _lambda_return_terms(
+        rewards, td_gammas, bootstrap_values, torch.full_like(rewards, td_lambda)
+    )
+    # UPGO, the trace continues if r_t + V_tp1 >= V_t
+    upgo_lambdas = ((rewards + values_tp1) >= values_t).to(rewards.dtype)
+    upgo_lambdas = torch.cat([upgo_lambdas[:, 1:], torch.ones_like(upgo_lambdas[:, -1:])], dim=1)
+    upgo_offsets, upgo_coeffs = _lambda_return_terms(rewards, torch.ones_like(rewards), bootstrap_values, upgo_lambdas)
+    # V-trace, solve vtrace_val - bootstrap_values which is 0 at T
+    pg_gammas = pg_gammas.expand(F_, K, T, B)
+    rhos = clipped_rhos.unsqueeze(0)
+    vtrace_offsets = rhos * (rewards.unsqueeze(1) + pg_gammas * values_tp1.unsqueeze(1) - values_t.unsqueeze(1))
+    vtrace_coeffs = pg_gammas * vtrace_lambda * rhos
+
+    offsets = torch.cat([td_offsets, upgo_offsets, vtrace_offsets.reshape(F_ * K, T, B)], dim=0)
+    coeffs = torch.cat([td_coeffs, upgo_coeffs, vtrace_coeffs.reshape(F_ * K, T, B)], dim=0)
+    result = reverse_linear_scan(offsets, coeffs, torch.zeros_like(offsets[:, 0]))
+    td_returns, upgo_returns_, vtrace_diff = result.split([F_, F_, F_ * K], dim=0)
+
+    vtrace_diff = vtrace_diff.reshape(F_, K, T, B)
+    vtrace_diff_tp1 = torch.cat([vtrace_diff[:, :, 1:], torch.zeros_like(vtrace_diff[:, :, -1:])], dim=2)
+    vtrace_val_tp1 = vtrace_diff_tp1 + values_tp1.unsqueeze(1)
+    if clipped_pg_rhos is None:
+        clipped_pg_rhos = rhos
+    vtrace_adv = clipped_pg_rhos * (rewards.unsqueeze(1) + pg_gammas * vtrace_val_tp1 - values_t.unsqueeze(1))
+    return td_returns, vtrace_adv, upgo_returns_ - values_t
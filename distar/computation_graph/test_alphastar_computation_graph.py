@@ -0,0 +1,148 @@
+import pytest
+import torch
+import torch.nn.functional as F
+
+from ctools.torch_utils.network.rnn import sequence_mask
+from distar.computation_graph.alphastar_computation_graph import AlphaStarCompGraph, filter_index, train_index
+from distar.computation_graph.as_rl_utils import compute_neg_log_prob
+
+B, S, N = 6, 5, 10
+HEAD_DIM = {'action_type': 327, 'delay': 128, 'queued': 2, 'target_location': 64}
+
+
+def get_data():
+    # at least 2 entities, the entropy of target units is normalized by log(entity_num)
+    entity_num = torch.randint(2, N + 1, (B, ))
+    entity_num[0] = N
+    selected_units_num = torch.randint(1, S + 1, (B, ))
+    selected_units_num[0] = S
+    mask = {
+        'actions_mask': {k: torch.rand(B) > 0.3
+                         for k in list(HEAD_DIM.keys()) + ['selected_units', 'target_units']},
+        'selected_units_mask': sequence_mask(selected_units_num),
+        'target_units_logits_mask': sequence_mask(entity_num),
+        'selected_units_logits_mask': sequence_mask(entity_num + 1),
+    }
+    outputs = []
+    for _ in range(3):
+        output = {k: torch.randn(B, n) * 3 for k, n in HEAD_DIM.items()}
+        # the padded logits are filled with -1e9 in collate, the same as the learner batch
+        su_logits_mask = mask['selected_units_logits_mask'].unsqueeze(1)
+        output['selected_units'] = torch.randn(B, S, N + 1).masked_fill(~su_logits_mask, -1e9)
+        output['target_units'] = torch.randn(B, N).masked_fill(~mask['target_units_logits_mask'], -1e9)
+        outputs.append(output)
+    actions = {k: torch.randint(0, n, (B, )) for k, n in HEAD_DIM.items()}
+    actions['selected_units'] = torch.stack([torch.randint(0, n + 1, (S, )) for n in entity_num.tolist()])
+    actions['target_units'] = torch.stack([torch.randint(0, n, ()) for n in entity_num.tolist()])
+    game_seconds = torch.randint(0, 20000, (B, ))
+    return outputs, actions, game_seconds, mask
+
+
+# the loss helpers before the shared log_softmax, kept as the reference
+def previous_human_kl_loss(graph, target_outputs, teacher_outputs, game_seconds, mask):
+
+    def kl(stu, tea, mask, k, flag=None):
+        tea = F.log_softmax(tea, dim=-1)
+        stu = F.log_softmax(stu, dim=-1)
+        tea_probs = torch.exp(tea)
+        kl = tea_probs * (tea - stu)
+        if k == 'selected_units':
+            kl *= mask['selected_units_mask'].unsqueeze(dim=2)
+            kl = kl.sum(dim=1)
+        kl = kl.sum(dim=-1)
+        if flag is not None:
+            kl *= flag
+        kl = kl * mask['actions_mask'][k]
+        return kl.mean()
+
+    def filter_kl(stu, tea, mask, k, build_fac, train_fac):
+        tea = F.log_softmax(tea, dim=-1)
+        stu = F.log_softmax(stu, dim=-1)
+        tea_probs = torch.exp(tea)
+        factor_filter = tea_probs[:, filter_index].max(dim=-1).values
+        factor_train = tea_probs[:, train_index].max(dim=-1).values
+        factor_mask = factor_filter > factor_train
+        factor = factor_mask * factor_filter * build_fac + ~factor_mask * factor_train * train_fac
+        kl = tea_probs * (tea - stu)
+        kl = kl.sum(dim=-1)
+        kl = kl * mask['actions_mask'][k] * factor
+        return kl.mean()
+
+    loss_dict = {}
+    kl_loss = torch.zeros(1)
+    for k in graph.action_keys:
+        tmp_loss = kl(target_outputs[k], teacher_outputs[k], mask, k)
+        loss_dict[k] = tmp_loss
+        kl_loss += tmp_loss
+    flag = game_seconds < graph.action_type_kl_seconds
+    action_type_kl_loss = kl(target_outputs['action_type'], teacher_outputs['action_type'], mask, 'action_type', flag)
+    filter_kl_loss = filter_kl(
+        target_outputs['action_type'], teacher_outputs['action_type'], mask, 'action_type',
+        graph.loss_weights.filter_kl_build, graph.loss_weights.filter_kl_train
+    )
+    return kl_loss, action_type_kl_loss, filter_kl_loss, loss_dict
+
+
+def previous_entropy_loss(graph, target_outputs, mask):
+    loss = torch.zeros(1)
+    loss_dict = {}
+    for k in graph.action_keys:
+        policy = target_outputs[k]
+        log_policy = F.log_softmax(policy, dim=-1)
+        policy = torch.exp(log_policy)
+        ent = -policy * log_policy
+        if k == 'selected_units':
+            ent *= mask['selected_units_mask'].unsqueeze(dim=2)
+            ent = ent.sum(dim=1)
+            ent = ent.sum(dim=-1) / torch.log(mask['selected_units_logits_mask'].sum(dim=-1).float())
+        elif k == 'target_units':
+            ent = ent.sum(dim=-1) / torch.log(mask['target_units_logits_mask'].sum(dim=-1).float())
+        else:
+            ent = ent.sum(dim=-1) / torch.log(torch.FloatTensor([ent.shape[-1]]))
+        ent = ent * mask['actions_mask'][k]
+        tmp_loss = ent.mean()
+        loss_dict[k] = tmp_loss
+        loss += tmp_loss
+    return -loss, loss_dict
+
+
+def grads(loss, target_outputs):
+    inputs = [target_outputs[k] for k in sorted(target_outputs.keys())]
+    g = torch.autograd.grad(loss.sum(), inputs, retain_graph=True, allow_unused=True)
+    return [torch.zeros_like(i) if t is None else t for i, t in zip(inputs, g)]
+
+
+@pytest.mark.unittest
+class TestPolicyTerms:
+
+    def test_same_as_previous(self):
+        torch.manual_seed(0)
+        graph = AlphaStarCompGraph({})
+        (target_outputs, behaviour_outputs, teacher_outputs), actions, game_seconds, mask = get_data()
+        for v in target_outputs.values():
+            v.requires_grad_(True)
+        terms = graph._policy_terms(target_outputs, behaviour_outputs, teacher_outputs, actions, mask)
+
+        for k in graph.action_keys:
+            su_mask = mask['selected_units_mask'] if k == 'selected_units' else None
+            for name, outputs in [('target_neg_logp', target_outputs), ('behaviour_neg_logp', behaviour_outputs)]:
+                ref = compute_neg_log_prob(outputs[k], actions[k], su_mask)
+                assert torch.allclose(terms[name][k], ref, atol=1e-5), (name, k)
+        assert torch.allclose(terms['teacher_action_type_probs'], F.softmax(teacher_outputs['action_type'], dim=-1))
+
+        new = graph._human_kl_loss(terms, game_seconds, mask)
+        ref = previous_human_kl_loss(graph, target_outputs, teacher_outputs, game_seconds, mask)
+        for a, b in zip(new[:3], ref[:3]):
+            assert torch.allclose(a, b, atol=1e-5)
+            for ga, gb in zip(grads(a, target_outputs), grads(b, target_outputs)):
+                assert torch.allclose(ga, gb, atol=1e-6)
+        for k in graph.action_keys:
+            assert torch.allclose(new[3][k], ref[3][k], atol=1e-5), k
+
+        new = graph._entropy_loss(terms, mask)
+        ref = previous_entropy_loss(graph, target_outputs, mask)
+        assert torch.allclose(new[0], ref[0], atol=1e-5)
+        for ga, gb in zip(grads(new[0], target_outputs), grads(ref[0], target_outputs)):
+            assert torch.allclose(ga, gb, atol=1e-6)
+        for k in graph.action_keys:
+            assert torch.allclose(new[1][k], ref[1][k], atol=1e-5), k
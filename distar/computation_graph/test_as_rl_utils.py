@@ -0,0 +1,41 @@
+import pytest
+import torch
+
+from distar.computation_graph.as_rl_utils import batched_returns, generalized_lambda_returns, upgo_returns, \
+    vtrace_advantages
+
+F, K, T, B = 6, 6, 8, 4
+
+
+@pytest.mark.unittest
+class TestBatchedReturns:
+
+    @pytest.mark.parametrize('use_pg_rhos', [False, True])
+    def test_reference(self, use_pg_rhos):
+        rewards = torch.randn(F, T, B)
+        values = torch.randn(F, T + 1, B)
+        clipped_rhos = torch.rand(K, T, B)
+        td_gammas = torch.rand(F) * 0.1 + 0.9
+        pg_gammas = torch.rand(F) * 0.1 + 0.9
+        pg_rhos = torch.rand(F)
+        td, vtrace, upgo = batched_returns(
+            rewards, values, clipped_rhos, td_gammas.view(-1, 1, 1), pg_gammas.view(-1, 1, 1, 1),
+            pg_rhos.view(-1, 1, 1, 1) if use_pg_rhos else None
+        )
+        assert td.shape == (F, T, B) and upgo.shape == (F, T, B) and vtrace.shape == (F, K, T, B)
+        for f in range(F):
+            ref = generalized_lambda_returns(rewards[f], td_gammas[f].item(), values[f], 0.8)
+            assert torch.allclose(td[f], ref, atol=1e-5)
+            ref = upgo_returns(rewards[f], values[f]) - values[f, :-1]
+            assert torch.allclose(upgo[f], ref, atol=1e-5)
+            for k in range(K):
+                ref = vtrace_advantages(
+                    clipped_rhos[k],
+                    clipped_rhos[k],
+                    rewards[f],
+                    values[f],
+                    pg_rhos[f].item() if use_pg_rhos else None,
+                    gammas=pg_gammas[f].item(),
+                    lambda_=0.8
+                )
+                assert torch.allclose(vtrace[f, k], ref, atol=1e-5)
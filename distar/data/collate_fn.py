@@ -1,11 +1,14 @@
 from collections.abc import Sequence, Mapping
+from concurrent.futures import ThreadPoolExecutor
 from numbers import Integral
+import os
 import torch
 import torch.nn.functional as F
 from torch.utils.data._utils.collate import default_collate
-from ctools.pysc2.lib.static_data import ACTIONS_REORDER_INV
+from ctools.pysc2.lib.static_data import ACTIONS_REORDER_INV, NUM_ACTIONS
 from ctools.pysc2.lib.action_dict import GENERAL_ACTION_INFO_MASK
 from ctools.utils import lists_to_dicts
+from ctools.data import host_decollate
 from ctools.torch_utils.network.rnn import sequence_mask
 from distar.envs.other.alphastar_compress import decompress_obs, compress_obs
 import numpy as np
@@ -119,21 +122,104 @@ def diff_shape_collate(batch):
     raise TypeError('not support element type: {}'.format(elem_type))
 
 
-def as_learner_collate_fn(batch):
+def build_entity_bucket(entity_num, bucket_num):
+    r"""
+    Overview:
+        group samples with similar entity num into buckets, so that the entity transformer only pads each bucket
+        to its own max entity num instead of the max entity num of the whole batch
+    Arguments:
+        - entity_num (:obj:`torch.LongTensor`): entity num of each sample, shape could be (n, 1) or (n)
+        - bucket_num (:obj:`int`): the max number of buckets
+    Returns:
+        - bucket (:obj:`list`): list of (index, max_num, padded) of each bucket: index is the LongTensor of sample \
+            indexes(sorted by entity num), max_num is the max entity num of the bucket and padded is whether any \
+            sample of the bucket has less entities than max_num. The sizes are python values, so the model doesn't \
+            read them back from the device
+    """
+    entity_num = entity_num.view(-1)
+    bucket_num = max(1, min(bucket_num, entity_num.shape[0]))
+    sorted_idx = torch.argsort(entity_num)
+    bucket = []
+    for idx in torch.chunk(sorted_idx, bucket_num):
+        if idx.numel() == 0:
+            continue
+        min_num, max_num = entity_num[idx[0]].item(), entity_num[idx[-1]].item()
+        bucket.append((idx, max_num, min_num < max_num))
+    return bucket
+
+
+def _build_actions_mask_table():
+    # actions mask of each action type(reordered), no-op(0) masks all the heads
+    table = torch.zeros(NUM_ACTIONS, len(ACTION_HEADS), dtype=torch.bool)
+    for action_type in range(1, NUM_ACTIONS):
+        action_info = GENERAL_ACTION_INFO_MASK[ACTIONS_REORDER_INV[action_type]]
+        for i, k in enumerate(ACTION_HEADS):
+            table[action_type, i] = True if k in ['action_type', 'delay'] else bool(action_info[k])
+    return table
+
+
+ACTION_HEADS = ['action_type', 'delay', 'queued', 'target_units', 'selected_units', 'target_location']
+ACTIONS_MASK_TABLE = _build_actions_mask_table()  # num_actions, num_heads
+OBS_KEYS = ['obs_home', 'obs_away', 'obs_home_next', 'obs_away_next']
+# (pid, num_threads) -> ThreadPoolExecutor, created lazily in each loader worker. A forked worker inherits the
+# executors of its parent without their threads, so the pools are never shared across processes
+_decompress_pools = {}
+
+
+def decompress_batch(batch, num_threads=4):
+    r"""
+    Overview:
+        decompress all the obs in a batch of trajectories inplace, with a thread pool if num_threads > 1
+    """
+    items = [(step, k) for traj in batch for step in traj for k in OBS_KEYS if k in step]
+    if num_threads > 1:
+        key = (os.getpid(), num_threads)
+        if key not in _decompress_pools:
+            _decompress_pools[key] = ThreadPoolExecutor(max_workers=num_threads)
+        obs = list(_decompress_pools[key].map(lambda item: decompress_obs(item[0][item[1]]), items))
+    else:
+        obs = [decompress_obs(step[k]) for step, k in items]
+    for (step, k), o in zip(items, obs):
+        step[k] = o
+    return batch
+
+
+def _pad_selected_units_logits(logits, max_selected_units_num, max_entity_num):
+    # same as padding each [S, E + 1] logit to max_entity_num + 1 columns with -1e9, then pad_sequence on S with 0
+    # and truncating to max_selected_units_num, but all the logits are copied into one preallocated buffer
+    logits = [l.unsqueeze(0) if len(l.shape) == 1 else l for l in logits]
+    S = min(max([l.shape[0] for l in logits]), max_selected_units_num)
+    E = max_entity_num + 1
+    out = logits[0].new_zeros(len(logits), S, E)
+    for i, l in enumerate(logits):
+        s, e = min(l.shape[0], S), min(l.shape[1], E)
+        out[i, :s, :e] = l[:s, :e]
+        out[i, :s, e:] = -1e9
+    return out
+
+
+def _pad_target_units_logits(logits, max_entity_num):
+    # same as pad_sequence with -1e9 then truncating to max_entity_num
+    N = min(max([l.shape[0] for l in logits]), max_entity_num)
+    out = logits[0].new_full((len(logits), N), -1e9)
+    for i, l in enumerate(logits):
+        n = min(l.shape[0], N)
+        out[i, :n] = l[:n]
+    return out
+
+
+def as_learner_collate_fn(batch, entity_bucket_num=0, decompress_threads=4):
     # ret keys:
     # sequence: batch_size, traj_len, prev_state
     # obs: entity_raw, entity_info, spatial_info, scalar_info, map_size
     # mask: entity_num, selected_units_num
+    # entity_padded: whether any sample has less entities than the padded entity_info
+    # entity_bucket(only when entity_bucket_num > 0): sample indexes grouped by entity num
     # action: actions, actions_mask, behaviour_output, teacher_output
     # rl: reward, game_second
 
     if isinstance(batch[0][0]['obs_home']['entity_info'], dict):
-        obs_keys = ['obs_home', 'obs_away', 'obs_home_next', 'obs_away_next']
-        for b in range(len(batch)):
-            for t in range(len(batch[b])):
-                for k in batch[b][t]:
-                    if k in obs_keys:
-                        batch[b][t][k] = decompress_obs(batch[b][t][k])
+        batch = decompress_batch(batch, decompress_threads)
 
     ret = {}
     # bs, traj -> traj, bs
@@ -163,40 +249,26 @@ def as_learner_collate_fn(batch):
     for k in ['spatial_info', 'scalar_info']:
         ret[k] = default_collate(obs[k])
 
-
     entity_raw = lists_to_dicts(obs['entity_raw'])
     entity_raw['location'] = torch.nn.utils.rnn.pad_sequence(entity_raw['location'], batch_first=True)
     ret['entity_raw'] = entity_raw
     ret['entity_num'] = torch.LongTensor([[i.shape[0]] for i in obs['entity_info']])
     ret['entity_info'] = torch.nn.utils.rnn.pad_sequence(obs['entity_info'], batch_first=True)
+    ret['entity_padded'] = ret['entity_num'].min().item() < ret['entity_info'].shape[1]
+    if entity_bucket_num > 0:
+        ret['entity_bucket'] = build_entity_bucket(ret['entity_num'], entity_bucket_num)
     ret['map_size'] = obs['map_size']
 
     ret['selected_units_num'] = torch.stack(new_batch['selected_units_num'], dim=0)
-    max_selected_units_num = ret['selected_units_num'].max()
-
-    actions = lists_to_dicts(new_batch['actions'])
-    actions_mask = {k: [] for k in actions.keys()}
-    for i in range(len(actions['action_type'])):
-        action_type = actions['action_type'][i].item()
-        flag = action_type == 0
-        inv_action_type = ACTIONS_REORDER_INV[action_type]
-        actions_mask['action_type'].append(False) if flag else actions_mask['action_type'].append(True)
-        actions_mask['delay'].append(False) if flag else actions_mask['delay'].append(True)
-        for k in ['queued', 'target_units', 'selected_units', 'target_location']:
-            if flag or not GENERAL_ACTION_INFO_MASK[inv_action_type][k]:
-                actions_mask[k].append(False)
-            else:
-                actions_mask[k].append(True)
-
-    for k in actions_mask.keys():
-        actions_mask[k] = torch.BoolTensor(actions_mask[k])
+    max_selected_units_num = ret['selected_units_num'].max().item()
 
     map_size = list(zip(*obs['map_size']))
     assert len(set(map_size[0])) == 1 and len(set(map_size[1])) == 1, 'only support same size map'
     map_size = obs['map_size'][0]
+    actions = lists_to_dicts(new_batch['actions'])
     for k, v in actions.items():
-        if k in ['action_type', 'delay', 'repeat', 'queued', 'target_units']: 
-            actions[k] = torch.cat(v, dim=0)            
+        if k in ['action_type', 'delay', 'repeat', 'queued', 'target_units']:
+            actions[k] = torch.cat(v, dim=0)
         elif k == 'target_location':
             actions[k] = torch.stack(v)
             actions[k] = actions[k][:, 0] * map_size[1] + actions[k][:, 1]
@@ -204,9 +276,17 @@ def as_learner_collate_fn(batch):
         else:
             actions[k] = torch.nn.utils.rnn.pad_sequence(actions[k], batch_first=True)
             actions[k] = actions[k][:, :max_selected_units_num].contiguous()
-
     ret['actions'] = actions
 
+    # look up the prebuilt table instead of checking each action type
+    actions_mask_table = ACTIONS_MASK_TABLE[actions['action_type'].long()].t().contiguous()  # num_heads, N
+    actions_mask = {}
+    for k in actions.keys():
+        if k in ACTION_HEADS:
+            actions_mask[k] = actions_mask_table[ACTION_HEADS.index(k)]
+        else:
+            actions_mask[k] = torch.BoolTensor([])
+
     ret['reward'] = {}
     reward = default_collate(new_batch['reward'])
     for k, v in reward.items():
@@ -215,25 +295,16 @@ def as_learner_collate_fn(batch):
     ret['game_second'] = torch.LongTensor(new_batch['game_second'])
 
     home_size = len(ret['game_second'])
-    max_entity_num = ret['entity_num'][:home_size].max()
+    max_entity_num = ret['entity_num'][:home_size].max().item()
     for k in ['behaviour_output', 'teacher_output']:
         data = lists_to_dicts(new_batch[k])
         for _k in data.keys():
             if _k in ['action_type', 'delay', 'repeat', 'queued', 'target_location']:
                 data[_k] = default_collate(data[_k])
             elif _k == 'selected_units':
-                for i in range(len(data[_k])):
-                    if len(data[_k][i].shape) == 1:
-                        data[_k][i] = data[_k][i].unsqueeze(0)
-                    data[_k][i] = data[_k][i][:, :max_entity_num + 1]
-                    data[_k][i] = torch.nn.functional.pad(data[_k][i], (0, max_entity_num + 1 - data[_k][i].shape[1]),
-                                                          'constant', -1e9)
-
-                data[_k] = torch.nn.utils.rnn.pad_sequence(data[_k], batch_first=True)
-                data[_k] = data[_k][:, :max_selected_units_num].contiguous()
+                data[_k] = _pad_selected_units_logits(data[_k], max_selected_units_num, max_entity_num)
             elif _k == 'target_units':
-                data[_k] = torch.nn.utils.rnn.pad_sequence(data[_k], batch_first=True, padding_value=-1e9)
-                data[_k] = data[_k][:, :max_entity_num].contiguous()
+                data[_k] = _pad_target_units_logits(data[_k], max_entity_num)
         ret[k] = data
 
     mask = {}
@@ -265,6 +336,7 @@ def as_eval_collate_fn(data):
             if k == 'entity_info':
                 new_data['entity_num'] = torch.LongTensor([[i.shape[0]] for i in new_data[k]])
                 new_data[k] = torch.nn.utils.rnn.pad_sequence(new_data[k], batch_first=True)
+                new_data['entity_padded'] = new_data['entity_num'].min().item() < new_data[k].shape[1]
             elif k == 'entity_raw':
                 new_data[k] = lists_to_dicts(new_data[k])
                 if isinstance(new_data[k]['location'][0], list):
@@ -278,23 +350,17 @@ def as_eval_collate_fn(data):
     return data
 
 
+_AS_EVAL_DECOLLATE_IGNORE = ['prev_state', 'teacher_prev_state', 'action']
+
+
 def as_eval_decollate_fn(batch):
-    ignore_item = ['prev_state', 'teacher_prev_state', 'action']
+    r"""
+    Overview:
+        decollate the actor outputs into a list of the outputs of each env, with one host copy for each dtype laid
+        out by env(``host_decollate``) instead of a clone of each piece. The tensors of each env are views of a chunk
+        of its own, which doesn't share memory with the model outputs nor the other envs, and lives as long as any
+        of them, so the output of one env pickles just its own elements.
+    """
     if batch is None:
         return None
-    elif isinstance(batch, torch.Tensor):
-        batch = torch.split(batch, 1, dim=0)
-        # squeeze if original batch's shape is like (B, dim1, dim2, ...);
-        # otherwise directly return the list.
-        if len(batch[0].shape) > 1:
-            batch = [elem.squeeze(0) for elem in batch]
-        batch = [b.clone() for b in batch]
-        return list(batch)
-    elif isinstance(batch, Sequence):
-        return list(zip(*[as_eval_decollate_fn(e) for e in batch]))
-    elif isinstance(batch, Mapping):
-        tmp = {k: v if k in ignore_item else as_eval_decollate_fn(v) for k, v in batch.items()}
-        B = len(list(tmp.values())[0])
-        return [{k: tmp[k][i] for k in tmp.keys()} for i in range(B)]
-
-    raise TypeError("not support batch type: {}".format(type(batch)))
+    return host_decollate(batch, ignore=_AS_EVAL_DECOLLATE_IGNORE)
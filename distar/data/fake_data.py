@@ -0,0 +1,143 @@
+"""
+Synthetic observations and trajectories with the same schema as the ones produced by actors, used by benchmarks
+"""
+import random
+
+import torch
+
+from ctools.pysc2.lib.static_data import NUM_ACTIONS
+from distar.envs.other.alphastar_compress import compress_obs
+
+SCALAR_SHAPE = {
+    'agent_statistics': [10],
+    'available_actions': [327],
+    'beginning_build_order': [20, 194],
+    'cumulative_stat': {
+        'effect': [83],
+        'research': [60],
+        'unit_build': [120]
+    },
+    'immediate_beginning_build_order': [20, 194],
+    'immediate_cumulative_stat': {
+        'effect': [83],
+        'research': [60],
+        'unit_build': [120]
+    },
+    'enemy_race': [5],
+    'enemy_upgrades': [48],
+    'last_action_type': [327],
+    'last_delay': [128],
+    'last_queued': [20],
+    'mmr': [7],
+    'race': [5],
+    'score_cumulative': [13],
+    'time': [64],
+    'unit_counts_bow': [259],
+    'upgrades': [90]
+}
+ENTITY_DIM = 1340
+SPATIAL_CHANNEL = 20
+MAP_SIZE = [152, 160]
+REWARD_KEYS = ['winloss', 'build_order', 'built_unit', 'effect', 'upgrade', 'battle']
+LSTM_SHAPE = [3, 384]  # num_layers, hidden_size
+DELAY_DIM = 128
+MAX_SELECTED_UNITS_NUM = 64
+
+
+def _fake_scalar(shape):
+    if isinstance(shape, dict):
+        return {k: _fake_scalar(v) for k, v in shape.items()}
+    return torch.randint(0, 2, shape).float()
+
+
+def fake_obs(entity_num, map_size=MAP_SIZE, compress=False):
+    r"""
+    Overview:
+        generate a fake agent observation(after obs runner)
+    Arguments:
+        - entity_num (:obj:`int`): the entity num of the observation
+        - map_size (:obj:`list`): [H, W]
+        - compress (:obj:`bool`): whether to compress the obs the same way as actors do
+    """
+    H, W = map_size
+    scalar_info = _fake_scalar(SCALAR_SHAPE)
+    scalar_info['available_actions'] = torch.ones(NUM_ACTIONS)
+    spatial_info = torch.randint(0, 2, (SPATIAL_CHANNEL, H, W)).float()
+    spatial_info[0] = torch.randint(0, 256, (H, W)).float() / 256.
+    entity_info = torch.randint(0, 2, (entity_num, ENTITY_DIM)).float()
+    entity_info[:, :4] = torch.rand(entity_num, 4)
+    obs = {
+        'scalar_info': scalar_info,
+        'spatial_info': spatial_info,
+        'entity_info': entity_info,
+        'entity_raw': {
+            'location': torch.stack([torch.randint(0, H, (entity_num, )), torch.randint(0, W, (entity_num, ))], dim=1),
+            'id': torch.arange(entity_num),
+            'type': torch.zeros(entity_num).long(),
+        },
+        'map_size': list(map_size),
+    }
+    return compress_obs(obs) if compress else obs
+
+
+def fake_lstm_state():
+    return [torch.zeros(LSTM_SHAPE[0], 1, LSTM_SHAPE[1]) for _ in range(2)]
+
+
+def _fake_logits(entity_num, selected_units_num, map_size):
+    return {
+        'action_type': torch.randn(NUM_ACTIONS),
+        'delay': torch.randn(DELAY_DIM),
+        'queued': torch.randn(2),
+        'selected_units': torch.randn(selected_units_num, entity_num + 1),
+        'target_units': torch.randn(entity_num),
+        'target_location': torch.randn(map_size[0] * map_size[1]),
+    }
+
+
+def fake_step(entity_num, map_size=MAP_SIZE, compress=False, first=False, last=False):
+    r"""
+    Overview:
+        generate one step of a trajectory, the schema is the same as the one used by ``as_learner_collate_fn``
+    """
+    selected_units_num = random.randint(1, min(entity_num, MAX_SELECTED_UNITS_NUM))
+    step = {
+        'obs_home': fake_obs(entity_num, map_size, compress),
+        'obs_away': fake_obs(entity_num, map_size, compress),
+        'actions': {
+            'action_type': torch.randint(0, NUM_ACTIONS, (1, )),
+            'delay': torch.randint(0, DELAY_DIM, (1, )),
+            'queued': torch.randint(0, 2, (1, )),
+            'selected_units': torch.randint(0, entity_num, (selected_units_num, )),
+            'target_units': torch.randint(0, entity_num, (1, )),
+            'target_location': torch.LongTensor([random.randint(0, map_size[0] - 1), random.randint(0, map_size[1] - 1)]),
+        },
+        'selected_units_num': torch.tensor(selected_units_num),
+        'reward': {k: torch.randn(1) for k in REWARD_KEYS},
+        'game_second': random.randint(0, 1200),
+        'behaviour_output': _fake_logits(entity_num, selected_units_num, map_size),
+        'teacher_output': _fake_logits(entity_num, selected_units_num, map_size),
+    }
+    if first:
+        step['prev_state'] = {'home': fake_lstm_state(), 'away': fake_lstm_state()}
+    if last:
+        step['obs_home_next'] = fake_obs(entity_num, map_size, compress)
+        step['obs_away_next'] = fake_obs(entity_num, map_size, compress)
+    return step
+
+
+def fake_trajectory(traj_len, entity_num=(40, 500), map_size=MAP_SIZE, compress=False):
+    r"""
+    Overview:
+        generate a fake trajectory
+    Arguments:
+        - traj_len (:obj:`int`): trajectory length
+        - entity_num (:obj:`Union[int, tuple]`): fixed entity num or the (min, max) range to sample it from
+        - map_size (:obj:`list`): [H, W]
+        - compress (:obj:`bool`): whether to compress the obs the same way as actors do
+    """
+    traj = []
+    for t in range(traj_len):
+        n = entity_num if isinstance(entity_num, int) else random.randint(*entity_num)
+        traj.append(fake_step(n, map_size, compress, first=t == 0, last=t == traj_len - 1))
+    return traj
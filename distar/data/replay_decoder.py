@@ -0,0 +1,674 @@
+"""
+Decode SC2 replays into trajectories for supervised learning
+
+    A pool of workers drives SC2 through ``start_replay``/``observe``, featurizes the observations with the same
+    ``AlphaStarObsRunner`` as ``AlphaStarEnv``, parses the actions with ``AlphaStarReplayActionHelper``, merges the
+    repeated actions with ``remove_repeat_data`` and extracts the statistics(Z) of each player. The trajectories are
+    written into shards, each worker writes its own shards:
+
+        <output_dir>/shard-<run>-<pid>-<n>.bin      concatenated step records, each one compressed separately
+        <output_dir>/shard-<run>-<pid>-<n>.index    pickled index: the byte offset of each record and the
+                                                    (replay, player_id, step_offset, length, meta) of each trajectory
+        <output_dir>/progress.log                   one json line per replay, decoding resumes from it
+        <output_dir>/metrics.json                   throughput of the last run
+
+    The replays are identified by their path relative to the replay root(e.g.: the replay dir), so the replays with
+    the same file name in different dirs are different replays. The index is rewritten(atomically) after each
+    replay, so a trajectory is either fully indexed or ignored if the worker dies, and a restarted decoding skips
+    the trajectories already in the shards.
+"""
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import pickle
+import time
+from collections import defaultdict
+from multiprocessing import util as mp_util
+
+import torch
+from easydict import EasyDict
+
+from ctools.pysc2 import run_configs
+from ctools.pysc2.env.sc2_env import SC2Env, parse_agent_interface_format
+from ctools.pysc2.lib import features, protocol, remote_controller
+from ctools.pysc2.lib.static_data import ACTIONS_REORDER
+from ctools.utils import deep_merge_dicts, read_config, get_data_compressor, get_data_decompressor
+from distar.data.collate_fn import ACTION_HEADS, ACTIONS_MASK_TABLE
+from distar.envs.action.alphastar_action import AlphaStarRawAction, AlphaStarReplayActionHelper, DELAY_MAX, \
+    location_transform, remove_repeat_data
+from distar.envs.obs.alphastar_obs_runner import AlphaStarObsRunner
+from distar.envs.other.alphastar_compress import compress_obs
+from distar.envs.other.alphastar_map import find_map_name, get_map_size
+from distar.envs.other.alphastar_statistics import RealTimeStatistics, transformed_stat_mmr
+from s2clientprotocol import common_pb2 as sc_common
+from s2clientprotocol import sc2api_pb2 as sc_pb
+
+default_config = read_config(os.path.join(os.path.dirname(__file__), 'replay_decoder_default_config.yaml'))
+logger = logging.getLogger(__name__)
+
+SC2_ERRORS = (protocol.ConnectionError, protocol.ProtocolError, remote_controller.RequestError)
+SHARD_BIN_SUFFIX = '.bin'
+SHARD_INDEX_SUFFIX = '.index'
+
+
+def launch_sc2(version=None):
+    r"""
+    Overview:
+        the default launcher of the decoding workers, any callable returning an object with ``controller`` and
+        ``close`` can be used instead(e.g.: ``MockReplayProcess`` to decode recordings offline)
+    """
+    return run_configs.get(version).start(want_rgb=False)
+
+
+class ShardWriter(object):
+    r"""
+    Overview:
+        append the steps of trajectories into shard files, one record per step
+    Interface:
+        __init__, add_trajectory, commit, close
+    """
+
+    def __init__(self, prefix, compressor='lz4', max_steps=50000):
+        self._prefix = prefix
+        self._compressor_name = compressor
+        self._compressor = get_data_compressor(compressor)
+        self._max_steps = max_steps
+        self._shard_count = 0
+        self._file = None
+        self._dirty = False
+
+    def _open(self):
+        self._path = '{}-{:04d}'.format(self._prefix, self._shard_count)
+        self._shard_count += 1
+        self._file = open(self._path + SHARD_BIN_SUFFIX, 'wb')
+        self._index = {'compressor': self._compressor_name, 'offsets': [0], 'trajectories': []}
+
+    def add_trajectory(self, steps, meta):
+        r"""
+        Overview:
+            write the steps of a trajectory and add them to the index, the shard is rolled over if it is full. The
+            trajectory is only visible to the readers after ``commit``
+        Arguments:
+            - steps (:obj:`list`): step dicts
+            - meta (:obj:`dict`): trajectory info, must contain 'replay' and 'player_id'
+        Returns:
+            - path (:obj:`str`): the shard(without suffix) the trajectory is written into
+        """
+        if self._file is None or len(self._index['offsets']) - 1 >= self._max_steps:
+            self.close()
+            self._open()
+        offsets = self._index['offsets']
+        step_offset = len(offsets) - 1
+        for step in steps:
+            data = self._compressor(step)
+            self._file.write(data)
+            offsets.append(offsets[-1] + len(data))
+        entry = {'step_offset': step_offset, 'length': len(steps)}
+        entry.update(meta)
+        self._index['trajectories'].append(entry)
+        self._dirty = True
+        return self._path
+
+    def commit(self):
+        r"""
+        Overview:
+            make the trajectories added since the last commit visible: the records are synced to disk, then the
+            index is written atomically
+        """
+        if self._file is None or not self._dirty:
+            return
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        tmp_path = self._path + SHARD_INDEX_SUFFIX + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self._index, f)
+        os.replace(tmp_path, self._path + SHARD_INDEX_SUFFIX)
+        self._dirty = False
+
+    def close(self):
+        if self._file is not None:
+            self.commit()
+            self._file.close()
+            self._file = None
+
+
+class ShardReader(object):
+    r"""
+    Overview:
+        random access to the steps of a shard, the records are read from a mmap of the shard file
+    Interface:
+        __init__, __len__, get_step, get_trajectory, close
+    Property:
+        trajectories
+    """
+
+    def __init__(self, path):
+        if path.endswith(SHARD_INDEX_SUFFIX) or path.endswith(SHARD_BIN_SUFFIX):
+            path = os.path.splitext(path)[0]
+        self.path = path
+        with open(path + SHARD_INDEX_SUFFIX, 'rb') as f:
+            self.index = pickle.load(f)
+        self._decompressor = get_data_decompressor(self.index['compressor'])
+        self._mmap = None
+
+    def __len__(self):
+        return len(self.index['offsets']) - 1
+
+    @property
+    def trajectories(self):
+        return self.index['trajectories']
+
+    def _buffer(self):
+        # opened lazily, so that a reader can be created before the dataloader workers are forked
+        if self._mmap is None:
+            with open(self.path + SHARD_BIN_SUFFIX, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def get_step(self, idx):
+        offsets = self.index['offsets']
+        return self._decompressor(self._buffer()[offsets[idx]:offsets[idx + 1]])
+
+    def get_trajectory(self, traj_idx):
+        traj = self.trajectories[traj_idx]
+        return [self.get_step(traj['step_offset'] + i) for i in range(traj['length'])]
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+
+def list_shards(output_dir):
+    return sorted([
+        os.path.join(output_dir, f[:-len(SHARD_INDEX_SUFFIX)]) for f in os.listdir(output_dir)
+        if f.endswith(SHARD_INDEX_SUFFIX)
+    ])
+
+
+class ProgressLog(object):
+    r"""
+    Overview:
+        append-only log of the decoded replays, together with the shard indexes it tells what is left to decode
+    """
+
+    def __init__(self, output_dir):
+        self._path = os.path.join(output_dir, 'progress.log')
+        self.status = {}
+        if os.path.exists(self._path):
+            with open(self._path, 'r') as f:
+                for line in f:
+                    try:
+                        item = json.loads(line)
+                    except ValueError:  # the last line may be partially written
+                        continue
+                    self.status[item['replay']] = item['status']
+        # trajectories written after the last log line
+        self.decoded = defaultdict(set)
+        for path in list_shards(output_dir):
+            for traj in ShardReader(path).trajectories:
+                self.decoded[traj['replay']].add(traj['player_id'])
+        self._file = open(self._path, 'a')
+
+    def done(self, replay):
+        # crashed replays are retried
+        return self.status.get(replay) in ['ok', 'invalid']
+
+    def add(self, result):
+        self.status[result['replay']] = result['status']
+        self._file.write(json.dumps(result) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class InvalidReplay(Exception):
+    pass
+
+
+class _ReplayEngine(object):
+    r"""
+    Overview:
+        the attributes of ``AlphaStarEnv`` read by ``AlphaStarObsRunner``, for one player
+    """
+
+    def __init__(self, begin_num, placeholder_z):
+        self.raw_obs = [None]
+        self.action = [None]
+        self.due = [True]
+        self.episode_stat = [RealTimeStatistics(begin_num)]
+        self.loaded_eval_stat = [self]
+        self._placeholder_z = placeholder_z
+
+    def get_input_z_by_game_loop(self, game_loop, cumulative_stat=None):
+        # the Z of a replay is only known at its end, it is filled into the obs afterwards
+        return self._placeholder_z
+
+
+class ReplayDecoder(object):
+    r"""
+    Overview:
+        decode the trajectory of a player in a replay, with a running SC2 controller
+    Interface:
+        __init__, check_replay, decode
+    """
+
+    def __init__(self, cfg=None):
+        self._cfg = deep_merge_dicts(default_config.decoder, cfg or {})
+        self._cfg.obs_stat_type = 'replay_last'
+        self._cfg.agent_num = 1
+        self._begin_num = self._cfg.obs_scalar.begin_num
+        self._action_helper = AlphaStarReplayActionHelper()
+        self._obs_runners = {}
+        self._placeholder_z = transformed_stat_mmr(
+            {
+                'begin_statistics': [],
+                'cumulative_statistics': {}
+            }, 0, self._begin_num
+        )
+
+    @property
+    def cfg(self):
+        return self._cfg
+
+    def _get_obs_runner(self, map_size):
+        key = tuple(map_size)
+        if key not in self._obs_runners:
+            cfg = EasyDict(self._cfg.copy())
+            cfg.map_size = list(map_size)
+            cfg.obs_spatial.spatial_resolution = list(map_size)
+            self._obs_runners[key] = AlphaStarObsRunner(cfg)
+        return self._obs_runners[key]
+
+    def check_replay(self, info, ping=None):
+        r"""
+        Overview:
+            check whether the replay is worth decoding
+        Returns:
+            - player_ids (:obj:`list`): the players to decode, empty if the replay is invalid
+        """
+        cfg = self._cfg
+        if info.HasField('error') or len(info.player_info) != 2 or info.game_duration_loops < cfg.min_game_loops:
+            return []
+        if cfg.check_build and ping is not None and info.base_build != ping.base_build:
+            return []
+        if find_map_name(info.map_name) is None:
+            return []
+        player_ids = []
+        for p in info.player_info:
+            race = sc_common.Race.Name(p.player_info.race_actual)
+            if p.player_apm < cfg.min_apm or p.player_mmr < cfg.min_mmr:
+                continue
+            if cfg.races and race not in cfg.races:
+                continue
+            player_ids.append(p.player_info.player_id)
+        return player_ids
+
+    def _interface(self, map_size):
+        aif = parse_agent_interface_format(
+            feature_screen=[1, 1],
+            feature_minimap=map_size,
+            crop_to_playable_area=self._cfg.crop_map_to_playable_area,
+            raw_crop_to_playable_area=self._cfg.crop_map_to_playable_area,
+        )
+        return aif, SC2Env._get_interface(aif, True)
+
+    def _parse_actions(self, obs):
+        # raw actions issued by the observed player since the last observation, with their game loops
+        ret = []
+        for a in obs.actions:
+            if not a.HasField('action_raw'):
+                continue
+            action = self._action_helper(a.action_raw)
+            if action['action_type'] is None:
+                continue
+            game_loop = a.game_loop if a.HasField('game_loop') else obs.observation.game_loop
+            ret.append((game_loop, action))
+        return ret
+
+    def _to_agent_action(self, action, entity_raw, map_size):
+        r"""
+        Overview:
+            transform the parsed env action(general action id, unit tags, world location) into the env Action used
+            by the obs runner and statistics, and the agent action tensors(entity indexes, map location), units
+            out of the(clipped) observation make the action invalid and None is returned
+        """
+        tag2idx = {int(t): i for i, t in enumerate(entity_raw['id'])}
+        agent_action, mask = {}, {}
+        for k in ['selected_units', 'target_units']:
+            tags = action[k]
+            if tags is not None:
+                if any([int(t) not in tag2idx for t in tags]):
+                    return None, None
+                agent_action[k] = torch.LongTensor([tag2idx[int(t)] for t in tags])
+        location = location_transform({'target_location': action['target_location'], 'map_size': map_size}, inv=False)
+        action_type = action['action_type'][0]
+        queued = action['queued'][0] if action['queued'] is not None else None
+        env_action = AlphaStarRawAction.Action(
+            action_type, 0, queued, action['selected_units'], action['target_units'],
+            torch.LongTensor(location) if location is not None else None
+        )
+        agent_action['action_type'] = torch.LongTensor([action_type])  # reordered after remove_repeat_data
+        agent_action['queued'] = torch.LongTensor([int(queued) if queued is not None else 0])
+        agent_action.setdefault('selected_units', torch.LongTensor([]))
+        agent_action.setdefault('target_units', torch.LongTensor([0]))
+        agent_action['target_location'] = torch.LongTensor(location if location is not None else [0, 0])
+        agent_action['delay'] = torch.LongTensor([0])
+        # remove_repeat_data tells targeted actions by whether target_units is None
+        agent_action['target_units'] = agent_action['target_units'] if action['target_units'] is not None else None
+        return env_action, agent_action
+
+    def decode(self, controller, replay_data, info, player_id, map_data=None):
+        r"""
+        Overview:
+            step through the replay from the view of a player and decode its trajectory
+        Arguments:
+            - controller (:obj:`RemoteController`): controller of a running SC2(or a mock)
+            - replay_data (:obj:`bytes`): replay file content
+            - info (:obj:`ResponseReplayInfo`): the replay info
+            - player_id (:obj:`int`): the observed player
+            - map_data (:obj:`bytes`): map file content, if the map isn't available to SC2
+        Returns:
+            - steps (:obj:`list`): step dicts, in the same format consumed by ``policy_collate_fn``
+            - meta (:obj:`dict`): player info and statistics(in the same format as the Z files) of the trajectory
+            - num_observations (:obj:`int`): observations read from SC2
+        """
+        map_name = find_map_name(info.map_name)
+        if map_name is None:
+            raise InvalidReplay('unknown map: {}'.format(info.map_name))
+        map_size = get_map_size(map_name, cropped=self._cfg.crop_map_to_playable_area)
+        aif, interface = self._interface(map_size)
+        controller.start_replay(
+            sc_pb.RequestStartReplay(
+                replay_data=replay_data,
+                map_data=map_data,
+                options=interface,
+                observed_player_id=player_id,
+                disable_fog=False
+            )
+        )
+        feat = features.features_from_game_info(controller.game_info(), agent_interface_format=aif)
+        obs_runner = self._get_obs_runner(map_size)
+        obs_runner.reset()
+        engine = _ReplayEngine(self._begin_num, self._placeholder_z)
+        step_mul = self._cfg.step_mul
+
+        steps = []
+        num_observations = 0
+        prev_obs = None
+        last_game_loop = 0
+        while True:
+            obs = controller.observe()
+            num_observations += 1
+            actions = self._parse_actions(obs)
+            if actions and prev_obs is not None:
+                # the actions are decided on the last observation, only the observations before actions are
+                # featurized
+                transformed_obs = feat.transform_obs(prev_obs)
+                for game_loop, action in actions:
+                    if engine.action[0] is not None:
+                        # the delay of the last action is only known now
+                        engine.action = [engine.action[0]._replace(delay=game_loop - last_game_loop)]
+                        obs_runner.update_last_action(engine)
+                    engine.raw_obs = [dict(transformed_obs)]
+                    agent_obs = obs_runner.get(engine)[0]
+                    env_action, agent_action = self._to_agent_action(action, agent_obs['entity_raw'], map_size)
+                    if env_action is None:
+                        continue
+                    engine.action = [env_action]
+                    last_game_loop = game_loop
+                    obs_runner.update_last_action(engine)
+                    engine.episode_stat[0].update_stat(env_action, None, game_loop, env_action.target_location)
+                    step = compress_obs(agent_obs)
+                    step['actions'] = agent_action
+                    step['game_loop'] = game_loop
+                    steps.append(step)
+            if obs.player_result:
+                break
+            prev_obs = obs
+            controller.step(step_mul)
+        steps, meta = self._postprocess(steps, engine.episode_stat[0], info, player_id, map_name)
+        return steps, meta, num_observations
+
+    def _postprocess(self, steps, stat, info, player_id, map_name):
+        game_loops = [s['game_loop'] for s in steps]
+
+        def set_delay():
+            for i, s in enumerate(steps):
+                delay = (game_loops[i + 1] if i + 1 < len(steps) else info.game_duration_loops) - game_loops[i]
+                s['actions']['delay'] = torch.LongTensor([delay])
+
+        set_delay()
+        if self._cfg.remove_repeat and len(steps) > 0:
+            steps = remove_repeat_data(steps)
+            game_loops = [s['game_loop'] for s in steps]
+            set_delay()
+
+        player = [p for p in info.player_info if p.player_info.player_id == player_id][0]
+        opponent = [p for p in info.player_info if p.player_info.player_id != player_id][0]
+        z = transformed_stat_mmr(
+            {
+                'begin_statistics': stat.begin_statistics[:self._begin_num],
+                'cumulative_statistics': stat.cumulative_statistics
+            }, player.player_mmr, self._begin_num
+        )
+        for s in steps:
+            actions = s['actions']
+            # the delay head has DELAY_MAX classes
+            actions['delay'].clamp_(max=DELAY_MAX - 1)
+            actions['action_type'] = torch.LongTensor([ACTIONS_REORDER[actions['action_type'].item()]])
+            if actions['target_units'] is None:
+                actions['target_units'] = torch.LongTensor([0])
+            mask = ACTIONS_MASK_TABLE[actions['action_type'].item()].tolist()
+            s['actions_mask'] = {k: mask[ACTION_HEADS.index(k)] for k in ACTION_HEADS}
+            s['scalar_info'].update(z)
+        meta = {
+            'player_id': player_id,
+            'map_name': map_name,
+            'race': sc_common.Race.Name(player.player_info.race_actual),
+            'opponent_race': sc_common.Race.Name(opponent.player_info.race_actual),
+            'mmr': player.player_mmr,
+            'apm': player.player_apm,
+            'result': sc_pb.Result.Name(player.player_result.result) if player.HasField('player_result') else None,
+            'game_loops': info.game_duration_loops,
+            'stat': {
+                'beginning_build_order': stat.begin_statistics,
+                'cumulative_stat': stat.cumulative_statistics_game_loop
+            },
+        }
+        return steps, meta
+
+
+_worker = None  # the decoding state of each pool worker
+
+
+class _DecodeWorker(object):
+
+    def __init__(self, cfg, launcher, output_dir, run_id):
+        self._decoder = ReplayDecoder(cfg)
+        cfg = self._decoder.cfg
+        self._launcher = launcher
+        self._proc = None
+        self._ping = None
+        prefix = os.path.join(output_dir, 'shard-{}-{}'.format(run_id, os.getpid()))
+        self._writer = ShardWriter(prefix, cfg.compressor, cfg.shard_max_steps)
+        # pool workers exit without atexit, the finalizer still runs
+        mp_util.Finalize(self, self.close, exitpriority=10)
+
+    def _controller(self):
+        if self._proc is None:
+            self._proc = self._launcher()
+            self._ping = self._proc.controller.ping()
+        return self._proc.controller
+
+    def _read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def __call__(self, replay_path, name, skip_players):
+        result = {'replay': name, 'status': 'ok', 'steps': 0, 'observations': 0, 'game_loops': 0, 'shards': []}
+        t = time.time()
+        try:
+            controller = self._controller()
+            replay_data = self._read(replay_path)
+            info = controller.replay_info(replay_data)
+            player_ids = self._decoder.check_replay(info, self._ping)
+            if not player_ids:
+                result['status'] = 'invalid'
+            map_data = None
+            if info.local_map_path:
+                map_data = run_configs.get().map_data(info.local_map_path)
+            for player_id in player_ids:
+                if player_id in skip_players:
+                    continue
+                steps, meta, num_observations = self._decoder.decode(
+                    controller, replay_data, info, player_id, map_data
+                )
+                meta['replay'] = name
+                if len(steps) > 0:
+                    result['shards'].append(os.path.basename(self._writer.add_trajectory(steps, meta)))
+                result['steps'] += len(steps)
+                result['observations'] += num_observations
+                result['game_loops'] += info.game_duration_loops
+        except InvalidReplay:
+            result['status'] = 'invalid'
+        except SC2_ERRORS as e:
+            # SC2 is relaunched for the next replay
+            logger.error('SC2 crashed in replay {}: {}'.format(name, repr(e)))
+            result['status'] = 'crash'
+            self._close_sc2()
+        except Exception as e:
+            logger.error('failed to decode replay {}: {}'.format(name, repr(e)))
+            result['status'] = 'error'
+        finally:
+            # the index is written once for the trajectories of the replay, including the ones decoded before a crash
+            self._writer.commit()
+        result['time'] = time.time() - t
+        return result
+
+    def _close_sc2(self):
+        if self._proc is not None:
+            try:
+                self._proc.close()
+            except Exception as e:
+                logger.warning('failed to close SC2: {}'.format(repr(e)))
+            self._proc = None
+
+    def close(self):
+        self._close_sc2()
+        self._writer.close()
+
+
+def _init_worker(cfg, launcher, output_dir, run_id):
+    global _worker
+    _worker = _DecodeWorker(cfg, launcher, output_dir, run_id)
+
+
+def _decode_task(args):
+    return _worker(*args)
+
+
+class DecodeMetrics(object):
+    r"""
+    Overview:
+        throughput of the decoding, game loops/s divided by 22.4 is the speed relative to realtime
+    """
+
+    def __init__(self):
+        self.start_time = time.time()
+        self.count = defaultdict(int)
+        self.decode_time = 0.
+
+    def update(self, result):
+        self.count[result['status']] += 1
+        for k in ['steps', 'observations', 'game_loops']:
+            self.count[k] += result[k]
+        self.decode_time += result['time']
+
+    def summary(self):
+        duration = max(time.time() - self.start_time, 1e-6)
+        ret = dict(self.count)
+        ret['duration'] = duration
+        ret['replays_per_sec'] = sum([self.count[k] for k in ['ok', 'invalid', 'crash', 'error']]) / duration
+        ret['steps_per_sec'] = self.count['steps'] / duration
+        ret['observations_per_sec'] = self.count['observations'] / duration
+        ret['game_loops_per_sec'] = self.count['game_loops'] / duration
+        # time of one worker decoding one replay on average
+        ret['sec_per_replay'] = self.decode_time / max(self.count['ok'], 1)
+        return ret
+
+    def __repr__(self):
+        s = self.summary()
+        return 'replays(ok/invalid/crash/error): {}/{}/{}/{}, steps: {}, {:.2f} replays/s, {:.1f} steps/s, ' \
+            '{:.1f} observations/s, {:.1f} game loops/s'.format(
+                s.get('ok', 0), s.get('invalid', 0), s.get('crash', 0), s.get('error', 0), s.get('steps', 0),
+                s['replays_per_sec'], s['steps_per_sec'], s['observations_per_sec'], s['game_loops_per_sec']
+            )
+
+
+def get_replay_name(replay_path, replay_root=None):
+    r"""
+    Overview:
+        the name of a replay in the progress log and the shard indexes, its path relative to the replay root, or
+        the normalized path if there is no root(e.g.: the replays are listed in a file)
+    """
+    if replay_root is None:
+        return os.path.normpath(replay_path)
+    return os.path.relpath(replay_path, replay_root)
+
+
+def decode_replays(replay_paths, output_dir, cfg=None, num_workers=1, launcher=launch_sc2, replay_root=None):
+    r"""
+    Overview:
+        decode replays with a pool of workers into shards, the replays(and players) decoded in the previous runs
+        in the same output_dir are skipped
+    Arguments:
+        - replay_paths (:obj:`list`): replay files(or recordings if the launcher is a mock)
+        - output_dir (:obj:`str`): where the shards, progress log and metrics are written
+        - cfg (:obj:`dict`): decoder config, merged into the default one
+        - num_workers (:obj:`int`): number of workers, each one runs a SC2
+        - launcher (:obj:`Callable`): picklable function launching a SC2 process
+        - replay_root (:obj:`str`): the replays are named by their path relative to it, see ``get_replay_name``
+    Returns:
+        - metrics (:obj:`dict`): throughput summary of this run
+    """
+    cfg = deep_merge_dicts(default_config.decoder, cfg or {})
+    os.makedirs(output_dir, exist_ok=True)
+    progress = ProgressLog(output_dir)
+    tasks = []
+    for path in replay_paths:
+        name = get_replay_name(path, replay_root)
+        if not progress.done(name):
+            tasks.append((path, name, progress.decoded[name]))
+    logger.info('{} replays to decode, {} done'.format(len(tasks), len(replay_paths) - len(tasks)))
+    run_id = time.strftime('%Y%m%d%H%M%S')
+    metrics = DecodeMetrics()
+    last_log_time = time.time()
+    pool = multiprocessing.Pool(
+        num_workers,
+        initializer=_init_worker,
+        initargs=(cfg, launcher, output_dir, run_id),
+        maxtasksperchild=cfg.max_replays_per_worker or None
+    )
+    try:
+        for result in pool.imap_unordered(_decode_task, tasks):
+            progress.add(result)
+            metrics.update(result)
+            if time.time() - last_log_time > cfg.log_freq:
+                logger.info(repr(metrics))
+                last_log_time = time.time()
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        progress.close()
+    summary = metrics.summary()
+    logger.info(repr(metrics))
+    with open(os.path.join(output_dir, 'metrics.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
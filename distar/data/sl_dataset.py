@@ -0,0 +1,269 @@
+"""
+Streaming dataset of fixed-length windows over the shards written by ``distar.data.replay_decoder``
+
+    Each epoch, every trajectory is cut into windows of ``traj_len`` steps(starting from a random offset), and all
+    the windows are shuffled. Both are derived from (seed, epoch), so the order of the batches is deterministic and a
+    loader can resume from a cursor(epoch, position) saved in the checkpoint. Only the steps of the requested windows
+    are read(from a mmap of the shard file) and decompressed, by a pool of worker processes.
+"""
+import logging
+import queue
+from typing import Any, Callable, Iterable, List, Optional, Union
+
+import numpy as np
+import torch
+import torch.multiprocessing as tm
+
+from distar.data.collate_fn import policy_collate_fn
+from distar.data.replay_decoder import ShardReader, list_shards
+from distar.envs.other.alphastar_compress import decompress_obs
+
+logger = logging.getLogger(__name__)
+
+
+class SLShardDataset(object):
+    r"""
+    Overview:
+        random-access index of the trajectories in the shards, and the shuffled windows of each epoch
+    Interface:
+        __init__, windows, load_window, __len__
+    """
+
+    def __init__(self, shards: Union[str, List[str]], traj_len: int, seed: int = 0) -> None:
+        r"""
+        Arguments:
+            - shards (:obj:`Union[str, List[str]]`): the output dir of the decoder or a list of shard paths
+            - traj_len (:obj:`int`): steps of each window, shorter trajectories are skipped
+            - seed (:obj:`int`): seed of the window offsets and the shuffle
+        """
+        self.shards = list_shards(shards) if isinstance(shards, str) else list(shards)
+        self.traj_len = traj_len
+        self.seed = seed
+        # trajectory table: shard idx, step offset in the shard, length
+        table = []
+        for shard_idx, path in enumerate(self.shards):
+            for traj in ShardReader(path).trajectories:
+                if traj['length'] >= traj_len:
+                    table.append([shard_idx, traj['step_offset'], traj['length']])
+        self.trajectories = np.array(table, dtype=np.int64).reshape(-1, 3)
+        self._readers = {}  # opened lazily in each worker
+        logger.info(
+            'SL dataset: {} shards, {} trajectories, {} steps'.format(
+                len(self.shards), len(self.trajectories), self.trajectories[:, 2].sum()
+            )
+        )
+
+    def __len__(self) -> int:
+        r"""
+        Overview:
+            number of windows in an epoch(at most, the random offset may cost one window of a trajectory)
+        """
+        return int((self.trajectories[:, 2] // self.traj_len).sum())
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state['_readers'] = {}
+        return state
+
+    def windows(self, epoch: int) -> np.ndarray:
+        r"""
+        Overview:
+            the shuffled windows of an epoch, the same epoch always gives the same windows
+        Returns:
+            - windows (:obj:`np.ndarray`): [N, 2], trajectory index and start step of each window
+        """
+        rng = np.random.RandomState((self.seed + epoch * 1000003) % 2**32)
+        lengths = self.trajectories[:, 2]
+        max_offset = np.minimum(self.traj_len, lengths - self.traj_len + 1)
+        offsets = (rng.random_sample(len(lengths)) * max_offset).astype(np.int64)
+        counts = (lengths - offsets) // self.traj_len
+        traj_idx = np.repeat(np.arange(len(lengths)), counts)
+        # k-th window of each trajectory
+        k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        starts = offsets[traj_idx] + k * self.traj_len
+        windows = np.stack([traj_idx, starts], axis=1)
+        return windows[rng.permutation(len(windows))]
+
+    def _reader(self, shard_idx: int) -> ShardReader:
+        if shard_idx not in self._readers:
+            self._readers[shard_idx] = ShardReader(self.shards[shard_idx])
+        return self._readers[shard_idx]
+
+    def load_window(self, traj_idx: int, start: int) -> list:
+        r"""
+        Overview:
+            read and decompress the steps of a window, the first step carries 'start_step'(whether the window
+            starts at the beginning of the trajectory) as ``policy_collate_fn`` expects
+        """
+        shard_idx, step_offset, _ = self.trajectories[traj_idx]
+        reader = self._reader(int(shard_idx))
+        steps = []
+        for i in range(self.traj_len):
+            step = reader.get_step(int(step_offset + start + i))
+            step.update(decompress_obs(step))
+            steps.append(step)
+        steps[0]['start_step'] = bool(start == 0)
+        return steps
+
+
+def _worker_loop(dataset: SLShardDataset, task_queue: Any, result_queue: Any, collate_fn: Callable,
+                 num_threads: int) -> None:
+    torch.set_num_threads(num_threads)
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        stream_id, batch_id, windows = task
+        try:
+            data = collate_fn([dataset.load_window(t, s) for t, s in windows])
+        except Exception as e:
+            logger.error('failed to load batch {}: {}'.format(batch_id, repr(e)))
+            data = e
+        result_queue.put((stream_id, batch_id, data))
+
+
+class SLDataLoader(object):
+    r"""
+    Overview:
+        stream the shuffled windows of a ``SLShardDataset`` in batches through a pool of worker processes, the
+        batches are returned in order, so the stream only depends on (seed, epoch, position) and can be resumed
+    Interface:
+        __init__, __iter__, __next__, state_dict, load_state_dict, close
+    """
+
+    def __init__(
+            self,
+            dataset: SLShardDataset,
+            batch_size: int,
+            num_workers: int = 4,
+            collate_fn: Optional[Callable] = policy_collate_fn,
+            prefetch_num: int = 2,
+            num_threads: int = 1,
+            cursor: Optional[dict] = None,
+    ) -> None:
+        r"""
+        Arguments:
+            - dataset (:obj:`SLShardDataset`): the dataset
+            - batch_size (:obj:`int`): windows per batch, the last incomplete batch of an epoch is dropped
+            - num_workers (:obj:`int`): worker processes, 0 means loading in the main process
+            - collate_fn (:obj:`Callable`): collate the windows of a batch
+            - prefetch_num (:obj:`int`): batches in flight per worker
+            - num_threads (:obj:`int`): torch threads of each worker
+            - cursor (:obj:`dict`): the ``state_dict`` to resume from
+        """
+        assert len(dataset) >= batch_size, 'not enough windows for a batch: {}/{}'.format(len(dataset), batch_size)
+        self._dataset = dataset
+        self._batch_size = batch_size
+        self._num_workers = num_workers
+        self._collate_fn = collate_fn
+        self._max_in_flight = max(1, num_workers * prefetch_num)
+        self._epoch, self._position = 0, 0
+        self._stream_id = 0
+        self._workers = []
+        if num_workers > 0:
+            self._task_queue = tm.Queue()
+            self._result_queue = tm.Queue()
+            for _ in range(num_workers):
+                p = tm.Process(
+                    target=_worker_loop,
+                    args=(dataset, self._task_queue, self._result_queue, collate_fn, num_threads),
+                    daemon=True
+                )
+                p.start()
+                self._workers.append(p)
+        self._reset_stream()
+        if cursor is not None:
+            self.load_state_dict(cursor)
+
+    def _reset_stream(self) -> None:
+        # batches are dispatched from the dispatch cursor, and returned in order from (epoch, position), the
+        # results of the batches dispatched before a reset are dropped by their stream id
+        self._stream_id += 1
+        self._dispatch_epoch, self._dispatch_position = self._epoch, self._position
+        self._windows = {}
+        self._next_batch_id = 0
+        self._returned_batch_id = 0
+        self._in_flight = {}  # batch id -> (epoch, position after the batch)
+        self._ready = {}
+
+    def _epoch_windows(self, epoch: int) -> np.ndarray:
+        if epoch not in self._windows:
+            self._windows = {epoch: self._dataset.windows(epoch)}  # only the current epoch is kept
+        return self._windows[epoch]
+
+    def _next_task(self) -> tuple:
+        windows = self._epoch_windows(self._dispatch_epoch)
+        if self._dispatch_position + self._batch_size > len(windows):
+            self._dispatch_epoch, self._dispatch_position = self._dispatch_epoch + 1, 0
+            windows = self._epoch_windows(self._dispatch_epoch)
+        batch = windows[self._dispatch_position:self._dispatch_position + self._batch_size].tolist()
+        self._dispatch_position += self._batch_size
+        batch_id = self._next_batch_id
+        self._next_batch_id += 1
+        self._in_flight[batch_id] = (self._dispatch_epoch, self._dispatch_position)
+        return batch_id, batch
+
+    def _dispatch(self) -> None:
+        while len(self._in_flight) < self._max_in_flight:
+            self._task_queue.put((self._stream_id, ) + self._next_task())
+
+    def __iter__(self) -> Iterable:
+        return self
+
+    def __next__(self) -> Any:
+        if self._num_workers == 0:
+            batch_id, windows = self._next_task()
+            data = self._collate_fn([self._dataset.load_window(t, s) for t, s in windows])
+        else:
+            self._dispatch()
+            batch_id = self._returned_batch_id
+            while batch_id not in self._ready:
+                try:
+                    stream_id, i, result = self._result_queue.get(timeout=60)
+                except queue.Empty:
+                    if not all([p.is_alive() for p in self._workers]):
+                        raise RuntimeError('SL dataloader worker died')
+                    continue
+                if stream_id == self._stream_id:
+                    self._ready[i] = result
+            data = self._ready.pop(batch_id)
+            if isinstance(data, Exception):
+                raise data
+        self._returned_batch_id = batch_id + 1
+        self._epoch, self._position = self._in_flight.pop(batch_id)
+        return data
+
+    @property
+    def epoch(self) -> int:
+        return self._epoch
+
+    def state_dict(self) -> dict:
+        r"""
+        Overview:
+            the cursor after the last returned batch, save it with the checkpoint to resume
+        """
+        return {
+            'seed': self._dataset.seed,
+            'traj_len': self._dataset.traj_len,
+            'batch_size': self._batch_size,
+            'epoch': self._epoch,
+            'position': self._position,
+        }
+
+    def load_state_dict(self, state_dict: dict) -> None:
+        for k in ['seed', 'traj_len']:
+            assert state_dict[k] == getattr(self._dataset, k), 'cursor of a different dataset, {}: {}/{}'.format(
+                k, state_dict[k], getattr(self._dataset, k)
+            )
+        assert state_dict['batch_size'] == self._batch_size, state_dict['batch_size']
+        self._epoch, self._position = state_dict['epoch'], state_dict['position']
+        self._reset_stream()
+
+    def close(self) -> None:
+        for _ in self._workers:
+            self._task_queue.put(None)
+        for p in self._workers:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+        self._workers = []
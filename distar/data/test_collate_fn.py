@@ -0,0 +1,186 @@
+import copy
+import multiprocessing as mp
+import random
+
+import pytest
+import torch
+from torch.utils.data._utils.collate import default_collate
+
+from ctools.pysc2.lib.action_dict import GENERAL_ACTION_INFO_MASK
+from ctools.pysc2.lib.static_data import ACTIONS_REORDER_INV
+from ctools.torch_utils.network.rnn import sequence_mask
+from ctools.utils import lists_to_dicts
+from distar.data.collate_fn import as_learner_collate_fn, decompress_batch
+from distar.data.fake_data import fake_trajectory
+from distar.envs.other.alphastar_compress import decompress_obs
+
+
+def previous_as_learner_collate_fn(batch):
+    # the implementation before the prebuilt action masks and the preallocated logits, kept as the reference
+    if isinstance(batch[0][0]['obs_home']['entity_info'], dict):
+        obs_keys = ['obs_home', 'obs_away', 'obs_home_next', 'obs_away_next']
+        for b in range(len(batch)):
+            for t in range(len(batch[b])):
+                for k in batch[b][t]:
+                    if k in obs_keys:
+                        batch[b][t][k] = decompress_obs(batch[b][t][k])
+
+    ret = {}
+    ret['batch_size'] = batch_size = len(batch)
+    batch = list(zip(*batch))
+    ret['traj_len'] = traj_len = len(batch)
+
+    ret['prev_state'] = [d.pop('prev_state') for d in batch[0]]
+
+    obs_home_next = [d.pop('obs_home_next') for d in batch[-1]]
+    obs_away_next = [d.pop('obs_away_next') for d in batch[-1]]
+    new_batch = []
+    for s in range(len(batch)):
+        new_batch += batch[s]
+    if 'obs_home_next' in new_batch[0].keys():
+        new_batch[0].pop('obs_home_next')
+        new_batch[0].pop('obs_away_next')
+    new_batch = lists_to_dicts(new_batch)
+
+    new_batch['obs_home'] += obs_home_next
+    new_batch['obs_away'] += obs_away_next
+    obs = new_batch['obs_home'] + new_batch['obs_away']
+    obs = lists_to_dicts(obs)
+    if 'actions' in obs.keys():
+        obs.pop('actions')
+
+    for k in ['spatial_info', 'scalar_info']:
+        ret[k] = default_collate(obs[k])
+
+    entity_raw = lists_to_dicts(obs['entity_raw'])
+    entity_raw['location'] = torch.nn.utils.rnn.pad_sequence(entity_raw['location'], batch_first=True)
+    ret['entity_raw'] = entity_raw
+    ret['entity_num'] = torch.LongTensor([[i.shape[0]] for i in obs['entity_info']])
+    ret['entity_info'] = torch.nn.utils.rnn.pad_sequence(obs['entity_info'], batch_first=True)
+    ret['map_size'] = obs['map_size']
+
+    ret['selected_units_num'] = torch.stack(new_batch['selected_units_num'], dim=0)
+    max_selected_units_num = ret['selected_units_num'].max()
+
+    actions = lists_to_dicts(new_batch['actions'])
+    actions_mask = {k: [] for k in actions.keys()}
+    for i in range(len(actions['action_type'])):
+        action_type = actions['action_type'][i].item()
+        flag = action_type == 0
+        inv_action_type = ACTIONS_REORDER_INV[action_type]
+        actions_mask['action_type'].append(False) if flag else actions_mask['action_type'].append(True)
+        actions_mask['delay'].append(False) if flag else actions_mask['delay'].append(True)
+        for k in ['queued', 'target_units', 'selected_units', 'target_location']:
+            if flag or not GENERAL_ACTION_INFO_MASK[inv_action_type][k]:
+                actions_mask[k].append(False)
+            else:
+                actions_mask[k].append(True)
+
+    for k in actions_mask.keys():
+        actions_mask[k] = torch.BoolTensor(actions_mask[k])
+
+    map_size = list(zip(*obs['map_size']))
+    assert len(set(map_size[0])) == 1 and len(set(map_size[1])) == 1, 'only support same size map'
+    map_size = obs['map_size'][0]
+    for k, v in actions.items():
+        if k in ['action_type', 'delay', 'repeat', 'queued', 'target_units']:
+            actions[k] = torch.cat(v, dim=0)
+        elif k == 'target_location':
+            actions[k] = torch.stack(v)
+            actions[k] = actions[k][:, 0] * map_size[1] + actions[k][:, 1]
+            actions[k] = actions[k].long()
+        else:
+            actions[k] = torch.nn.utils.rnn.pad_sequence(actions[k], batch_first=True)
+            actions[k] = actions[k][:, :max_selected_units_num].contiguous()
+
+    ret['actions'] = actions
+
+    ret['reward'] = {}
+    reward = default_collate(new_batch['reward'])
+    for k, v in reward.items():
+        ret['reward'][k] = v.view(traj_len, batch_size)
+
+    ret['game_second'] = torch.LongTensor(new_batch['game_second'])
+
+    home_size = len(ret['game_second'])
+    max_entity_num = ret['entity_num'][:home_size].max()
+    for k in ['behaviour_output', 'teacher_output']:
+        data = lists_to_dicts(new_batch[k])
+        for _k in data.keys():
+            if _k in ['action_type', 'delay', 'repeat', 'queued', 'target_location']:
+                data[_k] = default_collate(data[_k])
+            elif _k == 'selected_units':
+                for i in range(len(data[_k])):
+                    if len(data[_k][i].shape) == 1:
+                        data[_k][i] = data[_k][i].unsqueeze(0)
+                    data[_k][i] = data[_k][i][:, :max_entity_num + 1]
+                    data[_k][i] = torch.nn.functional.pad(
+                        data[_k][i], (0, max_entity_num + 1 - data[_k][i].shape[1]), 'constant', -1e9
+                    )
+
+                data[_k] = torch.nn.utils.rnn.pad_sequence(data[_k], batch_first=True)
+                data[_k] = data[_k][:, :max_selected_units_num].contiguous()
+            elif _k == 'target_units':
+                data[_k] = torch.nn.utils.rnn.pad_sequence(data[_k], batch_first=True, padding_value=-1e9)
+                data[_k] = data[_k][:, :max_entity_num].contiguous()
+        ret[k] = data
+
+    mask = {}
+    mask['actions_mask'] = actions_mask
+    mask['selected_units_mask'] = sequence_mask(ret['selected_units_num'][:home_size])
+    entity_num = ret['entity_num']
+    mask['target_units_logits_mask'] = sequence_mask(entity_num[:home_size])
+    plus_entity_num = entity_num + 1  # selected units head have one more end embedding
+    mask['selected_units_logits_mask'] = sequence_mask(plus_entity_num[:home_size])
+    ret['mask'] = mask
+    return ret
+
+
+def assert_same(a, b, key='batch'):
+    assert type(a) == type(b), key
+    if isinstance(a, torch.Tensor):
+        assert a.dtype == b.dtype and a.shape == b.shape and torch.equal(a, b), key
+    elif isinstance(a, dict):
+        assert set(a.keys()) == set(b.keys()), key
+        for k in a.keys():
+            assert_same(a[k], b[k], '{}.{}'.format(key, k))
+    elif isinstance(a, (list, tuple)):
+        assert len(a) == len(b), key
+        for i, (x, y) in enumerate(zip(a, b)):
+            assert_same(x, y, '{}[{}]'.format(key, i))
+    else:
+        assert a == b, key
+
+
+@pytest.mark.unittest
+class TestLearnerCollate:
+
+    @pytest.mark.parametrize('compress', [False, True])
+    def test_same_as_previous(self, compress):
+        random.seed(0)
+        torch.manual_seed(0)
+        # entity num varies across the steps, including a single entity and the max selected units
+        batch = [fake_trajectory(3, entity_num=(1, 300), compress=compress) for _ in range(4)]
+        ref = previous_as_learner_collate_fn(copy.deepcopy(batch))
+        output = as_learner_collate_fn(copy.deepcopy(batch), entity_bucket_num=2, decompress_threads=2)
+        # only the new keys are allowed to differ
+        entity_num = output['entity_num']
+        assert output.pop('entity_padded') == (entity_num.min().item() < entity_num.max().item())
+        bucket = output.pop('entity_bucket')
+        assert sorted(torch.cat([idx for idx, _, _ in bucket]).tolist()) == list(range(entity_num.shape[0]))
+        assert_same(output, ref)
+
+    def test_decompress_forked(self):
+        batch = [fake_trajectory(2, entity_num=(1, 30), compress=True) for _ in range(2)]
+        # the pool of the parent is created before the fork, as the main process of a DataLoader may do
+        decompress_batch(copy.deepcopy(batch), num_threads=2)
+
+        def worker():
+            decompress_batch(copy.deepcopy(batch), num_threads=2)
+
+        proc = mp.get_context('fork').Process(target=worker)
+        proc.start()
+        proc.join(timeout=60)
+        if proc.is_alive():
+            proc.terminate()
+        assert proc.exitcode == 0
@@ -0,0 +1,190 @@
+import json
+import os
+import pickle
+
+import pytest
+import torch
+from s2clientprotocol import common_pb2 as sc_common
+from s2clientprotocol import sc2api_pb2 as sc_pb
+
+from ctools.pysc2.lib import features
+from ctools.pysc2.lib.mock_replay_controller import MockReplayController, MockReplayProcess
+from distar.data.collate_fn import policy_collate_fn
+from distar.data.replay_decoder import ReplayDecoder, ShardReader, ShardWriter, decode_replays, list_shards
+from distar.envs.other.alphastar_compress import decompress_obs
+
+MAP_SIZE = [120, 140]  # KairosJunction cropped
+GAME_LOOPS = 40
+CFG = {'min_game_loops': 0, 'log_freq': 0}
+
+
+def fake_game_info():
+    w, h = MAP_SIZE
+    game_info = sc_pb.ResponseGameInfo(map_name='Kairos Junction LE')
+    game_info.options.raw = True
+    game_info.options.raw_crop_to_playable_area = True
+    feature_layer = game_info.options.feature_layer
+    feature_layer.width = 24
+    feature_layer.resolution.x, feature_layer.resolution.y = 1, 1
+    feature_layer.minimap_resolution.x, feature_layer.minimap_resolution.y = w, h
+    feature_layer.crop_to_playable_area = True
+    game_info.start_raw.map_size.x, game_info.start_raw.map_size.y = w, h
+    game_info.start_raw.playable_area.p1.x, game_info.start_raw.playable_area.p1.y = w, h
+    for player_id in [1, 2]:
+        game_info.player_info.add(player_id=player_id, type=sc_pb.Participant, race_requested=sc_common.Zerg)
+    return game_info
+
+
+def fake_observation(game_loop, actions, last):
+    w, h = MAP_SIZE
+    obs = sc_pb.ResponseObservation()
+    obs.observation.game_loop = game_loop
+    obs.observation.player_common.player_id = 1
+    for name in features.MINIMAP_FEATURES._fields:
+        image = getattr(obs.observation.feature_layer_data.minimap_renders, name)
+        image.bits_per_pixel = 8
+        image.size.x, image.size.y = w, h
+        image.data = bytes(w * h)
+    for i in range(5):
+        unit = obs.observation.raw_data.units.add(
+            tag=100 + i, unit_type=104, alliance=1, owner=1, health=40, health_max=40
+        )
+        unit.pos.x, unit.pos.y = 10 + i, 20
+    obs.actions.extend(actions)
+    if last:
+        obs.player_result.add(player_id=1, result=sc_pb.Victory)
+    return obs
+
+
+def fake_action(game_loop, ability_id, tags, location=None):
+    action = sc_pb.Action(game_loop=game_loop)
+    command = action.action_raw.unit_command
+    command.ability_id = ability_id
+    command.unit_tags.extend(tags)
+    if location is not None:
+        command.target_world_space_pos.x, command.target_world_space_pos.y = location
+    return action
+
+
+def fake_recording():
+    info = sc_pb.ResponseReplayInfo(map_name='Kairos Junction LE', game_duration_loops=GAME_LOOPS)
+    for player_id in [1, 2]:
+        player = info.player_info.add(player_mmr=4000, player_apm=100)
+        player.player_info.player_id = player_id
+        player.player_info.race_actual = sc_common.Zerg
+    observations = []
+    for game_loop in range(GAME_LOOPS):
+        actions = []
+        if game_loop % 5 == 3:
+            actions.append(fake_action(game_loop - 1, 16, [100, 101], (30.5, 40.2)))  # move
+        if game_loop % 7 == 0 and game_loop > 0:
+            actions.append(fake_action(game_loop - 1, 1342, [102]))  # train drone
+        observations.append(fake_observation(game_loop, actions, game_loop == GAME_LOOPS - 1).SerializeToString())
+    player = {'game_info': fake_game_info().SerializeToString(), 'observations': observations}
+    return pickle.dumps({'version': 1, 'replay_info': info.SerializeToString(), 'players': {1: player, 2: player}})
+
+
+@pytest.mark.unittest
+class TestReplayDecoder:
+
+    def test_decode(self):
+        recording = fake_recording()
+        controller = MockReplayController()
+        info = controller.replay_info(recording)
+        decoder = ReplayDecoder(CFG)
+        assert decoder.check_replay(info, controller.ping()) == [1, 2]
+        steps, meta, num_observations = decoder.decode(controller, recording, info, 1)
+        assert num_observations == GAME_LOOPS
+        # 8 moves and 5 trains, the moves are all different from the last action so none is removed
+        assert len(steps) == 13
+        game_loops = [s['game_loop'] for s in steps]
+        assert game_loops == sorted(game_loops)
+        for s, next_game_loop in zip(steps, game_loops[1:] + [GAME_LOOPS]):
+            assert s['actions']['delay'].item() == next_game_loop - s['game_loop']
+        assert len(meta['stat']['cumulative_stat']) == 5
+        # Z of the whole replay is filled into every step
+        assert all([s['scalar_info']['cumulative_stat'] is steps[0]['scalar_info']['cumulative_stat'] for s in steps])
+
+        traj = []
+        for s in steps[:4]:
+            s = dict(s)
+            s.update(decompress_obs(s))
+            traj.append(s)
+        traj[0]['start_step'] = True
+        batch = policy_collate_fn([traj])
+        assert batch['spatial_info'].shape[:2] == (4, 20)
+        assert batch['actions_mask']['target_location'].tolist() == [True, False, True, True]
+        assert torch.equal(batch['actions']['selected_units'][0], torch.LongTensor([0, 1]))
+
+    def test_mock_step_mul(self):
+        recording = fake_recording()
+        controller = MockReplayController()
+        info = controller.replay_info(recording)
+        steps, _, num_observations = ReplayDecoder(dict(CFG, step_mul=4)).decode(controller, recording, info, 2)
+        # the actions of the skipped observations are not lost
+        assert num_observations == GAME_LOOPS // 4 + 1  # and the last one
+        assert len(steps) == 13
+
+    def test_decode_replays(self, tmpdir):
+        recording = fake_recording()
+        paths = []
+        for i in range(3):
+            paths.append(os.path.join(str(tmpdir), 'replay{}.SC2Replay'.format(i)))
+            with open(paths[-1], 'wb') as f:
+                f.write(recording)
+        output_dir = os.path.join(str(tmpdir), 'output')
+        metrics = decode_replays(paths, output_dir, CFG, num_workers=2, launcher=MockReplayProcess)
+        assert metrics['ok'] == 3 and metrics['steps'] == 3 * 2 * 13
+        with open(os.path.join(output_dir, 'metrics.json')) as f:
+            assert json.load(f)['steps'] == metrics['steps']
+        trajs = {}
+        for path in list_shards(output_dir):
+            reader = ShardReader(path)
+            for i, t in enumerate(reader.trajectories):
+                trajs[(t['replay'], t['player_id'])] = reader.get_trajectory(i)
+        assert len(trajs) == 6 and all([len(t) == 13 for t in trajs.values()])
+
+        # resume: the finished replays are skipped, even if the progress log lost them
+        with open(os.path.join(output_dir, 'progress.log')) as f:
+            lines = f.readlines()
+        with open(os.path.join(output_dir, 'progress.log'), 'w') as f:
+            f.writelines(lines[:1])
+        metrics = decode_replays(paths, output_dir, CFG, num_workers=2, launcher=MockReplayProcess)
+        assert metrics['ok'] == 2 and metrics['steps'] == 0
+        assert sum([len(ShardReader(p)) for p in list_shards(output_dir)]) == 6 * 13
+
+    def test_same_name_replays(self, tmpdir):
+        recording = fake_recording()
+        paths = []
+        for d in ['a', 'b']:
+            os.makedirs(os.path.join(str(tmpdir), 'replays', d))
+            paths.append(os.path.join(str(tmpdir), 'replays', d, 'replay.SC2Replay'))
+            with open(paths[-1], 'wb') as f:
+                f.write(recording)
+        output_dir = os.path.join(str(tmpdir), 'output')
+        replay_root = os.path.join(str(tmpdir), 'replays')
+        metrics = decode_replays(paths, output_dir, CFG, launcher=MockReplayProcess, replay_root=replay_root)
+        assert metrics['ok'] == 2
+        names = [t['replay'] for p in list_shards(output_dir) for t in ShardReader(p).trajectories]
+        assert sorted(names) == sorted([os.path.join(d, 'replay.SC2Replay') for d in ['a', 'a', 'b', 'b']])
+        metrics = decode_replays(paths, output_dir, CFG, launcher=MockReplayProcess, replay_root=replay_root)
+        assert metrics.get('ok', 0) == 0
+
+    def test_shard_writer_commit(self, tmpdir):
+        prefix = os.path.join(str(tmpdir), 'shard')
+        writer = ShardWriter(prefix, max_steps=4)
+        steps = [{'step': torch.full((2, ), i)} for i in range(3)]
+        writer.add_trajectory(steps, {'replay': 'r', 'player_id': 1})
+        writer.add_trajectory(steps[:1], {'replay': 'r', 'player_id': 2})
+        # not visible before the commit
+        assert list_shards(str(tmpdir)) == []
+        writer.commit()
+        reader = ShardReader(list_shards(str(tmpdir))[0])
+        assert len(reader.trajectories) == 2 and len(reader) == 4
+        assert torch.equal(reader.get_trajectory(0)[2]['step'], steps[2]['step'])
+        # the shard is full, the next trajectory rolls over to a new shard
+        writer.add_trajectory(steps, {'replay': 'r2', 'player_id': 1})
+        assert len(list_shards(str(tmpdir))) == 1
+        writer.close()
+        shards = list_shards(str(tmpdir))
+        assert len(shards) == 2 and ShardReader(shards[1]).trajectories[0]['replay'] == 'r2'
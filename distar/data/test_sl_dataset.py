@@ -0,0 +1,82 @@
+import os
+
+import pytest
+import torch
+
+from ctools.pysc2.lib.mock_replay_controller import MockReplayProcess
+from distar.data.replay_decoder import decode_replays
+from distar.data.sl_dataset import SLDataLoader, SLShardDataset
+from distar.data.test_replay_decoder import CFG, fake_recording
+
+TRAJ_LEN = 4
+
+
+@pytest.fixture(scope='module')
+def shard_dir(tmpdir_factory):
+    tmpdir = str(tmpdir_factory.mktemp('shards'))
+    recording = fake_recording()
+    paths = []
+    for i in range(3):
+        paths.append(os.path.join(tmpdir, 'replay{}.SC2Replay'.format(i)))
+        with open(paths[-1], 'wb') as f:
+            f.write(recording)
+    # 6 trajectories of 13 steps, in 2 shards
+    output_dir = os.path.join(tmpdir, 'output')
+    decode_replays(paths, output_dir, dict(CFG, shard_max_steps=40), num_workers=1, launcher=MockReplayProcess)
+    return output_dir
+
+
+def collect(loader, num):
+    return [next(loader) for _ in range(num)]
+
+
+def same_batch(a, b):
+    return a['start_step'] == b['start_step'] and \
+        torch.equal(a['actions']['action_type'], b['actions']['action_type']) and \
+        torch.equal(a['actions']['delay'], b['actions']['delay'])
+
+
+@pytest.mark.unittest
+class TestSLDataset:
+
+    def test_windows(self, shard_dir):
+        dataset = SLShardDataset(shard_dir, TRAJ_LEN, seed=3)
+        assert len(dataset.shards) == 2 and len(dataset.trajectories) == 6
+        assert len(dataset) == 6 * 3
+        windows = dataset.windows(0)
+        assert (windows == SLShardDataset(shard_dir, TRAJ_LEN, seed=3).windows(0)).all()
+        other = dataset.windows(1)
+        assert windows.shape != other.shape or not (windows == other).all()
+        # windows of a trajectory don't overlap and fit in it
+        for t in range(6):
+            starts = sorted(windows[windows[:, 0] == t, 1].tolist())
+            assert len(starts) >= 2 and starts[-1] + TRAJ_LEN <= 13
+            assert all([b - a == TRAJ_LEN for a, b in zip(starts, starts[1:])])
+        steps = dataset.load_window(0, 0)
+        assert len(steps) == TRAJ_LEN and steps[0]['start_step']
+        assert 'entity_info' in steps[0] and 'actions' in steps[0]
+
+    def test_resume(self, shard_dir):
+        dataset = SLShardDataset(shard_dir, TRAJ_LEN, seed=1)
+        loader = SLDataLoader(dataset, batch_size=3, num_workers=0)
+        expected = collect(loader, 12)  # more than an epoch
+        assert loader.epoch >= 1
+        batch = expected[0]
+        assert batch['traj_lens'] == [TRAJ_LEN] * 3 and batch['actions']['action_type'].shape[0] == 3 * TRAJ_LEN
+
+        loader = SLDataLoader(dataset, batch_size=3, num_workers=2)
+        try:
+            batches = collect(loader, 5)
+            cursor = loader.state_dict()
+            assert all([same_batch(a, b) for a, b in zip(batches, expected)])
+            # rewind to the cursor of the 3rd batch
+            loader.load_state_dict({'seed': 1, 'traj_len': TRAJ_LEN, 'batch_size': 3, 'epoch': 0, 'position': 6})
+            assert same_batch(next(loader), expected[2])
+        finally:
+            loader.close()
+        loader = SLDataLoader(dataset, batch_size=3, num_workers=2, cursor=cursor)
+        try:
+            batches = collect(loader, 7)
+            assert all([same_batch(a, b) for a, b in zip(batches, expected[5:])])
+        finally:
+            loader.close()
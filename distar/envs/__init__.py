@@ -1,4 +1,5 @@
 from .alphastar_env import AlphaStarEnv, FakeAlphaStarEnv
 from .eval_env import EvalEnv
+from .recorded_env import RecordedObsEnv
 from .other.alphastar_mask import get_location_mask
 from .other.alphastar_statistics import StatManager
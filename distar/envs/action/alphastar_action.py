@@ -254,14 +254,17 @@ class AlphaStarReplayActionHelper:
         }
 
     def __call__(self, data):
+        '''
+            Overview: parse a raw action proto(ActionRaw) into an action dict, the action keys not used are None
+        '''
         action = data
         ret = copy.deepcopy(self._action_template)
         for k, f in self._ability2action.items():
             act_val = getattr(action, k)
             v = f(act_val)
             if v is not None:
-                ret[k] = v
-        return list(ret.values())
+                ret.update(v)
+        return ret
 
     # refer to https://github.com/Blizzard/s2client-proto/blob/master/s2clientprotocol/raw.proto
     def _parse_raw_camera_move(self, t):
@@ -290,7 +293,7 @@ class AlphaStarReplayActionHelper:
                 # transform into general_id action
                 ret['action_type'] = [ACT_TO_GENERAL_ACT[ret['action_type']]]
                 # queued attr
-                has_queue_attr = GENERAL_ACTION_INFO_MASK[ret['action_type']]['queued']
+                has_queue_attr = GENERAL_ACTION_INFO_MASK[ret['action_type'][0]]['queued']
                 if has_queue_attr:
                     if t.HasField('queue_command'):
                         assert (t.queue_command)
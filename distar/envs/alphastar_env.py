@@ -8,9 +8,10 @@ from typing import List, Any
 import logging
 
 import numpy as np
-import time
 import ctools.pysc2.env.sc2_env as sc2_env
+from ctools.pysc2 import run_configs
 from ctools.pysc2.env.sc2_env import SC2Env
+from ctools.pysc2.lib.sc_process_pool import StarcraftProcessPool
 from ctools.pysc2.lib.action_dict import GENERAL_ACTION_INFO_MASK
 from .other.alphastar_map import get_map_size
 from .action.alphastar_action_runner import AlphaStarRawActionRunner
@@ -18,7 +19,7 @@ from .reward.alphastar_reward_runner import AlphaStarRewardRunner
 from .obs.alphastar_obs_runner import AlphaStarObsRunner
 from .other.alphastar_statistics import RealTimeStatistics, GameLoopStatistics
 from ctools.envs.env.base_env import BaseEnv
-from ctools.utils import deep_merge_dicts, read_config, read_file
+from ctools.utils import deep_merge_dicts, read_config, read_file, get_profiler
 
 default_config = read_config(os.path.join(os.path.dirname(__file__), 'alphastar_env_default_config.yaml'))
 
@@ -46,6 +47,12 @@ class AlphaStarEnv(BaseEnv, SC2Env):
         self._reward_helper = AlphaStarRewardRunner(self._agent_num, cfg.pseudo_reward_type, cfg.pseudo_reward_prob)
 
         self._launch_env_flag = False
+        self._process_pool = None
+        self._profiler = get_profiler()
+        if self._profiler.enabled:
+            # the pysc2 stopwatch times the rpc of the env step
+            sc2_env.sw.enable()
+            self._profiler.add_stopwatch(sc2_env.sw, prefix='sc2.')
         if os.path.exists('./api-log'):
             logging.basicConfig(format='%(process)d - %(asctime)s - %(levelname)s: %(message)s',
                                 filename='./api-log/actor_error.log',
@@ -80,6 +87,16 @@ class AlphaStarEnv(BaseEnv, SC2Env):
             action_delays=cfg.action_delays
         )
 
+        # keep the SC2 processes warm across relaunches, they are health checked before reused, and launched by the
+        # run config of the same version as SC2Env, which keys the static data cache and the replays by its build
+        version = cfg.get('version', None)
+        if cfg.get('process_pool_size', 0) > 0 and self._process_pool is None:
+            self._process_pool = StarcraftProcessPool(
+                run_configs.get(version=version).start,
+                max_idle=cfg.process_pool_size,
+                max_uses=cfg.get('process_max_uses', 0)
+            )
+
         SC2Env.__init__(
             self,
             map_name=cfg.map_name,
@@ -94,6 +111,9 @@ class AlphaStarEnv(BaseEnv, SC2Env):
             score_index=-1,  # use win/loss reward rather than score
             ensure_available_actions=False,
             realtime=cfg.realtime,
+            pipeline_requests=cfg.get('pipeline_requests', False),
+            process_pool=self._process_pool,
+            version=version,
         )
 
     def _raw_env_reset(self, agent_names=None):
@@ -179,7 +199,7 @@ class AlphaStarEnv(BaseEnv, SC2Env):
                 break
             except Exception as e:
                 self.logger.error(repr(e) + 'retry times: {}'.format(retry_time))
-                self.close()
+                SC2Env.close(self, discard=True)  # the failed processes are not given back to the pool
                 if retry_time == max_retry_times - 1:
                     raise e
         return copy.deepcopy(obs)
@@ -199,8 +219,8 @@ class AlphaStarEnv(BaseEnv, SC2Env):
         # save original locat
         locations = [action_data[i]['action']['target_location'] for i in range(self._agent_num)]
 
-        raw_action, delay, action = self._action_helper.get(self)
-        print(delay)
+        with self._profiler.span('env.transform_action'):
+            raw_action, delay, action = self._action_helper.get(self)
         prev_due = copy.deepcopy(self.due)
         # get step_mul
         for n in range(self._agent_num):
@@ -217,7 +237,8 @@ class AlphaStarEnv(BaseEnv, SC2Env):
 
         # env step
         last_episode_steps = self.episode_steps
-        timestep, results = self._raw_env_step(raw_action, step_mul)  # update episode_steps
+        with self._profiler.span('env.sc2_step'):
+            timestep, results = self._raw_env_step(raw_action, step_mul)  # update episode_steps
 
         for n in range(self._agent_num):
             if prev_due[n]:
@@ -226,15 +247,15 @@ class AlphaStarEnv(BaseEnv, SC2Env):
 
         # transform obs, reward and record statistics
         self.raw_obs = [timestep[n].observation for n in range(self._agent_num)]
-        t = time.time()
-        obs = self._obs_helper.get(self)
-        print('numpy to tensor:', time.time() - t)
+        with self._profiler.span('env.transform_obs'):
+            obs = self._obs_helper.get(self)
         self.reward = [timestep[n].reward for n in range(self._agent_num)]
         info = [timestep[n].game_info for n in range(self._agent_num)]
         done = any([timestep[n].last() for n in range(self._agent_num)])
         # Note: pseudo reward must be derived after statistics update
         if self._agent_num > 1:
-            self.reward, self.dists = self._reward_helper.get(self)
+            with self._profiler.span('env.reward'):
+                self.reward, self.dists = self._reward_helper.get(self)
         else:
             self.dists = None
         # update last state variable
@@ -279,6 +300,9 @@ class AlphaStarEnv(BaseEnv, SC2Env):
 
     def close(self) -> None:
         SC2Env.close(self)
+        if self._process_pool is not None:
+            self._process_pool.close()
+            self._process_pool = None
 
     def _get_battle_value(self, raw_obs):
         minerals_ratio = 1.
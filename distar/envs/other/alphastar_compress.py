@@ -52,8 +52,15 @@ def decompress_obs(obs):
     entity_no_bool = obs['entity_info']['no_bool']
     spatial_bool = np.unpackbits(obs['spatial_info']['bool']).reshape(*obs['spatial_info']['bool_ori_shape'])
     spatial_uint8 = obs['spatial_info']['no_bool'].astype(np.float32) / 256.
-    new_obs['entity_info'] = torch.cat([torch.FloatTensor(entity_no_bool), torch.FloatTensor(entity_bool)], dim=1)
-    new_obs['spatial_info'] = torch.cat([torch.FloatTensor(spatial_uint8), torch.FloatTensor(spatial_bool)], dim=0)
+    # copy into preallocated tensors instead of converting each part to float and concatenating them
+    entity_info = torch.empty(entity_bool.shape[0], entity_no_bool.shape[1] + entity_bool.shape[1])
+    entity_info[:, :entity_no_bool.shape[1]] = torch.from_numpy(np.ascontiguousarray(entity_no_bool))
+    entity_info[:, entity_no_bool.shape[1]:] = torch.from_numpy(np.ascontiguousarray(entity_bool))
+    spatial_info = torch.empty(spatial_uint8.shape[0] + spatial_bool.shape[0], *spatial_bool.shape[1:])
+    spatial_info[:spatial_uint8.shape[0]] = torch.from_numpy(spatial_uint8)
+    spatial_info[spatial_uint8.shape[0]:] = torch.from_numpy(spatial_bool)
+    new_obs['entity_info'] = entity_info
+    new_obs['spatial_info'] = spatial_info
     return new_obs
 
 
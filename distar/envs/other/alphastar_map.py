@@ -253,3 +253,18 @@ def get_map_size(map_name, cropped=True):
 #     return inv_tab
 
 # LOCALIZED_BNET_NAME_TO_ctools.pysc2_NAME_LUT = get_inverse_tran_table(MAPS, [0, 4, 5, 6])
+
+
+def find_map_name(name):
+    r"""
+    Overview:
+        find the key in MAPS of a map name in any form(battle_net, localized, path), e.g.: the map name in replay info
+    Returns:
+        - map_name (:obj:`str`): key in MAPS, None if not found
+    """
+    name = name.replace(' ', '')
+    for k, v in MAPS.items():
+        names = [k, v[0], v[4], v[5], v[6], v[1].split('\\')[-1].split('.')[0]]
+        if name in [n.replace(' ', '') for n in names if n]:
+            return k
+    return None
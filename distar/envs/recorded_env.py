@@ -0,0 +1,186 @@
+"""
+``AlphaStarEnv`` without SC2 for the benchmarks, the observations are played back from a recording
+
+    A recording holds the raw observation protos of the players(see ``record_replay`` of
+    ``ctools.pysc2.lib.mock_replay_controller``), ``fake_recording`` makes a synthetic one with a given entity number.
+"""
+import pickle
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from ctools.pysc2.env.sc2_env import parse_agent_interface_format
+from ctools.pysc2.lib import features, protocol
+from ctools.pysc2.lib.mock_replay_controller import MockReplayController
+from ctools.utils import deep_merge_dicts
+from s2clientprotocol import common_pb2 as sc_common
+from s2clientprotocol import sc2api_pb2 as sc_pb
+from .action.alphastar_action_runner import AlphaStarRawActionRunner
+from .alphastar_env import default_config
+from .obs.alphastar_obs_runner import AlphaStarObsRunner
+from .other.alphastar_map import MAPS, get_map_size
+from .other.alphastar_statistics import RealTimeStatistics, transformed_stat_mmr
+
+# (unit_type, alliance, owner) of the synthetic units: zerg units of both players and the neutral resources
+_UNIT_TEMPLATES = [
+    (104, 1, 1), (105, 1, 1), (105, 1, 1), (106, 1, 1), (110, 1, 1), (126, 1, 1), (86, 1, 1),
+    (104, 4, 2), (105, 4, 2), (110, 4, 2), (341, 3, 16), (342, 3, 16)
+]
+
+
+def fake_recording(entity_num, obs_num=64, map_name='KairosJunction', seed=0):
+    r"""
+    Overview:
+        a synthetic recording in the format of ``record_replay``, ``entity_num`` moving units in each observation
+    """
+    rng = np.random.RandomState(seed)
+    w, h = get_map_size(map_name, cropped=True)
+    game_info = sc_pb.ResponseGameInfo(map_name=MAPS[map_name][0])
+    game_info.options.raw = True
+    game_info.options.raw_crop_to_playable_area = True
+    feature_layer = game_info.options.feature_layer
+    feature_layer.width = 24
+    feature_layer.resolution.x, feature_layer.resolution.y = 1, 1
+    feature_layer.minimap_resolution.x, feature_layer.minimap_resolution.y = w, h
+    feature_layer.crop_to_playable_area = True
+    game_info.start_raw.map_size.x, game_info.start_raw.map_size.y = w, h
+    game_info.start_raw.playable_area.p1.x, game_info.start_raw.playable_area.p1.y = w, h
+    for player_id in [1, 2]:
+        game_info.player_info.add(player_id=player_id, type=sc_pb.Participant, race_requested=sc_common.Zerg)
+
+    templates = [_UNIT_TEMPLATES[i] for i in rng.randint(len(_UNIT_TEMPLATES), size=entity_num)]
+    pos = rng.uniform(0, [w, h], size=(entity_num, 2))
+    observations = []
+    for game_loop in range(obs_num):
+        obs = sc_pb.ResponseObservation()
+        obs.observation.game_loop = game_loop * 8
+        obs.observation.player_common.player_id = 1
+        obs.observation.player_common.minerals = 50 + game_loop * 10
+        obs.observation.player_common.food_used = min(entity_num, 200)
+        obs.observation.player_common.food_cap = 200
+        for name in features.MINIMAP_FEATURES._fields:
+            image = getattr(obs.observation.feature_layer_data.minimap_renders, name)
+            image.bits_per_pixel = 8
+            image.size.x, image.size.y = w, h
+            if name == 'height_map':
+                image.data = rng.randint(0, 256, size=w * h, dtype=np.uint8).tobytes()
+            else:
+                image.data = bytes(w * h)
+        pos = np.clip(pos + rng.normal(0, 0.5, size=pos.shape), 0, [w - 1, h - 1])
+        for i, (unit_type, alliance, owner) in enumerate(templates):
+            unit = obs.observation.raw_data.units.add(
+                tag=1000 + i, unit_type=unit_type, alliance=alliance, owner=owner, health=40, health_max=40,
+                build_progress=1.
+            )
+            unit.pos.x, unit.pos.y = pos[i]
+        if game_loop == obs_num - 1:
+            obs.player_result.add(player_id=1, result=sc_pb.Victory)
+        observations.append(obs.SerializeToString())
+    info = sc_pb.ResponseReplayInfo(map_name=MAPS[map_name][0], game_duration_loops=obs_num * 8)
+    player = {'game_info': game_info.SerializeToString(), 'observations': observations}
+    return pickle.dumps({'version': 1, 'replay_info': info.SerializeToString(), 'players': {1: player, 2: player}})
+
+
+class RecordedObsEnv(object):
+    r"""
+    Overview:
+        ``AlphaStarEnv`` of two agents without SC2, the observations of each player are played back from a recording,
+        the actions are transformed but not sent. The timing of the env stages is returned in the info
+    Interface:
+        __init__, reset, step, close
+    """
+    timestep = namedtuple('RecordedObsTimestep', ['obs', 'reward', 'done', 'info', 'episode_steps', 'due'])
+
+    def __init__(self, cfg):
+        cfg = deep_merge_dicts(default_config.env, cfg)
+        self._map_size = get_map_size(cfg.map_name, cropped=True)
+        cfg.map_size = self._map_size
+        cfg.obs_spatial.spatial_resolution = self._map_size
+        cfg.action.map_size = self._map_size
+        cfg.obs_stat_type = 'replay_last'
+        self._agent_num = cfg.agent_num = 2
+        self._cfg = cfg
+        self._obs_helper = AlphaStarObsRunner(cfg)
+        self._action_helper = AlphaStarRawActionRunner(cfg)
+        self._begin_num = cfg.obs_scalar.begin_num
+        # the Z of the players, read by the obs runner through loaded_eval_stat
+        self._z = transformed_stat_mmr({'begin_statistics': [], 'cumulative_statistics': {}}, 0, self._begin_num)
+        self.loaded_eval_stat = [self for _ in range(self._agent_num)]
+        self._recording = None
+        self._timing = {}
+
+    def get_input_z_by_game_loop(self, game_loop, cumulative_stat=None):
+        return self._z
+
+    def _time(self, name, start):
+        self._timing[name] = self._timing.get(name, 0.) + time.perf_counter() - start
+
+    def _observe(self):
+        raw_obs = []
+        for controller, feat in zip(self._controllers, self._features):
+            t = time.perf_counter()
+            obs = controller.observe()
+            self._time('env.observe', t)
+            t = time.perf_counter()
+            raw_obs.append(feat.transform_obs(obs))
+            self._time('env.transform_obs', t)
+        self.raw_obs = raw_obs
+        t = time.perf_counter()
+        obs = self._obs_helper.get(self)
+        self._time('env.obs_runner', t)
+        return obs
+
+    def reset(self):
+        if self._recording is None:
+            with open(self._cfg.recording, 'rb') as f:
+                self._recording = f.read()
+        aif = parse_agent_interface_format(
+            feature_screen=[1, 1],
+            feature_minimap=self._map_size,
+            crop_to_playable_area=True,
+            raw_crop_to_playable_area=True,
+        )
+        self._controllers, self._features = [], []
+        for player_id in range(1, self._agent_num + 1):
+            controller = MockReplayController()
+            controller.start_replay(sc_pb.RequestStartReplay(replay_data=self._recording, observed_player_id=player_id))
+            self._controllers.append(controller)
+            self._features.append(features.features_from_game_info(controller.game_info(), agent_interface_format=aif))
+        self._obs_helper.reset()
+        self._action_helper.reset()
+        self.episode_stat = [RealTimeStatistics(self._begin_num) for _ in range(self._agent_num)]
+        self.due = [True for _ in range(self._agent_num)]
+        self.action = [None] * self._agent_num
+        self._timing = {}
+        return self._observe()
+
+    def step(self, action):
+        self._timing = {}
+        self.agent_action = action
+        t = time.perf_counter()
+        _, _, action = self._action_helper.get(self)
+        self._time('env.transform_action', t)
+        for n in range(self._agent_num):
+            if action[n] is not None:  # the illegal actions are skipped
+                self.action[n] = action[n]
+        self._obs_helper.update_last_action(self)
+        for controller in self._controllers:
+            controller.step(self._cfg.default_step_mul)
+        obs = self._observe()
+        game_loop = self.raw_obs[0]['game_loop'][0]
+        done = any([c.status == protocol.Status.ended for c in self._controllers])
+        return RecordedObsEnv.timestep(
+            obs=obs,
+            reward=[0. for _ in range(self._agent_num)],
+            done=done,
+            info={'timing': self._timing},
+            episode_steps=[int(game_loop) for _ in range(self._agent_num)],
+            due=list(self.due),
+        )
+
+    def close(self):
+        pass
+
+
+RecordedObsTimestep = RecordedObsEnv.timestep
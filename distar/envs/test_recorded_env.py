@@ -0,0 +1,31 @@
+import pytest
+import torch
+
+from distar.envs.recorded_env import RecordedObsEnv, fake_recording
+
+
+@pytest.mark.unittest
+def test_recorded_obs_env(tmpdir):
+    path = str(tmpdir.join('fake.recording'))
+    with open(path, 'wb') as f:
+        f.write(fake_recording(30, obs_num=5))
+    env = RecordedObsEnv({'map_name': 'KairosJunction', 'recording': path})
+    obs = env.reset()
+    assert len(obs) == 2 and obs[0]['entity_info'].shape == (30, 1340)
+    assert obs[0]['spatial_info'].shape[1:] == (140, 120)
+    no_op = {
+        'action': {
+            'action_type': torch.tensor(0),
+            'delay': torch.tensor(1),
+            'queued': None,
+            'selected_units': None,
+            'target_units': None,
+            'target_location': None
+        },
+        'entity_raw': obs[0]['entity_raw']
+    }
+    for i in range(4):
+        timestep = env.step([no_op, no_op])
+        assert timestep.done == (i == 3)
+        assert timestep.episode_steps == [(i + 1) * 8] * 2
+        assert {'env.transform_obs', 'env.obs_runner', 'env.transform_action'} <= set(timestep.info['timing'].keys())
@@ -19,14 +19,17 @@ class CoreLstm(nn.Module):
             embedded_entity: [seq_len, batch_size, embed_dim_entity]
             embedded_spatial: [seq_len, batch_size, embed_dim_spatial]
             embedded_scalar: [seq_len, batch_size, embed_dim_scalar]
-            prev_state: None or list [H,C]
+            prev_state: None or list [H,C] or list of per-sample state
                 H and C are history sized of [num_layers, batch_size, hidden_size]
         Output:
             output: [seq_len, batch_size, hidden_size]
-            next_state: list [H,C], H and C are of size [num_layers, batch_size, hidden_size]
+            next_state: list of per-sample state [h,c], h and c are of size [num_layers, 1, hidden_size]
+                if prev_state is list [H,C], next_state is also list [H,C] to avoid splitting the batch
         '''
         embedded = torch.cat([embedded_entity, embedded_spatial, embedded_scalar], dim=2)
-        output, next_state = self.lstm(embedded, prev_state, list_next_state=True)
+        stacked_state = isinstance(prev_state, (list, tuple)) and len(prev_state) == 2 and \
+            isinstance(prev_state[0], torch.Tensor)
+        output, next_state = self.lstm(embedded, prev_state, list_next_state=not stacked_state)
         return output, next_state
 
 
@@ -78,6 +78,8 @@ class Encoder(nn.Module):
                 - map_size
                 - prev_state
                 - score_cumulative
+                - entity_bucket(optional)
+                - entity_padded(optional)
         Outputs:
             - lstm_output: The LSTM state for the next step. Tensor of size [seq_len, batch_size, hidden_size]
             - next_state: The LSTM state for the next step.
@@ -93,7 +95,7 @@ class Encoder(nn.Module):
             inputs['scalar_info']
         )
         entity_embeddings, embedded_entity, entity_mask = self.encoder['entity_encoder'](
-            inputs['entity_info'], inputs['entity_num']
+            inputs['entity_info'], inputs['entity_num'], inputs.get('entity_bucket'), inputs.get('entity_padded')
         )
         spatial_input = self._scatter_connection(
             inputs['spatial_info'], entity_embeddings, inputs['entity_raw'], entity_mask
@@ -119,7 +121,7 @@ class Encoder(nn.Module):
             inputs['scalar_info']
         )
         entity_embeddings, embedded_entity, entity_mask = self.encoder['entity_encoder'](
-            inputs['entity_info'], inputs['entity_num']
+            inputs['entity_info'], inputs['entity_num'], inputs.get('entity_bucket'), inputs.get('entity_padded')
         )
         spatial_input = self._scatter_connection(
             inputs['spatial_info'], entity_embeddings, inputs['entity_raw'], entity_mask
@@ -0,0 +1,208 @@
+import copy
+import logging
+from collections import OrderedDict
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from ctools.utils import read_file, save_file
+from .actor_critic import AlphaStarActorCritic
+
+INFERENCE_KEY = 'inference_cfg'
+STRIP_KEYWORDS = ['value_networks', 'teacher']
+
+
+def strip_state_dict(state_dict):
+    r"""
+    Overview:
+        remove the parameters only used in training(value networks and teacher model)
+    """
+    return OrderedDict({k: v for k, v in state_dict.items() if not any([s in k for s in STRIP_KEYWORDS])})
+
+
+def remove_dropout(model):
+    r"""
+    Overview:
+        replace all the dropout modules with identity, dropout is always a no-op in inference
+    """
+    for m in model.modules():
+        for name, child in m._modules.items():
+            if isinstance(child, nn.Dropout):
+                m._modules[name] = nn.Identity()
+    return model
+
+
+def _fold_bn(layer, bn):
+    std = torch.sqrt(bn.running_var + bn.eps)
+    scale = bn.weight / std if bn.affine else 1. / std
+    shift = bn.bias - bn.running_mean * scale if bn.affine else -bn.running_mean * scale
+    shape = [-1] + [1] * (layer.weight.dim() - 1)
+    layer.weight.data.mul_(scale.view(*shape))
+    if layer.bias is None:
+        layer.bias = nn.Parameter(shift.clone())
+    else:
+        layer.bias.data.mul_(scale).add_(shift)
+
+
+def fold_norm(model):
+    r"""
+    Overview:
+        fold the BatchNorm following a Linear/Conv2d in the same ``nn.Sequential`` (e.g.: fc_block, conv2d_block)
+        into the weight and bias of the layer
+    Returns:
+        - num (:obj:`int`): the number of folded norms
+    Note:
+        LayerNorm statistics depend on the input, so it can't be folded and is kept as it is. The default
+        AlphaStar config only uses LayerNorm, so nothing is folded unless some blocks are configured with 'BN'
+    """
+    pairs = [(nn.Linear, nn.BatchNorm1d), (nn.Conv2d, nn.BatchNorm2d)]
+    num = 0
+    for m in model.modules():
+        if not isinstance(m, nn.Sequential):
+            continue
+        names = list(m._modules.keys())
+        for prev, cur in zip(names[:-1], names[1:]):
+            layer, bn = m._modules[prev], m._modules[cur]
+            if any([isinstance(layer, p[0]) and isinstance(bn, p[1]) for p in pairs]) and bn.track_running_stats:
+                _fold_bn(layer, bn)
+                m._modules[cur] = nn.Identity()
+                num += 1
+    return num
+
+
+def quantize(model):
+    r"""
+    Overview:
+        apply dynamic int8 quantization to all the ``nn.Linear``, only support cpu inference
+    """
+    return torch.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def script_inference_model(model, prefix=''):
+    r"""
+    Overview:
+        compile the submodules of the model with TorchScript in place. Each submodule is scripted as a whole if
+        possible, otherwise its children are tried one by one. The autoregressive sampling of the policy and the
+        modules with python-only inputs(e.g.: the lstm state tuple) are kept in eager mode
+    Arguments:
+        - model (:obj:`nn.Module`): the model in eval mode, with its weights loaded
+        - prefix (:obj:`str`): the name prefix of the submodules
+    Returns:
+        - scripted (:obj:`list`): the names of the scripted submodules
+    """
+    scripted = []
+    for name, child in model._modules.items():
+        # scripting a leaf layer only adds the call overhead of the script module
+        if child is None or len(child._modules) == 0 or isinstance(child, torch.jit.ScriptModule):
+            continue
+        try:
+            model._modules[name] = torch.jit.script(child)
+            scripted.append(prefix + name)
+        except Exception:
+            scripted += script_inference_model(child, prefix + name + '.')
+    return scripted
+
+
+def _transform(model, inference_cfg):
+    model.eval()
+    remove_dropout(model)
+    if inference_cfg['fold_norm']:
+        num = fold_norm(model)
+        logging.info('fold {} norms into the previous layers'.format(num))
+    if inference_cfg['quantize']:
+        model = quantize(model)
+    for p in model.parameters():
+        p.requires_grad_(False)
+    return model
+
+
+def build_inference_model(data):
+    r"""
+    Overview:
+        build the inference model from the exported artifact(the data returned by ``read_file``)
+    """
+    assert INFERENCE_KEY in data, 'not an inference artifact, please export it with export_inference_model'
+    inference_cfg = data[INFERENCE_KEY]
+    model = AlphaStarActorCritic(copy.deepcopy(inference_cfg['model_cfg']))
+    model = _transform(model, inference_cfg)
+    model.load_state_dict(data['model'])
+    if inference_cfg.get('script', False):
+        scripted = script_inference_model(model)
+        logging.info('script {} submodules with TorchScript'.format(len(scripted)))
+    return model
+
+
+def load_inference_model(path):
+    return build_inference_model(read_file(path))
+
+
+def export_inference_model(checkpoint_path, save_path, model_cfg=None, fold=True, quant=False, script=True):
+    r"""
+    Overview:
+        export a training checkpoint into an inference-only artifact: value networks and teacher are stripped,
+        dropout is removed, norms are folded and Linears are optionally quantized into dynamic int8. The submodules
+        are scripted with TorchScript when the artifact is loaded
+    Arguments:
+        - checkpoint_path (:obj:`str`): training checkpoint path(with 'model' field)
+        - save_path (:obj:`str`): the path of the artifact
+        - model_cfg (:obj:`dict`): the model config used in training, default config is used if it is None
+        - fold (:obj:`bool`): whether to fold the norms
+        - quant (:obj:`bool`): whether to apply dynamic int8 quantization
+        - script (:obj:`bool`): whether to script the submodules with TorchScript when loading
+    Returns:
+        - model (:obj:`AlphaStarActorCritic`): the exported inference model, before scripting
+    """
+    model_cfg = {} if model_cfg is None else copy.deepcopy(model_cfg)
+    model_cfg['use_value_network'] = False
+    inference_cfg = {'model_cfg': model_cfg, 'fold_norm': fold, 'quantize': quant, 'script': script}
+
+    state_dict = read_file(checkpoint_path)
+    model = AlphaStarActorCritic(copy.deepcopy(model_cfg))
+    model.load_state_dict(strip_state_dict(state_dict['model']), strict=False)
+    model = _transform(model, inference_cfg)
+    save_file(save_path, {INFERENCE_KEY: inference_cfg, 'model': model.state_dict()})
+    return model
+
+
+def check_inference_parity(eager_model, inference_model, inputs, seed=0):
+    r"""
+    Overview:
+        compare the action distributions of the eager model and the inference model on the same inputs. The
+        actions sampled by the eager model are fed to both models(``mimic_single``), so that the autoregressive
+        heads are conditioned on the same actions even if the sampling of the two models diverges
+    Arguments:
+        - eager_model (:obj:`AlphaStarActorCritic`): the training model
+        - inference_model (:obj:`AlphaStarActorCritic`): the model returned by ``build_inference_model``
+        - inputs (:obj:`dict`): collated inputs for ``compute_action``
+        - seed (:obj:`int`): the sampling seed
+    Returns:
+        - result (:obj:`dict`): for each head: max abs difference of probs, mean KL(eager || inference) and
+            whether the two models sample the same action with the same rng
+    """
+    actions = []
+    for model in [eager_model, inference_model]:
+        model.eval()
+        torch.manual_seed(seed)
+        with torch.no_grad():
+            (output, _), _, _ = model.compute_action(copy.deepcopy(inputs))
+        actions.append(output)
+    mimic_inputs = copy.deepcopy(inputs)
+    mimic_inputs['actions'] = actions[0]['action']
+    mimic_inputs['selected_units_num'] = actions[0]['selected_units_num']
+    logits = []
+    for model in [eager_model, inference_model]:
+        with torch.no_grad():
+            logits.append(model.mimic_single(copy.deepcopy(mimic_inputs))['policy_outputs'])
+    (action_e, action_i), (logits_e, logits_i) = [a['action'] for a in actions], logits
+    result = {}
+    for k in logits_e.keys():
+        le, li = logits_e[k], logits_i[k]
+        le, li = le.reshape(-1, le.shape[-1]).float(), li.reshape(-1, li.shape[-1]).float()
+        log_pe, log_pi = F.log_softmax(le, dim=-1), F.log_softmax(li, dim=-1)
+        pe, pi = log_pe.exp(), log_pi.exp()
+        kl = (pe * (log_pe - log_pi)).masked_fill(pe == 0, 0.).sum(dim=-1).mean()
+        ae, ai = action_e[k], action_i[k]
+        same = ae.shape == ai.shape and torch.equal(ae, ai)
+        result[k] = {'max_prob_diff': (pe - pi).abs().max().item(), 'kl': kl.item(), 'action_match': float(same)}
+    return result
@@ -2,6 +2,7 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import math
+from typing import Dict, Optional
 from torch.nn.init import kaiming_normal_, kaiming_uniform_
 from ctools.torch_utils import conv2d_block, sequence_mask, fc_block, build_normalization
 
@@ -14,8 +15,11 @@ class Attention(nn.Module):
         self.dropout = dropout
         self.attention_pre = fc_block(input_dim, head_dim * head_num * 3)  # query, key, value
         self.project = fc_block(head_dim * head_num, output_dim)
+        # fused kernel needs a dropout module to read the drop ratio from, fall back to the naive path otherwise
+        self.use_fused = hasattr(F, 'scaled_dot_product_attention') and isinstance(dropout, nn.Module)
+        self.dropout_p = float(getattr(dropout, 'p', 0.))
 
-    def split(self, x, T=False):
+    def split(self, x, T: bool = False):
         B, N = x.shape[:2]
         x = x.view(B, N, self.head_num, self.head_dim)
         x = x.permute(0, 2, 1, 3).contiguous()  # B, head_num, N, head_dim
@@ -23,7 +27,7 @@ class Attention(nn.Module):
             x = x.permute(0, 1, 3, 2).contiguous()
         return x
 
-    def forward(self, x, mask=None):
+    def forward(self, x, mask: Optional[torch.Tensor] = None):
         """
         Overview:
             x: [batch_size, seq_len, embeddding_size]
@@ -32,16 +36,23 @@ class Attention(nn.Module):
         B, N = x.shape[:2]
         x = self.attention_pre(x)
         query, key, value = torch.chunk(x, 3, dim=2)
-        query, key, value = self.split(query), self.split(key, T=True), self.split(value)
-
-        score = torch.matmul(query, key)  # B, head_num, N, N
-        score /= math.sqrt(self.head_dim)
-        if mask is not None:
-            score.masked_fill_(~mask, value=-1e9)
+        query, key, value = self.split(query), self.split(key, T=not self.use_fused), self.split(value)
+
+        if self.use_fused:
+            # mask is a key padding mask of shape [B, 1, 1, N] (or a full [B, 1, N, N] one), True for valid keys
+            dropout_p = self.dropout_p if self.training else 0.
+            attention = F.scaled_dot_product_attention(
+                query, key, value, attn_mask=mask, dropout_p=dropout_p
+            )  # B, head_num, N, head_dim
+        else:
+            score = torch.matmul(query, key)  # B, head_num, N, N
+            score /= math.sqrt(self.head_dim)
+            if mask is not None:
+                score.masked_fill_(~mask, value=-1e9)
 
-        score = F.softmax(score, dim=-1)
-        score = self.dropout(score)
-        attention = torch.matmul(score, value)  # B, head_num, N, head_dim
+            score = F.softmax(score, dim=-1)
+            score = self.dropout(score)
+            attention = torch.matmul(score, value)  # B, head_num, N, head_dim
 
         attention = attention.permute(0, 2, 1, 3).contiguous()  # B, N, head_num, head_dim
         attention = self.project(attention.view(B, N, -1))  # B, N, output_dim
@@ -78,8 +89,9 @@ class TransformerLayer(nn.Module):
         self.layernorm2 = build_normalization('LN')(output_dim)
         self.ln_type = ln_type
 
-    def forward(self, inputs):
+    def forward(self, inputs: Dict[str, Optional[torch.Tensor]]) -> Dict[str, Optional[torch.Tensor]]:
         x, mask = inputs['data'], inputs['mask']
+        assert x is not None
         if self.ln_type == 'post':
             a = self.dropout(self.attention(x, mask))
             x = self.layernorm1(x + a)
@@ -128,14 +140,20 @@ class Transformer(nn.Module):
                     dims[i], head_dim, hidden_dim, dims[i + 1], head_num, mlp_num, self.dropout, self.act, ln_type
                 )
             )
-        self.main = nn.Sequential(*layers)
+        # a ModuleList run layer by layer, as TorchScript types nn.Sequential as tensor in and out
+        self.main = nn.ModuleList(layers)
 
-    def forward(self, x, mask=None):
+    def forward(self, x, mask: Optional[torch.Tensor] = None):
         if mask is not None:
-            mask = mask.unsqueeze(dim=1).repeat(1, mask.shape[1], 1).unsqueeze(dim=1)
+            # key padding mask, broadcast to [B, head_num, N, N] inside attention instead of being materialized
+            mask = mask.unsqueeze(dim=1).unsqueeze(dim=1)  # B, 1, 1, N
         x = self.embedding(x)
         x = self.dropout(x)
-        x = self.main({'data': x, 'mask': mask})['data']
+        inputs: Dict[str, Optional[torch.Tensor]] = {'data': x, 'mask': mask}
+        for layer in self.main:
+            inputs = layer(inputs)
+        x = inputs['data']
+        assert x is not None
         return x
 
 
@@ -34,7 +34,7 @@ class EntityEncoder(nn.Module):
         self.entity_fc = fc_block(cfg.output_dim, cfg.output_dim, activation=self.act)
         self.embed_fc = fc_block(cfg.output_dim, cfg.output_dim, activation=self.act)
 
-    def forward(self, x, entity_num):
+    def forward(self, x, entity_num, entity_bucket=None, entity_padded=None):
         '''
         Input:
             x: list(tuple) of batch_size * Tensor of size [entity_num, input_dim]
@@ -42,12 +42,24 @@ class EntityEncoder(nn.Module):
                See detailed-architecture.txt line 19-64 for more detail
                about the fields in the dim 2
             entity:num: valid entity num
+            entity_bucket: (optional) list of (index tensor, max entity num, padded) grouping samples with similar
+                entity num, each bucket only pays attention cost for its own max entity num
+            entity_padded: (optional) whether any sample has less entities than x.shape[1], computed on host by the
+                collate function so that the forward doesn't read entity_num back from the device
         Output:
             entity_embeddings: tuple(len=batch_size)->element: torch.Tensor, shape(entity_num_b, output_dim)
             embedded_entity: Tensor of size [batch_size, output_dim]
         '''
         mask = sequence_mask(entity_num)
-        x = self.transformer(x, mask=mask)
+        if entity_padded is None:
+            entity_padded = entity_num.min().item() < x.shape[1]
+        if entity_bucket is not None:
+            x = self._bucket_transformer(x, entity_num, entity_bucket)
+        elif not entity_padded:
+            # no padding in this batch(e.g.: single env actor inference), skip attention masking
+            x = self.transformer(x)
+        else:
+            x = self.transformer(x, mask=mask)
         x = self.act(x)
         entity_embeddings = self.entity_fc(x)
         x_mask = x * mask.unsqueeze(dim=2)
@@ -56,3 +68,17 @@ class EntityEncoder(nn.Module):
         embedded_entity = self.embed_fc(embedded_entity)
         return entity_embeddings, embedded_entity, mask
 
+    def _bucket_transformer(self, x, entity_num, entity_bucket):
+        B, N = x.shape[:2]
+        entity_num = entity_num.view(-1)
+        output = None
+        for idx, n, padded in entity_bucket:
+            idx = idx.to(x.device)
+            if padded:
+                bucket_output = self.transformer(x[idx, :n], mask=sequence_mask(entity_num[idx], max_len=n))
+            else:
+                bucket_output = self.transformer(x[idx, :n])
+            if output is None:
+                output = x.new_zeros(B, N, bucket_output.shape[-1])
+            output[idx, :n] = bucket_output
+        return output
@@ -0,0 +1,85 @@
+import copy
+
+import pytest
+import torch
+from easydict import EasyDict
+
+from distar.data.collate_fn import build_entity_bucket
+from distar.model.alphastar.module_utils import Attention
+from distar.model.alphastar.obs_encoder.entity_encoder import EntityEncoder
+
+ENTITY_NUM = [3, 7, 12, 12, 5, 9, 1, 8]
+
+
+def get_encoder():
+    cfg = EasyDict(
+        {
+            'input_dim': 16,
+            'head_dim': 8,
+            'hidden_dim': 32,
+            'output_dim': 24,
+            'head_num': 2,
+            'mlp_num': 2,
+            'layer_num': 2,
+            'dropout_ratio': 0,
+            'activation': 'relu',
+            'ln_type': 'post',
+        }
+    )
+    encoder = EntityEncoder(cfg)
+    encoder.eval()
+    # the naive attention with the mask filled before softmax, as before the fused kernel
+    eager_encoder = copy.deepcopy(encoder)
+    for m in eager_encoder.modules():
+        if isinstance(m, Attention):
+            m.use_fused = False
+    return encoder, eager_encoder
+
+
+def get_inputs(entity_num):
+    x = torch.nn.utils.rnn.pad_sequence([torch.randn(n, 16) for n in entity_num], batch_first=True)
+    return x, torch.LongTensor([[n] for n in entity_num])
+
+
+def assert_same_output(output, ref, entity_num):
+    for b, n in enumerate(entity_num):
+        assert torch.allclose(output[0][b, :n], ref[0][b, :n], atol=1e-5)
+    assert torch.allclose(output[1], ref[1], atol=1e-5)
+    assert torch.equal(output[2], ref[2])
+
+
+@pytest.mark.unittest
+class TestEntityEncoder:
+
+    def test_build_entity_bucket(self):
+        entity_num = torch.LongTensor([[n] for n in ENTITY_NUM])
+        bucket = build_entity_bucket(entity_num, 3)
+        assert sorted(torch.cat([idx for idx, _, _ in bucket]).tolist()) == list(range(len(ENTITY_NUM)))
+        for idx, max_num, padded in bucket:
+            assert isinstance(max_num, int) and isinstance(padded, bool)
+            assert max_num == entity_num[idx].max().item()
+            assert padded == (entity_num[idx].min().item() < max_num)
+        assert len(build_entity_bucket(entity_num, 100)) == len(ENTITY_NUM)
+
+    @pytest.mark.parametrize('bucket_num', [1, 3, len(ENTITY_NUM)])
+    def test_padded_batch(self, bucket_num):
+        encoder, eager_encoder = get_encoder()
+        x, entity_num = get_inputs(ENTITY_NUM)
+        with torch.no_grad():
+            ref = eager_encoder(x, entity_num, entity_padded=True)
+            fused = encoder(x, entity_num, entity_padded=True)
+            bucketed = encoder(x, entity_num, build_entity_bucket(entity_num, bucket_num), entity_padded=True)
+            # without the host hint, the padding is read from entity_num
+            no_hint = encoder(x, entity_num)
+        for output in [fused, bucketed, no_hint]:
+            assert_same_output(output, ref, ENTITY_NUM)
+
+    def test_no_padding(self):
+        encoder, eager_encoder = get_encoder()
+        x, entity_num = get_inputs([6, 6, 6])
+        with torch.no_grad():
+            ref = eager_encoder(x, entity_num, entity_padded=True)
+            output = encoder(x, entity_num, entity_padded=False)
+            bucketed = encoder(x, entity_num, build_entity_bucket(entity_num, 2), entity_padded=False)
+        assert_same_output(output, ref, [6, 6, 6])
+        assert_same_output(bucketed, ref, [6, 6, 6])
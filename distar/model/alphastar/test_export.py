@@ -0,0 +1,75 @@
+import os
+
+import pytest
+import torch
+import torch.nn as nn
+
+from ctools.torch_utils import fc_block
+from ctools.utils import read_file, save_file
+from distar.data.collate_fn import as_eval_collate_fn
+from distar.data.fake_data import fake_obs
+from distar.model import AlphaStarActorCritic
+from distar.model.alphastar.export import export_inference_model, check_inference_parity, fold_norm, \
+    remove_dropout, script_inference_model
+from distar.worker.actor.eval_actor import build_eval_agent
+
+
+def get_inputs(entity_num):
+    inputs = as_eval_collate_fn([(fake_obs(entity_num), )])[0]
+    inputs['prev_state'] = [None]
+    return inputs
+
+
+@pytest.mark.unittest
+class TestExport:
+
+    def test_fold_norm(self):
+        model = nn.Sequential(fc_block(8, 16, norm_type='BN', activation=nn.ReLU()), nn.Linear(16, 4))
+        bn = model[0][1]
+        bn.running_mean.normal_()
+        bn.running_var.uniform_(0.5, 2.)
+        bn.weight.data.normal_()
+        bn.bias.data.normal_()
+        model.eval()
+        x = torch.randn(5, 8)
+        with torch.no_grad():
+            ref = model(x)
+            assert fold_norm(model) == 1
+            assert isinstance(model[0][1], nn.Identity)
+            assert torch.allclose(model(x), ref, atol=1e-5)
+        # the default model only has LayerNorm
+        assert fold_norm(AlphaStarActorCritic({'use_value_network': False})) == 0
+
+    def test_script(self):
+        model = AlphaStarActorCritic({'use_value_network': False})
+        model.eval()
+        remove_dropout(model)
+        scripted = script_inference_model(model)
+        assert 'encoder.encoder.entity_encoder.transformer' in scripted
+        assert isinstance(model.encoder.encoder.entity_encoder.transformer, torch.jit.ScriptModule)
+
+    @pytest.mark.parametrize('quant', [False, True])
+    def test_eval_actor_parity(self, tmp_path, quant):
+        # int8 error depends on the weights, a fixed random model keeps the bounds of quant meaningful
+        torch.manual_seed(0)
+        checkpoint_path = os.path.join(str(tmp_path), 'checkpoint.pth')
+        artifact_path = os.path.join(str(tmp_path), 'inference.pth')
+        save_file(checkpoint_path, {'model': AlphaStarActorCritic().state_dict()})
+        export_inference_model(checkpoint_path, artifact_path, quant=quant)
+
+        # the agents are built the same way as the eval actor does
+        eager_agent = build_eval_agent(read_file(checkpoint_path))
+        inference_agent = build_eval_agent(read_file(artifact_path))
+        assert isinstance(inference_agent._model.encoder.encoder.entity_encoder.transformer, torch.jit.ScriptModule)
+        result = check_inference_parity(eager_agent._model, inference_agent._model, get_inputs(50))
+        assert set(result.keys()) == {'action_type', 'delay', 'queued', 'selected_units', 'target_units',
+                                      'target_location'}
+        for k, v in result.items():
+            if quant:
+                assert v['kl'] < 0.1 and v['max_prob_diff'] < 0.2, k
+            else:
+                assert v['max_prob_diff'] < 1e-5 and v['action_match'] == 1., k
+
+        output = inference_agent.forward(get_inputs(50), state_id=[0], valid_id=[0])
+        assert len(output['action']) == 1
+        assert output['action'][0]['action']['action_type'] is not None
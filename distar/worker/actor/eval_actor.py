@@ -1,5 +1,4 @@
 import os
-import time
 import copy
 import requests
 import traceback
@@ -17,8 +16,9 @@ from urllib3.util.retry import Retry
 from ctools.worker.actor import BaseEnvManager, SubprocessEnvManager
 from ctools.torch_utils import to_device, tensor_to_list
 from distar.model import AlphaStarActorCritic
+from distar.model.alphastar.export import INFERENCE_KEY, build_inference_model
 from distar.worker.agent.alphastar_agent import create_as_actor_agent
-from ctools.utils import get_data_compressor, lists_to_dicts, get_task_uid
+from ctools.utils import get_data_compressor, lists_to_dicts, get_task_uid, get_profiler, pretty_print
 from distar.envs import AlphaStarEnv, FakeAlphaStarEnv, EvalEnv
 from distar.data.collate_fn import as_eval_collate_fn
 from collections import OrderedDict
@@ -32,6 +32,33 @@ short = {'winloss': 'winloss', 'build_order': 'bo', 'built_unit': 'bu', 'effect'
 default_config = read_config(os.path.join(os.path.dirname(__file__), "eval.yaml"))
 
 
+def build_eval_agent(state_dict, use_cuda=False):
+    r"""
+    Overview:
+        build the actor agent from a training checkpoint or an inference artifact exported by
+        distar/bin/export_model.py
+    Arguments:
+        - state_dict (:obj:`dict`): the data returned by ``read_file``
+        - use_cuda (:obj:`bool`): whether to run the model on gpu
+    Returns:
+        - agent (:obj:`Agent`): the agent in eval mode with its hidden state reset
+    """
+    if INFERENCE_KEY in state_dict:
+        assert not (use_cuda and state_dict[INFERENCE_KEY]['quantize']), 'quantized inference model only supports cpu'
+        model = build_inference_model(state_dict)
+    else:
+        model = AlphaStarActorCritic()
+        actor_state_dict = state_dict['model']
+        actor_state_dict = OrderedDict({k: v for k, v in actor_state_dict.items() if 'value_networks' not in k})
+        model.load_state_dict(actor_state_dict, strict=False)
+    if use_cuda:
+        model.cuda()
+    agent = create_as_actor_agent(model, 1, use_teacher=False)
+    agent.mode(False)
+    agent.reset()
+    return agent
+
+
 class ASEvalActor:
 
     def __init__(self, model1=None, model2=None, cuda=None, game_type=None):
@@ -86,58 +113,47 @@ class ASEvalActor:
             self._agent_num = 1
         self._agent = []
         for i in range(self._agent_num):
-            model = AlphaStarActorCritic()
-            if self._cfg.use_cuda:
-                model.cuda()
-            agent = create_as_actor_agent(model, 1, use_teacher=False)
-            agent.mode(False)
-            agent.reset()
-            # load model
-            agent = self._load_model(agent, self._cfg.model_path[i])
+            state_dict = read_file(self._cfg.model_path[i])
+            agent = build_eval_agent(state_dict, self._cfg.use_cuda)
             self._agent.append(agent)
         self._valid_obs_flag = {k: [True for _ in range(self._agent_num)] for k in range(1)}
 
-    def _load_model(self, agent, model_path):
-        state_dict = torch.load(model_path, map_location='cpu')
-        actor_state_dict = state_dict['model']
-        actor_state_dict = OrderedDict({k: v for k, v in actor_state_dict.items() if 'value_networks' not in k})
-        agent._model.load_state_dict(actor_state_dict, strict=False)
-        agent.reset()
-        return agent
-
     # override
     def _agent_inference(self, obs):
         data = [None for _ in range(self._agent_num)]
         state_id = obs.keys()
-        obs = as_eval_collate_fn(list(obs.values()))
+        profiler = get_profiler()
+        with profiler.span('actor.collate'):
+            obs = as_eval_collate_fn(list(obs.values()))
         valid_id = [[env_idx for env_idx in range(self.env_num) if self._valid_obs_flag[env_idx][agent_idx]] for agent_idx in range(self._agent_num)]
 
         if self._cfg.use_cuda:
             obs = [to_device(o, 'cuda') for o in obs]
-        for agent_obs_idx, agent in enumerate(self._agent):
-            data[agent_obs_idx] = agent.forward(obs[agent_obs_idx], state_id=state_id, valid_id=valid_id[agent_obs_idx])
+        with profiler.span('actor.forward'):
+            for agent_obs_idx, agent in enumerate(self._agent):
+                data[agent_obs_idx] = agent.forward(obs[agent_obs_idx], state_id=state_id, valid_id=valid_id[agent_obs_idx])
         data = lists_to_dicts(data)
+        # the actions are already on host, copied once in the post processing of the agent
         tmp_action = list(zip(*data['action']))
-        if self._cfg.use_cuda:
-            tmp_action = to_device(tmp_action, 'cpu')
         action = {}
         for i, a in zip(state_id, tmp_action):
             action[i] = a
         return action, data
 
     def run(self) -> None:
-        step_ = 1
+        # set DISTAR_PROFILE_DIR to enable the profiler, the timing of each stage is printed after the game
+        profiler = get_profiler()
         while True:
             obs = self._env_manager.next_obs
-            t = time.time()
-            action, data = self._agent_inference(obs)
-            inference_time = time.time() - t
-            timestep = self._env_manager.step(action)
+            with profiler.span('actor.infer'):
+                action, data = self._agent_inference(obs)
+            with profiler.span('actor.env_step'):
+                timestep = self._env_manager.step(action)
             self._process_timestep(timestep)
-            print('step: {}, inference_time: {}'.format(step_, inference_time))
-            step_ += 1
             if self._env_manager.done:
                 break
+        if profiler.enabled:
+            pretty_print(profiler.summary())
 
     # override
     def _process_timestep(self, timestep: namedtuple) -> None:
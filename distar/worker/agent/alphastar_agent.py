@@ -1,31 +1,82 @@
 import torch
-import copy
 from typing import Any, Optional
 from collections import OrderedDict
+from collections.abc import Mapping
+from ctools.torch_utils import to_device, to_host_split
 from ctools.worker.agent import BaseAgent, add_plugin, IAgentStatelessPlugin, AgentAggregator
 from ctools.pysc2.lib.action_dict import GENERAL_ACTION_INFO_MASK
 from ctools.pysc2.lib.static_data import ACTIONS_REORDER_INV
 
 
+class ActionRecord(Mapping):
+    r"""
+    Overview:
+        compact struct-of-arrays record of the actions of all the envs in a step: one (B, ...) tensor for each
+        action head and the selected units num of each env, instead of a dict of small tensors for each env. As a
+        mapping it is the batched action dict, and ``env_actions`` gives the action of each env.
+    Interface:
+        __init__, __getitem__, __iter__, __len__, env_actions, batch_size
+    """
+
+    __slots__ = ('_action', 'selected_units_num')
+
+    def __init__(self, action: dict, selected_units_num: torch.Tensor) -> None:
+        self._action = action
+        self.selected_units_num = selected_units_num
+
+    def __getitem__(self, k: str) -> torch.Tensor:
+        return self._action[k]
+
+    def __iter__(self):
+        return iter(self._action)
+
+    def __len__(self) -> int:
+        return len(self._action)
+
+    @property
+    def batch_size(self) -> int:
+        return self._action['action_type'].shape[0]
+
+    def env_actions(self) -> list:
+        r"""
+        Overview:
+            the action dict of each env, the heads unused by the action type are None, and the end flag of the
+            selected units is excluded. The tensors of each env are views of a host chunk of its own
+            (``to_host_split``), so the action of an env pickles just its own elements.
+        """
+        return [_env_action(a, n) for a, n in to_host_split([self._action, self.selected_units_num])]
+
+
+def _env_action(action: dict, selected_units_num: torch.Tensor) -> dict:
+    # the action of an env from its pieces of the batched action
+    mask = GENERAL_ACTION_INFO_MASK[ACTIONS_REORDER_INV[action['action_type'].item()]]
+    env_action = {}
+    for k, v in action.items():
+        if k in ['queued', 'selected_units', 'target_units', 'target_location'] and not mask[k]:
+            env_action[k] = None
+        elif k == 'selected_units':
+            # exclude end flag, a view by numpy has a storage of just the selected units, as to_host_split
+            env_action[k] = torch.from_numpy(v.numpy()[:selected_units_num.item() - 1])
+        else:
+            env_action[k] = v
+    return env_action
+
+
 def post_processing(data, bs):
     action, action_output = data[0]
     action, entity_raw, selected_units_num = list(action.values())
-    algo_action = copy.deepcopy(action)
-
-    entity_raw = [{k: entity_raw[k][b] for k in entity_raw.keys()} for b in range(bs)]
-    env_action = [{k: action[k][b] for k in action.keys()} for b in range(bs)]
-    for b in range(bs):
-        action_type = env_action[b]['action_type'].item()
-        action_type = ACTIONS_REORDER_INV[action_type]
-        for k in ['queued', 'selected_units', 'target_units', 'target_location']:
-            if not GENERAL_ACTION_INFO_MASK[action_type][k]:
-                env_action[b][k] = None
-        if env_action[b]['selected_units'] is not None:
-            env_action[b]['selected_units'] = env_action[b]['selected_units'][:selected_units_num[b] - 1
-                                                                              ]  # exclude end flag
+    algo_action = ActionRecord(action, selected_units_num)
+    # one device to host copy of each dtype for the actions of all the envs, laid out by env, as the action of each
+    # env is pickled to its env process and kept in the trajectories. The entity_raw lists hold a tensor of each env.
+    batched_raw = {k: v for k, v in entity_raw.items() if isinstance(v, torch.Tensor)}
+    env_data = to_host_split([action, batched_raw, selected_units_num])
+    assert len(env_data) == bs, (len(env_data), bs)
 
     output = {}
-    output['action'] = [{'action': a, 'entity_raw': e} for a, e in zip(env_action, entity_raw)]
+    output['action'] = []
+    for b, (a, raw, n) in enumerate(env_data):
+        e = {k: raw[k] if k in raw else to_device(v[b], 'cpu') for k, v in entity_raw.items()}
+        output['action'].append({'action': _env_action(a, n), 'entity_raw': e})
     output['action_output'] = action_output
     output['algo_action'] = algo_action
     output['selected_units_num'] = selected_units_num
@@ -44,7 +95,7 @@ class ASDataTransformPlugin(IAgentStatelessPlugin):
 
             def wrapper(data, **kwargs):
                 ret = fn(data, **kwargs)
-                return post_processing(ret, bs=len(ret[1]))
+                return post_processing(ret, bs=len(ret[0][0]['action']['action_type']))
 
             return wrapper
 
@@ -71,12 +122,14 @@ class AlphaStarActorAgent(BaseAgent):
         return super().forward(data, param)
 
 
-def create_as_actor_agent(model, state_num, use_teacher=False):
+def create_as_actor_agent(model, state_num, use_teacher=False, tensor_hidden_state=False):
+    # tensor_hidden_state: store the hidden states of all the envs in contiguous tensors(TensorHiddenStateHelper)
+    hidden_state = 'tensor_hidden_state' if tensor_hidden_state else 'hidden_state'
     plugin_cfg = {
         'main': OrderedDict(
             {
                 'as_data_transform': {},
-                'hidden_state': {
+                hidden_state: {
                     'state_num': state_num,
                     'save_prev_state': True,
                 },
@@ -89,7 +142,7 @@ def create_as_actor_agent(model, state_num, use_teacher=False):
     if use_teacher:
         plugin_cfg['teacher'] = OrderedDict(
             {
-                'hidden_state': {
+                hidden_state: {
                     'state_num': state_num,
                     'save_prev_state': True,
                 },
@@ -0,0 +1,93 @@
+import pickle
+
+import pytest
+import torch
+
+from distar.data.collate_fn import as_eval_collate_fn
+from distar.data.fake_data import fake_obs
+from distar.model import AlphaStarActorCritic
+from distar.worker.agent.alphastar_agent import ActionRecord, post_processing, create_as_actor_agent
+
+
+def get_model_output(batch_size, entity_num):
+    action = {
+        'action_type': torch.randint(0, 300, (batch_size, )),
+        'delay': torch.randint(0, 100, (batch_size, )),
+        'queued': torch.randint(0, 2, (batch_size, )),
+        'selected_units': torch.randint(0, entity_num, (batch_size, 64)),
+        'target_units': torch.randint(0, entity_num, (batch_size, )),
+        'target_location': torch.randint(0, 1000, (batch_size, )),
+    }
+    entity_raw = {
+        'location': torch.randint(0, 100, (batch_size, entity_num, 2)),
+        'id': torch.randint(0, 9999, (batch_size, entity_num)),
+    }
+    selected_units_num = torch.randint(1, 64, (batch_size, ))
+    action = {'action': action, 'entity_raw': entity_raw, 'selected_units_num': selected_units_num}
+    return ((action, None), None, None)
+
+
+@pytest.mark.unittest
+class TestPostProcessing:
+
+    def test_env_action(self):
+        batch_size = 4
+        data = get_model_output(batch_size, 16)
+        output = post_processing(data, batch_size)
+        assert isinstance(output['algo_action'], ActionRecord)
+        assert output['algo_action'].batch_size == batch_size
+        action = data[0][0]['action']
+        for b in range(batch_size):
+            env_action = output['action'][b]['action']
+            assert env_action['action_type'] == action['action_type'][b]
+            if env_action['selected_units'] is not None:
+                num = data[0][0]['selected_units_num'][b] - 1
+                assert torch.equal(env_action['selected_units'], action['selected_units'][b][:num])
+            assert torch.equal(output['action'][b]['entity_raw']['id'], data[0][0]['entity_raw']['id'][b])
+
+    def test_pickled_size(self):
+        # the actions of each env are pickled to the env processes, they must not carry the batch buffers
+        batch_size, entity_num = 8, 512
+        output = post_processing(get_model_output(batch_size, entity_num), batch_size)
+        env_output = output['action'][0]
+        compact = {
+            'action': {k: v.clone() if v is not None else None for k, v in env_output['action'].items()},
+            'entity_raw': {k: v.clone() for k, v in env_output['entity_raw'].items()},
+        }
+        assert len(pickle.dumps(env_output)) <= len(pickle.dumps(compact))
+        assert len(pickle.dumps(output['algo_action']['action_type'])) < 2048
+
+
+@pytest.mark.unittest
+class TestTensorHiddenState:
+
+    def test_same_as_hidden_state(self):
+        torch.manual_seed(0)
+        model = AlphaStarActorCritic({'use_value_network': False})
+        agents = [create_as_actor_agent(model, 3, tensor_hidden_state=t) for t in [False, True]]
+        for a in agents:
+            a.mode(False)
+            a.reset()
+        obs = [fake_obs(n) for n in [20, 35, 50]]
+        # batch size 2 is also the length of a stacked [H, C] state, CoreLstm must tell them apart
+        for state_id in [[0, 1, 2], [0, 1, 2], [2, 0], [1]]:
+            data = as_eval_collate_fn([(obs[i], ) for i in state_id])[0]
+            outputs = []
+            for a in agents:
+                torch.manual_seed(1)
+                outputs.append(a.forward(data, state_id=state_id))
+            for output in outputs:
+                assert output['algo_action'].batch_size == len(state_id)
+                assert len(output['action']) == len(output['prev_state']) == len(state_id)
+            for p, q in zip(*[o['action'] for o in outputs]):
+                assert p['action']['action_type'] == q['action']['action_type']
+            h = agents[0]._state_manager._state
+            H, C = agents[1]._state_manager._state
+            for i in range(3):
+                if h[i] is None:
+                    assert (H[:, i] == 0).all() and (C[:, i] == 0).all()
+                else:
+                    assert torch.allclose(H[:, i], h[i][0].squeeze(1), atol=1e-5)
+                    assert torch.allclose(C[:, i], h[i][1].squeeze(1), atol=1e-5)
+            for a in agents:
+                a.reset(state_id=[0])
@@ -95,6 +95,7 @@ setup(
         'yapf==0.29.0',
         'flask',
         'lz4',
+        'msgpack',
     ],
     classifiers=[
         'Development Status :: 4 - Beta',